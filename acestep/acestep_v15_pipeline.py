@@ -32,22 +32,17 @@ for proxy_var in ['http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY', 'ALL
 
 try:
     # When executed as a module: `python -m acestep.acestep_v15_pipeline`
-    from .handler import AceStepHandler
-    from .llm_inference import LLMHandler
-    from .dataset_handler import DatasetHandler
-    from .gradio_ui import create_gradio_interface
     from .gpu_config import get_gpu_config, get_gpu_memory_gb, print_gpu_config_info, set_global_gpu_config, VRAM_16GB_MIN_GB
 except ImportError:
     # When executed as a script: `python acestep/acestep_v15_pipeline.py`
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     if project_root not in sys.path:
         sys.path.insert(0, project_root)
-    from acestep.handler import AceStepHandler
-    from acestep.llm_inference import LLMHandler
-    from acestep.dataset_handler import DatasetHandler
-    from acestep.gradio_ui import create_gradio_interface
     from acestep.gpu_config import get_gpu_config, get_gpu_memory_gb, print_gpu_config_info, set_global_gpu_config, VRAM_16GB_MIN_GB
 
+# Handlers and the Gradio UI (torch, transformers, diffusers, gradio) are
+# imported on first use, so argument errors and --help return immediately.
+
 
 def create_demo(init_params=None, language='en'):
     """
@@ -66,11 +61,16 @@ def create_demo(init_params=None, language='en'):
     Returns:
         Gradio Blocks instance
     """
+    from acestep.dataset_handler import DatasetHandler
+    from acestep.gradio_ui import create_gradio_interface
+
     # Use pre-initialized handlers if available, otherwise create new ones
     if init_params and init_params.get('pre_initialized') and 'dit_handler' in init_params:
         dit_handler = init_params['dit_handler']
         llm_handler = init_params['llm_handler']
     else:
+        from acestep.handler import AceStepHandler
+        from acestep.llm_inference import LLMHandler
         dit_handler = AceStepHandler()  # DiT handler
         llm_handler = LLMHandler()      # LM handler
     
@@ -200,6 +200,8 @@ def main():
             print("Initializing service from command line...")
             
             # Create handler instances for initialization
+            from acestep.handler import AceStepHandler
+            from acestep.llm_inference import LLMHandler
             dit_handler = AceStepHandler()
             llm_handler = LLMHandler()
             
@@ -6,11 +6,13 @@ Endpoints:
 - POST /create_random_sample  Generate random music parameters via LLM
 - POST /format_input          Format and enhance lyrics/caption via LLM
 - GET  /v1/models             List available models
-- GET  /v1/audio              Download audio file
+- GET  /v1/audio              Download audio file (Range, ?preview=opus|mp3)
+- GET  /v1/audio/peaks        Waveform peak data for an audio file
 - GET  /health                Health check
 
 NOTE:
-- In-memory queue and job store -> run uvicorn with workers=1.
+- The job queue is persisted on disk (queued jobs survive restarts), but the
+  job store and workers are per-process -> run uvicorn with workers=1.
 """
 
 from __future__ import annotations
@@ -31,7 +33,7 @@ from contextlib import asynccontextmanager
 from dataclasses import dataclass
 from pathlib import Path
 from threading import Lock
-from typing import Any, Dict, List, Literal, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional
 from uuid import uuid4
 from loguru import logger
 
@@ -44,21 +46,28 @@ from fastapi import FastAPI, HTTPException, Request, Depends, Header
 from pydantic import BaseModel, Field
 from starlette.datastructures import UploadFile as StarletteUploadFile
 
-from acestep.handler import AceStepHandler
-from acestep.llm_inference import LLMHandler
 from acestep.constants import (
     DEFAULT_DIT_INSTRUCTION,
     DEFAULT_LM_INSTRUCTION,
     TASK_INSTRUCTIONS,
 )
-from acestep.inference import (
-    GenerationParams,
-    GenerationConfig,
-    generate_music,
-    create_sample,
-    format_sample,
+from acestep.cancellation import CancellationToken, GenerationCancelled, cancellation_scope
+from acestep.duration_buckets import padding_stats
+from acestep.job_queue import (
+    DEFAULT_PRIORITY,
+    PRIORITY_CLASSES,
+    DurableJobQueue,
+    make_cost_key,
+)
+from acestep.audio_serving import (
+    PREVIEW_FORMATS,
+    DEFAULT_PEAK_BUCKETS,
+    TranscodeCache,
+    guess_audio_media_type,
+    load_or_compute_peaks,
+    precompute_peaks_async,
+    ranged_file_response,
 )
-from acestep.gradio_ui.events.results_handlers import _build_generation_info
 from acestep.gpu_config import (
     get_gpu_config,
     get_gpu_memory_gb,
@@ -70,6 +79,13 @@ from acestep.gpu_config import (
     VRAM_16GB_MIN_GB,
 )
 
+# The model stack (torch, transformers, diffusers, gradio, ...) is imported on
+# first use, so importing this module and answering /health stay fast.
+if TYPE_CHECKING:
+    from acestep.dit_worker_pool import DiTWorkerPool
+    from acestep.handler import AceStepHandler
+    from acestep.llm_inference import LLMHandler
+
 
 # =============================================================================
 # Model Auto-Download Support
@@ -234,7 +250,7 @@ RESULT_EXPIRE_SECONDS = 7 * 24 * 60 * 60  # 7 days
 TASK_TIMEOUT_SECONDS = 3600  # 1 hour
 JOB_STORE_CLEANUP_INTERVAL = 300  # 5 minutes - interval for cleaning up old jobs
 JOB_STORE_MAX_AGE_SECONDS = 86400  # 24 hours - completed jobs older than this will be cleaned
-STATUS_MAP = {"queued": 0, "running": 0, "succeeded": 1, "failed": 2}
+STATUS_MAP = {"queued": 0, "running": 0, "succeeded": 1, "failed": 2, "cancelled": 2}
 
 LM_DEFAULT_TEMPERATURE = 0.85
 LM_DEFAULT_CFG_SCALE = 2.5
@@ -444,7 +460,7 @@ def _parse_description_hints(description: str) -> tuple[Optional[str], bool]:
     return detected_language, is_instrumental
 
 
-JobStatus = Literal["queued", "running", "succeeded", "failed"]
+JobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
 
 
 class GenerateMusicRequest(BaseModel):
@@ -464,6 +480,15 @@ class GenerateMusicRequest(BaseModel):
     use_format: bool = Field(default=False, description="Use format_sample() to enhance input (default: False)")
     # Model name for multi-model support (select which DiT model to use)
     model: Optional[str] = Field(default=None, description="Model name to use (e.g., 'acestep-v15-turbo')")
+    # Queue priority class: "high", "normal" or "low"
+    priority: str = Field(default=DEFAULT_PRIORITY, description="Queue priority class (high/normal/low)")
+    # Deadline: abort the job this many seconds after submission (queued time included)
+    timeout_seconds: Optional[float] = Field(default=None, description="Abort the job after this many seconds (default: ACESTEP_JOB_TIMEOUT_SECONDS)")
+    # LoRA adapter for this request only (name registered by load_lora or a sub-directory of ACESTEP_LORA_DIR)
+    lora_adapter: Optional[str] = Field(default=None, description="LoRA adapter name for this request")
+    lora_scale: Optional[float] = Field(default=None, description="LoRA adapter scale (default: 1.0)")
+    # Best-of-N: generate this many candidates, return the best batch_size
+    best_of: int = Field(default=0, description="Candidates to generate and rank (0 = off)")
 
     bpm: Optional[int] = None
     # Accept common client keys via manual parsing (see RequestParser).
@@ -484,6 +509,10 @@ class GenerateMusicRequest(BaseModel):
 
     repainting_start: float = 0.0
     repainting_end: Optional[float] = None
+    repaint_context: Optional[float] = None
+    long_form: bool = False
+    adaptive_tol: Optional[float] = None
+    adaptive_min_steps: Optional[int] = None
 
     instruction: str = DEFAULT_DIT_INSTRUCTION
     audio_cover_strength: float = 1.0
@@ -555,6 +584,9 @@ class JobResult(BaseModel):
     lm_model: Optional[str] = None
     dit_model: Optional[str] = None
 
+    # Diffusion steps each audio took (fewer than inference_steps when adaptive_tol ended it early)
+    steps_run: Optional[list[int]] = None
+
 
 class JobResponse(BaseModel):
     job_id: str
@@ -636,11 +668,19 @@ class _JobStore:
             rec.result = None
             rec.error = error
 
+    def mark_cancelled(self, job_id: str, reason: str) -> None:
+        with self._lock:
+            rec = self._jobs[job_id]
+            rec.status = "cancelled"
+            rec.finished_at = time.time()
+            rec.result = None
+            rec.error = f"Cancelled: {reason}"
+
     def cleanup_old_jobs(self, max_age_seconds: Optional[int] = None) -> int:
         """
         Clean up completed jobs older than max_age_seconds.
 
-        Only removes jobs with status 'succeeded' or 'failed'.
+        Only removes jobs with status 'succeeded', 'failed' or 'cancelled'.
         Jobs that are 'queued' or 'running' are never removed.
 
         Returns the number of jobs removed.
@@ -652,7 +692,7 @@ class _JobStore:
         with self._lock:
             to_remove = []
             for job_id, rec in self._jobs.items():
-                if rec.status in ("succeeded", "failed"):
+                if rec.status in ("succeeded", "failed", "cancelled"):
                     finish_time = rec.finished_at or rec.created_at
                     age = now - finish_time
                     if age > max_age:
@@ -673,6 +713,7 @@ class _JobStore:
                 "running": 0,
                 "succeeded": 0,
                 "failed": 0,
+                "cancelled": 0,
             }
             for rec in self._jobs.values():
                 if rec.status in stats:
@@ -799,6 +840,23 @@ def _is_instrumental(lyrics: str) -> bool:
     return lyrics_clean in ("[inst]", "[instrumental]")
 
 
+def _job_cost_key(req: "GenerateMusicRequest", default_model: str):
+    """Job shape used by the queue's cost model for ETA estimation."""
+    parsed_timesteps = _parse_timesteps(req.timesteps)
+    steps = len(parsed_timesteps) if parsed_timesteps else req.inference_steps
+    use_lm = bool(
+        req.thinking or req.sample_mode or req.use_format
+        or (req.sample_query and req.sample_query.strip())
+    )
+    return make_cost_key(
+        model=req.model or default_model,
+        steps=steps,
+        duration=req.audio_duration,
+        batch_size=req.batch_size if req.batch_size is not None else 2,
+        use_lm=use_lm,
+    )
+
+
 class RequestParser:
     """Parse request parameters from multiple sources with alias support."""
 
@@ -894,6 +952,7 @@ def create_app() -> FastAPI:
 
     INITIAL_AVG_JOB_SECONDS = float(os.getenv("ACESTEP_AVG_JOB_SECONDS", "5.0"))
     AVG_WINDOW = int(os.getenv("ACESTEP_AVG_WINDOW", "50"))
+    JOB_TIMEOUT_SECONDS = float(os.getenv("ACESTEP_JOB_TIMEOUT_SECONDS", "0"))  # 0 = no deadline
 
     def _path_to_audio_url(path: str) -> str:
         """Convert local file path to downloadable relative URL"""
@@ -938,6 +997,9 @@ def create_app() -> FastAPI:
         os.environ.setdefault("TRITON_CACHE_DIR", triton_cache_root)
         os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", inductor_cache_root)
 
+        from acestep.handler import AceStepHandler
+        from acestep.llm_inference import LLMHandler
+
         handler = AceStepHandler()
         llm_handler = LLMHandler()
         init_lock = asyncio.Lock()
@@ -973,10 +1035,17 @@ def create_app() -> FastAPI:
         max_workers = int(os.getenv("ACESTEP_API_WORKERS", "1"))
         executor = ThreadPoolExecutor(max_workers=max_workers)
 
-        # Queue & observability
-        app.state.job_queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)  # (job_id, req)
-        app.state.pending_ids = deque()  # queued job_ids
-        app.state.pending_lock = asyncio.Lock()
+        # Queue & observability (persisted under the cache dir unless disabled)
+        queue_dir = None
+        if _env_bool("ACESTEP_QUEUE_PERSIST", True):
+            queue_dir = (os.getenv("ACESTEP_QUEUE_DIR") or os.path.join(cache_root, "job_queue")).strip()
+        job_queue = DurableJobQueue(
+            queue_dir, maxsize=QUEUE_MAXSIZE, default_job_seconds=INITIAL_AVG_JOB_SECONDS
+        )
+        app.state.job_queue = job_queue
+        app.state.job_queue_sem = asyncio.Semaphore(0)  # released once per queued job
+        app.state.job_tokens = {}  # job_id -> CancellationToken (queued and running jobs)
+        app.state.publish_tasks = set()  # jobs whose audio files are still being written
 
         # temp files per job (from multipart uploads)
         app.state.job_temp_files = {}  # job_id -> list[path]
@@ -996,6 +1065,12 @@ def create_app() -> FastAPI:
         app.state.temp_audio_dir = os.path.join(tmp_root, "api_audio")
         os.makedirs(app.state.temp_audio_dir, exist_ok=True)
 
+        # Content-addressed cache for low-bitrate preview transcodes
+        transcode_cache_mb = int(os.getenv("ACESTEP_TRANSCODE_CACHE_MB", "512"))
+        app.state.transcode_cache = TranscodeCache(
+            os.path.join(cache_root, "transcode"), transcode_cache_mb * 1024 * 1024
+        )
+
         # Initialize local cache
         try:
             from acestep.local_cache import get_local_cache
@@ -1011,6 +1086,18 @@ def create_app() -> FastAPI:
             if not getattr(app.state, "_initialized", False):
                 raise RuntimeError("Model not initialized")
 
+        def _job_token(job_id: str, req: GenerateMusicRequest) -> CancellationToken:
+            """Cancellation token of a job; its deadline counts from submission."""
+            token = app.state.job_tokens.get(job_id)
+            if token is None:
+                rec = store.get(job_id)
+                token = CancellationToken.with_timeout(
+                    req.timeout_seconds or JOB_TIMEOUT_SECONDS,
+                    start=rec.created_at if rec else None,
+                )
+                app.state.job_tokens[job_id] = token
+            return token
+
         async def _cleanup_job_temp_files(job_id: str) -> None:
             async with app.state.job_temp_files_lock:
                 paths = app.state.job_temp_files.pop(job_id, [])
@@ -1056,6 +1143,7 @@ def create_app() -> FastAPI:
                 seed_value = result.get("seed_value", "")
                 lm_model = result.get("lm_model", "")
                 dit_model = result.get("dit_model", "")
+                steps_run = result.get("steps_run") or []
 
                 if audio_paths:
                     result_data = [
@@ -1072,8 +1160,9 @@ def create_app() -> FastAPI:
                             "seed_value": seed_value,
                             "lm_model": lm_model,
                             "dit_model": dit_model,
+                            "steps_run": steps_run[i] if i < len(steps_run) else None,
                         }
-                        for p in audio_paths
+                        for i, p in enumerate(audio_paths)
                     ]
                 else:
                     result_data = [{
@@ -1098,12 +1187,19 @@ def create_app() -> FastAPI:
             result_key = f"{RESULT_KEY_PREFIX}{job_id}"
             local_cache.set(result_key, result_data, ex=RESULT_EXPIRE_SECONDS)
 
-        async def _run_one_job(job_id: str, req: GenerateMusicRequest) -> None:
+        async def _run_one_job(job_id: str, req: GenerateMusicRequest, cost_key=None) -> None:
             job_store: _JobStore = app.state.job_store
             llm: LLMHandler = app.state.llm_handler
             executor: ThreadPoolExecutor = app.state.executor
 
             await _ensure_initialized()
+            token = _job_token(job_id, req)
+            if token.cancelled:
+                # Deadline passed (or cancelled) while still queued
+                job_store.mark_cancelled(job_id, token.reason)
+                _update_local_cache(job_id, None, "cancelled")
+                app.state.job_tokens.pop(job_id, None)
+                return
             job_store.mark_running(job_id)
             
             # Select DiT handler based on user's model choice
@@ -1142,9 +1238,25 @@ def create_app() -> FastAPI:
             
             # Use selected handler for generation
             h: AceStepHandler = selected_handler
+            dit_pool: Optional[DiTWorkerPool] = getattr(app.state, "dit_pool", None)
+            if dit_pool is not None:
+                # Worker-pool mode: route to the least busy process serving the model
+                h = dit_pool.handler_for(req.model)
+                selected_model_name = h.model_name
+
+            # GenerationResult whose audio files are still being encoded
+            pending_files: List[Any] = []
 
             def _blocking_generate() -> Dict[str, Any]:
                 """Generate music using unified inference logic from acestep.inference"""
+                from acestep.inference import (
+                    GenerationParams,
+                    GenerationConfig,
+                    generate_music,
+                    create_sample,
+                    format_sample,
+                )
+                from acestep.gradio_ui.events.results_handlers import _build_generation_info
 
                 def _ensure_llm_ready() -> None:
                     """Ensure LLM handler is initialized when needed"""
@@ -1386,7 +1498,13 @@ def create_app() -> FastAPI:
                     timesteps=parsed_timesteps,
                     repainting_start=req.repainting_start,
                     repainting_end=req.repainting_end if req.repainting_end else -1,
+                    repaint_context=req.repaint_context,
+                    long_form=req.long_form,
+                    adaptive_tol=req.adaptive_tol,
+                    adaptive_min_steps=req.adaptive_min_steps,
                     audio_cover_strength=req.audio_cover_strength,
+                    lora_adapter=req.lora_adapter,
+                    lora_scale=req.lora_scale,
                     # LM parameters
                     thinking=thinking,  # Use LM for code generation when thinking=True
                     lm_temperature=req.lm_temperature,
@@ -1414,6 +1532,9 @@ def create_app() -> FastAPI:
                     seeds=None,  # Let unified logic handle seed generation
                     audio_format=req.audio_format,
                     constrained_decoding_debug=req.constrained_decoding_debug,
+                    best_of=req.best_of or 0,
+                    # Files are encoded while the worker moves on; _publish_files waits for them
+                    wait_for_files=False,
                 )
 
                 # Check LLM initialization status
@@ -1464,11 +1585,7 @@ def create_app() -> FastAPI:
 
                 if not result.success:
                     raise RuntimeError(f"Music generation failed: {result.error or result.status_message}")
-
-                # Extract results
-                audio_paths = [audio["path"] for audio in result.audios if audio.get("path")]
-                first_audio = audio_paths[0] if len(audio_paths) > 0 else None
-                second_audio = audio_paths[1] if len(audio_paths) > 1 else None
+                pending_files.append(result)
 
                 # Get metadata from LM or CoT results
                 lm_metadata = result.extra_outputs.get("lm_metadata", {})
@@ -1532,9 +1649,10 @@ def create_app() -> FastAPI:
                 dit_model_name = selected_model_name
                 
                 return {
-                    "first_audio_path": _path_to_audio_url(first_audio) if first_audio else None,
-                    "second_audio_path": _path_to_audio_url(second_audio) if second_audio else None,
-                    "audio_paths": [_path_to_audio_url(p) for p in audio_paths],
+                    # Audio paths are filled in by _publish_files once the files are written
+                    "first_audio_path": None,
+                    "second_audio_path": None,
+                    "audio_paths": [],
                     "generation_info": generation_info,
                     "status_message": result.status_message,
                     "seed_value": seed_value,
@@ -1550,16 +1668,57 @@ def create_app() -> FastAPI:
                     "timesignature": _none_if_na_str(metas_out.get("timesignature")),
                     "lm_model": lm_model_name,
                     "dit_model": dit_model_name,
+                    "time_costs": time_costs,
+                    "steps_run": result.extra_outputs.get("steps_run"),
                 }
 
+            def _blocking_generate_cancellable() -> Dict[str, Any]:
+                # Bind the job's token so diffusion/LM/VAE loops can abort early
+                with cancellation_scope(token):
+                    return _blocking_generate()
+
+            def _publish_files(payload: Dict[str, Any]) -> Dict[str, Any]:
+                """Wait for the job's audio files and add their URLs to ``payload``."""
+                gen_result = pending_files[0]
+                gen_result.wait_for_files()
+                audio_paths = [audio["path"] for audio in gen_result.audios if audio.get("path")]
+                for p in audio_paths:
+                    precompute_peaks_async(p)
+                payload["first_audio_path"] = _path_to_audio_url(audio_paths[0]) if len(audio_paths) > 0 else None
+                payload["second_audio_path"] = _path_to_audio_url(audio_paths[1]) if len(audio_paths) > 1 else None
+                payload["audio_paths"] = [_path_to_audio_url(p) for p in audio_paths]
+                return payload
+
+            async def _finish_job(payload: Dict[str, Any]) -> None:
+                try:
+                    if pending_files:
+                        # Default executor: the generation executor is free for the next job
+                        payload = await asyncio.get_running_loop().run_in_executor(None, _publish_files, payload)
+                    job_store.mark_succeeded(job_id, payload)
+                    _update_local_cache(job_id, payload, "succeeded")
+                except Exception:
+                    error_traceback = traceback.format_exc()
+                    print(f"[API Server] Job {job_id} FAILED while saving audio:\n{error_traceback}")
+                    job_store.mark_failed(job_id, error_traceback)
+                    _update_local_cache(job_id, None, "failed")
+
             t0 = time.time()
+            result = None
             try:
                 loop = asyncio.get_running_loop()
-                result = await loop.run_in_executor(executor, _blocking_generate)
-                job_store.mark_succeeded(job_id, result)
-
-                # Update local cache
-                _update_local_cache(job_id, result, "succeeded")
+                result = await loop.run_in_executor(executor, _blocking_generate_cancellable)
+                if pending_files:
+                    # The job stays "running" until its files are written; the
+                    # queue worker already takes the next job meanwhile
+                    task = asyncio.create_task(_finish_job(result))
+                    app.state.publish_tasks.add(task)
+                    task.add_done_callback(app.state.publish_tasks.discard)
+                else:
+                    await _finish_job(result)
+            except GenerationCancelled as e:
+                print(f"[API Server] Job {job_id} cancelled: {e.reason}")
+                job_store.mark_cancelled(job_id, e.reason)
+                _update_local_cache(job_id, None, "cancelled")
             except Exception as e:
                 error_traceback = traceback.format_exc()
                 print(f"[API Server] Job {job_id} FAILED: {e}")
@@ -1569,26 +1728,56 @@ def create_app() -> FastAPI:
                 # Update local cache
                 _update_local_cache(job_id, None, "failed")
             finally:
+                app.state.job_tokens.pop(job_id, None)
                 dt = max(0.0, time.time() - t0)
                 async with app.state.stats_lock:
                     app.state.recent_durations.append(dt)
                     if app.state.recent_durations:
                         app.state.avg_job_seconds = sum(app.state.recent_durations) / len(app.state.recent_durations)
+                # Only successful runs describe the cost of a job shape
+                if result is not None:
+                    app.state.job_queue.observe(cost_key, dt, result.get("time_costs"))
+
+        async def _cancel_job(job_id: str, reason: str) -> str:
+            """Cancel a queued or running job; returns the job's status afterwards."""
+            rec = store.get(job_id)
+            if rec is None:
+                return "not_found"
+            if rec.status == "queued" and app.state.job_queue.remove(job_id):
+                store.mark_cancelled(job_id, reason)
+                _update_local_cache(job_id, None, "cancelled")
+                await _cleanup_job_temp_files(job_id)
+                return "cancelled"
+            token = app.state.job_tokens.get(job_id)
+            if rec.status in ("queued", "running"):
+                if token is None:
+                    token = app.state.job_tokens.setdefault(job_id, CancellationToken())
+                # Running jobs stop at the next diffusion/LM/VAE step boundary
+                token.cancel(reason)
+                return "cancelling"
+            return rec.status
+
+        app.state.cancel_job = _cancel_job
 
         async def _queue_worker(worker_idx: int) -> None:
+            job_queue: DurableJobQueue = app.state.job_queue
             while True:
-                job_id, req = await app.state.job_queue.get()
+                await app.state.job_queue_sem.acquire()
+                rec = job_queue.pop()
+                if rec is None:
+                    continue
+                job_id = rec["job_id"]
                 try:
-                    async with app.state.pending_lock:
-                        try:
-                            app.state.pending_ids.remove(job_id)
-                        except ValueError:
-                            pass
-
-                    await _run_one_job(job_id, req)
+                    req = GenerateMusicRequest(**rec["payload"]["request"])
+                    await _run_one_job(job_id, req, rec.get("cost_key"))
+                except Exception as e:
+                    # Request could not be rebuilt (e.g. schema changed across a restart)
+                    if store.get(job_id) and store.get(job_id).status == "queued":
+                        store.mark_failed(job_id, f"Invalid queued job: {e}")
+                        _update_local_cache(job_id, None, "failed")
                 finally:
                     await _cleanup_job_temp_files(job_id)
-                    app.state.job_queue.task_done()
+                    job_queue.complete(job_id)
 
         async def _job_store_cleanup_worker() -> None:
             """Background task to periodically clean up old completed jobs."""
@@ -1678,22 +1867,67 @@ def create_app() -> FastAPI:
         except Exception as e:
             print(f"[API Server] Warning: Failed to download VAE model: {e}")
 
-        print(f"[API Server] Loading primary DiT model: {config_path}")
-        status_msg, ok = handler.initialize_service(
-            project_root=project_root,
-            config_path=config_path,
-            device=device,
-            use_flash_attention=use_flash_attention,
-            compile_model=False,
-            offload_to_cpu=offload_to_cpu,
-            offload_dit_to_cpu=offload_dit_to_cpu,
-        )
-        if not ok:
-            app.state._init_error = status_msg
-            print(f"[API Server] ERROR: Primary model failed to load: {status_msg}")
-            raise RuntimeError(status_msg)
-        app.state._initialized = True
-        print(f"[API Server] Primary model loaded: {_get_model_name(config_path)}")
+        # Worker-pool mode: one DiT process per device/model instead of in-process handlers
+        dit_workers_spec = os.getenv("ACESTEP_DIT_WORKERS", "").strip()
+        app.state.dit_pool = None
+        if dit_workers_spec:
+            from acestep.dit_worker_pool import DiTWorkerPool, parse_worker_specs
+
+            specs = parse_worker_specs(
+                dit_workers_spec,
+                default_model=dit_model_name,
+                init_kwargs={
+                    "project_root": project_root,
+                    "use_flash_attention": use_flash_attention,
+                    "compile_model": False,
+                    "offload_to_cpu": offload_to_cpu,
+                    "offload_dit_to_cpu": offload_dit_to_cpu,
+                },
+            )
+            for model_name in sorted({s.model for s in specs}):
+                try:
+                    _ensure_model_downloaded(model_name, checkpoint_dir)
+                except Exception as e:
+                    print(f"[API Server] Warning: Failed to download DiT model {model_name}: {e}")
+            print(f"[API Server] Starting {len(specs)} DiT worker process(es): {', '.join(s.label for s in specs)}")
+            dit_pool = DiTWorkerPool(specs, default_model=dit_model_name)
+            try:
+                failed = dit_pool.start()
+            except RuntimeError as e:
+                app.state._init_error = str(e)
+                raise
+            if failed:
+                print(f"[API Server] Warning: DiT workers failed to start: {failed}")
+            app.state.dit_pool = dit_pool
+            app.state._initialized = True
+            # The pool already covers secondary models
+            handler2 = handler3 = None
+            # Keep enough executor threads to feed every worker concurrently
+            if os.getenv("ACESTEP_API_WORKERS") is None and len(dit_pool) > max_workers:
+                executor.shutdown(wait=False)
+                executor = ThreadPoolExecutor(max_workers=len(dit_pool))
+                app.state.executor = executor
+            if os.getenv("ACESTEP_QUEUE_WORKERS") is None:
+                for i in range(len(workers), len(dit_pool)):
+                    workers.append(asyncio.create_task(_queue_worker(i)))
+            print(f"[API Server] DiT worker pool ready, serving: {dit_pool.models}")
+        else:
+            print(f"[API Server] Loading primary DiT model: {config_path}")
+            status_msg, ok = handler.initialize_service(
+                project_root=project_root,
+                config_path=config_path,
+                device=device,
+                use_flash_attention=use_flash_attention,
+                compile_model=False,
+                offload_to_cpu=offload_to_cpu,
+                offload_dit_to_cpu=offload_dit_to_cpu,
+            )
+            if not ok:
+                app.state._init_error = status_msg
+                print(f"[API Server] ERROR: Primary model failed to load: {status_msg}")
+                raise RuntimeError(status_msg)
+            app.state._initialized = True
+            print(f"[API Server] Primary model loaded: {_get_model_name(config_path)}")
 
         # Initialize secondary model if configured
         if handler2 and config_path2:
@@ -1839,7 +2073,7 @@ def create_app() -> FastAPI:
                 backend=lm_backend,
                 device=lm_device,
                 offload_to_cpu=lm_offload,
-                dtype=handler.dtype,
+                dtype=app.state.dit_pool.dtype_for() if app.state.dit_pool is not None else handler.dtype,
             )
             if llm_ok:
                 app.state._llm_initialized = True
@@ -1858,29 +2092,43 @@ def create_app() -> FastAPI:
 
         print("[API Server] All models initialized successfully!")
 
+        # Resume jobs persisted by a previous run (running ones go back to the front)
+        recovered, requeued = job_queue.recover()
+        for qrec in recovered:
+            payload = qrec.get("payload") or {}
+            job_rec = store.create_with_id(qrec["job_id"], env=payload.get("env", "development"))
+            job_rec.created_at = payload.get("created_at", job_rec.created_at)
+            if payload.get("temp_files"):
+                app.state.job_temp_files[qrec["job_id"]] = list(payload["temp_files"])
+            app.state.job_queue_sem.release()
+        if recovered:
+            print(
+                f"[API Server] Recovered {len(recovered)} queued job(s) "
+                f"({len(requeued)} interrupted while running)"
+            )
+
         try:
             yield
         finally:
             cleanup_task.cancel()
             for t in workers:
                 t.cancel()
-            executor.shutdown(wait=False, cancel_futures=True)
+            app.state.executor.shutdown(wait=False, cancel_futures=True)
+            if app.state.dit_pool is not None:
+                app.state.dit_pool.close()
+            job_queue.close()
 
     app = FastAPI(title="ACE-Step API", version="1.0", lifespan=lifespan)
 
-    async def _queue_position(job_id: str) -> int:
-        async with app.state.pending_lock:
-            try:
-                return list(app.state.pending_ids).index(job_id) + 1
-            except ValueError:
-                return 0
+    def _queue_position(job_id: str) -> int:
+        return app.state.job_queue.position(job_id)
 
-    async def _eta_seconds_for_position(pos: int) -> Optional[float]:
-        if pos <= 0:
+    def _eta_seconds(job_id: str) -> Optional[float]:
+        job_queue: DurableJobQueue = app.state.job_queue
+        eta = job_queue.eta_seconds(job_id, job_queue.running_remaining_seconds())
+        if eta is None:
             return None
-        async with app.state.stats_lock:
-            avg = float(getattr(app.state, "avg_job_seconds", INITIAL_AVG_JOB_SECONDS))
-        return pos * avg
+        return round(eta / max(1, WORKER_COUNT), 1)
 
     @app.post("/release_task")
     async def create_music_generate_job(request: Request, authorization: Optional[str] = Header(None)):
@@ -1898,6 +2146,11 @@ def create_app() -> FastAPI:
                 sample_query=p.str("sample_query"),
                 use_format=p.bool("use_format"),
                 model=p.str("model") or None,
+                priority=p.str("priority", DEFAULT_PRIORITY),
+                timeout_seconds=p.float("timeout_seconds"),
+                lora_adapter=p.str("lora_adapter") or None,
+                lora_scale=p.float("lora_scale"),
+                best_of=p.int("best_of", 0),
                 bpm=p.int("bpm"),
                 key_scale=p.str("key_scale"),
                 time_signature=p.str("time_signature"),
@@ -1911,6 +2164,10 @@ def create_app() -> FastAPI:
                 audio_code_string=p.str("audio_code_string"),
                 repainting_start=p.float("repainting_start", 0.0),
                 repainting_end=p.float("repainting_end"),
+                repaint_context=p.float("repaint_context"),
+                long_form=p.bool("long_form"),
+                adaptive_tol=p.float("adaptive_tol"),
+                adaptive_min_steps=p.int("adaptive_min_steps"),
                 instruction=p.str("instruction", DEFAULT_DIT_INSTRUCTION),
                 audio_cover_strength=p.float("audio_cover_strength", 1.0),
                 task_type=p.str("task_type", "text2music"),
@@ -2034,10 +2291,14 @@ def create_app() -> FastAPI:
                     ),
                 )
 
-        rec = store.create()
+        if req.priority not in PRIORITY_CLASSES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid priority '{req.priority}', expected one of {list(PRIORITY_CLASSES)}",
+            )
 
-        q: asyncio.Queue = app.state.job_queue
-        if q.full():
+        job_queue: DurableJobQueue = app.state.job_queue
+        if job_queue.full():
             for p in temp_files:
                 try:
                     os.remove(p)
@@ -2045,16 +2306,31 @@ def create_app() -> FastAPI:
                     pass
             raise HTTPException(status_code=429, detail="Server busy: queue is full")
 
+        rec = store.create()
+
         if temp_files:
             async with app.state.job_temp_files_lock:
                 app.state.job_temp_files[rec.job_id] = temp_files
 
-        async with app.state.pending_lock:
-            app.state.pending_ids.append(rec.job_id)
-            position = len(app.state.pending_ids)
-
-        await q.put((rec.job_id, req))
-        return _wrap_response({"task_id": rec.job_id, "status": "queued", "queue_position": position})
+        payload = {
+            "request": req.model_dump(),
+            "temp_files": temp_files,
+            "env": rec.env,
+            "created_at": rec.created_at,
+        }
+        position = job_queue.put(
+            rec.job_id,
+            payload,
+            priority=req.priority,
+            cost_key=_job_cost_key(req, _get_model_name(app.state._config_path)),
+        )
+        app.state.job_queue_sem.release()
+        return _wrap_response({
+            "task_id": rec.job_id,
+            "status": "queued",
+            "queue_position": position,
+            "eta_seconds": _eta_seconds(rec.job_id),
+        })
 
     @app.post("/query_result")
     async def query_result(request: Request, authorization: Optional[str] = Header(None)):
@@ -2158,17 +2434,41 @@ def create_app() -> FastAPI:
                         "error": rec.error if rec.error else None,
                     }]
 
-                data_list.append({
+                entry = {
                     "task_id": task_id,
                     "result": json.dumps(result_data, ensure_ascii=False),
                     "status": status_int,
                     "progress_text": log_buffer.last_message
-                })
+                }
+                if rec.status == "queued":
+                    entry["queue_position"] = _queue_position(task_id)
+                    entry["eta_seconds"] = _eta_seconds(task_id)
+                data_list.append(entry)
             else:
                 data_list.append({"task_id": task_id, "result": "[]", "status": 0})
 
         return _wrap_response(data_list)
 
+    @app.post("/cancel_task")
+    async def cancel_task(request: Request, authorization: Optional[str] = Header(None)):
+        """Cancel a queued or running job."""
+        content_type = (request.headers.get("content-type") or "").lower()
+        if "json" in content_type:
+            body = await request.json()
+        else:
+            form = await request.form()
+            body = {k: v for k, v in form.items()}
+
+        verify_token_from_request(body, authorization)
+        task_id = str(body.get("task_id") or "").strip()
+        if not task_id:
+            raise HTTPException(status_code=400, detail="task_id is required")
+
+        status = await app.state.cancel_job(task_id, "cancelled by client")
+        if status == "not_found":
+            raise HTTPException(status_code=404, detail="Task not found")
+        return _wrap_response({"task_id": task_id, "status": status})
+
     @app.get("/health")
     async def health_check():
         """Health check endpoint for service status."""
@@ -2188,16 +2488,28 @@ def create_app() -> FastAPI:
             "jobs": job_stats,
             "queue_size": app.state.job_queue.qsize(),
             "queue_maxsize": QUEUE_MAXSIZE,
+            "queue_persistent": app.state.job_queue.persistent,
             "avg_job_seconds": avg_job_seconds,
+            "dit_workers": app.state.dit_pool.queue_depths() if getattr(app.state, "dit_pool", None) else None,
+            "duration_padding": padding_stats.snapshot(),
+            "latent_cache": app.state.handler.latent_cache.snapshot() if getattr(app.state, "handler", None) else None,
+            "code_cache": app.state.handler.code_cache.snapshot() if getattr(app.state, "handler", None) else None,
         })
 
     @app.get("/v1/models")
     async def list_models(_: None = Depends(verify_api_key)):
         """List available DiT models."""
         models = []
-        
+
+        dit_pool = getattr(app.state, "dit_pool", None)
+        if dit_pool is not None:
+            models = [
+                {"name": name, "is_default": name == dit_pool.default_model}
+                for name in dit_pool.models
+            ]
+
         # Primary model (always available if initialized)
-        if getattr(app.state, "_initialized", False):
+        elif getattr(app.state, "_initialized", False):
             primary_model = _get_model_name(app.state._config_path)
             if primary_model:
                 models.append({
@@ -2358,6 +2670,8 @@ def create_app() -> FastAPI:
 
         # Call format_sample
         try:
+            from acestep.inference import format_sample
+
             format_result = format_sample(
                 llm_handler=llm,
                 caption=prompt,
@@ -2391,11 +2705,7 @@ def create_app() -> FastAPI:
         except Exception as e:
             return _wrap_response(None, code=500, error=f"format_sample error: {str(e)}")
 
-    @app.get("/v1/audio")
-    async def get_audio(path: str, request: Request, _: None = Depends(verify_api_key)):
-        """Serve audio file by path."""
-        from fastapi.responses import FileResponse
-
+    def _resolve_audio_path(path: str, request: Request) -> str:
         # Security: Validate path is within allowed directory to prevent path traversal
         resolved_path = os.path.realpath(path)
         allowed_dir = os.path.realpath(request.app.state.temp_audio_dir)
@@ -2403,17 +2713,46 @@ def create_app() -> FastAPI:
             raise HTTPException(status_code=403, detail="Access denied: path outside allowed directory")
         if not os.path.exists(resolved_path):
             raise HTTPException(status_code=404, detail="Audio file not found")
+        return resolved_path
 
-        ext = os.path.splitext(resolved_path)[1].lower()
-        media_types = {
-            ".mp3": "audio/mpeg",
-            ".wav": "audio/wav",
-            ".flac": "audio/flac",
-            ".ogg": "audio/ogg",
-        }
-        media_type = media_types.get(ext, "audio/mpeg")
-
-        return FileResponse(resolved_path, media_type=media_type)
+    @app.get("/v1/audio")
+    async def get_audio(
+        path: str,
+        request: Request,
+        preview: Optional[str] = None,
+        _: None = Depends(verify_api_key),
+    ):
+        """Serve audio file by path, with HTTP Range and optional low-bitrate preview."""
+        resolved_path = _resolve_audio_path(path, request)
+        range_header = request.headers.get("range")
+
+        if preview:
+            if preview not in PREVIEW_FORMATS:
+                raise HTTPException(status_code=400, detail=f"Unsupported preview format: {preview}")
+            cache: TranscodeCache = request.app.state.transcode_cache
+            try:
+                preview_path = await asyncio.to_thread(cache.get_or_create, resolved_path, preview)
+            except RuntimeError as e:
+                print(f"[API Server] Preview transcode failed, serving original: {e}")
+            else:
+                return ranged_file_response(preview_path, range_header, PREVIEW_FORMATS[preview][2])
+
+        return ranged_file_response(resolved_path, range_header, guess_audio_media_type(resolved_path))
+
+    @app.get("/v1/audio/peaks")
+    async def get_audio_peaks(
+        path: str,
+        request: Request,
+        buckets: int = DEFAULT_PEAK_BUCKETS,
+        _: None = Depends(verify_api_key),
+    ):
+        """Return min/max waveform peaks (computed once and stored next to the file)."""
+        resolved_path = _resolve_audio_path(path, request)
+        try:
+            peaks = await asyncio.to_thread(load_or_compute_peaks, resolved_path, buckets)
+        except Exception as e:
+            return _wrap_response(None, code=500, error=f"Peak extraction failed: {e}")
+        return _wrap_response(peaks)
 
     return app
 
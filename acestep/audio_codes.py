@@ -0,0 +1,161 @@
+"""Compact audio code sequences
+
+The 5Hz LM emits semantic audio codes as ``<|audio_code_N|>`` tokens, and those
+strings used to travel through the whole stack: ~19 characters per code (a
+4-minute song is ~1,200 codes), regex-parsed again by the DiT handler and
+serialized as-is into results and stored metadata. ``AudioCodes`` keeps them as
+a uint16 array (the codebook has 64000 entries) and converts only at the edges:
+
+* ``from_string`` / ``to_string``: the ``<|audio_code_N|>`` token form used in
+  LM prompts and outputs (lossless for in-range codes).
+* ``serialize`` / ``deserialize``: ``ac1:`` + base64 of the little-endian uint16
+  array, under 3 bytes per code. ``export_audio_codes`` uses it for results,
+  stored metadata and API payloads unless ``ACESTEP_AUDIO_CODES_FORMAT=tokens``.
+
+``parse_audio_codes`` accepts every form (plus int lists, arrays and tensors),
+so older clients and previously saved files keep working.
+"""
+
+import base64
+import os
+import re
+from typing import Any, List, Union
+
+import numpy as np
+from loguru import logger
+
+MAX_AUDIO_CODE = 63999  # Codebook size is 64000
+COMPACT_PREFIX = "ac1:"
+EXPORT_FORMAT = os.environ.get("ACESTEP_AUDIO_CODES_FORMAT", "compact").strip().lower()
+
+_TOKEN_PREFIX = "<|audio_code_"
+_TOKEN_SUFFIX = "|>"
+_TOKEN = re.compile(r"<\|audio_code_(\d+)\|>")
+
+
+def _clamp(values: np.ndarray) -> np.ndarray:
+    """uint16 codes clamped to the codebook range."""
+    out_of_range = int(np.count_nonzero((values < 0) | (values > MAX_AUDIO_CODE)))
+    if out_of_range:
+        logger.warning(f"[audio_codes] Clamped {out_of_range} audio code value(s) to valid range [0, {MAX_AUDIO_CODE}]")
+        values = np.clip(values, 0, MAX_AUDIO_CODE)
+    return values.astype(np.uint16)
+
+
+class AudioCodes:
+    """A sequence of 5Hz semantic audio codes stored as a uint16 array."""
+
+    __slots__ = ("array",)
+
+    def __init__(self, values: Any = None):
+        if values is None:
+            array = np.empty(0, dtype=np.uint16)
+        else:
+            array = np.asarray(values).reshape(-1)
+            if array.dtype != np.uint16:
+                array = _clamp(array.astype(np.int64, copy=False))
+        self.array = array
+
+    # ------------------------------------------------------------------
+    # Edge conversions
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_string(cls, text: str) -> "AudioCodes":
+        """Codes from ``<|audio_code_N|>`` tokens (other text is ignored) or the ``ac1:`` form."""
+        if not text:
+            return cls()
+        text = text.strip()
+        if text.startswith(COMPACT_PREFIX):
+            return cls.deserialize(text)
+        # Pure token strings (the common case) split without a regex scan
+        if text.startswith(_TOKEN_PREFIX) and text.endswith(_TOKEN_SUFFIX):
+            inner = text[len(_TOKEN_PREFIX):-len(_TOKEN_SUFFIX)].split(_TOKEN_SUFFIX + _TOKEN_PREFIX)
+            if all(part.isdigit() for part in inner):
+                return cls(np.array(inner, dtype=np.int64))
+        return cls(np.array(_TOKEN.findall(text), dtype=np.int64))
+
+    def to_string(self) -> str:
+        """``<|audio_code_N|>`` token form, as the LM reads and writes it."""
+        if not len(self.array):
+            return ""
+        return _TOKEN_PREFIX + (_TOKEN_SUFFIX + _TOKEN_PREFIX).join(map(str, self.array.tolist())) + _TOKEN_SUFFIX
+
+    def serialize(self) -> str:
+        """Compact text form: ``ac1:`` + base64 of the little-endian uint16 codes."""
+        return COMPACT_PREFIX + base64.b64encode(self.array.astype("<u2", copy=False).tobytes()).decode("ascii")
+
+    @classmethod
+    def deserialize(cls, text: str) -> "AudioCodes":
+        payload = base64.b64decode(text[len(COMPACT_PREFIX):])
+        return cls(np.frombuffer(payload, dtype="<u2").astype(np.uint16))
+
+    # ------------------------------------------------------------------
+    # Model side
+    # ------------------------------------------------------------------
+
+    def to_tensor(self, device: Any = "cpu"):
+        """int64 index tensor [T_5Hz] on ``device``."""
+        import torch
+        return torch.from_numpy(self.array.astype(np.int64)).to(device)
+
+    def tolist(self):
+        return self.array.tolist()
+
+    def __len__(self) -> int:
+        return int(self.array.shape[0])
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, AudioCodes):
+            return NotImplemented
+        return np.array_equal(self.array, other.array)
+
+    __hash__ = None
+
+    def __str__(self) -> str:
+        return self.to_string()
+
+    def __repr__(self) -> str:
+        return f"AudioCodes(n={len(self)})"
+
+
+def parse_audio_codes(value: Any) -> AudioCodes:
+    """``AudioCodes`` from any accepted form: AudioCodes, token string, ``ac1:`` string, ints, array, tensor."""
+    if value is None:
+        return AudioCodes()
+    if isinstance(value, AudioCodes):
+        return value
+    if isinstance(value, str):
+        return AudioCodes.from_string(value)
+    if hasattr(value, "detach"):
+        value = value.detach().cpu().numpy()
+    return AudioCodes(value)
+
+
+def has_audio_codes(value: Any) -> bool:
+    """True if ``value`` (one code sequence, or a per-row list of them) holds any codes."""
+    if value is None:
+        return False
+    if isinstance(value, AudioCodes):
+        return bool(value)
+    if isinstance(value, str):
+        return bool(value.strip())
+    if isinstance(value, (list, tuple)):
+        return any(has_audio_codes(v) for v in value)
+    return bool(value)
+
+
+def export_audio_codes(value: Any) -> Union[str, List[str]]:
+    """Text form for results, stored metadata and API payloads (see ``ACESTEP_AUDIO_CODES_FORMAT``)."""
+    if isinstance(value, str) and not value:
+        return ""
+    if isinstance(value, list) and value and isinstance(value[0], (str, AudioCodes, list)):
+        # Per-row code sequences
+        return [export_audio_codes(v) for v in value]
+    codes = parse_audio_codes(value)
+    if not codes:
+        return ""
+    return codes.to_string() if EXPORT_FORMAT == "tokens" else codes.serialize()
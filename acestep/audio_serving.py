@@ -0,0 +1,436 @@
+"""
+Audio serving utilities shared by the web backend and the API server
+
+Provides:
+- HTTP Range (206 Partial Content) responses for audio files
+- On-demand low-bitrate preview transcoding (Opus/MP3) with a
+  content-addressed, size-bounded disk cache
+- Waveform peak data (min/max per pixel bucket) stored next to the audio file
+
+Only lightweight dependencies are imported at module level so that the
+serving path does not pull in torch.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple
+
+from loguru import logger
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+AUDIO_MEDIA_TYPES = {
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".flac": "audio/flac",
+    ".ogg": "audio/ogg",
+    ".opus": "audio/ogg",
+}
+
+# preview name -> (file extension, ffmpeg codec args, media type)
+PREVIEW_FORMATS = {
+    "opus": (".ogg", ["-c:a", "libopus", "-b:a", "64k"], "audio/ogg"),
+    "mp3": (".mp3", ["-c:a", "libmp3lame", "-b:a", "128k"], "audio/mpeg"),
+}
+
+DEFAULT_PEAK_BUCKETS = 1000
+MAX_PEAK_BUCKETS = 20000
+PEAKS_SUFFIX = ".peaks"
+
+_STREAM_CHUNK_SIZE = 64 * 1024
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def guess_audio_media_type(path: str) -> str:
+    """Return the media type for an audio path, defaulting to audio/mpeg."""
+    return AUDIO_MEDIA_TYPES.get(os.path.splitext(path)[1].lower(), "audio/mpeg")
+
+
+# =============================================================================
+# HTTP Range support
+# =============================================================================
+
+class RangeNotSatisfiable(ValueError):
+    """Raised when a Range header cannot be satisfied for the file size."""
+
+
+def parse_range_header(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``Range: bytes=...`` header.
+
+    Args:
+        range_header: Raw header value (may be None)
+        file_size: Size of the resource in bytes
+
+    Returns:
+        Inclusive (start, end) byte offsets, or None if the header is absent,
+        malformed, or requests multiple ranges (the full file is served then).
+
+    Raises:
+        RangeNotSatisfiable: If the range lies entirely outside the file
+    """
+    if not range_header:
+        return None
+    unit, _, spec = range_header.strip().partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_s, sep, end_s = spec.strip().partition("-")
+    if not sep:
+        return None
+    start_s, end_s = start_s.strip(), end_s.strip()
+    if not (start_s or end_s) or not (start_s + end_s).isdigit():
+        return None
+    if start_s == "":
+        # Suffix range: last N bytes
+        suffix = int(end_s)
+        if suffix <= 0:
+            raise RangeNotSatisfiable(range_header)
+        start = max(0, file_size - suffix)
+        end = file_size - 1
+    else:
+        start = int(start_s)
+        end = int(end_s) if end_s else file_size - 1
+    if start >= file_size:
+        raise RangeNotSatisfiable(range_header)
+    if end < start:
+        return None
+    return start, min(end, file_size - 1)
+
+
+def _iter_file_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(_STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(
+    path: str,
+    range_header: Optional[str] = None,
+    media_type: Optional[str] = None,
+    filename: Optional[str] = None,
+) -> Response:
+    """
+    Serve a file honouring an optional HTTP Range header.
+
+    Args:
+        path: File to serve
+        range_header: Value of the request's ``Range`` header
+        media_type: Response media type (guessed from extension if None)
+        filename: Optional download filename for Content-Disposition
+
+    Returns:
+        A 200 FileResponse, a 206 StreamingResponse, or a 416 Response
+    """
+    media_type = media_type or guess_audio_media_type(path)
+    file_size = os.path.getsize(path)
+    try:
+        byte_range = parse_range_header(range_header, file_size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{file_size}"})
+
+    if byte_range is None:
+        response = FileResponse(path, media_type=media_type, filename=filename)
+        response.headers["Accept-Ranges"] = "bytes"
+        return response
+
+    start, end = byte_range
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Range": f"bytes {start}-{end}/{file_size}",
+        "Content-Length": str(end - start + 1),
+    }
+    if filename:
+        headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    return StreamingResponse(
+        _iter_file_range(path, start, end),
+        status_code=206,
+        media_type=media_type,
+        headers=headers,
+    )
+
+
+# =============================================================================
+# Content hashing
+# =============================================================================
+
+_content_hash_memo: Dict[Tuple[str, int, int], str] = {}
+_content_hash_lock = threading.Lock()
+
+
+def file_content_hash(path: str) -> str:
+    """
+    SHA-256 of a file's content, memoized on (path, size, mtime).
+
+    Generated audio files are immutable once written, so the memo avoids
+    re-hashing a 4-minute FLAC on every preview request.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+    with _content_hash_lock:
+        cached = _content_hash_memo.get(memo_key)
+    if cached is not None:
+        return cached
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _content_hash_lock:
+        _content_hash_memo[memo_key] = digest
+    return digest
+
+
+# =============================================================================
+# Transcode cache
+# =============================================================================
+
+class TranscodeCache:
+    """
+    Content-addressed, size-bounded cache of low-bitrate preview transcodes.
+
+    Entries are keyed by the SHA-256 of the source audio plus the preview
+    format, so identical audio stored under different ids shares one entry.
+    The least recently used entries are evicted once the cache exceeds
+    ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def is_available() -> bool:
+        """True if an ffmpeg binary is available for transcoding."""
+        return shutil.which("ffmpeg") is not None
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def get_or_create(self, src_path: str, preview_format: str) -> str:
+        """
+        Return the path of a cached preview, transcoding on a miss.
+
+        Args:
+            src_path: Source audio file
+            preview_format: Key of PREVIEW_FORMATS ('opus' or 'mp3')
+
+        Returns:
+            Path to the preview file inside the cache directory
+
+        Raises:
+            ValueError: Unknown preview format
+            RuntimeError: ffmpeg is missing or transcoding failed
+        """
+        if preview_format not in PREVIEW_FORMATS:
+            raise ValueError(f"Unsupported preview format: {preview_format}")
+        ext, codec_args, _ = PREVIEW_FORMATS[preview_format]
+        key = hashlib.sha256(
+            f"{file_content_hash(src_path)}:{preview_format}:{' '.join(codec_args)}".encode()
+        ).hexdigest()
+        dest = os.path.join(self.cache_dir, f"{key}{ext}")
+
+        with self._key_lock(key):
+            if os.path.exists(dest):
+                try:
+                    os.utime(dest)  # LRU touch
+                except OSError:
+                    pass
+                return dest
+            self._transcode(src_path, dest, codec_args)
+
+        self._evict()
+        return dest
+
+    def _transcode(self, src_path: str, dest: str, codec_args: list) -> None:
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg not found; preview transcoding unavailable")
+        tmp = f"{dest}.tmp{os.path.splitext(dest)[1]}"
+        cmd = [ffmpeg, "-nostdin", "-v", "error", "-y", "-i", src_path, "-vn", *codec_args, tmp]
+        proc = subprocess.run(cmd, capture_output=True)
+        if proc.returncode != 0:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            err = proc.stderr.decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"ffmpeg transcode failed: {err}")
+        os.replace(tmp, dest)
+        logger.debug(f"[TranscodeCache] Transcoded {src_path} -> {dest}")
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if ".tmp" in name:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"[TranscodeCache] Evicted {removed} preview(s), cache now {total / 1e6:.1f} MB")
+
+
+# =============================================================================
+# Waveform peaks
+# =============================================================================
+
+def peaks_sidecar_path(audio_path: str, num_buckets: int = DEFAULT_PEAK_BUCKETS) -> str:
+    """Path of the peaks file stored next to ``audio_path``."""
+    return f"{audio_path}{PEAKS_SUFFIX}-{num_buckets}.json"
+
+
+def compute_waveform_peaks(audio_path: str, num_buckets: int = DEFAULT_PEAK_BUCKETS) -> dict:
+    """
+    Compute min/max peaks per pixel bucket, streaming the file block by block.
+
+    Channels are folded together (min of mins, max of maxes) so the result is
+    a single WaveSurfer-compatible peak track.
+
+    Args:
+        audio_path: Audio file readable by soundfile
+        num_buckets: Number of pixel buckets
+
+    Returns:
+        Dict with ``sample_rate``, ``duration``, ``samples_per_pixel``,
+        ``length`` (bucket count) and interleaved ``data`` [min0, max0, ...]
+    """
+    import numpy as np
+    import soundfile as sf
+
+    num_buckets = max(1, min(int(num_buckets), MAX_PEAK_BUCKETS))
+    with sf.SoundFile(audio_path) as f:
+        frames = f.frames
+        sample_rate = f.samplerate
+        spp = max(1, -(-frames // num_buckets))  # ceil division
+        length = max(1, -(-frames // spp))
+        mins = np.zeros(length, dtype=np.float32)
+        maxs = np.zeros(length, dtype=np.float32)
+        block_frames = spp * max(1, (1 << 20) // spp)
+        bucket = 0
+        for block in f.blocks(blocksize=block_frames, dtype="float32", always_2d=True):
+            n = block.shape[0]
+            full = n // spp
+            if full:
+                view = block[: full * spp].reshape(full, spp, -1)
+                mins[bucket:bucket + full] = view.min(axis=(1, 2))
+                maxs[bucket:bucket + full] = view.max(axis=(1, 2))
+                bucket += full
+            if n % spp:
+                tail = block[full * spp:]
+                mins[bucket] = tail.min()
+                maxs[bucket] = tail.max()
+                bucket += 1
+
+    data = np.empty(length * 2, dtype=np.float32)
+    data[0::2] = mins
+    data[1::2] = maxs
+    return {
+        "version": 1,
+        "sample_rate": sample_rate,
+        "duration": frames / sample_rate if sample_rate else 0.0,
+        "samples_per_pixel": spp,
+        "length": length,
+        "data": [round(float(v), 4) for v in data],
+    }
+
+
+def load_or_compute_peaks(audio_path: str, num_buckets: int = DEFAULT_PEAK_BUCKETS) -> dict:
+    """
+    Return peaks for ``audio_path``, reading the sidecar if it is current.
+
+    The sidecar records the source size/mtime and is recomputed when either
+    changes.
+    """
+    num_buckets = max(1, min(int(num_buckets), MAX_PEAK_BUCKETS))
+    st = os.stat(audio_path)
+    source_sig = [st.st_size, st.st_mtime_ns]
+    sidecar = peaks_sidecar_path(audio_path, num_buckets)
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("source") == source_sig:
+            return cached
+    except (OSError, ValueError):
+        pass
+
+    peaks = compute_waveform_peaks(audio_path, num_buckets)
+    peaks["source"] = source_sig
+    tmp = f"{sidecar}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(peaks, f, separators=(",", ":"))
+        os.replace(tmp, sidecar)
+    except OSError as e:
+        logger.warning(f"[audio_serving] Could not write peaks sidecar {sidecar}: {e}")
+    return peaks
+
+
+_peaks_executor: Optional[ThreadPoolExecutor] = None
+_peaks_executor_lock = threading.Lock()
+
+
+def precompute_peaks_async(audio_path: str, num_buckets: int = DEFAULT_PEAK_BUCKETS) -> None:
+    """Compute the peaks sidecar in a background thread (best effort)."""
+    global _peaks_executor
+    with _peaks_executor_lock:
+        if _peaks_executor is None:
+            _peaks_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="peaks")
+
+    def _run():
+        try:
+            load_or_compute_peaks(audio_path, num_buckets)
+        except Exception as e:
+            logger.debug(f"[audio_serving] Peak precompute skipped for {audio_path}: {e}")
+
+    _peaks_executor.submit(_run)
+
+
+def remove_peaks_sidecars(audio_path: str) -> None:
+    """Delete all peaks sidecars belonging to ``audio_path``."""
+    directory = os.path.dirname(audio_path) or "."
+    prefix = os.path.basename(audio_path) + PEAKS_SUFFIX
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(prefix):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
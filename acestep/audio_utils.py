@@ -4,12 +4,15 @@ Audio saving and transcoding utility module
 Independent audio file operations outside of handler, supporting:
 - Save audio tensor/numpy to files (default FLAC format, fast)
 - Format conversion (FLAC/WAV/MP3)
-- Batch processing
+- Batch processing, encoded in parallel by a shared writer pool
 """
 
+import io
 import os
 import hashlib
 import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from typing import Union, Optional, List, Tuple
 import torch
@@ -17,6 +20,9 @@ import numpy as np
 import torchaudio
 from loguru import logger
 
+# Threads encoding and writing audio files (see AudioWriterPool)
+AUDIO_WRITERS = int(os.environ.get("ACESTEP_AUDIO_WRITERS", "4"))
+
 
 class AudioSaver:
     """Audio saving and transcoding utility class"""
@@ -56,15 +62,7 @@ class AudioSaver:
         Returns:
             Actual saved file path
         """
-        format = (format or self.default_format).lower()
-        if format not in ["flac", "wav", "mp3"]:
-            logger.warning(f"Unsupported format {format}, using {self.default_format}")
-            format = self.default_format
-        
-        # Ensure output path has correct extension
-        output_path = Path(output_path)
-        if output_path.suffix.lower() not in ['.flac', '.wav', '.mp3']:
-            output_path = output_path.with_suffix(f'.{format}')
+        output_path, format = self.resolve_output(output_path, format)
         
         # Convert to torch tensor
         if isinstance(audio_data, np.ndarray):
@@ -87,71 +85,83 @@ class AudioSaver:
         # Ensure memory is contiguous
         audio_tensor = audio_tensor.contiguous()
         
-        # Select backend and save
+        # Encode and tag in memory, then write the file once
+        buffer = self._encode(audio_tensor, sample_rate, format)
+        if metadata:
+            self._embed_metadata(buffer, metadata, ext=f".{format}")
+        tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
         try:
-            if format == "mp3":
-                # MP3 uses ffmpeg backend
-                torchaudio.save(
-                    str(output_path),
-                    audio_tensor,
-                    sample_rate,
-                    channels_first=True,
-                    backend='ffmpeg',
-                )
-            elif format in ["flac", "wav"]:
-                # FLAC and WAV use soundfile backend (fastest)
-                torchaudio.save(
-                    str(output_path),
-                    audio_tensor,
-                    sample_rate,
-                    channels_first=True,
-                    backend='soundfile',
-                )
-            else:
-                # Other formats use default backend
-                torchaudio.save(
-                    str(output_path),
-                    audio_tensor,
-                    sample_rate,
-                    channels_first=True,
-                )
-            
-            logger.debug(f"[AudioSaver] Saved audio to {output_path} ({format}, {sample_rate}Hz)")
-
-            # Embed metadata if provided
-            if metadata and format in ["flac", "wav"]:
-                self._embed_metadata(str(output_path), metadata)
-
-            return str(output_path)
+            with open(tmp_path, "wb") as f:
+                f.write(buffer.getbuffer())
+            os.replace(tmp_path, output_path)
+        except Exception as e:
+            logger.error(f"[AudioSaver] Failed to save audio: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        logger.debug(f"[AudioSaver] Saved audio to {output_path} ({format}, {sample_rate}Hz)")
+        return str(output_path)
 
+    def resolve_output(self, output_path: Union[str, Path], format: Optional[str] = None) -> Tuple[Path, str]:
+        """
+        Format and file path ``save_audio`` writes for these arguments
+
+        Returns:
+            (output path with a supported extension, format)
+        """
+        format = (format or self.default_format).lower()
+        if format not in ["flac", "wav", "mp3"]:
+            logger.warning(f"Unsupported format {format}, using {self.default_format}")
+            format = self.default_format
+        
+        # Ensure output path has correct extension
+        output_path = Path(output_path)
+        if output_path.suffix.lower() not in ['.flac', '.wav', '.mp3']:
+            output_path = output_path.with_suffix(f'.{format}')
+        return output_path, format
+
+    def _encode(self, audio_tensor: torch.Tensor, sample_rate: int, format: str) -> io.BytesIO:
+        """Encode [channels, samples] audio into an in-memory file of ``format``."""
+        buffer = io.BytesIO()
+        try:
+            # MP3 uses ffmpeg backend, FLAC and WAV use soundfile backend (fastest)
+            torchaudio.save(
+                buffer,
+                audio_tensor,
+                sample_rate,
+                channels_first=True,
+                format=format,
+                backend='ffmpeg' if format == "mp3" else 'soundfile',
+            )
         except Exception as e:
             try:
                 import soundfile as sf
+                buffer = io.BytesIO()
                 audio_np = audio_tensor.transpose(0, 1).numpy()  # -> [samples, channels]
-                sf.write(str(output_path), audio_np, sample_rate, format=format.upper())
-                logger.debug(f"[AudioSaver] Fallback soundfile Saved audio to {output_path} ({format}, {sample_rate}Hz)")
-
-                # Embed metadata if provided
-                if metadata and format in ["flac", "wav"]:
-                    self._embed_metadata(str(output_path), metadata)
-
-                return str(output_path)
+                sf.write(buffer, audio_np, sample_rate, format=format.upper())
+                logger.debug(f"[AudioSaver] Fallback soundfile encoded {format} audio ({e})")
             except Exception as e2:
                 logger.error(f"[AudioSaver] Failed to save audio: {e2}")
                 raise
+        buffer.seek(0)
+        return buffer
 
-    def _embed_metadata(self, filepath: str, metadata: dict) -> bool:
+    def _embed_metadata(self, filepath: Union[str, io.BytesIO], metadata: dict, ext: Optional[str] = None) -> bool:
         """Embed generation metadata into audio file.
 
         Args:
-            filepath: Path to the audio file
+            filepath: Path to the audio file, or the encoded file in memory
             metadata: Dictionary of generation parameters
+            ext: File extension, required for in-memory files
 
         Returns:
             True if successful, False otherwise
         """
         try:
-            ext = Path(filepath).suffix.lower()
+            ext = (ext or Path(filepath).suffix).lower()
+            if not isinstance(filepath, str):
+                filepath.seek(0)
 
             if ext == ".flac":
                 from mutagen.flac import FLAC
@@ -166,8 +176,8 @@ class AudioSaver:
                 if "keyscale" in metadata:
                     audio["KEY"] = metadata["keyscale"]
                 audio["SOFTWARE"] = "ACE-Step 1.5"
-                audio.save()
-                logger.debug(f"[AudioSaver] Embedded metadata in {filepath}")
+                audio.save(filepath)
+                logger.debug(f"[AudioSaver] Embedded metadata in {filepath if isinstance(filepath, str) else ext + ' audio'}")
                 return True
 
             elif ext == ".wav":
@@ -177,8 +187,8 @@ class AudioSaver:
                 if audio.tags is None:
                     audio.add_tags()
                 audio.tags.add(TXXX(encoding=3, desc="ACESTEP_JSON", text=json.dumps(metadata)))
-                audio.save()
-                logger.debug(f"[AudioSaver] Embedded metadata in {filepath}")
+                audio.save(filepath)
+                logger.debug(f"[AudioSaver] Embedded metadata in {filepath if isinstance(filepath, str) else ext + ' audio'}")
                 return True
 
             elif ext == ".mp3":
@@ -195,8 +205,8 @@ class AudioSaver:
                     audio.tags.add(COMM(encoding=3, lang='eng', desc='', text=metadata["caption"]))
                 if "bpm" in metadata and metadata["bpm"]:
                     audio.tags.add(TBPM(encoding=3, text=str(metadata["bpm"])))
-                audio.save()
-                logger.debug(f"[AudioSaver] Embedded metadata in {filepath}")
+                audio.save(filepath)
+                logger.debug(f"[AudioSaver] Embedded metadata in {filepath if isinstance(filepath, str) else ext + ' audio'}")
                 return True
 
             return False
@@ -284,19 +294,69 @@ class AudioSaver:
         else:
             audio_list = [audio_batch]
         
-        saved_paths = []
-        for i, audio in enumerate(audio_list):
-            output_path = output_dir / f"{file_prefix}_{i:04d}"
-            saved_path = self.save_audio(
+        # Encode in parallel on the shared writer pool
+        pool = get_audio_writer_pool()
+        futures = [
+            pool.submit(
+                self,
                 audio,
-                output_path,
+                output_dir / f"{file_prefix}_{i:04d}",
                 sample_rate=sample_rate,
                 format=format,
                 channels_first=channels_first
             )
-            saved_paths.append(saved_path)
-        
-        return saved_paths
+            for i, audio in enumerate(audio_list)
+        ]
+        return [future.result() for future in futures]
+
+
+class AudioWriterPool:
+    """
+    Bounded thread pool that encodes and writes audio files off the calling thread
+
+    ``submit`` returns a ``Future`` of the saved path. At most ``max_pending``
+    files are queued or being written; further submits block until one finishes,
+    so a fast producer cannot pile up decoded audio in memory. Encoding runs in
+    libsndfile/ffmpeg, which release the GIL.
+    """
+
+    def __init__(self, max_workers: int = AUDIO_WRITERS, max_pending: Optional[int] = None):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="audio-writer")
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * self.max_workers)
+
+    def submit(
+        self,
+        saver: AudioSaver,
+        audio_data: Union[torch.Tensor, np.ndarray],
+        output_path: Union[str, Path],
+        **kwargs,
+    ) -> Future:
+        """Schedule ``saver.save_audio(audio_data, output_path, **kwargs)``."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(saver.save_audio, audio_data, output_path, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+_writer_pool: Optional[AudioWriterPool] = None
+_writer_pool_lock = threading.Lock()
+
+
+def get_audio_writer_pool() -> AudioWriterPool:
+    """Process-wide ``AudioWriterPool`` with ``ACESTEP_AUDIO_WRITERS`` threads, created on first use."""
+    global _writer_pool
+    with _writer_pool_lock:
+        if _writer_pool is None:
+            _writer_pool = AudioWriterPool()
+        return _writer_pool
 
 
 def get_audio_file_hash(audio_file) -> str:
@@ -0,0 +1,100 @@
+"""Cooperative cancellation for generation jobs
+
+A ``CancellationToken`` is bound to the thread running a job with
+``cancellation_scope``; the hot loops (diffusion steps, LM decode steps, VAE
+decode chunks) call ``check_cancelled()`` once per iteration, which raises
+``GenerationCancelled`` when the token was cancelled or its deadline passed.
+
+``GenerationCancelled`` derives from ``BaseException`` (like
+``asyncio.CancelledError``) so the many ``except Exception`` error handlers
+along the generation path let it through to the job runner.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+
+class GenerationCancelled(BaseException):
+    """Raised inside a generation loop when its job was cancelled or timed out."""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    Thread-safe cancel flag with an optional wall-clock deadline.
+
+    Args:
+        deadline: Absolute ``time.time()`` after which the job counts as
+            cancelled with reason ``"deadline exceeded"``.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self._event = threading.Event()
+        self._reason: Optional[str] = None
+
+    @classmethod
+    def with_timeout(cls, seconds: Optional[float], start: Optional[float] = None) -> "CancellationToken":
+        """Token expiring ``seconds`` after ``start`` (default now); no deadline if seconds is falsy."""
+        if not seconds or seconds <= 0:
+            return cls()
+        return cls(deadline=(start if start is not None else time.time()) + seconds)
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self._reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.cancel("deadline exceeded")
+            return True
+        return False
+
+    @property
+    def reason(self) -> Optional[str]:
+        return self._reason if self.cancelled else None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the deadline (None when there is none)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise GenerationCancelled(self._reason or "cancelled")
+
+
+_current_token: ContextVar[Optional[CancellationToken]] = ContextVar("acestep_cancel_token", default=None)
+
+
+def current_token() -> Optional[CancellationToken]:
+    """Token bound to the running job, if any."""
+    return _current_token.get()
+
+
+@contextmanager
+def cancellation_scope(token: Optional[CancellationToken]) -> Iterator[Optional[CancellationToken]]:
+    """Bind ``token`` to the current thread/context for the duration of the block."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def check_cancelled() -> None:
+    """Raise ``GenerationCancelled`` if the current job should stop. Cheap when no token is bound."""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
@@ -0,0 +1,145 @@
+"""Disk cache of audio codes produced from source audio
+
+``convert_src_audio_to_codes`` runs a VAE encode plus the DiT tokenizer on the
+uploaded audio each time cover/repaint hints are requested, and deployments
+tend to reuse the same few reference tracks. The resulting codes are small
+(~3 bytes per 5Hz code in the ``ac1:`` form), so they are kept on disk:
+
+* key: hash of the decoded 48kHz stereo waveform (any trimming done before
+  the conversion changes it) plus the VAE identity and dtype, the DiT variant
+  and its weights fingerprint (the tokenizer lives in the DiT),
+* one ``<key>.ac1`` file per entry under ``ACESTEP_CODE_CACHE_DIR``,
+* LRU by file mtime, bounded by ``ACESTEP_CODE_CACHE_MB`` (``0`` disables it).
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from loguru import logger
+
+from acestep.audio_codes import AudioCodes
+
+CODE_CACHE_MB = float(os.environ.get("ACESTEP_CODE_CACHE_MB", "64"))
+_SUFFIX = ".ac1"
+
+
+def default_cache_dir() -> str:
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.environ.get("ACESTEP_CODE_CACHE_DIR", os.path.join(project_root, ".cache", "acestep", "audio_codes"))
+
+
+class AudioCodeCache:
+    """Size-bounded LRU of ``AudioCodes`` in a directory, one compact file per key."""
+
+    def __init__(self, cache_dir: Optional[str] = None, budget_mb: float = CODE_CACHE_MB):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.budget = int(budget_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None  # scanned lazily on first write
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    def _entries(self):
+        """(mtime, size, path) of every cache file, oldest first."""
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(_SUFFIX):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+        except FileNotFoundError:
+            pass
+        entries.sort()
+        return entries
+
+    def get(self, key: str) -> Optional[AudioCodes]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="ascii") as f:
+                codes = AudioCodes.deserialize(f.read())
+            os.utime(path)  # refresh LRU position
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"[code_cache] Dropping unreadable entry {path}: {e}")
+            with self._lock:
+                self.misses += 1
+            self._remove(path)
+            return None
+        with self._lock:
+            self.hits += 1
+        return codes
+
+    def put(self, key: str, codes: AudioCodes) -> None:
+        if not self.enabled or not codes:
+            return
+        data = codes.serialize()
+        if len(data) > self.budget:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="ascii") as f:
+                f.write(data)
+            with self._lock:
+                if self._bytes is None:
+                    self._bytes = sum(size for _, size, _ in self._entries())
+                elif os.path.exists(path):
+                    self._bytes -= os.path.getsize(path)
+                os.replace(tmp, path)
+                self._bytes += len(data)
+                if self._bytes > self.budget:
+                    self._evict()
+        except Exception as e:
+            logger.warning(f"[code_cache] Could not cache audio codes: {e}")
+
+    def _evict(self) -> None:
+        """Drop least recently used files until under budget. Caller holds the lock."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.budget:
+                break
+            if self._remove(path):
+                total -= size
+        self._bytes = total
+
+    @staticmethod
+    def _remove(path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self) -> None:
+        with self._lock:
+            for _, _, path in self._entries():
+                self._remove(path)
+            self._bytes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._entries()
+            return {
+                "entries": len(entries),
+                "mb": round(sum(size for _, size, _ in entries) / 1024**2, 3),
+                "budget_mb": round(self.budget / 1024**2, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+                "dir": self.cache_dir,
+            }
@@ -0,0 +1,217 @@
+"""Shape-bucketed compiled DiT decoder step
+
+``torch.compile`` on the whole model recompiles and graph-breaks inside the
+diffusion loop (DynamicCache objects, varying latent/lyric lengths, Python
+scalars). ``CompiledDiTStep`` instead compiles one stateless decoder step:
+
+* No KV cache object: the cross-attention keys/values are recomputed from the
+  (constant) encoder states each step, which keeps every input a plain tensor
+  of static shape.
+* Batch size is padded to a power of two (rows are independent) and the
+  encoder sequence is padded to a multiple of ``ACESTEP_COMPILE_ENCODER_BUCKET``
+  with masked positions, so mixed requests reuse the same graphs. Latent
+  length is used as-is; duration bucketing upstream keeps it on a few values.
+* On CUDA the step runs with ``mode="reduce-overhead"`` (CUDA graph replay),
+  which removes most kernel-launch overhead from short turbo schedules.
+* Compile artifacts and the shapes seen so far are persisted per variant, so
+  a restart or a model swap warms up from disk instead of recompiling.
+"""
+
+import json
+import os
+import threading
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+import torch
+from loguru import logger
+
+ENCODER_BUCKET = int(os.environ.get("ACESTEP_COMPILE_ENCODER_BUCKET", "64"))
+
+
+def default_cache_dir() -> str:
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.environ.get("ACESTEP_COMPILE_CACHE_DIR", os.path.join(project_root, ".cache", "acestep", "compile"))
+
+
+def bucket_batch(n: int) -> int:
+    """Next power of two >= n."""
+    return 1 << max(0, (n - 1).bit_length())
+
+
+def bucket_encoder_length(n: int, bucket: int = ENCODER_BUCKET) -> int:
+    return ((n + bucket - 1) // bucket) * bucket
+
+
+def _pad_rows(t: torch.Tensor, rows: int) -> torch.Tensor:
+    if t.shape[0] == rows:
+        return t
+    return torch.cat([t, t[-1:].expand(rows - t.shape[0], *t.shape[1:])], dim=0)
+
+
+def _pad_seq(t: torch.Tensor, length: int) -> torch.Tensor:
+    if t.shape[1] == length:
+        return t
+    pad = t.new_zeros((t.shape[0], length - t.shape[1], *t.shape[2:]))
+    return torch.cat([t, pad], dim=1)
+
+
+class CompiledDiTStep:
+    """
+    Callable ``step(x, t, attention_mask, encoder_hidden_states,
+    encoder_attention_mask, context_latents) -> velocity`` for one variant.
+
+    Args:
+        model: DiT model (held by weak reference; the residency manager owns it).
+        variant: Variant name, used to key the on-disk artifacts.
+        cache_dir: Root directory for persisted artifacts.
+    """
+
+    def __init__(self, model: torch.nn.Module, variant: str, cache_dir: Optional[str] = None):
+        self._model_ref = weakref.ref(model)
+        self.variant = variant
+        self.cache_dir = os.path.join(cache_dir or default_cache_dir(), variant)
+        device = next(model.parameters()).device
+        self.use_cuda_graphs = device.type == "cuda"
+        self._shapes: Dict[str, List[Tuple[List[int], str]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "new_buckets": 0, "padded_rows": 0}
+        self._pending_save = False
+
+        import torch._dynamo
+        # One graph per (batch bucket, latent length, encoder bucket)
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 64)
+        self._load_artifacts()
+        self._fn = torch.compile(
+            self._step,
+            mode="reduce-overhead" if self.use_cuda_graphs else "default",
+            dynamic=False,
+        )
+
+    @property
+    def model(self) -> Optional[torch.nn.Module]:
+        return self._model_ref()
+
+    @staticmethod
+    def _step(decoder, x, t, attention_mask, encoder_hidden_states, encoder_attention_mask, context_latents):
+        return decoder(
+            hidden_states=x,
+            timestep=t,
+            timestep_r=t,
+            attention_mask=attention_mask,
+            encoder_hidden_states=encoder_hidden_states,
+            encoder_attention_mask=encoder_attention_mask,
+            context_latents=context_latents,
+            use_cache=False,
+            past_key_values=None,
+        )[0]
+
+    def __call__(self, x, t, attention_mask, encoder_hidden_states, encoder_attention_mask, context_latents):
+        rows = x.shape[0]
+        padded_rows = bucket_batch(rows)
+        enc_len = bucket_encoder_length(encoder_hidden_states.shape[1])
+        inputs = [
+            _pad_rows(x, padded_rows),
+            _pad_rows(t, padded_rows),
+            _pad_rows(attention_mask, padded_rows),
+            _pad_seq(_pad_rows(encoder_hidden_states, padded_rows), enc_len),
+            _pad_seq(_pad_rows(encoder_attention_mask, padded_rows), enc_len),
+            _pad_rows(context_latents, padded_rows),
+        ]
+        self.stats["calls"] += 1
+        self.stats["padded_rows"] += padded_rows - rows
+        self._record(inputs)
+        if self.use_cuda_graphs:
+            torch.compiler.cudagraph_mark_step_begin()
+        out = self._fn(self.model.decoder, *inputs)
+        # CUDA-graph outputs live in a static pool that the next replay overwrites
+        return out[:rows].clone()
+
+    # ------------------------------------------------------------------
+    # Shape manifest and artifact persistence
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _key(inputs) -> str:
+        return "|".join("x".join(str(d) for d in t.shape) for t in inputs)
+
+    def _record(self, inputs) -> None:
+        key = self._key(inputs)
+        if key in self._shapes:
+            return
+        with self._lock:
+            self._shapes[key] = [(list(t.shape), str(t.dtype).replace("torch.", "")) for t in inputs]
+            self.stats["new_buckets"] += 1
+        logger.info(f"[compiled_step] {self.variant}: compiling bucket {key}")
+        self._pending_save = True
+
+    def _artifact_path(self) -> str:
+        device_name = torch.cuda.get_device_name().replace(" ", "_") if self.use_cuda_graphs else "cpu"
+        return os.path.join(self.cache_dir, f"torch-{torch.__version__}-{device_name}.bin")
+
+    def _load_artifacts(self) -> None:
+        manifest = os.path.join(self.cache_dir, "shapes.json")
+        if os.path.exists(manifest):
+            try:
+                with open(manifest, "r", encoding="utf-8") as f:
+                    self._shapes = {k: [(s, d) for s, d in v] for k, v in json.load(f).items()}
+            except (OSError, ValueError) as e:
+                logger.warning(f"[compiled_step] Ignoring unreadable shape manifest {manifest}: {e}")
+        path = self._artifact_path()
+        load = getattr(torch.compiler, "load_cache_artifacts", None)
+        if load is not None and os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    load(f.read())
+                logger.info(f"[compiled_step] Loaded compile artifacts for {self.variant} from {path}")
+            except Exception as e:
+                logger.warning(f"[compiled_step] Could not load compile artifacts {path}: {e}")
+
+    def save(self) -> None:
+        """Persist the shape manifest and (torch >= 2.7) the compile artifacts."""
+        if not self._pending_save:
+            return
+        self._pending_save = False
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock:
+            shapes = dict(self._shapes)
+        with open(os.path.join(self.cache_dir, "shapes.json"), "w", encoding="utf-8") as f:
+            json.dump(shapes, f)
+        save = getattr(torch.compiler, "save_cache_artifacts", None)
+        if save is None:
+            return
+        try:
+            artifacts = save()
+            if artifacts is not None:
+                tmp = self._artifact_path() + ".tmp"
+                with open(tmp, "wb") as f:
+                    f.write(artifacts[0])
+                os.replace(tmp, self._artifact_path())
+        except Exception as e:
+            logger.warning(f"[compiled_step] Could not save compile artifacts: {e}")
+
+    def precompile(self) -> int:
+        """Compile (and capture) every bucket in the manifest with dummy inputs. Returns the count."""
+        model = self.model
+        if model is None:
+            return 0
+        device = next(model.parameters()).device
+        done = 0
+        with torch.no_grad():
+            for key, specs in list(self._shapes.items()):
+                inputs = [torch.zeros(shape, dtype=getattr(torch, dtype), device=device) for shape, dtype in specs]
+                # All-zero masks can produce NaNs in softmax; valid masks are ones
+                inputs[2].fill_(1)
+                inputs[4].fill_(1)
+                try:
+                    if self.use_cuda_graphs:
+                        torch.compiler.cudagraph_mark_step_begin()
+                    self._fn(model.decoder, *inputs)
+                    done += 1
+                except Exception as e:
+                    logger.warning(f"[compiled_step] Precompile of {key} failed: {e}")
+        logger.info(f"[compiled_step] {self.variant}: precompiled {done}/{len(self._shapes)} buckets")
+        return done
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"variant": self.variant, "buckets": len(self._shapes), "cuda_graphs": self.use_cuda_graphs, **self.stats}
@@ -24,12 +24,14 @@ import os
 import time
 import importlib.util
 from dataclasses import dataclass
-from typing import Optional, List, Union, Dict, Any, Tuple
+from typing import Optional, List, Union, Dict, Any, Tuple, Callable
 
 import torch
 from loguru import logger
 from transformers.cache_utils import DynamicCache, EncoderDecoderCache
 
+from acestep.cancellation import check_cancelled
+
 
 # ── Lazy import for APG/ADG guidance (only needed for base/sft) ────────
 
@@ -336,6 +338,18 @@ def generate_audio_core(
     t_start: float = 1.0,
     # Step checkpointing (Phase 4)
     checkpoint_step: Optional[int] = None,
+    # Compiled decoder step (acestep.compiled_step.CompiledDiTStep); None = eager decoder
+    decoder_step: Optional[Any] = None,
+    # Latent self-attention mask [B, T] (duration-bucket padding = 0); None = all ones
+    attention_mask: Optional[torch.Tensor] = None,
+    # Best-of-N: at prune_step, prune_fn(x0_estimate, encoder_hidden_states,
+    # encoder_attention_mask, context_latents, rows) returns the positions to keep
+    prune_step: Optional[int] = None,
+    prune_fn: Optional[Callable[..., List[int]]] = None,
+    # Adaptive steps: a row is finished with its x0 estimate once that estimate
+    # changes by less than adaptive_tol (relative L2) between steps
+    adaptive_tol: Optional[float] = None,
+    adaptive_min_steps: Optional[int] = None,
     **kwargs,
 ) -> Dict[str, Any]:
     """Unified diffusion loop replacing per-model generate_audio() methods.
@@ -344,9 +358,20 @@ def generate_audio_core(
     ``variant`` to select model-specific behavior and ``init_latents``/``t_start``
     for pipeline multi-stage denoising.
 
+    With ``prune_fn``, the batch is ranked once on the x0 estimate of step
+    ``prune_step`` and only the kept rows are denoised further.
+
+    With ``adaptive_tol``, from step ``adaptive_min_steps`` (default: half the
+    schedule, and never before ``prune_step``) on, a row whose x0 estimate
+    moved by less than ``adaptive_tol`` relative to the previous step's is
+    finished with it, as the final step would, and leaves the batch. Not
+    combined with ``checkpoint_step``.
+
     Returns:
         Dict with "target_latents" and "time_costs" (same structure as
-        the original model.generate_audio()).
+        the original model.generate_audio()), plus "kept_rows" (original
+        batch indices of the returned rows, None if nothing was pruned) and
+        "steps_run" (decoder steps each returned row took).
     """
     config = MODEL_VARIANT_CONFIGS.get(variant)
     if config is None:
@@ -381,10 +406,11 @@ def generate_audio_core(
         infer_steps = config.default_steps
 
     # ── Attention mask (all variants create this identically) ─────────
-    attention_mask = torch.ones(
-        src_latents.shape[0], src_latents.shape[1],
-        device=src_latents.device, dtype=src_latents.dtype,
-    )
+    if attention_mask is None:
+        attention_mask = torch.ones(
+            src_latents.shape[0], src_latents.shape[1],
+            device=src_latents.device, dtype=src_latents.dtype,
+        )
 
     # ── Timekeeping ───────────────────────────────────────────────────
     time_costs = {}
@@ -449,6 +475,8 @@ def generate_audio_core(
     device = context_latents.device
     dtype = context_latents.dtype
     bsz = context_latents.shape[0]
+    rows = list(range(bsz))
+    pruned = False
 
     schedule = TimestepScheduler.compute(
         config, infer_steps, shift, timesteps, device, dtype,
@@ -462,9 +490,27 @@ def generate_audio_core(
     num_steps = len(schedule) - 1  # exclude terminal value
     cover_steps = int(num_steps * audio_cover_strength)
 
+    adaptive = adaptive_tol is not None and adaptive_tol > 0
+    if adaptive and checkpoint_step is not None:
+        logger.warning("[generate_audio_core] adaptive_tol is ignored with checkpoint_step")
+        adaptive = False
+    if adaptive_min_steps is None:
+        adaptive_min_steps = num_steps // 2
+    if prune_fn is not None and prune_step is not None:
+        # Every row takes part in the best-of ranking before any can finish
+        adaptive_min_steps = max(adaptive_min_steps, prune_step + 1)
+    prev_x0 = None
+    finished: Dict[int, torch.Tensor] = {}  # original row -> final latent
+    steps_run: Dict[int, int] = {}
+
     # ── Prepare initial latent ────────────────────────────────────────
     if init_latents is not None:
         xt = init_latents.to(device=device, dtype=dtype)
+        if xt.shape[1] < context_latents.shape[1]:
+            # Stored latents are trimmed to their real length; the duration-bucket
+            # tail is masked out, so plain noise is enough there
+            noise = model.prepare_noise(context_latents, seed)
+            xt = torch.cat([xt, noise[:, xt.shape[1]:]], dim=1)
     else:
         xt = model.prepare_noise(context_latents, seed)
 
@@ -496,13 +542,44 @@ def generate_audio_core(
     past_key_values = EncoderDecoderCache(DynamicCache(), DynamicCache())
     cover_cfg_doubled = False  # Track CFG doubling of non-cover states (once only)
 
+    def select_rows(keep: List[int]) -> None:
+        """Shrink the running batch to positions ``keep``."""
+        nonlocal xt, vt, prev_x0, encoder_hidden_states, encoder_attention_mask, context_latents
+        nonlocal attention_mask, encoder_hidden_states_non_cover, encoder_attention_mask_non_cover
+        nonlocal context_latents_non_cover, past_key_values, rows, bsz
+        idx = torch.tensor(keep, device=device)
+        # CFG-doubled tensors hold [conditional, unconditional] halves
+        idx2 = torch.cat([idx, idx + bsz]) if do_cfg_guidance else idx
+        xt, vt = xt[idx], vt[idx]
+        if prev_x0 is not None:
+            prev_x0 = prev_x0[idx]
+        encoder_hidden_states = encoder_hidden_states[idx2]
+        encoder_attention_mask = encoder_attention_mask[idx2]
+        context_latents = context_latents[idx2]
+        attention_mask = attention_mask[idx2]
+        if encoder_hidden_states_non_cover is not None:
+            idx_nc = idx2 if cover_cfg_doubled else idx
+            encoder_hidden_states_non_cover = encoder_hidden_states_non_cover[idx_nc]
+            encoder_attention_mask_non_cover = encoder_attention_mask_non_cover[idx_nc]
+            context_latents_non_cover = context_latents_non_cover[idx_nc]
+        running_average = getattr(momentum_buffer, "running_average", None)
+        if isinstance(running_average, torch.Tensor) and running_average.shape[:1] == (bsz,):
+            momentum_buffer.running_average = running_average[idx]
+        # Cross-attention keys/values are rebuilt for the smaller batch
+        past_key_values = EncoderDecoderCache(DynamicCache(), DynamicCache())
+        rows = [rows[i] for i in keep]
+        bsz = len(keep)
+
     # ── Diffusion loop ────────────────────────────────────────────────
     # NOTE: Tried inference_mode() here — speed was negligible vs no_grad,
     # didn't measure VRAM. Keeping no_grad for future potential backprop
     # (RLHF/RLVR training through diffusion loop).
     checkpoint_latent = None
+    vt = None
     with torch.no_grad():
         for step_idx in range(num_steps):
+            # Cooperative cancellation: stop between steps if the job was aborted
+            check_cancelled()
             t_curr = schedule[step_idx].item()
 
             # Checkpoint: snapshot xt at the requested step
@@ -549,20 +626,27 @@ def generate_audio_core(
                     (bsz,), device=device, dtype=dtype,
                 )
 
-            decoder_outputs = model.decoder(
-                hidden_states=x_in,
-                timestep=t_in,
-                timestep_r=t_in,
-                attention_mask=attention_mask,
-                encoder_hidden_states=encoder_hidden_states,
-                encoder_attention_mask=encoder_attention_mask,
-                context_latents=context_latents,
-                use_cache=True,
-                past_key_values=past_key_values,
-            )
+            if decoder_step is not None:
+                # Stateless static-shape step: no KV cache object to trace
+                vt = decoder_step(
+                    x_in, t_in, attention_mask,
+                    encoder_hidden_states, encoder_attention_mask, context_latents,
+                )
+            else:
+                decoder_outputs = model.decoder(
+                    hidden_states=x_in,
+                    timestep=t_in,
+                    timestep_r=t_in,
+                    attention_mask=attention_mask,
+                    encoder_hidden_states=encoder_hidden_states,
+                    encoder_attention_mask=encoder_attention_mask,
+                    context_latents=context_latents,
+                    use_cache=True,
+                    past_key_values=past_key_values,
+                )
 
-            vt = decoder_outputs[0]
-            past_key_values = decoder_outputs[1]
+                vt = decoder_outputs[0]
+                past_key_values = decoder_outputs[1]
 
             # ── CFG guidance ──────────────────────────────────────────
             if do_cfg_guidance:
@@ -589,6 +673,21 @@ def generate_audio_core(
                 else:
                     vt = pred_cond
 
+            # ── Best-of-N pruning ─────────────────────────────────────
+            if prune_fn is not None and step_idx == prune_step and step_idx < num_steps - 1:
+                x0_estimate = model.get_x0_from_noise(
+                    xt, vt, t_curr * torch.ones((bsz,), device=device, dtype=dtype),
+                )
+                keep = prune_fn(
+                    x0_estimate, encoder_hidden_states[:bsz],
+                    encoder_attention_mask[:bsz], context_latents[:bsz], rows,
+                )
+                del x0_estimate
+                if len(keep) < bsz:
+                    select_rows(keep)
+                    pruned = True
+                    logger.info(f"[generate_audio_core] Pruned to rows {rows} at step {step_idx}")
+
             # ── Step update ───────────────────────────────────────────
             t_step = t_curr * torch.ones((bsz,), device=device, dtype=dtype)
 
@@ -597,8 +696,35 @@ def generate_audio_core(
                 xt = model.get_x0_from_noise(xt, vt, t_step)
                 break
 
-            if infer_method == "sde":
+            pred_clean = None
+            if adaptive:
+                # ── Adaptive early exit ───────────────────────────────
                 pred_clean = model.get_x0_from_noise(xt, vt, t_step)
+                if prev_x0 is not None and step_idx + 1 >= adaptive_min_steps:
+                    change = (pred_clean - prev_x0).flatten(1).float().norm(dim=1)
+                    change = change / pred_clean.flatten(1).float().norm(dim=1).clamp_min(1e-8)
+                    converged = (change < adaptive_tol).tolist()
+                    if any(converged):
+                        for pos, done in enumerate(converged):
+                            if done:
+                                finished[rows[pos]] = pred_clean[pos]
+                                steps_run[rows[pos]] = step_idx + 1
+                        keep = [pos for pos, done in enumerate(converged) if not done]
+                        logger.info(
+                            f"[generate_audio_core] Rows {[rows[pos] for pos, done in enumerate(converged) if done]} "
+                            f"converged at step {step_idx + 1}/{num_steps}"
+                        )
+                        if not keep:
+                            rows, bsz = [], 0
+                            break
+                        select_rows(keep)
+                        pred_clean = pred_clean[torch.tensor(keep, device=device)]
+                        t_step = t_step[:bsz]
+                prev_x0 = pred_clean
+
+            if infer_method == "sde":
+                if pred_clean is None:
+                    pred_clean = model.get_x0_from_noise(xt, vt, t_step)
                 if config.sde_renoise_linear:
                     # Base/SFT: renoise using unshifted linear timestep
                     next_t = 1.0 - (step_idx + 1) / num_steps
@@ -619,6 +745,13 @@ def generate_audio_core(
 
     # ── Output ────────────────────────────────────────────────────────
     x_gen = xt
+    if finished:
+        # Converged rows rejoin the others in batch order
+        finished.update({row: x_gen[pos] for pos, row in enumerate(rows)})
+        rows = sorted(finished)
+        x_gen = torch.stack([finished[row] for row in rows])
+        saved = len(rows) * num_steps - sum(steps_run.get(row, num_steps) for row in rows)
+        logger.info(f"[generate_audio_core] Adaptive steps saved {saved} of {len(rows) * num_steps} row-steps")
     end_time = time.time()
     time_costs["diffusion_time_cost"] = end_time - start_time
     time_costs["diffusion_per_step_time_cost"] = (
@@ -631,4 +764,6 @@ def generate_audio_core(
         "time_costs": time_costs,
         "checkpoint_latent": checkpoint_latent,
         "schedule": schedule,
+        "kept_rows": rows if pruned else None,
+        "steps_run": [steps_run.get(row, num_steps) for row in rows],
     }
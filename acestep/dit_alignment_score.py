@@ -36,7 +36,41 @@ class SentenceTimestamp:
 
 
 # ================= DTW Algorithm (Numba Optimized) =================
-@numba.jit(nopython=True)
+# Kernels are compiled once and cached on disk (cache=True), so request threads
+# do not pay the JIT compile on the first alignment after a restart.
+@numba.jit(nopython=True, cache=True)
+def _dtw_trace(x: np.ndarray, trace: np.ndarray, N: int, M: int):
+    """
+    Fill the DTW trace for the top-left [N, M] block of cost matrix ``x``.
+
+    Row by row with two rolling cost rows (float32, as before): the same
+    recurrence and tie-breaking as the original column-order fill, so the
+    path is identical, but memory access is sequential and the cost matrix
+    is never materialized.
+    """
+    prev = np.full(M + 1, np.inf, dtype=np.float32)
+    curr = np.full(M + 1, np.inf, dtype=np.float32)
+    prev[0] = 0
+    for i in range(1, N + 1):
+        curr[0] = np.inf
+        for j in range(1, M + 1):
+            c0 = prev[j - 1]
+            c1 = prev[j]
+            c2 = curr[j - 1]
+
+            if c0 < c1 and c0 < c2:
+                c, t = c0, 0
+            elif c1 < c0 and c1 < c2:
+                c, t = c1, 1
+            else:
+                c, t = c2, 2
+
+            curr[j] = x[i - 1, j - 1] + c
+            trace[i, j] = t
+        prev, curr = curr, prev
+
+
+@numba.jit(nopython=True, cache=True)
 def dtw_cpu(x: np.ndarray):
     """
     Dynamic Time Warping algorithm optimized with Numba.
@@ -48,31 +82,46 @@ def dtw_cpu(x: np.ndarray):
         Tuple of (text_indices, time_indices) arrays
     """
     N, M = x.shape
-    # Use float32 for memory efficiency
-    cost = np.ones((N + 1, M + 1), dtype=np.float32) * np.inf
-    trace = -np.ones((N + 1, M + 1), dtype=np.float32)
-    cost[0, 0] = 0
+    trace = np.full((N + 1, M + 1), -1, dtype=np.int8)
+    _dtw_trace(x, trace, N, M)
+    return _backtrace(trace, N, M)
 
-    for j in range(1, M + 1):
-        for i in range(1, N + 1):
-            c0 = cost[i - 1, j - 1]
-            c1 = cost[i - 1, j]
-            c2 = cost[i, j - 1]
 
-            if c0 < c1 and c0 < c2:
-                c, t = c0, 0
-            elif c1 < c0 and c1 < c2:
-                c, t = c1, 1
-            else:
-                c, t = c2, 2
+@numba.jit(nopython=True, parallel=True, cache=True)
+def _dtw_trace_batch(x: np.ndarray, Ns: np.ndarray, Ms: np.ndarray, traces: np.ndarray):
+    """DTW traces of a padded batch of cost matrices [B, N_max, M_max], one thread per matrix."""
+    for b in numba.prange(x.shape[0]):
+        _dtw_trace(x[b], traces[b], Ns[b], Ms[b])
 
-            cost[i, j] = x[i - 1, j - 1] + c
-            trace[i, j] = t
 
-    return _backtrace(trace, N, M)
+def dtw_batch(xs: List[np.ndarray]) -> List[np.ndarray]:
+    """
+    ``dtw_cpu`` over several cost matrices at once, filled in parallel.
 
+    Matrices are padded per dtype group (mixing dtypes in one padded array
+    would change the cost sums), so each path equals ``dtw_cpu(x)``.
 
-@numba.jit(nopython=True)
+    Returns:
+        One (2, path_len) path array per input.
+    """
+    paths: List[Optional[np.ndarray]] = [None] * len(xs)
+    groups: Dict[Any, List[int]] = {}
+    for i, x in enumerate(xs):
+        groups.setdefault(x.dtype, []).append(i)
+    for dtype, indices in groups.items():
+        Ns = np.array([xs[i].shape[0] for i in indices], dtype=np.int64)
+        Ms = np.array([xs[i].shape[1] for i in indices], dtype=np.int64)
+        padded = np.zeros((len(indices), Ns.max(), Ms.max()), dtype=dtype)
+        for b, i in enumerate(indices):
+            padded[b, :Ns[b], :Ms[b]] = xs[i]
+        traces = np.full((len(indices), Ns.max() + 1, Ms.max() + 1), -1, dtype=np.int8)
+        _dtw_trace_batch(padded, Ns, Ms, traces)
+        for b, i in enumerate(indices):
+            paths[i] = _backtrace(np.ascontiguousarray(traces[b, :Ns[b] + 1, :Ms[b] + 1]), Ns[b], Ms[b])
+    return paths
+
+
+@numba.jit(nopython=True, cache=True)
 def _backtrace(trace: np.ndarray, N: int, M: int):
     """
     Optimized backtrace function for DTW.
@@ -358,9 +407,32 @@ class MusicStampsAligner:
         Returns:
             List of TokenTimestamp objects
         """
-        n_frames = calc_matrix.shape[-1]
-        text_indices, time_indices = dtw_cpu(-calc_matrix.astype(np.float64))
+        return self.token_timestamps_batch([calc_matrix], [lyrics_tokens], [total_duration_seconds])[0]
 
+    def token_timestamps_batch(
+        self,
+        calc_matrices: List[np.ndarray],
+        lyrics_tokens_list: List[List[int]],
+        durations: List[float]
+    ) -> List[List[TokenTimestamp]]:
+        """
+        ``token_timestamps`` for every sample of a generation, with the DTW
+        of all samples run in one parallel call.
+        """
+        paths = dtw_batch([-m.astype(np.float64) for m in calc_matrices])
+        return [
+            self._timestamps_from_path(path, m.shape[-1], tokens, duration)
+            for path, m, tokens, duration in zip(paths, calc_matrices, lyrics_tokens_list, durations)
+        ]
+
+    def _timestamps_from_path(
+        self,
+        path: np.ndarray,
+        n_frames: int,
+        lyrics_tokens: List[int],
+        total_duration_seconds: float
+    ) -> List[TokenTimestamp]:
+        text_indices, time_indices = path
         seconds_per_frame = total_duration_seconds / n_frames
         alignment_results = []
         
@@ -776,40 +848,63 @@ class MusicLyricScorer:
         Returns:
             Dict or AlignmentInfo object containing path and masks.
         """
-        calc_matrix, energy_matrix, vis_matrix = self._preprocess_attention(
-            attention_matrix, custom_config, medfilt_width
-        )
+        return self.lyrics_alignment_info_batch(
+            [attention_matrix], [token_ids], custom_config, return_matrices, medfilt_width
+        )[0]
 
-        if calc_matrix is None:
-            return {
-                "calc_matrix": None,
-                "error": "No valid attention heads found"
+    def lyrics_alignment_info_batch(
+            self,
+            attention_matrices: List[Union[torch.Tensor, np.ndarray]],
+            token_ids_list: List[List[int]],
+            custom_config: Dict[int, List[int]],
+            return_matrices: bool = False,
+            medfilt_width: int = 1
+    ) -> List[Dict[str, Any]]:
+        """
+        ``lyrics_alignment_info`` for every sample of a generation; the DTW
+        paths of all samples are computed in one parallel call.
+        """
+        results: List[Dict[str, Any]] = []
+        pending = []  # (result index, calc_matrix)
+        for attention_matrix, token_ids in zip(attention_matrices, token_ids_list):
+            calc_matrix, energy_matrix, vis_matrix = self._preprocess_attention(
+                attention_matrix, custom_config, medfilt_width
+            )
+
+            if calc_matrix is None:
+                results.append({
+                    "calc_matrix": None,
+                    "error": "No valid attention heads found"
+                })
+                continue
+
+            # 1. Generate Semantic Mask (1=Lyrics, 0=Tags)
+            # Uses self.tokenizer internally
+            type_mask = self._generate_token_type_mask(token_ids)
+
+            # Safety check for shape mismatch
+            if len(type_mask) != energy_matrix.shape[0]:
+                # Fallback to all lyrics if shapes don't align
+                type_mask = np.ones(energy_matrix.shape[0], dtype=np.int32)
+
+            return_dict = {
+                "type_mask": type_mask,
+                "energy_matrix": energy_matrix
             }
-
-        # 1. Generate Semantic Mask (1=Lyrics, 0=Tags)
-        # Uses self.tokenizer internally
-        type_mask = self._generate_token_type_mask(token_ids)
-
-        # Safety check for shape mismatch
-        if len(type_mask) != energy_matrix.shape[0]:
-            # Fallback to all lyrics if shapes don't align
-            type_mask = np.ones(energy_matrix.shape[0], dtype=np.int32)
+            if return_matrices:
+                return_dict['calc_matrix'] = calc_matrix
+                return_dict['vis_matrix'] = vis_matrix
+            pending.append((len(results), calc_matrix))
+            results.append(return_dict)
 
         # 2. DTW Pathfinding
         # Using negative calc_matrix because DTW minimizes cost
-        text_indices, time_indices = dtw_cpu(-calc_matrix.astype(np.float32))
-        path_coords = np.stack([text_indices, time_indices], axis=1)
+        if pending:
+            paths = dtw_batch([-calc_matrix.astype(np.float32) for _, calc_matrix in pending])
+            for (idx, _), path in zip(pending, paths):
+                results[idx]["path_coords"] = np.stack([path[0], path[1]], axis=1)
 
-        return_dict = {
-            "path_coords": path_coords,
-            "type_mask": type_mask,
-            "energy_matrix": energy_matrix
-        }
-        if return_matrices:
-            return_dict['calc_matrix'] = calc_matrix
-            return_dict['vis_matrix'] = vis_matrix
-
-        return return_dict
+        return results
 
     def calculate_score(
             self,
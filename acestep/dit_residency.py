@@ -0,0 +1,350 @@
+"""Multi-variant DiT residency
+
+Keeps several DiT variants (turbo / base / sft ...) loaded at once so pipelines
+that alternate between them do not pay a full ``from_pretrained`` per stage.
+
+Two tiers, each with a byte budget and LRU eviction:
+
+* **device tier** - the variant's weights live on the accelerator. The active
+  variant always counts against this tier and is never evicted.
+* **pinned-CPU tier** - weights live in page-locked host memory, so promoting
+  them back to the accelerator is a single async DMA instead of a disk read.
+
+Evicting from the device tier demotes a variant to pinned CPU; evicting from
+the CPU tier drops it. ``prefetch`` loads/promotes a variant on a background
+thread (and, on CUDA, a side stream) so the copy overlaps with diffusion of
+the currently active variant. While it runs, the variant's entry stays in
+its tier (a placeholder sized like the variant when it comes from disk), so
+the budgets account for it before the weights arrive.
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import torch
+from loguru import logger
+
+
+def module_nbytes(model: torch.nn.Module) -> int:
+    """Bytes held by a module's parameters and buffers."""
+    total = 0
+    for t in list(model.parameters()) + list(model.buffers()):
+        total += t.numel() * t.element_size()
+    return total
+
+
+def _pin_module(model: torch.nn.Module) -> None:
+    """Move every CPU parameter/buffer into page-locked memory (best effort)."""
+    if not torch.cuda.is_available():
+        return
+    try:
+        for t in list(model.parameters()) + list(model.buffers()):
+            if t.device.type == "cpu" and not t.is_pinned():
+                t.data = t.data.pin_memory()
+    except RuntimeError as e:
+        # Pinning can fail when the host is short on lockable memory; pageable
+        # weights still work, the device copy is just synchronous.
+        logger.warning(f"[dit_residency] Could not pin weights ({e}); keeping pageable memory")
+
+
+@dataclass
+class _Resident:
+    variant: str
+    model: Any  # None while a prefetch is loading it
+    nbytes: int
+    tier: str  # "device" | "cpu"
+    ready: Optional[Any] = None  # CUDA event of an in-flight async device copy
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+class DiTResidencyManager:
+    """
+    LRU residency of DiT variants across a device tier and a pinned-CPU tier.
+
+    Args:
+        loader: ``loader(variant) -> nn.Module`` that loads a variant on CPU in
+            the serving dtype and in eval mode. Must raise on failure.
+        device: Accelerator device string (``"cuda"``, ``"xpu"``, ``"mps"``, ``"cpu"``).
+        device_budget_bytes: Bytes of DiT weights allowed on the device,
+            including the active variant.
+        cpu_budget_bytes: Bytes of pinned host memory for parked variants.
+        home_on_device: False when DiT is offloaded to CPU between uses; the
+            active variant then lives in the CPU tier and nothing is promoted.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], torch.nn.Module],
+        device: str,
+        device_budget_bytes: int,
+        cpu_budget_bytes: int,
+        home_on_device: bool = True,
+    ):
+        self._loader = loader
+        self.device = device
+        self.device_budget_bytes = int(device_budget_bytes)
+        self.cpu_budget_bytes = int(cpu_budget_bytes)
+        self.home_on_device = home_on_device and device != "cpu"
+        self._entries: "OrderedDict[str, _Resident]" = OrderedDict()  # LRU first
+        self._pending: Dict[str, Future] = {}
+        self._sizes: Dict[str, int] = {}  # last known nbytes per variant
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dit-prefetch")
+        self._stream = None
+        if self.home_on_device and str(device).startswith("cuda") and torch.cuda.is_available():
+            self._stream = torch.cuda.Stream(device=device)
+        self.active: Optional[str] = None
+        self.stats = {"device_hits": 0, "cpu_hits": 0, "misses": 0, "prefetches": 0, "evictions": 0, "drops": 0}
+
+    # ------------------------------------------------------------------
+    # Bookkeeping
+    # ------------------------------------------------------------------
+
+    def _used(self, tier: str) -> int:
+        return sum(e.nbytes for e in self._entries.values() if e.tier == tier)
+
+    def _entry(self, variant: str, model: torch.nn.Module, tier: str,
+               extra: Optional[Dict[str, Any]] = None) -> _Resident:
+        nbytes = module_nbytes(model)
+        self._sizes[variant] = nbytes
+        return _Resident(variant, model, nbytes, tier, extra=dict(extra or {}))
+
+    def _expected_nbytes(self, variant: str) -> int:
+        """Size of ``variant`` before it is loaded: last known, else the largest resident variant."""
+        if variant in self._sizes:
+            return self._sizes[variant]
+        return max((e.nbytes for e in self._entries.values() if e.model is not None), default=0)
+
+    def resident(self) -> Dict[str, str]:
+        """``{variant: tier}`` in LRU order (least recently used first)."""
+        with self._lock:
+            return {v: e.tier for v, e in self._entries.items()}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self.active,
+                "resident": {v: e.tier for v, e in self._entries.items()},
+                "device_used_gb": round(self._used("device") / 1024**3, 2),
+                "device_budget_gb": round(self.device_budget_bytes / 1024**3, 2),
+                "cpu_used_gb": round(self._used("cpu") / 1024**3, 2),
+                "cpu_budget_gb": round(self.cpu_budget_bytes / 1024**3, 2),
+                "prefetching": sorted(self._pending),
+                **self.stats,
+            }
+
+    # ------------------------------------------------------------------
+    # Tier moves
+    # ------------------------------------------------------------------
+
+    def _to_device(self, entry: _Resident, async_copy: bool) -> None:
+        if async_copy and self._stream is not None:
+            with torch.cuda.stream(self._stream):
+                entry.model.to(self.device, non_blocking=True)
+                event = torch.cuda.Event()
+                event.record(self._stream)
+            entry.ready = event
+        else:
+            entry.model.to(self.device)
+            entry.ready = None
+        entry.tier = "device"
+
+    def _to_cpu(self, entry: _Resident) -> None:
+        if entry.tier == "device" and torch.cuda.is_available():
+            # Weights may have been allocated on the side stream; make sure no
+            # queued kernel still reads them before the allocator reuses them.
+            torch.cuda.synchronize()
+        entry.model.to("cpu")
+        _pin_module(entry.model)
+        entry.ready = None
+        entry.tier = "cpu"
+
+    def _make_device_room(self, nbytes: int) -> None:
+        """Demote LRU parked device-tier variants until ``nbytes`` more fit the device budget."""
+        with self._lock:
+            freed = False
+            for variant in list(self._entries):
+                if self._used("device") + nbytes <= self.device_budget_bytes:
+                    break
+                entry = self._entries[variant]
+                if entry.tier != "device" or variant == self.active or variant in self._pending:
+                    continue
+                logger.info(f"[dit_residency] Demoting {variant} to pinned CPU to make room")
+                self._to_cpu(entry)
+                self.stats["evictions"] += 1
+                freed = True
+            if freed and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    def _enforce_budgets(self) -> None:
+        """Demote LRU device-tier variants to CPU, then drop LRU CPU-tier variants."""
+        with self._lock:
+            for variant in list(self._entries):
+                if self._used("device") <= self.device_budget_bytes:
+                    break
+                entry = self._entries[variant]
+                if entry.tier != "device" or variant == self.active or variant in self._pending:
+                    continue
+                logger.info(f"[dit_residency] Demoting {variant} to pinned CPU (device budget)")
+                self._to_cpu(entry)
+                self.stats["evictions"] += 1
+            for variant in list(self._entries):
+                if self._used("cpu") <= self.cpu_budget_bytes:
+                    break
+                entry = self._entries[variant]
+                if entry.tier != "cpu" or variant == self.active or variant in self._pending:
+                    continue
+                logger.info(f"[dit_residency] Dropping {variant} (CPU budget)")
+                del self._entries[variant]
+                self.stats["drops"] += 1
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def register_active(self, variant: str, model: torch.nn.Module, extra: Optional[Dict[str, Any]] = None) -> None:
+        """Record the model the handler loaded itself (e.g. at ``initialize_service``)."""
+        with self._lock:
+            self._entries.pop(variant, None)
+            tier = "device" if self.home_on_device else "cpu"
+            self._entries[variant] = self._entry(variant, model, tier, extra)
+            self.active = variant
+
+    def park(self, variant: str, model: torch.nn.Module, extra: Optional[Dict[str, Any]] = None) -> None:
+        """Mark the active variant inactive, keeping it resident subject to the budgets."""
+        with self._lock:
+            entry = self._entries.get(variant)
+            if entry is None:
+                entry = self._entry(variant, model, "device" if self.home_on_device else "cpu")
+                self._entries[variant] = entry
+            entry.model = model
+            entry.extra = dict(extra or {})
+            self._entries.move_to_end(variant)
+            if self.active == variant:
+                self.active = None
+            self._enforce_budgets()
+
+    def activate(
+        self, variant: str, loader: Optional[Callable[[str], torch.nn.Module]] = None
+    ) -> Tuple[torch.nn.Module, Dict[str, Any]]:
+        """
+        Make ``variant`` the active model and return ``(model, extra)``.
+
+        Waits for an in-flight prefetch of the same variant, promotes a parked
+        copy, or falls back to loading from disk (with ``loader`` if given).
+        """
+        pending = self._pending.get(variant)
+        if pending is not None:
+            try:
+                pending.result()
+            except Exception as e:
+                logger.warning(f"[dit_residency] Prefetch of {variant} failed ({e}); loading synchronously")
+
+        with self._lock:
+            entry = self._entries.pop(variant, None)
+        if entry is None or entry.model is None:
+            self.stats["misses"] += 1
+            model = (loader or self._loader)(variant)
+            entry = self._entry(variant, model, "cpu")
+        elif entry.tier == "device":
+            self.stats["device_hits"] += 1
+        else:
+            self.stats["cpu_hits"] += 1
+
+        if self.home_on_device and entry.tier != "device":
+            # Move parked variants off first so the outgoing and incoming DiT
+            # are never both on the device beyond the budget
+            self._make_device_room(entry.nbytes)
+            self._to_device(entry, async_copy=False)
+        if entry.ready is not None:
+            torch.cuda.current_stream().wait_event(entry.ready)
+            entry.ready = None
+
+        with self._lock:
+            self._entries[variant] = entry
+            self.active = variant
+            self._enforce_budgets()
+        return entry.model, entry.extra
+
+    def prefetch(self, variant: str) -> Optional[Future]:
+        """
+        Start loading/promoting ``variant`` in the background.
+
+        The copy targets the device tier only when it fits next to the active
+        variant; otherwise the weights are staged in pinned CPU memory so the
+        later ``activate`` is a single host-to-device copy.
+        """
+        with self._lock:
+            if variant == self.active:
+                return None
+            if variant in self._pending:
+                return self._pending[variant]
+            entry = self._entries.get(variant)
+            if entry is not None and entry.tier == "device":
+                self._entries.move_to_end(variant)
+                return None
+            future = self._executor.submit(self._prefetch_job, variant)
+            self._pending[variant] = future
+            self.stats["prefetches"] += 1
+        future.add_done_callback(lambda _f, v=variant: self._pending_done(v))
+        return future
+
+    def _pending_done(self, variant: str) -> None:
+        with self._lock:
+            self._pending.pop(variant, None)
+            self._enforce_budgets()
+
+    def _prefetch_job(self, variant: str) -> None:
+        with self._lock:
+            entry = self._entries.get(variant)
+            from_disk = entry is None
+            if from_disk:
+                # Placeholder holding the variant's CPU-tier cost until it is loaded
+                entry = _Resident(variant, None, self._expected_nbytes(variant), "cpu")
+                self._entries[variant] = entry
+            self._entries.move_to_end(variant)
+        if from_disk:
+            logger.info(f"[dit_residency] Prefetching {variant} from disk")
+            try:
+                model = self._loader(variant)
+            except Exception:
+                with self._lock:
+                    if self._entries.get(variant) is entry:
+                        del self._entries[variant]
+                raise
+            _pin_module(model)
+            loaded = self._entry(variant, model, "cpu")
+            with self._lock:
+                entry.model, entry.nbytes = loaded.model, loaded.nbytes
+        if self.home_on_device:
+            with self._lock:
+                fits = self._used("device") + entry.nbytes <= self.device_budget_bytes
+                if fits:
+                    # Reserve the device budget before the copy starts
+                    entry.tier = "device"
+            if fits:
+                try:
+                    self._to_device(entry, async_copy=True)
+                except Exception:
+                    self._to_cpu(entry)
+                    raise
+        with self._lock:
+            self._entries[variant] = entry
+        logger.info(f"[dit_residency] Prefetched {variant} into {entry.tier} tier")
+
+    def drop(self, variant: str) -> None:
+        """Forget a parked variant (no-op for the active one)."""
+        with self._lock:
+            if variant != self.active:
+                self._entries.pop(variant, None)
+
+    def clear(self) -> None:
+        """Drop every parked variant and stop the prefetch thread."""
+        with self._lock:
+            for variant in list(self._entries):
+                if variant != self.active:
+                    del self._entries[variant]
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,609 @@
+"""Process-per-device DiT worker pool with a shared-memory result channel
+
+Each worker is a separate (spawned) process that owns one ``AceStepHandler``
+bound to one device, so DiT models no longer share a GIL or a CUDA context
+with each other or with the API front end. A router picks the least loaded
+live worker that serves the requested model.
+
+Requests and results travel over a pipe as small pickled envelopes; every
+tensor in them (audio, latents, masks) is packed into a single
+``multiprocessing.shared_memory`` segment and only its (offset, shape, dtype)
+is pickled. The receiving side copies the tensors out and unlinks the segment.
+
+Worker specs are ``[model@]device[*count]`` items separated by commas, e.g.::
+
+    acestep-v15-turbo@cuda:0,acestep-v15-turbo@cuda:1,acestep-v15-base@cuda:2
+    acestep-v15-turbo@cpu*4
+"""
+
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import traceback
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+from loguru import logger
+
+from acestep.cancellation import CancellationToken, GenerationCancelled, cancellation_scope, current_token
+
+
+# Env var per accelerator family used to pin a worker to one device index
+_DEVICE_VISIBILITY_ENV = {
+    "cuda": "CUDA_VISIBLE_DEVICES",
+    "xpu": "ZE_AFFINITY_MASK",
+}
+
+DEFAULT_START_TIMEOUT = 1800.0
+
+# How often a waiting caller re-checks its cancellation token
+_CANCEL_POLL_SECONDS = 0.25
+
+
+@dataclass
+class WorkerSpec:
+    """One worker process: which model it serves and where it runs."""
+    model: str
+    device: str = "auto"
+    init_kwargs: Dict[str, Any] = field(default_factory=dict)
+    num_threads: Optional[int] = None
+
+    @property
+    def label(self) -> str:
+        return f"{self.model}@{self.device}"
+
+
+def parse_worker_specs(spec_str: str, default_model: str, init_kwargs: Optional[Dict[str, Any]] = None) -> List[WorkerSpec]:
+    """
+    Parse a ``[model@]device[*count]`` list into worker specs.
+
+    CPU workers split the available cores evenly so N processes do not
+    oversubscribe the machine.
+    """
+    specs: List[WorkerSpec] = []
+    for item in (spec_str or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        count = 1
+        if "*" in item:
+            item, count_str = item.rsplit("*", 1)
+            count = max(1, int(count_str))
+        if "@" in item:
+            model, device = item.split("@", 1)
+        else:
+            model, device = default_model, item
+        model = os.path.basename(model.strip().rstrip("/\\")) or default_model
+        for _ in range(count):
+            specs.append(WorkerSpec(model=model, device=device.strip() or "auto", init_kwargs=dict(init_kwargs or {})))
+
+    cpu_specs = [s for s in specs if s.device == "cpu"]
+    if cpu_specs:
+        threads = max(1, (os.cpu_count() or 1) // len(cpu_specs))
+        for s in cpu_specs:
+            s.num_threads = threads
+    return specs
+
+
+# ---------------------------------------------------------------------------
+# Shared-memory tensor channel
+# ---------------------------------------------------------------------------
+
+@dataclass
+class _ShmTensor:
+    offset: int
+    nbytes: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def _walk(obj: Any, fn: Callable[[Any], Any]) -> Any:
+    """Rebuild dicts/lists/tuples, applying ``fn`` to every leaf."""
+    if isinstance(obj, dict):
+        return {k: _walk(v, fn) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_walk(v, fn) for v in obj]
+    if isinstance(obj, tuple):
+        return tuple(_walk(v, fn) for v in obj)
+    return fn(obj)
+
+
+def pack_tensors(obj: Any) -> Tuple[Any, Optional[str]]:
+    """
+    Move every tensor in ``obj`` into one shared-memory segment.
+
+    Returns:
+        (envelope with tensors replaced by references, segment name or None)
+    """
+    tensors: List[torch.Tensor] = []
+
+    def _collect(x):
+        if isinstance(x, torch.Tensor):
+            tensors.append(x.detach().to("cpu").contiguous())
+            return ("__shm__", len(tensors) - 1)
+        return x
+
+    envelope = _walk(obj, _collect)
+    if not tensors:
+        return envelope, None
+
+    # 64-byte aligned slots so every view starts on a cache line
+    offsets, total = [], 0
+    for t in tensors:
+        offsets.append(total)
+        total += (t.numel() * t.element_size() + 63) // 64 * 64
+    shm = shared_memory.SharedMemory(create=True, size=max(total, 1))
+    try:
+        buf = torch.frombuffer(shm.buf, dtype=torch.uint8, count=max(total, 1))
+        refs = []
+        for t, off in zip(tensors, offsets):
+            nbytes = t.numel() * t.element_size()
+            if nbytes:
+                buf[off:off + nbytes].copy_(t.reshape(-1).view(torch.uint8))
+            refs.append(_ShmTensor(off, nbytes, tuple(t.shape), str(t.dtype).replace("torch.", "")))
+        del buf
+    finally:
+        shm.close()
+
+    def _resolve(x):
+        if isinstance(x, tuple) and len(x) == 2 and x[0] == "__shm__":
+            return refs[x[1]]
+        return x
+
+    return _walk(envelope, _resolve), shm.name
+
+
+def unpack_tensors(envelope: Any, shm_name: Optional[str]) -> Any:
+    """Copy tensors referenced by ``envelope`` out of ``shm_name`` and unlink it."""
+    if shm_name is None:
+        return envelope
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buf = torch.frombuffer(shm.buf, dtype=torch.uint8, count=shm.size)
+
+        def _load(x):
+            if isinstance(x, _ShmTensor):
+                dtype = getattr(torch, x.dtype)
+                if not x.nbytes:
+                    return torch.empty(x.shape, dtype=dtype)
+                return buf[x.offset:x.offset + x.nbytes].clone().view(dtype).reshape(x.shape)
+            return x
+
+        out = _walk(envelope, _load)
+        del buf
+        return out
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _discard_segment(shm_name: Optional[str]) -> None:
+    if shm_name is None:
+        return
+    try:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        shm.close()
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Worker process
+# ---------------------------------------------------------------------------
+
+def _default_handler_factory(spec: WorkerSpec):
+    """Build and initialize an ``AceStepHandler`` for ``spec``."""
+    from acestep.handler import AceStepHandler
+
+    handler = AceStepHandler()
+    device = spec.device.split(":", 1)[0] if spec.device != "auto" else "auto"
+    kwargs = dict(spec.init_kwargs)
+    project_root = kwargs.pop("project_root", os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    status_msg, ok = handler.initialize_service(
+        project_root=project_root,
+        config_path=spec.model,
+        device=device,
+        **kwargs,
+    )
+    if not ok:
+        raise RuntimeError(status_msg)
+    return handler
+
+
+def _worker_main(spec: WorkerSpec, conn, handler_factory: Callable[[WorkerSpec], Any]) -> None:
+    """Worker process loop: init the handler, then serve requests until told to stop."""
+    if spec.num_threads:
+        torch.set_num_threads(spec.num_threads)
+    try:
+        handler = handler_factory(spec)
+    except Exception as e:
+        conn.send(("init_error", None, f"{e}\n{traceback.format_exc()}", None))
+        return
+    conn.send(("ready", None, str(getattr(handler, "dtype", torch.float32)).replace("torch.", ""), None))
+
+    send_lock = threading.Lock()
+    jobs: "queue.Queue" = queue.Queue()
+    tokens: Dict[int, CancellationToken] = {}
+
+    def _send(msg):
+        with send_lock:
+            conn.send(msg)
+
+    def _receive():
+        # Separate thread so "cancel" messages arrive while a job is running
+        while True:
+            try:
+                kind, req_id, payload, shm_name = conn.recv()
+            except (EOFError, OSError):
+                kind, req_id, payload, shm_name = "stop", None, None, None
+            if kind == "stop":
+                jobs.put(None)
+                return
+            if kind == "generate":
+                envelope, deadline = payload
+                tokens[req_id] = CancellationToken(deadline=deadline)
+                jobs.put((req_id, envelope, shm_name))
+            elif kind == "cancel" and req_id in tokens:
+                tokens[req_id].cancel(payload or "cancelled")
+
+    threading.Thread(target=_receive, daemon=True).start()
+
+    while True:
+        item = jobs.get()
+        if item is None:
+            break
+        req_id, envelope, shm_name = item
+        token = tokens[req_id]
+        try:
+            kwargs = unpack_tensors(envelope, shm_name)
+
+            def _progress(value=None, desc=None, *args, **kwargs):
+                _send(("progress", req_id, (value, desc), None))
+
+            with cancellation_scope(token):
+                token.check()
+                result = handler.generate_music(progress=_progress, **kwargs)
+            envelope, out_shm = pack_tensors(result)
+            _send(("result", req_id, envelope, out_shm))
+        except GenerationCancelled as e:
+            _send(("cancelled", req_id, e.reason, None))
+        except Exception as e:
+            logger.exception(f"[dit_worker_pool] {spec.label} request {req_id} failed")
+            _send(("error", req_id, f"{e}", None))
+        finally:
+            tokens.pop(req_id, None)
+
+    conn.close()
+
+
+@contextmanager
+def _child_env(**overrides):
+    """Temporarily set env vars so a spawned child inherits them."""
+    saved = {k: os.environ.get(k) for k in overrides}
+    os.environ.update({k: v for k, v in overrides.items() if v is not None})
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+class _Worker:
+    def __init__(self, index: int, spec: WorkerSpec):
+        self.index = index
+        self.spec = spec
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.inflight = 0
+        self.ready = threading.Event()
+        self.alive = False
+        self.init_error: Optional[str] = None
+        self.dtype = torch.float32
+        self.reader: Optional[threading.Thread] = None
+
+
+class DiTWorkerPool:
+    """
+    Pool of DiT worker processes with a model/queue-depth router.
+
+    ``submit`` returns a ``Future`` resolving to the same dict
+    ``AceStepHandler.generate_music`` returns (tensors already copied out of
+    shared memory). Use ``handler_for(model)`` to get a drop-in handler for
+    ``acestep.inference.generate_music``.
+    """
+
+    def __init__(
+        self,
+        specs: List[WorkerSpec],
+        handler_factory: Optional[Callable[[WorkerSpec], Any]] = None,
+        default_model: Optional[str] = None,
+    ):
+        if not specs:
+            raise ValueError("DiTWorkerPool needs at least one worker spec")
+        self._specs = specs
+        self._factory = handler_factory or _default_handler_factory
+        self.default_model = default_model or specs[0].model
+        self._workers = [_Worker(i, s) for i, s in enumerate(specs)]
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Tuple[Future, _Worker, Optional[Callable]]] = {}
+        self._ids = itertools.count(1)
+        self._rr = itertools.count()
+        self._closed = False
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def start(self, timeout: float = DEFAULT_START_TIMEOUT) -> List[str]:
+        """
+        Spawn all workers and wait for them to load their models.
+
+        Returns:
+            Labels of workers that failed to initialize (the pool keeps running
+            with the rest; raises if none came up).
+        """
+        ctx = mp.get_context("spawn")
+        for w in self._workers:
+            parent_conn, child_conn = ctx.Pipe()
+            env = {}
+            family, _, index = w.spec.device.partition(":")
+            if index and family in _DEVICE_VISIBILITY_ENV:
+                env[_DEVICE_VISIBILITY_ENV[family]] = index
+            with _child_env(**env):
+                w.process = ctx.Process(
+                    target=_worker_main,
+                    args=(w.spec, child_conn, self._factory),
+                    name=f"dit-worker-{w.index}",
+                    daemon=True,
+                )
+                w.process.start()
+            child_conn.close()
+            w.conn = parent_conn
+            w.reader = threading.Thread(target=self._reader_loop, args=(w,), daemon=True)
+            w.reader.start()
+
+        failed = []
+        for w in self._workers:
+            if not w.ready.wait(timeout) or not w.alive:
+                failed.append(w.spec.label)
+                logger.error(f"[dit_worker_pool] Worker {w.spec.label} failed to start: {w.init_error or 'timeout'}")
+            else:
+                logger.info(f"[dit_worker_pool] Worker {w.index} ready: {w.spec.label} (pid {w.process.pid})")
+        if len(failed) == len(self._workers):
+            self.close()
+            raise RuntimeError(f"No DiT worker could be started: {failed}")
+        return failed
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop all workers and fail outstanding requests."""
+        self._closed = True
+        for w in self._workers:
+            if w.conn is None:
+                continue
+            try:
+                with w.send_lock:
+                    w.conn.send(("stop", None, None, None))
+            except (OSError, ValueError):
+                pass
+        for w in self._workers:
+            if w.process is not None:
+                w.process.join(timeout)
+                if w.process.is_alive():
+                    w.process.terminate()
+            w.alive = False
+        with self._lock:
+            pending = list(self._pending.items())
+            self._pending.clear()
+        for _, (fut, _, _) in pending:
+            if not fut.done():
+                fut.set_exception(RuntimeError("DiT worker pool closed"))
+
+    def _reader_loop(self, w: _Worker) -> None:
+        while True:
+            try:
+                kind, req_id, payload, shm_name = w.conn.recv()
+            except (EOFError, OSError):
+                break
+            if kind == "ready":
+                w.dtype = getattr(torch, payload, torch.float32)
+                w.alive = True
+                w.ready.set()
+                continue
+            if kind == "init_error":
+                w.init_error = payload
+                w.ready.set()
+                break
+            with self._lock:
+                entry = self._pending.get(req_id)
+                if kind in ("result", "error", "cancelled"):
+                    self._pending.pop(req_id, None)
+                    w.inflight = max(0, w.inflight - 1)
+            if entry is None:
+                _discard_segment(shm_name)
+                continue
+            fut, _, progress = entry
+            if kind == "progress":
+                if progress is not None:
+                    try:
+                        progress(payload[0], desc=payload[1])
+                    except Exception:
+                        pass
+            elif kind == "result":
+                try:
+                    fut.set_result(unpack_tensors(payload, shm_name))
+                except Exception as e:
+                    fut.set_exception(e)
+            elif kind == "cancelled":
+                fut.set_exception(GenerationCancelled(payload))
+            else:
+                fut.set_exception(RuntimeError(f"DiT worker {w.spec.label}: {payload}"))
+
+        # Worker exited: fail whatever it still owed us
+        w.alive = False
+        w.ready.set()
+        with self._lock:
+            lost = [rid for rid, (_, owner, _) in self._pending.items() if owner is w]
+            entries = [self._pending.pop(rid) for rid in lost]
+            w.inflight = 0
+        for fut, _, _ in entries:
+            if not fut.done():
+                fut.set_exception(RuntimeError(f"DiT worker {w.spec.label} exited"))
+        if not self._closed:
+            logger.error(f"[dit_worker_pool] Worker {w.spec.label} exited unexpectedly")
+
+    # -- routing -----------------------------------------------------------
+
+    @property
+    def models(self) -> List[str]:
+        """Models served by at least one live worker, default first."""
+        seen = []
+        for w in self._workers:
+            if w.alive and w.spec.model not in seen:
+                seen.append(w.spec.model)
+        if self.default_model in seen:
+            seen.remove(self.default_model)
+            seen.insert(0, self.default_model)
+        return seen
+
+    def resolve_model(self, model: Optional[str]) -> str:
+        """Map a requested model to one the pool serves (falls back to the default)."""
+        live = self.models
+        if model and model in live:
+            return model
+        if self.default_model in live:
+            return self.default_model
+        if live:
+            return live[0]
+        raise RuntimeError("No live DiT worker")
+
+    def _route(self, model: Optional[str]) -> _Worker:
+        """Least in-flight live worker for ``model``; round-robin among ties."""
+        model = self.resolve_model(model)
+        candidates = [w for w in self._workers if w.alive and w.spec.model == model]
+        low = min(w.inflight for w in candidates)
+        tied = [w for w in candidates if w.inflight == low]
+        return tied[next(self._rr) % len(tied)]
+
+    def queue_depths(self) -> Dict[str, int]:
+        """In-flight requests per worker label (for stats)."""
+        with self._lock:
+            return {f"{w.index}:{w.spec.label}": w.inflight for w in self._workers if w.alive}
+
+    def dtype_for(self, model: Optional[str] = None) -> torch.dtype:
+        model = self.resolve_model(model)
+        for w in self._workers:
+            if w.alive and w.spec.model == model:
+                return w.dtype
+        return torch.float32
+
+    # -- requests ----------------------------------------------------------
+
+    def submit(
+        self,
+        model: Optional[str],
+        kwargs: Dict[str, Any],
+        progress: Optional[Callable] = None,
+        deadline: Optional[float] = None,
+    ) -> Future:
+        """
+        Route one ``generate_music`` call to a worker.
+
+        ``deadline`` (absolute ``time.time()``) is enforced inside the worker;
+        use ``cancel`` for explicit aborts.
+        """
+        if self._closed:
+            raise RuntimeError("DiT worker pool closed")
+        fut: Future = Future()
+        req_id = next(self._ids)
+        fut.request_id = req_id
+        envelope, shm_name = pack_tensors(kwargs)
+        with self._lock:
+            w = self._route(model)
+            w.inflight += 1
+            self._pending[req_id] = (fut, w, progress)
+        try:
+            with w.send_lock:
+                w.conn.send(("generate", req_id, (envelope, deadline), shm_name))
+        except (OSError, ValueError) as e:
+            with self._lock:
+                self._pending.pop(req_id, None)
+                w.inflight = max(0, w.inflight - 1)
+            _discard_segment(shm_name)
+            fut.set_exception(RuntimeError(f"DiT worker {w.spec.label} unavailable: {e}"))
+        return fut
+
+    def cancel(self, fut: Future, reason: str = "cancelled") -> None:
+        """Ask the worker running ``fut`` to stop at its next cancellation check."""
+        req_id = getattr(fut, "request_id", None)
+        with self._lock:
+            entry = self._pending.get(req_id)
+        if entry is None:
+            return
+        w = entry[1]
+        try:
+            with w.send_lock:
+                w.conn.send(("cancel", req_id, reason, None))
+        except (OSError, ValueError):
+            pass
+
+    def handler_for(self, model: Optional[str] = None) -> "RemoteDiTHandler":
+        return RemoteDiTHandler(self, self.resolve_model(model))
+
+    def __len__(self) -> int:
+        return len(self._workers)
+
+
+class RemoteDiTHandler:
+    """
+    Duck-typed stand-in for ``AceStepHandler`` that runs ``generate_music``
+    on the pool. Covers what ``acestep.inference.generate_music`` uses.
+    """
+
+    def __init__(self, pool: DiTWorkerPool, model: str):
+        self.pool = pool
+        self.model_name = model
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return self.pool.dtype_for(self.model_name)
+
+    def prepare_seeds(self, actual_batch_size, seed, use_random_seed):
+        from acestep.handler import AceStepHandler
+        return AceStepHandler.prepare_seeds(self, actual_batch_size, seed, use_random_seed)
+
+    def generate_music(self, progress=None, **kwargs) -> Dict[str, Any]:
+        # The caller's cancellation token is mirrored into the worker process
+        token = current_token()
+        try:
+            fut = self.pool.submit(
+                self.model_name, kwargs, progress=progress,
+                deadline=token.deadline if token is not None else None,
+            )
+            while True:
+                try:
+                    return fut.result(timeout=_CANCEL_POLL_SECONDS if token is not None else None)
+                except FutureTimeoutError:
+                    if token.cancelled:
+                        self.pool.cancel(fut, token.reason)
+                        token = None  # wait for the worker to acknowledge
+        except Exception as e:
+            return {
+                "audios": [],
+                "status_message": f"❌ Error: {e}",
+                "extra_outputs": {},
+                "success": False,
+                "error": str(e),
+            }
@@ -0,0 +1,101 @@
+"""Duration bucketing for DiT batches
+
+Every request's duration sets its own latent length, so a 62 s and a 64 s job
+can neither share a diffusion batch nor reuse a compiled step. With bucketing
+the latent length is rounded up to the next bucket boundary; the extra frames
+are silence that is masked out of self-attention and kept out of the generated
+region (chunk mask 0), and the decoded audio is trimmed back afterwards.
+
+``padding_stats`` accumulates how many of the frames pushed through the DiT
+were padding, so the cost of a bucket layout can be watched in production.
+"""
+
+import math
+import os
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+LATENT_HZ = 25  # 48 kHz audio / 1920 samples per latent frame
+
+DEFAULT_BUCKETS_SECONDS: Tuple[float, ...] = (
+    10, 15, 20, 30, 45, 60, 75, 90, 120, 150, 180, 210, 240, 300, 360, 420, 480, 540, 600,
+)
+
+
+def _parse_buckets(value: Optional[str]) -> Tuple[float, ...]:
+    if not value:
+        return DEFAULT_BUCKETS_SECONDS
+    try:
+        buckets = tuple(sorted(float(v) for v in value.split(",") if v.strip()))
+    except ValueError:
+        return DEFAULT_BUCKETS_SECONDS
+    return buckets or DEFAULT_BUCKETS_SECONDS
+
+
+BUCKETS_SECONDS = _parse_buckets(os.environ.get("ACESTEP_DURATION_BUCKETS"))
+
+
+def bucketing_enabled(compile_model: bool) -> bool:
+    """``ACESTEP_DURATION_BUCKETING``: true/false, or auto (default) = on with compile_model."""
+    value = os.environ.get("ACESTEP_DURATION_BUCKETING", "auto").strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    return compile_model
+
+
+def bucket_seconds(seconds: float, buckets: Sequence[float] = BUCKETS_SECONDS) -> float:
+    """Smallest bucket boundary >= ``seconds``; past the last one, the next full minute."""
+    for boundary in buckets:
+        if seconds <= boundary:
+            return boundary
+    return math.ceil(seconds / 60.0) * 60.0
+
+
+def bucket_latent_length(frames: int, limit: Optional[int] = None,
+                         buckets: Sequence[float] = BUCKETS_SECONDS) -> int:
+    """Latent length of the bucket holding ``frames`` (never shorter than ``frames``)."""
+    bucketed = int(math.ceil(bucket_seconds(frames / LATENT_HZ, buckets) * LATENT_HZ))
+    if limit is not None:
+        bucketed = min(bucketed, limit)
+    return max(frames, bucketed)
+
+
+class PaddingStats:
+    """Thread-safe counters of valid vs padded latent frames."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.valid_frames = 0
+        self.total_frames = 0
+        self.bucket_frames = 0
+
+    def record(self, valid_frames: int, total_frames: int, bucket_frames: int = 0) -> None:
+        """
+        Args:
+            valid_frames: Sum of the rows' own latent lengths.
+            total_frames: rows * padded latent length.
+            bucket_frames: Part of the padding added by bucketing (the rest is
+                shorter rows padded to the longest one).
+        """
+        with self._lock:
+            self.batches += 1
+            self.valid_frames += valid_frames
+            self.total_frames += total_frames
+            self.bucket_frames += bucket_frames
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            padded = self.total_frames - self.valid_frames
+            return {
+                "batches": self.batches,
+                "valid_frames": self.valid_frames,
+                "padded_frames": padded,
+                "bucket_padded_frames": self.bucket_frames,
+                "waste_ratio": round(padded / self.total_frames, 4) if self.total_frames else 0.0,
+            }
+
+
+padding_stats = PaddingStats()
@@ -14,7 +14,8 @@ from loguru import logger
 from acestep.gradio_ui.i18n import t
 from acestep.gradio_ui.events.generation_handlers import parse_and_validate_timesteps
 from acestep.inference import generate_music, GenerationParams, GenerationConfig
-from acestep.audio_utils import save_audio
+from acestep.audio_utils import AudioSaver, get_audio_writer_pool
+from acestep.audio_codes import has_audio_codes
 from acestep.gpu_config import (
     get_global_gpu_config,
     check_duration_limit,
@@ -685,21 +686,54 @@ def generate_with_progress(
         None,  # raw_codes placeholder
     )
     time_module.sleep(0.1)
-    
+
+    # PMI scores of all samples in one batched scoring pass (prompt prefixes and
+    # unconditional terms are shared); each sample's display is built in the loop
+    batch_pmi_results = [None] * len(audios)
+    if auto_score and llm_handler.llm_initialized:
+        from acestep.test_time_scaling import calculate_pmi_scores_batch
+        auto_score_start = time_module.time()
+        score_metadata = _build_score_metadata(lm_generated_metadata, captions, bpm, audio_duration,
+                                               key_scale, vocal_language, time_signature)
+        scored = [i for i, audio in enumerate(audios) if has_audio_codes(audio["params"].get("audio_codes", ""))]
+        if scored:
+            pmi_results = calculate_pmi_scores_batch(
+                llm_handler,
+                [{
+                    "audio_codes": audios[i]["params"].get("audio_codes", ""),
+                    "caption": captions or "",
+                    "lyrics": lyrics or "",
+                    "metadata": dict(score_metadata) if score_metadata else None,
+                } for i in scored],
+                topk=10,
+                score_scale=score_scale,
+            )
+            for i, pmi_result in zip(scored, pmi_results):
+                batch_pmi_results[i] = pmi_result
+        total_auto_score_time += time_module.time() - auto_score_start
+    
+    # Use local output directory instead of system temp
+    timestamp = int(time_module.time())
+    temp_dir = os.path.join(DEFAULT_RESULTS_DIR, f"batch_{timestamp}")
+    temp_dir = os.path.abspath(temp_dir).replace("\\", "/")
+    os.makedirs(temp_dir, exist_ok=True)
+    # Encode every sample in parallel up front; each is awaited when its turn comes
+    audio_saver = AudioSaver(default_format="flac")
+    writer_pool = get_audio_writer_pool()
+    save_futures = [
+        writer_pool.submit(audio_saver, audio["tensor"],
+                           os.path.join(temp_dir, f"{audio['key']}.{audio_format}").replace("\\", "/"),
+                           sample_rate=audio["sample_rate"], format=audio_format, channels_first=True)
+        for audio in audios[:8]
+    ]
+
     for i in range(8):
         if i < len(audios):
             key = audios[i]["key"]
-            audio_tensor = audios[i]["tensor"]
-            sample_rate = audios[i]["sample_rate"]
             audio_params = audios[i]["params"]
-            # Use local output directory instead of system temp
-            timestamp = int(time_module.time())
-            temp_dir = os.path.join(DEFAULT_RESULTS_DIR, f"batch_{timestamp}")
-            temp_dir = os.path.abspath(temp_dir).replace("\\", "/")
-            os.makedirs(temp_dir, exist_ok=True)
             json_path = os.path.join(temp_dir, f"{key}.json").replace("\\", "/")
             audio_path = os.path.join(temp_dir, f"{key}.{audio_format}").replace("\\", "/")
-            save_audio(audio_data=audio_tensor, output_path=audio_path, sample_rate=sample_rate, format=audio_format, channels_first=True)
+            save_futures[i].result()
             with open(json_path, 'w', encoding='utf-8') as f:
                 json.dump(audio_params, f, indent=2, ensure_ascii=False)
             audio_outputs[i] = audio_path
@@ -719,31 +753,31 @@ def generate_with_progress(
                     full_pred = result.extra_outputs.get("pred_latents")
 
                     if full_pred is not None and i < full_pred.shape[0]:
+                        # Whole-batch tensors: the first sample captures attention for
+                        # all of them, the rest (and auto LRC) read the cache
                         sample_tensor_data = {
-                            "pred_latent": full_pred[i:i + 1],
-                            "encoder_hidden_states": result.extra_outputs.get("encoder_hidden_states")[
-                                                     i:i + 1] if result.extra_outputs.get(
-                                "encoder_hidden_states") is not None else None,
-                            "encoder_attention_mask": result.extra_outputs.get("encoder_attention_mask")[
-                                                      i:i + 1] if result.extra_outputs.get(
-                                "encoder_attention_mask") is not None else None,
-                            "context_latents": result.extra_outputs.get("context_latents")[
-                                               i:i + 1] if result.extra_outputs.get(
-                                "context_latents") is not None else None,
-                            "lyric_token_ids": result.extra_outputs.get("lyric_token_idss")[
-                                               i:i + 1] if result.extra_outputs.get(
-                                "lyric_token_idss") is not None else None,
+                            "pred_latent": full_pred,
+                            "encoder_hidden_states": result.extra_outputs.get("encoder_hidden_states"),
+                            "encoder_attention_mask": result.extra_outputs.get("encoder_attention_mask"),
+                            "context_latents": result.extra_outputs.get("context_latents"),
+                            "lyric_token_ids": result.extra_outputs.get("lyric_token_idss"),
+                            "sample_index": i,
+                            "alignment_cache": result.extra_outputs.setdefault("lyric_alignment", {}),
                         }
 
                         # 简单校验完整性
                         if any(v is None for v in sample_tensor_data.values()):
                             sample_tensor_data = None
+                        else:
+                            # Per-row LoRA of the generation (None = default adapter)
+                            sample_tensor_data["lora_adapters"] = result.extra_outputs.get("lora_adapters")
+                            sample_tensor_data["lora_scales"] = result.extra_outputs.get("lora_scales")
 
                 except Exception as e:
                     print(f"[Auto Score] Failed to prepare tensor data for sample {i}: {e}")
                     sample_tensor_data = None
 
-                score_str = calculate_score_handler(llm_handler, code_str, captions, lyrics, lm_generated_metadata, bpm, key_scale, time_signature, audio_duration, vocal_language, score_scale, dit_handler, sample_tensor_data, inference_steps)
+                score_str = calculate_score_handler(llm_handler, code_str, captions, lyrics, lm_generated_metadata, bpm, key_scale, time_signature, audio_duration, vocal_language, score_scale, dit_handler, sample_tensor_data, inference_steps, pmi_result=batch_pmi_results[i])
                 auto_score_end = time_module.time()
                 total_auto_score_time += (auto_score_end - auto_score_start)
             scores_ui_updates[i] = score_str
@@ -764,13 +798,6 @@ def generate_with_progress(
                     logger.info(f"[auto_lrc] pred_latents: {pred_latents is not None}, encoder_hidden_states: {encoder_hidden_states is not None}, encoder_attention_mask: {encoder_attention_mask is not None}, context_latents: {context_latents is not None}, lyric_token_idss: {lyric_token_idss is not None}")
                     
                     if all(x is not None for x in [pred_latents, encoder_hidden_states, encoder_attention_mask, context_latents, lyric_token_idss]):
-                        # Extract single sample tensors
-                        sample_pred_latent = pred_latents[i:i+1]
-                        sample_encoder_hidden_states = encoder_hidden_states[i:i+1]
-                        sample_encoder_attention_mask = encoder_attention_mask[i:i+1]
-                        sample_context_latents = context_latents[i:i+1]
-                        sample_lyric_token_ids = lyric_token_idss[i:i+1]
-                        
                         # Calculate actual duration
                         actual_duration = audio_duration
                         if actual_duration is None or actual_duration <= 0:
@@ -778,15 +805,19 @@ def generate_with_progress(
                             actual_duration = latent_length / 25.0  # 25 Hz latent rate
                         
                         lrc_result = dit_handler.get_lyric_timestamp(
-                            pred_latent=sample_pred_latent,
-                            encoder_hidden_states=sample_encoder_hidden_states,
-                            encoder_attention_mask=sample_encoder_attention_mask,
-                            context_latents=sample_context_latents,
-                            lyric_token_ids=sample_lyric_token_ids,
+                            pred_latent=pred_latents,
+                            encoder_hidden_states=encoder_hidden_states,
+                            encoder_attention_mask=encoder_attention_mask,
+                            context_latents=context_latents,
+                            lyric_token_ids=lyric_token_idss,
                             total_duration_seconds=float(actual_duration),
                             vocal_language=vocal_language or "en",
                             inference_steps=int(inference_steps),
                             seed=42,
+                            sample_index=i,
+                            alignment_cache=result.extra_outputs.setdefault("lyric_alignment", {}),
+                            lora_adapters=result.extra_outputs.get("lora_adapters"),
+                            lora_scales=result.extra_outputs.get("lora_scales"),
                         )
                         
                         logger.info(f"[auto_lrc] LRC result for sample {i + 1}: success={lrc_result.get('success')}")
@@ -962,6 +993,41 @@ def generate_with_progress(
 
 
 
+def _build_score_metadata(lm_metadata, caption, bpm, audio_duration, key_scale, vocal_language, time_signature):
+    """Metadata to score against: LM-generated values first, then the user inputs."""
+    metadata = {}
+    
+    # Priority 1: Use LM-generated metadata if available
+    if lm_metadata and isinstance(lm_metadata, dict):
+        metadata.update(lm_metadata)
+    
+    # Priority 2: Add user-provided metadata (if not already in LM metadata)
+    if bpm is not None and 'bpm' not in metadata:
+        try:
+            metadata['bpm'] = int(bpm)
+        except:
+            pass
+    
+    if caption and 'caption' not in metadata:
+        metadata['caption'] = caption
+    
+    if audio_duration is not None and audio_duration > 0 and 'duration' not in metadata:
+        try:
+            metadata['duration'] = int(audio_duration)
+        except:
+            pass
+    
+    if key_scale and key_scale.strip() and 'keyscale' not in metadata:
+        metadata['keyscale'] = key_scale.strip()
+    
+    if vocal_language and vocal_language.strip() and 'language' not in metadata:
+        metadata['language'] = vocal_language.strip()
+    
+    if time_signature and time_signature.strip() and 'timesignature' not in metadata:
+        metadata['timesignature'] = time_signature.strip()
+    return metadata
+
+
 def calculate_score_handler(
         llm_handler,
         audio_codes_str,
@@ -977,6 +1043,7 @@ def calculate_score_handler(
         dit_handler,
         extra_tensor_data,
         inference_steps,
+        pmi_result=None,
 ):
     """
     Calculate PMI-based quality score for generated audio.
@@ -1000,8 +1067,11 @@ def calculate_score_handler(
         vocal_language: Vocal language value
         score_scale: Sensitivity scale parameter
         dit_handler: DiT handler instance (for alignment scoring)
-        extra_tensor_data: Dictionary containing tensors for the specific sample
+        extra_tensor_data: Dictionary with the batch tensors, the sample_index to score and
+            the result's alignment_cache (see ``get_lyric_alignments``)
         inference_steps: Number of inference steps used
+        pmi_result: Precomputed ``calculate_pmi_score_per_condition`` result for this
+            sample (from ``calculate_pmi_scores_batch``), if any
         
     Returns:
         Score display string
@@ -1027,38 +1097,12 @@ def calculate_score_handler(
                 # Can still try DiT alignment if available
                 if not has_dit_alignment_data:
                     return t("messages.lm_not_initialized")
+            elif pmi_result is not None:
+                # Already scored together with the rest of the batch
+                scores_per_condition, global_score, status = pmi_result
             else:
-                # Build metadata dictionary from both LM metadata and user inputs
-                metadata = {}
-                
-                # Priority 1: Use LM-generated metadata if available
-                if lm_metadata and isinstance(lm_metadata, dict):
-                    metadata.update(lm_metadata)
-                
-                # Priority 2: Add user-provided metadata (if not already in LM metadata)
-                if bpm is not None and 'bpm' not in metadata:
-                    try:
-                        metadata['bpm'] = int(bpm)
-                    except:
-                        pass
-                
-                if caption and 'caption' not in metadata:
-                    metadata['caption'] = caption
-                
-                if audio_duration is not None and audio_duration > 0 and 'duration' not in metadata:
-                    try:
-                        metadata['duration'] = int(audio_duration)
-                    except:
-                        pass
-                
-                if key_scale and key_scale.strip() and 'keyscale' not in metadata:
-                    metadata['keyscale'] = key_scale.strip()
-                
-                if vocal_language and vocal_language.strip() and 'language' not in metadata:
-                    metadata['language'] = vocal_language.strip()
-                
-                if time_signature and time_signature.strip() and 'timesignature' not in metadata:
-                    metadata['timesignature'] = time_signature.strip()
+                metadata = _build_score_metadata(lm_metadata, caption, bpm, audio_duration,
+                                                 key_scale, vocal_language, time_signature)
                 
                 # Calculate per-condition scores with appropriate metrics
                 # - Metadata fields (bpm, duration, etc.): Top-k recall
@@ -1086,6 +1130,10 @@ def calculate_score_handler(
                     vocal_language=vocal_language or "en",
                     inference_steps=int(inference_steps),
                     seed=42,
+                    sample_index=extra_tensor_data.get('sample_index', 0),
+                    alignment_cache=extra_tensor_data.get('alignment_cache'),
+                    lora_adapters=extra_tensor_data.get('lora_adapters'),
+                    lora_scales=extra_tensor_data.get('lora_scales'),
                 )
 
                 if align_result.get("success"):
@@ -1216,24 +1264,26 @@ def calculate_score_handler_with_selection(
             batch_size = pred_latents.shape[0]
 
             if 0 <= sample_idx_0based < batch_size:
-                # Slice tensors for this specific sample (keep dimension [1, ...])
+                # Whole-batch tensors plus the sample index: attention is captured
+                # for every sample at once and cached with the batch
                 # We assume all stored tensors are aligned in batch dim 0
                 try:
                     extra_tensor_data = {
-                        "pred_latent": pred_latents[sample_idx_0based:sample_idx_0based + 1],
-                        "encoder_hidden_states": extra_outputs.get("encoder_hidden_states")[
-                                                 sample_idx_0based:sample_idx_0based + 1],
-                        "encoder_attention_mask": extra_outputs.get("encoder_attention_mask")[
-                                                  sample_idx_0based:sample_idx_0based + 1],
-                        "context_latents": extra_outputs.get("context_latents")[
-                                           sample_idx_0based:sample_idx_0based + 1],
-                        "lyric_token_ids": extra_outputs.get("lyric_token_idss")[
-                                           sample_idx_0based:sample_idx_0based + 1]
+                        "pred_latent": pred_latents,
+                        "encoder_hidden_states": extra_outputs.get("encoder_hidden_states"),
+                        "encoder_attention_mask": extra_outputs.get("encoder_attention_mask"),
+                        "context_latents": extra_outputs.get("context_latents"),
+                        "lyric_token_ids": extra_outputs.get("lyric_token_idss"),
+                        "sample_index": sample_idx_0based,
+                        "alignment_cache": extra_outputs.setdefault("lyric_alignment", {}),
                     }
 
                     # Verify no None values in the sliced dict
                     if any(v is None for v in extra_tensor_data.values()):
                         extra_tensor_data = None
+                    else:
+                        extra_tensor_data["lora_adapters"] = extra_outputs.get("lora_adapters")
+                        extra_tensor_data["lora_scales"] = extra_outputs.get("lora_scales")
                 except Exception as e:
                     print(f"Error slicing tensor data for score: {e}")
                     extra_tensor_data = None
@@ -1328,24 +1378,22 @@ def generate_lrc_handler(dit_handler, sample_idx, current_batch_index, batch_que
             latent_length = pred_latents.shape[1]
             audio_duration = latent_length / 25.0  # 25 Hz latent rate
         
-        # Get the sample's data (keep batch dimension for handler)
-        sample_pred_latent = pred_latents[sample_idx_0based:sample_idx_0based+1]
-        sample_encoder_hidden_states = encoder_hidden_states[sample_idx_0based:sample_idx_0based+1]
-        sample_encoder_attention_mask = encoder_attention_mask[sample_idx_0based:sample_idx_0based+1]
-        sample_context_latents = context_latents[sample_idx_0based:sample_idx_0based+1]
-        sample_lyric_token_ids = lyric_token_idss[sample_idx_0based:sample_idx_0based+1]
-        
-        # Call handler to generate timestamps
+        # Call handler to generate timestamps; every sample of the batch is captured
+        # in one pass and cached, so the other samples' LRC/score skip the DiT
         result = dit_handler.get_lyric_timestamp(
-            pred_latent=sample_pred_latent,
-            encoder_hidden_states=sample_encoder_hidden_states,
-            encoder_attention_mask=sample_encoder_attention_mask,
-            context_latents=sample_context_latents,
-            lyric_token_ids=sample_lyric_token_ids,
+            pred_latent=pred_latents,
+            encoder_hidden_states=encoder_hidden_states,
+            encoder_attention_mask=encoder_attention_mask,
+            context_latents=context_latents,
+            lyric_token_ids=lyric_token_idss,
             total_duration_seconds=float(audio_duration),
             vocal_language=vocal_language or "en",
             inference_steps=int(inference_steps),
             seed=42,  # Use fixed seed for reproducibility
+            sample_index=sample_idx_0based,
+            alignment_cache=extra_outputs.setdefault("lyric_alignment", {}),
+            lora_adapters=extra_outputs.get("lora_adapters"),
+            lora_scales=extra_outputs.get("lora_scales"),
         )
         
         if result.get("success"):
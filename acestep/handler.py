@@ -3,12 +3,12 @@ Business Logic Handler
 Encapsulates all data processing and business logic as a bridge between model and UI
 """
 import os
+import threading
 
 # Disable tokenizers parallelism to avoid fork warning
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 import math
-from copy import deepcopy
 import tempfile
 import traceback
 import re
@@ -16,9 +16,11 @@ import random
 import uuid
 import hashlib
 import json
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from typing import Optional, Dict, Any, Tuple, List, Union
 
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+
 import torch
 import torchaudio
 import soundfile as sf
@@ -31,6 +33,7 @@ from transformers import AutoTokenizer, AutoModel, AutoModelForCausalLM
 from transformers.generation.streamers import BaseStreamer
 from diffusers.models import AutoencoderOobleck
 from acestep.diffusion_core import generate_audio_core
+from acestep.cancellation import check_cancelled
 from acestep.model_downloader import (
     ensure_main_model,
     ensure_dit_model,
@@ -45,6 +48,12 @@ from acestep.constants import (
 )
 from acestep.dit_alignment_score import MusicStampsAligner, MusicLyricScorer
 from acestep.gpu_config import get_gpu_memory_gb
+from acestep.duration_buckets import bucketing_enabled, bucket_latent_length, padding_stats
+from acestep.model_loading import LOAD_WORKERS, load_pretrained
+from acestep.lora_registry import lora_batch
+from acestep.code_cache import AudioCodeCache
+from acestep.latent_cache import EncodeMemo, LatentCache, waveform_key
+from acestep.audio_codes import AudioCodes, export_audio_codes, has_audio_codes, parse_audio_codes
 
 
 warnings.filterwarnings("ignore")
@@ -80,15 +89,46 @@ class AceStepHandler:
         
         # Custom layers config
         self.custom_layers_config = {2: [6], 3: [10, 11], 4: [3], 5: [8, 9], 6: [8]}
+        # Samples per attention-capture pass for LRC/score (see get_lyric_alignments)
+        self.alignment_batch = int(os.environ.get("ACESTEP_ALIGNMENT_BATCH", "4"))
+        # Source audio kept around a repaint window (seconds per side); negative (default) repaints full length
+        self.repaint_context_seconds = float(os.environ.get("ACESTEP_REPAINT_CONTEXT_SECONDS", "-1"))
+        # Long-form generation: window length and overlap between consecutive windows (seconds)
+        self.longform_window_seconds = float(os.environ.get("ACESTEP_LONGFORM_WINDOW_SECONDS", "120"))
+        self.longform_overlap_seconds = float(os.environ.get("ACESTEP_LONGFORM_OVERLAP_SECONDS", "10"))
+        # Adaptive step count: default convergence threshold (0 runs every step)
+        self.adaptive_tol = float(os.environ.get("ACESTEP_ADAPTIVE_TOL", "0"))
         self.offload_to_cpu = False
         self.offload_dit_to_cpu = False
         self.current_offload_cost = 0.0
+        self.quantization = None
+        self.offload_engine = None  # acestep.offload_engine.OffloadEngine when offload_to_cpu
+        self.compile_model = False
+        self._compiled_steps = {}  # variant -> acestep.compiled_step.CompiledDiTStep
+        self.duration_bucketing = False  # see acestep.duration_buckets
         
         # LoRA state
         self.lora_loaded = False
         self.use_lora = False
         self.lora_scale = 1.0  # LoRA influence scale (0-1)
-        self._base_decoder = None  # Backup of original decoder
+        self.active_lora = None  # Registry name of the adapter loaded via load_lora
+        self.lora_registry = None  # acestep.lora_registry.LoraRegistry, created on first use
+        # Fuse the adapter into the decoder weights when a whole batch uses one adapter
+        self.lora_merge = os.environ.get("ACESTEP_LORA_MERGE", "false").lower() in ("1", "true", "yes")
+        self._lora_mergers = {}  # variant -> acestep.lora_registry.LoraMerger
+        # Held while LoRA hooks or merged weights are on the decoder and the
+        # forward passes that rely on them run (generation, LRC/scoring)
+        self._decoder_lock = threading.RLock()
+
+        # VAE latents of source/reference audio by content hash (see acestep.latent_cache)
+        self.latent_cache = LatentCache()
+        self._latent_cache_salt = ""
+        # Codes of converted source audio, on disk (see acestep.code_cache)
+        self.code_cache = AudioCodeCache()
+        self._code_cache_salts: Dict[str, str] = {}
+
+        # Loaded DiT variants (device / pinned-CPU tiers), see acestep.dit_residency
+        self.dit_residency = None
     
     def get_available_checkpoints(self) -> str:
         """Return project root directory path"""
@@ -134,7 +174,10 @@ class AceStepHandler:
         return getattr(self.config, 'is_turbo', False)
     
     def load_lora(self, lora_path: str) -> str:
-        """Load LoRA adapter into the decoder.
+        """Load a LoRA adapter as the default for requests that do not name one.
+
+        The adapter goes into the LoRA registry (see acestep.lora_registry);
+        the decoder weights are not modified.
         
         Args:
             lora_path: Path to the LoRA adapter directory (containing adapter_config.json)
@@ -160,65 +203,51 @@ class AceStepHandler:
             return f"❌ Invalid LoRA adapter: adapter_config.json not found in {lora_path}"
         
         try:
-            from peft import PeftModel, PeftConfig
-        except ImportError:
-            return "❌ PEFT library not installed. Please install with: pip install peft"
-        
-        try:
-            import copy
-            # Backup base decoder if not already backed up
-            if self._base_decoder is None:
-                self._base_decoder = copy.deepcopy(self.model.decoder)
-                logger.info("Base decoder backed up")
-            else:
-                # Restore base decoder before loading new LoRA
-                self.model.decoder = copy.deepcopy(self._base_decoder)
-                logger.info("Restored base decoder before loading new LoRA")
-            
-            # Load PEFT adapter
+            # The decoder is left untouched; the adapter is applied per batch row
+            name = os.path.abspath(lora_path)
             logger.info(f"Loading LoRA adapter from {lora_path}")
-            self.model.decoder = PeftModel.from_pretrained(
-                self.model.decoder,
-                lora_path,
-                is_trainable=False,
-            )
-            self.model.decoder = self.model.decoder.to(self.device).to(self.dtype)
-            self.model.decoder.eval()
-            
+            self._get_lora_registry().register(name, lora_path)
+            if self.active_lora is not None and self.active_lora != name:
+                self.lora_registry.remove(self.active_lora)
+            self.active_lora = name
+
             self.lora_loaded = True
             self.use_lora = True  # Enable LoRA by default after loading
-            
+
             logger.info(f"LoRA adapter loaded successfully from {lora_path}")
             return f"✅ LoRA loaded from {lora_path}"
-            
+
         except Exception as e:
             logger.exception("Failed to load LoRA adapter")
             return f"❌ Failed to load LoRA: {str(e)}"
-    
+
+    def _get_lora_registry(self):
+        """Registry of resident LoRA adapters (created on first use)."""
+        if self.lora_registry is None:
+            from acestep.lora_registry import LoraRegistry
+            self.lora_registry = LoraRegistry(self.device, self.dtype)
+        return self.lora_registry
+
     def unload_lora(self) -> str:
-        """Unload LoRA adapter and restore base decoder.
+        """Unload the default LoRA adapter.
         
         Returns:
             Status message
         """
         if not self.lora_loaded:
             return "⚠️ No LoRA adapter loaded."
-        
-        if self._base_decoder is None:
-            return "❌ Base decoder backup not found. Cannot restore."
-        
+
         try:
-            import copy
-            # Restore base decoder
-            self.model.decoder = copy.deepcopy(self._base_decoder)
-            self.model.decoder = self.model.decoder.to(self.device).to(self.dtype)
-            self.model.decoder.eval()
-            
+            self._unmerge_lora()
+            if self.lora_registry is not None and self.active_lora is not None:
+                self.lora_registry.remove(self.active_lora)
+            self.active_lora = None
+
             self.lora_loaded = False
             self.use_lora = False
             self.lora_scale = 1.0  # Reset scale to default
             
-            logger.info("LoRA unloaded, base decoder restored")
+            logger.info("LoRA unloaded, using base decoder")
             return "✅ LoRA unloaded, using base model"
             
         except Exception as e:
@@ -237,20 +266,12 @@ class AceStepHandler:
         if use_lora and not self.lora_loaded:
             return "❌ No LoRA adapter loaded. Please load a LoRA first."
         
+        # Takes effect with the next batch (a merged adapter is restored right away)
         self.use_lora = use_lora
-        
-        # Use PEFT's enable/disable methods if available
-        if self.lora_loaded and hasattr(self.model.decoder, 'disable_adapter_layers'):
-            try:
-                if use_lora:
-                    self.model.decoder.enable_adapter_layers()
-                    logger.info("LoRA adapter enabled")
-                else:
-                    self.model.decoder.disable_adapter_layers()
-                    logger.info("LoRA adapter disabled")
-            except Exception as e:
-                logger.warning(f"Could not toggle adapter layers: {e}")
-        
+        if not use_lora:
+            self._unmerge_lora()
+        logger.info(f"LoRA adapter {'enabled' if use_lora else 'disabled'}")
+
         status = "enabled" if use_lora else "disabled"
         return f"✅ LoRA {status}"
     
@@ -269,42 +290,129 @@ class AceStepHandler:
         # Clamp scale to 0-1 range
         self.lora_scale = max(0.0, min(1.0, scale))
         
-        # Iterate through all LoRA layers and set their scaling
-        try:
-            for name, module in self.model.decoder.named_modules():
-                if hasattr(module, 'scaling'):
-                    scaling = module.scaling
-                    # Handle dict-style scaling (adapter_name -> value)
-                    if isinstance(scaling, dict):
-                        # Save original scaling on first call
-                        if not hasattr(module, '_original_scaling'):
-                            module._original_scaling = {k: v for k, v in scaling.items()}
-                        # Apply new scale
-                        for adapter_name in scaling:
-                            module.scaling[adapter_name] = module._original_scaling[adapter_name] * self.lora_scale
-                    # Handle float-style scaling (single value)
-                    elif isinstance(scaling, (int, float)):
-                        if not hasattr(module, '_original_scaling'):
-                            module._original_scaling = scaling
-                        module.scaling = module._original_scaling * self.lora_scale
-            
-            logger.info(f"LoRA scale set to {self.lora_scale:.2f}")
-            return f"✅ LoRA scale: {self.lora_scale:.2f}"
-        except Exception as e:
-            logger.warning(f"Could not set LoRA scale: {e}")
-            return f"⚠️ Scale set to {self.lora_scale:.2f} (partial)"
-    
+        # Applied per row at generation time (see _resolve_lora_rows)
+        logger.info(f"LoRA scale set to {self.lora_scale:.2f}")
+        return f"✅ LoRA scale: {self.lora_scale:.2f}"
+
     def get_lora_status(self) -> Dict[str, Any]:
         """Get current LoRA status.
         
         Returns:
             Dictionary with LoRA status info
         """
+        merger = self._lora_mergers.get(getattr(self, "model_variant", None))
         return {
             "loaded": self.lora_loaded,
             "active": self.use_lora,
             "scale": self.lora_scale,
+            "adapter": self.active_lora,
+            "merge": self.lora_merge,
+            "merged": merger.merged[0] if merger is not None and merger.merged else None,
+            "registry": self.lora_registry.snapshot() if self.lora_registry is not None else None,
         }
+
+    def set_lora_merge(self, merge: bool) -> str:
+        """Toggle merged LoRA inference.
+
+        When on, a batch whose rows all use the same adapter and scale runs
+        with the adapter fused into the decoder weights (no per-step cost);
+        mixed batches still use per-row deltas. Needs the DiT resident on the
+        device and unquantized.
+
+        Args:
+            merge: Whether to merge single-adapter batches
+
+        Returns:
+            Status message
+        """
+        self.lora_merge = merge
+        if not merge:
+            self._unmerge_lora()
+        logger.info(f"LoRA merge mode {'enabled' if merge else 'disabled'}")
+        return f"✅ LoRA merge {'enabled' if merge else 'disabled'}"
+
+    def _unmerge_lora(self, variant: Optional[str] = None) -> None:
+        """Restore the base weights of ``variant`` (default: active) if an adapter is merged."""
+        with self._decoder_lock:
+            merger = self._lora_mergers.get(variant or getattr(self, "model_variant", None))
+            if merger is not None and merger.merged is not None:
+                logger.info(f"[lora_merge] Unmerging {merger.merged[0]}")
+                merger.unmerge()
+
+    def _apply_lora_merge(
+        self, row_adapters: List[Optional[Any]], row_scales: List[float]
+    ) -> Tuple[List[Optional[Any]], List[float]]:
+        """Merge the batch's adapter when every row uses the same one; returns the rows left for hooks."""
+        merger = self._lora_mergers.get(self.model_variant)
+        if merger is not None and merger.decoder is not self.model.decoder:
+            # Variant reloaded after eviction; the snapshots belong to the old weights
+            del self._lora_mergers[self.model_variant]
+            merger = None
+
+        first = row_adapters[0] if row_adapters else None
+        uniform = (
+            first is not None
+            and all(a is first for a in row_adapters)
+            and len(set(row_scales)) == 1
+        )
+        streamed = self.offload_to_cpu and self.offload_dit_to_cpu
+        if self.lora_merge and uniform and not streamed:
+            if merger is None:
+                from acestep.lora_registry import LoraMerger
+                merger = LoraMerger(self.model.decoder)
+                self._lora_mergers[self.model_variant] = merger
+            try:
+                start = time.time()
+                merger.merge(first, row_scales[0])
+                logger.info(f"[lora_merge] {first.name} @ {row_scales[0]:.2f} merged in {(time.time() - start) * 1000:.1f} ms")
+                return [None] * len(row_adapters), row_scales
+            except ValueError as e:
+                logger.warning(f"[lora_merge] {e}; using per-row LoRA")
+
+        if merger is not None:
+            merger.unmerge()
+        return row_adapters, row_scales
+
+    def _resolve_lora_rows(
+        self,
+        batch_size: int,
+        lora_adapters: Optional[Union[str, List[Optional[str]]]] = None,
+        lora_scales: Optional[Union[float, List[float]]] = None,
+        use_default: bool = True,
+    ) -> Tuple[List[Optional[Any]], List[float]]:
+        """Per-row LoRA adapters (on the device) and scales for one batch.
+
+        Rows without an explicit adapter use the loaded default adapter when
+        LoRA is enabled, at ``self.lora_scale``; with ``use_default=False``
+        they use the base model (names already resolved by a generation).
+        """
+        if lora_adapters is None or isinstance(lora_adapters, str):
+            lora_adapters = [lora_adapters] * batch_size
+        if lora_scales is None or isinstance(lora_scales, (int, float)):
+            lora_scales = [lora_scales] * batch_size
+        if len(lora_adapters) == 1:
+            lora_adapters = list(lora_adapters) * batch_size
+        if len(lora_scales) == 1:
+            lora_scales = list(lora_scales) * batch_size
+
+        default = self.active_lora if (use_default and self.use_lora and self.lora_loaded) else None
+        names: List[Optional[str]] = []
+        scales: List[float] = []
+        for i in range(batch_size):
+            name = lora_adapters[i] if i < len(lora_adapters) else None
+            scale = lora_scales[i] if i < len(lora_scales) else None
+            if name:
+                names.append(name)
+                scales.append(1.0 if scale is None else float(scale))
+            else:
+                names.append(default)
+                scales.append(self.lora_scale if scale is None else float(scale))
+
+        unique = list(dict.fromkeys(n for n in names if n is not None))
+        if not unique:
+            return [None] * batch_size, scales
+        adapters = dict(zip(unique, self._get_lora_registry().acquire(unique)))
+        return [adapters[n] if n is not None else None for n in names], scales
     
     def initialize_service(
         self,
@@ -334,6 +442,7 @@ class AceStepHandler:
         Returns:
             (status_message, enable_generate_button)
         """
+        pending_loads = []
         try:
             if device == "auto":
                 if hasattr(torch, 'xpu') and torch.xpu.is_available():
@@ -350,6 +459,15 @@ class AceStepHandler:
             self.device = device
             self.offload_to_cpu = offload_to_cpu
             self.offload_dit_to_cpu = offload_dit_to_cpu
+            self.compile_model = compile_model
+            self._compiled_steps = {}
+            self._lora_mergers = {}
+            self.duration_bucketing = bucketing_enabled(compile_model)
+            if self.offload_to_cpu:
+                from acestep.offload_engine import OffloadEngine
+                self.offload_engine = OffloadEngine(device)
+            else:
+                self.offload_engine = None
             # Set dtype based on device: bfloat16 for cuda, float32 for cpu
             self.dtype = torch.bfloat16 if device in ["cuda","xpu"] else torch.float32
             self.quantization = quantization
@@ -385,28 +503,49 @@ class AceStepHandler:
                     return f"❌ Failed to download DiT model '{config_path}': {msg}", False
                 logger.info(f"[initialize_service] {msg}")
 
+            # Determine attention implementation
+            if use_flash_attention:
+                if self.is_flash_attention_available():
+                    attn_implementation = "flash_attention_2"
+                    self.dtype = torch.bfloat16
+                else:
+                    attn_implementation = "sdpa"
+                    logger.warning("[initialize_service] Flash attention requested but flash_attn package not installed — falling back to SDPA. Install with: pip install flash-attn")
+            else:
+                attn_implementation = "sdpa"
+
+            # VAE and text encoder load on the pool while the DiT loads here
+            vae_checkpoint_path = os.path.join(checkpoint_dir, "vae")
+            if not os.path.exists(vae_checkpoint_path):
+                raise FileNotFoundError(f"VAE checkpoint not found at {vae_checkpoint_path}")
+            text_encoder_path = os.path.join(checkpoint_dir, "Qwen3-Embedding-0.6B")
+            if not os.path.exists(text_encoder_path):
+                raise FileNotFoundError(f"Text encoder not found at {text_encoder_path}")
+            component_device = "cpu" if self.offload_to_cpu else device
+            load_pool = ThreadPoolExecutor(max_workers=LOAD_WORKERS, thread_name_prefix="acestep-load")
+            vae_future = load_pool.submit(
+                load_pretrained, AutoencoderOobleck, vae_checkpoint_path, component_device, self._get_vae_dtype(device)
+            )
+            text_encoder_future = load_pool.submit(
+                load_pretrained, AutoModel, text_encoder_path, component_device, self.dtype
+            )
+            load_pool.shutdown(wait=False)
+            pending_loads = [vae_future, text_encoder_future]
+
             # 1. Load main model
             # config_path is relative path (e.g., "acestep-v15-turbo"), concatenate to checkpoints directory
             acestep_v15_checkpoint_path = os.path.join(checkpoint_dir, config_path)
             if os.path.exists(acestep_v15_checkpoint_path):
-                # Determine attention implementation
-                if use_flash_attention:
-                    if self.is_flash_attention_available():
-                        attn_implementation = "flash_attention_2"
-                        self.dtype = torch.bfloat16
-                    else:
-                        attn_implementation = "sdpa"
-                        logger.warning("[initialize_service] Flash attention requested but flash_attn package not installed — falling back to SDPA. Install with: pip install flash-attn")
-                else:
-                    attn_implementation = "sdpa"
-
+                # Load straight into the serving placement (see _load_model_context for offload)
+                dit_device = "cpu" if self.offload_to_cpu and self.offload_dit_to_cpu else device
+                if self.offload_to_cpu and not self.offload_dit_to_cpu:
+                    logger.info(f"[initialize_service] Keeping main model on {device} (persistent)")
                 try:
                     logger.info(f"[initialize_service] Attempting to load model with attention implementation: {attn_implementation}")
-                    self.model = AutoModel.from_pretrained(
-                        acestep_v15_checkpoint_path, 
-                        trust_remote_code=True, 
+                    self.model = load_pretrained(
+                        AutoModel, acestep_v15_checkpoint_path, dit_device, self.dtype,
+                        trust_remote_code=True,
                         attn_implementation=attn_implementation,
-                        dtype="bfloat16"
                     )
                 except Exception as e:
                     logger.warning(f"[initialize_service] Failed to load model with {attn_implementation}: {e}")
@@ -415,71 +554,40 @@ class AceStepHandler:
                     logger.info(f"[initialize_service] Falling back to {fallback} attention")
                     attn_implementation = fallback
                     try:
-                        self.model = AutoModel.from_pretrained(
-                            acestep_v15_checkpoint_path,
+                        self.model = load_pretrained(
+                            AutoModel, acestep_v15_checkpoint_path, dit_device, self.dtype,
                             trust_remote_code=True,
                             attn_implementation=attn_implementation,
-                            dtype="bfloat16"
                         )
                     except Exception as e2:
                         if attn_implementation == "sdpa":
                             logger.warning(f"[initialize_service] SDPA also failed: {e2}, falling back to eager")
                             attn_implementation = "eager"
-                            self.model = AutoModel.from_pretrained(
-                                acestep_v15_checkpoint_path,
+                            self.model = load_pretrained(
+                                AutoModel, acestep_v15_checkpoint_path, dit_device, self.dtype,
                                 trust_remote_code=True,
-                                attn_implementation=attn_implementation
+                                attn_implementation=attn_implementation,
                             )
                         else:
                             raise e2
 
                 self.model.config._attn_implementation = attn_implementation
                 self.config = self.model.config
-                # Move model to device and set dtype
-                if not self.offload_to_cpu:
-                    self.model = self.model.to(device).to(self.dtype)
-                else:
-                    # If offload_to_cpu is True, check if we should keep DiT on GPU
-                    if not self.offload_dit_to_cpu:
-                        logger.info(f"[initialize_service] Keeping main model on {device} (persistent)")
-                        self.model = self.model.to(device).to(self.dtype)
-                    else:
-                        self.model = self.model.to("cpu").to(self.dtype)
                 self.model.eval()
                 
-                if compile_model:
-                    # Add __len__ method to model to support torch.compile
-                    # torch.compile's dynamo requires this method for introspection
-                    # Note: This modifies the model class, affecting all instances
-                    if not hasattr(self.model.__class__, '__len__'):
-                        def _model_len(model_self):
-                            """Return 0 as default length for torch.compile compatibility"""
-                            return 0
-                        self.model.__class__.__len__ = _model_len
-                    
-                    self.model = torch.compile(self.model)
-                    
-                    if self.quantization is not None:
-                        from torchao.quantization import quantize_
-                        if self.quantization == "int8_weight_only":
-                            from torchao.quantization import Int8WeightOnlyConfig
-                            quant_config = Int8WeightOnlyConfig()
-                        elif self.quantization == "fp8_weight_only":
-                            from torchao.quantization import Float8WeightOnlyConfig
-                            quant_config = Float8WeightOnlyConfig()
-                        elif self.quantization == "w8a8_dynamic":
-                            from torchao.quantization import Int8DynamicActivationInt8WeightConfig, MappingType
-                            quant_config = Int8DynamicActivationInt8WeightConfig(act_mapping_type=MappingType.ASYMMETRIC)
-                        else:
-                            raise ValueError(f"Unsupported quantization type: {self.quantization}")
-                        
-                        quantize_(self.model, quant_config)
-                        logger.info(f"[initialize_service] DiT quantized with: {self.quantization}")
-                    
+                if compile_model and self.quantization is not None:
+                    from acestep.quantization import quantize_dit
+                    self.model = quantize_dit(
+                        self.model, self.quantization, config_path, acestep_v15_checkpoint_path,
+                        device=str(next(self.model.parameters()).device),
+                    )
+                    logger.info(f"[initialize_service] DiT quantized with: {self.quantization}")
+                # With compile_model the decoder step is compiled per shape bucket
+                # (see _get_compiled_step) instead of wrapping the whole model.
                     
                 silence_latent_path = os.path.join(acestep_v15_checkpoint_path, "silence_latent.pt")
                 if os.path.exists(silence_latent_path):
-                    self.silence_latent = torch.load(silence_latent_path).transpose(1, 2)
+                    self.silence_latent = torch.load(silence_latent_path, map_location="cpu", mmap=True).transpose(1, 2)
                     # Always keep silence_latent on GPU - it's used in many places outside model context
                     # and is small enough that it won't significantly impact VRAM
                     self.silence_latent = self.silence_latent.to(device).to(self.dtype)
@@ -490,20 +598,13 @@ class AceStepHandler:
 
             # Store model variant for diffusion_core dispatch
             self.model_variant = config_path
+            self._init_dit_residency()
 
-            # 2. Load VAE
-            vae_checkpoint_path = os.path.join(checkpoint_dir, "vae")
-            if os.path.exists(vae_checkpoint_path):
-                self.vae = AutoencoderOobleck.from_pretrained(vae_checkpoint_path)
-                # Use bfloat16 for VAE on GPU, otherwise use self.dtype (float32 on CPU)
-                vae_dtype = self._get_vae_dtype(device)
-                if not self.offload_to_cpu:
-                    self.vae = self.vae.to(device).to(vae_dtype)
-                else:
-                    self.vae = self.vae.to("cpu").to(vae_dtype)
-                self.vae.eval()
-            else:
-                raise FileNotFoundError(f"VAE checkpoint not found at {vae_checkpoint_path}")
+            # 2. VAE (bfloat16 on GPU, otherwise self.dtype)
+            self.vae = vae_future.result()
+            self.vae.eval()
+            from acestep.quantization import weights_fingerprint
+            self._latent_cache_salt = f"{weights_fingerprint(vae_checkpoint_path)}:{self._get_vae_dtype(device)}"
 
             if compile_model:
                 # Add __len__ method to VAE to support torch.compile if needed
@@ -516,18 +617,10 @@ class AceStepHandler:
                 
                 self.vae = torch.compile(self.vae)
             
-            # 3. Load text encoder and tokenizer
-            text_encoder_path = os.path.join(checkpoint_dir, "Qwen3-Embedding-0.6B")
-            if os.path.exists(text_encoder_path):
-                self.text_tokenizer = AutoTokenizer.from_pretrained(text_encoder_path)
-                self.text_encoder = AutoModel.from_pretrained(text_encoder_path)
-                if not self.offload_to_cpu:
-                    self.text_encoder = self.text_encoder.to(device).to(self.dtype)
-                else:
-                    self.text_encoder = self.text_encoder.to("cpu").to(self.dtype)
-                self.text_encoder.eval()
-            else:
-                raise FileNotFoundError(f"Text encoder not found at {text_encoder_path}")
+            # 3. Text encoder and tokenizer
+            self.text_tokenizer = AutoTokenizer.from_pretrained(text_encoder_path)
+            self.text_encoder = text_encoder_future.result()
+            self.text_encoder.eval()
 
             # Determine actual attention implementation used
             actual_attn = getattr(self.config, "_attn_implementation", "eager")
@@ -547,12 +640,104 @@ class AceStepHandler:
         except Exception as e:
             error_msg = f"❌ Error initializing model: {str(e)}\n\nTraceback:\n{traceback.format_exc()}"
             logger.exception("[initialize_service] Error initializing model")
+            # Do not leave component loads running after a failed init
+            for future in pending_loads:
+                future.cancel()
+            futures_wait(pending_loads)
             return error_msg, False
 
+    def _load_dit_variant(self, variant: str, prefer_source: Optional[str] = None) -> torch.nn.Module:
+        """
+        Load a DiT variant from disk onto the CPU in the serving dtype (eval mode).
+
+        Downloads the checkpoint first when it is missing. Used as the residency
+        manager's loader, so it may run on the prefetch thread.
+        """
+        actual_project_root = self._get_project_root()
+        checkpoint_dir = os.path.join(actual_project_root, "checkpoints")
+        model_path = os.path.join(checkpoint_dir, variant)
+
+        from pathlib import Path
+        checkpoint_path = Path(checkpoint_dir)
+        if not check_model_exists(variant, checkpoint_path):
+            logger.info(f"[_load_dit_variant] Model {variant} not found, downloading...")
+            success, msg = ensure_dit_model(variant, checkpoint_path, prefer_source=prefer_source)
+            if not success:
+                raise RuntimeError(f"Failed to download {variant}: {msg}")
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found at {model_path}")
+
+        # Reuse the attention implementation chosen at init
+        attn_implementation = getattr(self.config, "_attn_implementation", "sdpa")
+        logger.info(f"[_load_dit_variant] Loading {variant} with attention={attn_implementation}")
+        model = load_pretrained(
+            AutoModel, model_path, "cpu", self.dtype,
+            trust_remote_code=True,
+            attn_implementation=attn_implementation,
+        )
+        model.config._attn_implementation = attn_implementation
+        model.eval()
+        if self.quantization is not None and self.compile_model:
+            # Same precision as the variant loaded at init; cached weights make this a load
+            from acestep.quantization import quantize_dit
+            quant_device = "cpu" if self.offload_dit_to_cpu and self.offload_to_cpu else self.device
+            model = quantize_dit(model.to(quant_device), self.quantization, variant, model_path, device=quant_device)
+            model = model.to("cpu")
+        return model
+
+    def _dit_lora_state(self) -> Dict[str, Any]:
+        """LoRA attributes that belong to the active DiT variant."""
+        return {
+            "lora_loaded": self.lora_loaded,
+            "use_lora": self.use_lora,
+            "lora_scale": self.lora_scale,
+            "active_lora": self.active_lora,
+        }
+
+    def _init_dit_residency(self):
+        """
+        Create the multi-variant residency manager around the freshly loaded DiT.
+
+        Budgets come from ``ACESTEP_DIT_DEVICE_CACHE_GB`` / ``ACESTEP_DIT_CPU_CACHE_GB``.
+        By default GPUs with >= 24GB keep one extra variant resident next to the
+        active one, and pinned host memory holds two more.
+        """
+        from acestep.dit_residency import DiTResidencyManager, module_nbytes
+
+        if self.dit_residency is not None:
+            self.dit_residency.clear()
+        model_bytes = module_nbytes(self.model)
+
+        def _budget(env_name: str, default_bytes: int) -> int:
+            value = os.environ.get(env_name, "").strip()
+            if not value:
+                return default_bytes
+            try:
+                return int(float(value) * 1024**3)
+            except ValueError:
+                logger.warning(f"[_init_dit_residency] Ignoring invalid {env_name}={value!r}")
+                return default_bytes
+
+        default_device = model_bytes * (2 if get_gpu_memory_gb() >= 24 else 1)
+        self.dit_residency = DiTResidencyManager(
+            loader=self._load_dit_variant,
+            device=self.device,
+            device_budget_bytes=_budget("ACESTEP_DIT_DEVICE_CACHE_GB", default_device),
+            cpu_budget_bytes=_budget("ACESTEP_DIT_CPU_CACHE_GB", model_bytes * 2),
+            home_on_device=not (self.offload_to_cpu and self.offload_dit_to_cpu),
+        )
+        self.dit_residency.register_active(self.model_variant, self.model, self._dit_lora_state())
+
     def swap_dit_model(self, new_model_variant: str, prefer_source: Optional[str] = None) -> Tuple[str, bool]:
         """
         Swap the DiT model to a different variant without reloading VAE/text encoder.
 
+        The outgoing variant is parked in the residency manager (device or pinned
+        CPU tier, LRU within the budgets), so swapping back is a device move or a
+        no-op instead of a disk load. A variant started with ``prefetch_dit_model``
+        is picked up where the prefetch left it.
+
         Args:
             new_model_variant: Model name like "acestep-v15-turbo", "acestep-v15-base", etc.
             prefer_source: Preferred download source ("huggingface", "modelscope", or None for auto-detect)
@@ -560,8 +745,6 @@ class AceStepHandler:
         Returns:
             Tuple of (message, success)
         """
-        import gc
-
         # Check if already on this model
         current_variant = getattr(self, "model_variant", None)
         if current_variant == new_model_variant:
@@ -570,67 +753,82 @@ class AceStepHandler:
 
         logger.info(f"[swap_dit_model] Swapping from {current_variant} to {new_model_variant}")
 
-        try:
-            # Unload current model
-            if self.model is not None:
-                del self.model
-                self.model = None
-                gc.collect()
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-                logger.info(f"[swap_dit_model] Unloaded {current_variant}")
-
-            # Get checkpoint path
-            actual_project_root = self._get_project_root()
-            checkpoint_dir = os.path.join(actual_project_root, "checkpoints")
-            model_path = os.path.join(checkpoint_dir, new_model_variant)
-
-            # Check if model exists, auto-download if needed
-            from pathlib import Path
-            checkpoint_path = Path(checkpoint_dir)
-            if not check_model_exists(new_model_variant, checkpoint_path):
-                logger.info(f"[swap_dit_model] Model {new_model_variant} not found, downloading...")
-                success, msg = ensure_dit_model(new_model_variant, checkpoint_path, prefer_source=prefer_source)
-                if not success:
-                    return f"❌ Failed to download {new_model_variant}: {msg}", False
+        if self.dit_residency is None:
+            return "❌ Model not initialized. Please initialize service first.", False
 
-            if not os.path.exists(model_path):
-                return f"❌ Model not found at {model_path}", False
-
-            # Determine attention implementation (reuse settings from init)
-            attn_implementation = getattr(self.config, "_attn_implementation", "sdpa")
-
-            # Load the new model
-            logger.info(f"[swap_dit_model] Loading {new_model_variant} with attention={attn_implementation}")
-            self.model = AutoModel.from_pretrained(
-                model_path,
-                trust_remote_code=True,
-                attn_implementation=attn_implementation,
-                dtype="bfloat16"
-            )
-
-            self.model.config._attn_implementation = attn_implementation
+        try:
+            start = time.time()
+            loader = None
+            if prefer_source is not None:
+                loader = lambda variant: self._load_dit_variant(variant, prefer_source=prefer_source)
+            # Parked variants keep their base weights
+            self._unmerge_lora(current_variant)
+            self.dit_residency.park(current_variant, self.model, self._dit_lora_state())
+            model, extra = self.dit_residency.activate(new_model_variant, loader=loader)
+
+            self.model = model
             self.config = self.model.config
-
-            # Move to device
-            if not self.offload_to_cpu and not self.offload_dit_to_cpu:
-                self.model = self.model.to(self.device).to(self.dtype)
-            elif self.offload_dit_to_cpu:
-                self.model = self.model.to("cpu").to(self.dtype)
-            else:
-                self.model = self.model.to(self.device).to(self.dtype)
-
-            self.model.eval()
+            self.lora_loaded = extra.get("lora_loaded", False)
+            self.use_lora = extra.get("use_lora", False)
+            self.lora_scale = extra.get("lora_scale", 1.0)
+            self.active_lora = extra.get("active_lora")
             self.model_variant = new_model_variant
 
-            logger.info(f"[swap_dit_model] Successfully swapped to {new_model_variant}")
-            return f"✅ Swapped to {new_model_variant}", True
+            elapsed = time.time() - start
+            logger.info(f"[swap_dit_model] Successfully swapped to {new_model_variant} in {elapsed:.2f}s "
+                        f"(resident: {self.dit_residency.resident()})")
+            return f"✅ Swapped to {new_model_variant} ({elapsed:.1f}s)", True
 
         except Exception as e:
             error_msg = f"❌ Error swapping model: {str(e)}"
             logger.exception("[swap_dit_model] Error swapping model")
+            # Fall back to the previous variant, which is still parked
+            if self.model_variant == current_variant and current_variant is not None:
+                try:
+                    self.model, _ = self.dit_residency.activate(current_variant)
+                except Exception:
+                    logger.exception("[swap_dit_model] Could not restore previous model")
             return error_msg, False
 
+    def _get_compiled_step(self):
+        """
+        Compiled decoder step for the active variant, or None when compilation is off.
+
+        Steps are kept per variant and rebuilt when the variant's model object
+        changes (reload after eviction), so swapping models keeps compilation;
+        persisted artifacts make the rebuild a cache hit. Not used while the DiT
+        is streamed from CPU, whose per-layer hooks cannot be graph-captured.
+        """
+        if not self.compile_model or self.model is None:
+            return None
+        if self.offload_to_cpu and self.offload_dit_to_cpu:
+            return None
+        step = self._compiled_steps.get(self.model_variant)
+        if step is None or step.model is not self.model:
+            from acestep.compiled_step import CompiledDiTStep
+            step = CompiledDiTStep(self.model, self.model_variant)
+            self._compiled_steps[self.model_variant] = step
+            if os.environ.get("ACESTEP_COMPILE_WARMUP", "false").lower() in ("1", "true", "yes"):
+                step.precompile()
+        return step
+
+    def prefetch_dit_model(self, model_variant: str) -> bool:
+        """
+        Start loading ``model_variant`` in the background so a later
+        ``swap_dit_model`` to it does not block on disk or a host-to-device copy.
+
+        Returns:
+            True if a prefetch was started or the variant is already resident on device.
+        """
+        if self.dit_residency is None or not model_variant or model_variant == self.model_variant:
+            return False
+        try:
+            self.dit_residency.prefetch(model_variant)
+            return True
+        except Exception as e:
+            logger.warning(f"[prefetch_dit_model] Could not prefetch {model_variant}: {e}")
+            return False
+
     def _is_on_target_device(self, tensor, target_device):
         """Check if tensor is on the target device (handles cuda vs cuda:0 comparison)."""
         if tensor is None:
@@ -777,38 +975,30 @@ class AceStepHandler:
             yield
             return
 
-        # Load to GPU
-        logger.info(f"[_load_model_context] Loading {model_name} to {self.device}")
-        start_time = time.time()
         if model_name == "vae":
-            vae_dtype = self._get_vae_dtype()
-            self._recursive_to_device(model, self.device, vae_dtype)
+            dtype = self._get_vae_dtype()
         else:
-            self._recursive_to_device(model, self.device, self.dtype)
-        
-        if model_name == "model" and hasattr(self, "silence_latent"):
-             self.silence_latent = self.silence_latent.to(self.device).to(self.dtype)
-        
-        load_time = time.time() - start_time
-        self.current_offload_cost += load_time
-        logger.info(f"[_load_model_context] Loaded {model_name} to {self.device} in {load_time:.4f}s")
+            dtype = self.dtype
 
-        try:
-            yield
-        finally:
-            # Offload to CPU
-            logger.info(f"[_load_model_context] Offloading {model_name} to CPU")
-            start_time = time.time()
-            self._recursive_to_device(model, "cpu")
-            
-            # NOTE: Do NOT offload silence_latent to CPU here!
-            # silence_latent is used in many places outside of model context,
-            # so it should stay on GPU to avoid device mismatch errors.
-            
-            torch.cuda.empty_cache()
-            offload_time = time.time() - start_time
-            self.current_offload_cost += offload_time
-            logger.info(f"[_load_model_context] Offloaded {model_name} to CPU in {offload_time:.4f}s")
+        # Pinned mirrors: one async copy in, a pointer swap out. The DiT is
+        # streamed layer by layer so only a few decoder layers occupy VRAM.
+        start_time = time.time()
+        if model_name == "model":
+            context = self.offload_engine.streamed(model_name, model, dtype)
+        else:
+            context = self.offload_engine.resident(model_name, model, dtype)
+        with context:
+            if model_name == "model" and hasattr(self, "silence_latent"):
+                self.silence_latent = self.silence_latent.to(self.device).to(self.dtype)
+            load_time = time.time() - start_time
+            self.current_offload_cost += load_time
+            logger.debug(f"[_load_model_context] {model_name} ready on {self.device} in {load_time:.4f}s")
+            try:
+                yield
+            finally:
+                start_time = time.time()
+        # NOTE: silence_latent stays on the device; it is used outside model contexts.
+        self.current_offload_cost += time.time() - start_time
 
     def process_target_audio(self, audio_file) -> Optional[torch.Tensor]:
         """Process target audio"""
@@ -832,43 +1022,34 @@ class AceStepHandler:
             logger.exception("[process_target_audio] Error processing target audio")
             return None
     
-    def _parse_audio_code_string(self, code_str: str) -> List[int]:
-        """Extract integer audio codes from prompt tokens like <|audio_code_123|>.
+    def _parse_audio_code_string(self, code_str: Union[str, AudioCodes]) -> List[int]:
+        """Extract integer audio codes from prompt tokens like <|audio_code_123|> (or any AudioCodes form).
         Code values are clamped to valid range [0, 63999] (codebook size = 64000).
         """
         if not code_str:
             return []
         try:
-            MAX_AUDIO_CODE = 63999  # Maximum valid audio code value (codebook size = 64000)
-            codes = []
-            clamped_count = 0
-            for x in re.findall(r"<\|audio_code_(\d+)\|>", code_str):
-                code_value = int(x)
-                # Clamp code value to valid range [0, MAX_AUDIO_CODE]
-                clamped_value = max(0, min(code_value, MAX_AUDIO_CODE))
-                if clamped_value != code_value:
-                    clamped_count += 1
-                    logger.warning(f"[_parse_audio_code_string] Clamped audio code value from {code_value} to {clamped_value}")
-                codes.append(clamped_value)
-            if clamped_count > 0:
-                logger.warning(f"[_parse_audio_code_string] Clamped {clamped_count} audio code value(s) to valid range [0, {MAX_AUDIO_CODE}]")
-            return codes
+            return parse_audio_codes(code_str).tolist()
         except Exception as e:
             logger.debug(f"[_parse_audio_code_string] Failed to parse audio code string: {e}")
             return []
     
-    def _decode_audio_codes_to_latents(self, code_str: str) -> Optional[torch.Tensor]:
+    def _decode_audio_codes_to_latents(self, code_str: Union[str, AudioCodes]) -> Optional[torch.Tensor]:
         """
-        Convert serialized audio code string into 25Hz latents using model quantizer/detokenizer.
+        Convert audio codes (AudioCodes or any serialized form) into 25Hz latents using model quantizer/detokenizer.
         
-        Note: Code values are already clamped to valid range [0, 63999] by _parse_audio_code_string(),
+        Note: Code values are already clamped to valid range [0, 63999] by AudioCodes,
         ensuring indices are within the quantizer's codebook size (64000).
         """
         if self.model is None or not hasattr(self.model, 'tokenizer') or not hasattr(self.model, 'detokenizer'):
             return None
         
-        code_ids = self._parse_audio_code_string(code_str)
-        if len(code_ids) == 0:
+        try:
+            codes = parse_audio_codes(code_str)
+        except Exception as e:
+            logger.debug(f"[_decode_audio_codes_to_latents] Failed to parse audio codes: {e}")
+            return None
+        if len(codes) == 0:
             return None
         
         with self._load_model_context("model"):
@@ -877,8 +1058,8 @@ class AceStepHandler:
             
             num_quantizers = getattr(quantizer, "num_quantizers", 1)
             # Create indices tensor: [T_5Hz]
-            # Note: code_ids are already clamped to [0, 63999] by _parse_audio_code_string()
-            indices = torch.tensor(code_ids, device=self.device, dtype=torch.long)  # [T_5Hz]
+            # Note: codes are already clamped to [0, 63999] by AudioCodes
+            indices = codes.to_tensor(self.device)  # [T_5Hz]
             
             indices = indices.unsqueeze(0).unsqueeze(-1)  # [1, T_5Hz, 1]
             
@@ -1174,11 +1355,11 @@ class AceStepHandler:
         
         return audio
     
-    def _normalize_audio_code_hints(self, audio_code_hints: Optional[Union[str, List[str]]], batch_size: int) -> List[Optional[str]]:
+    def _normalize_audio_code_hints(self, audio_code_hints: Optional[Union[str, AudioCodes, List[Union[str, AudioCodes]]]], batch_size: int) -> List[Optional[AudioCodes]]:
         """Normalize audio_code_hints to list of correct length."""
         if audio_code_hints is None:
             normalized = [None] * batch_size
-        elif isinstance(audio_code_hints, str):
+        elif isinstance(audio_code_hints, (str, AudioCodes)):
             normalized = [audio_code_hints] * batch_size
         elif len(audio_code_hints) == 1 and batch_size > 1:
             normalized = audio_code_hints * batch_size
@@ -1190,8 +1371,15 @@ class AceStepHandler:
         else:
             normalized = list(audio_code_hints)
         
-        # Clean up: convert empty strings to None
-        normalized = [hint if isinstance(hint, str) and hint.strip() else None for hint in normalized]
+        # Parse once per batch; empty strings (or strings without codes) become None
+        parsed = {}
+        for i, hint in enumerate(normalized):
+            if not isinstance(hint, (str, AudioCodes)) or not has_audio_codes(hint):
+                normalized[i] = None
+                continue
+            if id(hint) not in parsed:
+                parsed[id(hint)] = (hint, parse_audio_codes(hint))  # hold hint so its id stays unique
+            normalized[i] = parsed[id(hint)][1] or None
         return normalized
     
     def _normalize_instructions(self, instructions: Optional[Union[str, List[str]]], batch_size: int, default: Optional[str] = None) -> List[str]:
@@ -1282,6 +1470,31 @@ class AceStepHandler:
             latents = latents.squeeze(0)
         
         return latents
+
+    def _encode_audio_cached(self, audio: torch.Tensor, memo: EncodeMemo, prepare=None) -> torch.Tensor:
+        """
+        Latents [T, D] for one waveform, shared within a batch (``memo``) and across requests.
+
+        Args:
+            audio: Audio tensor [channels, samples]; its contents are the cache key
+            memo: Latents already encoded for this batch
+            prepare: Optional transform applied to ``audio`` before encoding
+
+        Returns:
+            Latents tensor [T, D] on the device in the model dtype
+        """
+        key = memo.key(audio)
+        latent = memo.latents.get(key)
+        if latent is not None:
+            return latent
+        cached = self.latent_cache.get(key)
+        if cached is not None:
+            latent = cached.to(self.device).to(self.dtype)
+        else:
+            latent = self._encode_audio_to_latents(prepare(audio) if prepare is not None else audio)
+            self.latent_cache.put(key, latent)
+        memo.latents[key] = latent
+        return latent
     
     def _build_metadata_dict(self, bpm: Optional[Union[int, str]], key_scale: str, time_signature: str, duration: Optional[float] = None) -> Dict[str, Any]:
         """
@@ -1427,6 +1640,18 @@ class AceStepHandler:
             logger.exception("[process_src_audio] Error processing source audio")
             return None
     
+    def _code_cache_salt(self) -> str:
+        """Identity of the VAE + tokenizer pair that produces codes (the tokenizer is part of the DiT)."""
+        variant = self.model_variant
+        memo_key = f"{self._latent_cache_salt}|{variant}"
+        salt = self._code_cache_salts.get(memo_key)
+        if salt is None:
+            from acestep.quantization import weights_fingerprint
+            model_path = os.path.join(self._get_project_root(), "checkpoints", variant)
+            salt = f"{memo_key}:{weights_fingerprint(model_path)}"
+            self._code_cache_salts[memo_key] = salt
+        return salt
+
     def convert_src_audio_to_codes(self, audio_file) -> str:
         """
         Convert uploaded source audio to audio codes string.
@@ -1448,6 +1673,14 @@ class AceStepHandler:
             processed_audio = self.process_src_audio(audio_file)
             if processed_audio is None:
                 return "❌ Failed to process audio file"
+
+            cache_key = None
+            if self.code_cache.enabled:
+                cache_key = waveform_key(processed_audio, self._code_cache_salt())
+                cached = self.code_cache.get(cache_key)
+                if cached is not None:
+                    logger.info(f"[convert_src_audio_to_codes] {len(cached)} audio codes from cache")
+                    return export_audio_codes(cached)
             
             # Encode audio to latents using VAE
             with torch.no_grad():
@@ -1456,8 +1689,8 @@ class AceStepHandler:
                     if self.is_silence(processed_audio.unsqueeze(0)):
                         return "❌ Audio file appears to be silent"
                     
-                    # Encode to latents using helper method
-                    latents = self._encode_audio_to_latents(processed_audio)  # [T, d]
+                    # Encode to latents using helper method (re-used if this audio was encoded recently)
+                    latents = self._encode_audio_cached(processed_audio, EncodeMemo(self._latent_cache_salt))  # [T, d]
                 
                 # Create attention mask for latents
                 attention_mask = torch.ones(latents.shape[0], dtype=torch.bool, device=self.device)
@@ -1471,14 +1704,13 @@ class AceStepHandler:
                     # tokenize returns: (quantized, indices, attention_mask)
                     _, indices, _ = self.model.tokenize(hidden_states, self.silence_latent, attention_mask.unsqueeze(0))
                     
-                    # Format indices as code string
-                    # indices shape: [1, T_5Hz] or [1, T_5Hz, num_quantizers]
-                    # Flatten and convert to list
-                    indices_flat = indices.flatten().cpu().tolist()
-                    codes_string = "".join([f"<|audio_code_{idx}|>" for idx in indices_flat])
+                    # indices shape: [1, T_5Hz] or [1, T_5Hz, num_quantizers]; flattened into AudioCodes
+                    codes = parse_audio_codes(indices.flatten())
                     
-                    logger.info(f"[convert_src_audio_to_codes] Generated {len(indices_flat)} audio codes")
-                    return codes_string
+                    logger.info(f"[convert_src_audio_to_codes] Generated {len(codes)} audio codes")
+                    if cache_key is not None:
+                        self.code_cache.put(cache_key, codes)
+                    return export_audio_codes(codes)
                     
         except Exception as e:
             error_msg = f"❌ Error converting audio to codes: {str(e)}\n{traceback.format_exc()}"
@@ -1525,11 +1757,7 @@ class AceStepHandler:
         is_lego_task = (task_type == "lego")
         is_cover_task = (task_type == "cover")
 
-        has_codes = False
-        if isinstance(audio_code_string, list):
-            has_codes = any((c or "").strip() for c in audio_code_string)
-        else:
-            has_codes = bool(audio_code_string and str(audio_code_string).strip())
+        has_codes = has_audio_codes(audio_code_string)
 
         if has_codes:
             is_cover_task = True
@@ -1708,7 +1936,7 @@ class AceStepHandler:
         repainting_start: Optional[List[float]] = None,
         repainting_end: Optional[List[float]] = None,
         instructions: Optional[List[str]] = None,
-        audio_code_hints: Optional[List[Optional[str]]] = None,
+        audio_code_hints: Optional[List[Optional[Union[str, AudioCodes]]]] = None,
         audio_cover_strength: float = 1.0,
     ) -> Dict[str, Any]:
         """
@@ -1738,10 +1966,14 @@ class AceStepHandler:
         if refer_audios is None:
             refer_audios = [[torch.zeros(2, 30 * self.sample_rate)] for _ in range(batch_size)]
 
+        # Rows often share one reference tensor; convert it once so they keep sharing it
+        converted = {}
         for ii, refer_audio_list in enumerate(refer_audios):
             if isinstance(refer_audio_list, list):
                 for idx, refer_audio in enumerate(refer_audio_list):
-                    refer_audio_list[idx] = refer_audio_list[idx].to(self.device).to(torch.bfloat16)
+                    if id(refer_audio) not in converted:
+                        converted[id(refer_audio)] = (refer_audio, refer_audio.to(self.device).to(torch.bfloat16))
+                    refer_audio_list[idx] = converted[id(refer_audio)][1]
             elif isinstance(refer_audio_list, torch.Tensor):
                 refer_audios[ii] = refer_audios[ii].to(self.device)
         
@@ -1773,6 +2005,7 @@ class AceStepHandler:
             if target_wavs.device != self.device:
                 target_wavs = target_wavs.to(self.device)
             
+            memo = EncodeMemo(self._latent_cache_salt)
             with self._load_model_context("vae"):
                 for i in range(batch_size):
                     code_hint = audio_code_hints[i]
@@ -1794,9 +2027,9 @@ class AceStepHandler:
                         expected_latent_length = current_wav.shape[-1] // 1920
                         target_latent = self.silence_latent[0, :expected_latent_length, :]
                     else:
-                        # Encode using helper method
+                        # Encode using helper method (identical items and recent sources are encoded once)
                         logger.info(f"[generate_music] Encoding target audio to latents for item {i}...")
-                        target_latent = self._encode_audio_to_latents(current_wav.squeeze(0))  # Remove batch dim for helper
+                        target_latent = self._encode_audio_cached(current_wav.squeeze(0), memo)  # Remove batch dim for helper
                     target_latents_list.append(target_latent)
                     latent_lengths.append(target_latent.shape[0])
              
@@ -1814,6 +2047,18 @@ class AceStepHandler:
             # Pad latents to same length
             max_latent_length = max(latent.shape[0] for latent in target_latents_list)
             max_latent_length = max(128, max_latent_length)
+            # Length the outputs are trimmed back to after decode
+            unbucketed_latent_length = max_latent_length
+            if self.duration_bucketing:
+                # Round up to a shared bucket (bounded by the silence latent used as padding)
+                max_latent_length = bucket_latent_length(
+                    max_latent_length, limit=self.silence_latent.shape[1]
+                )
+            padding_stats.record(
+                valid_frames=sum(latent_lengths),
+                total_frames=batch_size * max_latent_length,
+                bucket_frames=batch_size * (max_latent_length - unbucketed_latent_length),
+            )
             
             padded_latents = []
             for latent in target_latents_list:
@@ -1908,6 +2153,9 @@ class AceStepHandler:
                 is_covers.append(is_cover)
         
         chunk_masks = torch.stack(chunk_masks)
+        if max_latent_length > unbucketed_latent_length:
+            # Bucket padding is context (silence), never a region to generate
+            chunk_masks[:, unbucketed_latent_length:] = False
         is_covers = torch.BoolTensor(is_covers).to(self.device)
         
         # Create src_latents based on task type
@@ -2101,6 +2349,7 @@ class AceStepHandler:
             "target_latents": target_latents,
             "src_latents": src_latents,
             "latent_masks": latent_masks,
+            "unbucketed_latent_length": unbucketed_latent_length,
             "chunk_masks": chunk_masks,
             "spans": spans,
             "text_inputs": text_inputs,
@@ -2152,6 +2401,7 @@ class AceStepHandler:
                 z = z.unsqueeze(0)
             return z
 
+        memo = EncodeMemo(self._latent_cache_salt)
         for batch_idx, refer_audios in enumerate(refer_audioss):
             if len(refer_audios) == 1 and torch.all(refer_audios[0] == 0.0):
                 refer_audio_latent = _ensure_latent_3d(self.silence_latent[:, :750, :])
@@ -2159,16 +2409,10 @@ class AceStepHandler:
                 refer_audio_order_mask.append(batch_idx)
             else:
                 for refer_audio in refer_audios:
-                    refer_audio = _normalize_audio_2d(refer_audio)
-                    # Use tiled_encode for memory-efficient encoding of long audio
-                    with torch.no_grad():
-                        refer_audio_latent = self.tiled_encode(refer_audio, offload_latent_to_cpu=True)
-                    # Move to device and cast to model dtype
-                    refer_audio_latent = refer_audio_latent.to(self.device).to(self.dtype)
-                    # Ensure 3D before transpose: [C, T] -> [1, C, T] -> [1, T, C]
-                    if refer_audio_latent.dim() == 2:
-                        refer_audio_latent = refer_audio_latent.unsqueeze(0)
-                    refer_audio_latents.append(_ensure_latent_3d(refer_audio_latent.transpose(1, 2)))
+                    # Tiled encode, once per distinct clip in the batch and cached across requests
+                    refer_audio_latent = self._encode_audio_cached(refer_audio, memo, prepare=_normalize_audio_2d)
+                    # [T, D] -> [1, T, D]
+                    refer_audio_latents.append(_ensure_latent_3d(refer_audio_latent))
                     refer_audio_order_mask.append(batch_idx)
 
         refer_audio_latents = torch.cat(refer_audio_latents, dim=0)
@@ -2282,13 +2526,19 @@ class AceStepHandler:
         cfg_interval_start: float = 0.0,
         cfg_interval_end: float = 1.0,
         shift: float = 1.0,
-        audio_code_hints: Optional[Union[str, List[str]]] = None,
+        audio_code_hints: Optional[Union[str, AudioCodes, List[Optional[Union[str, AudioCodes]]]]] = None,
         infer_method: str = "ode",
         scheduler: Optional[str] = None,  # Override timestep_mode: "linear", "discrete", "continuous"
         timesteps: Optional[List[float]] = None,
         init_latents: Optional[torch.Tensor] = None,
         t_start: float = 1.0,
         checkpoint_step: Optional[int] = None,
+        lora_adapters: Optional[Union[str, List[Optional[str]]]] = None,
+        lora_scales: Optional[Union[float, List[float]]] = None,
+        best_of_keep: Optional[int] = None,
+        prune_step: Optional[int] = None,
+        adaptive_tol: Optional[float] = None,
+        adaptive_min_steps: Optional[int] = None,
     ) -> Dict[str, Any]:
 
         """
@@ -2315,6 +2565,18 @@ class AceStepHandler:
             cfg_interval_end: End of CFG interval (0.0-1.0, default: 1.0)
             init_latents: Pre-computed latent tensor for Pipeline Builder (partial denoising)
             t_start: Starting timestep for Pipeline Builder (0.0-1.0, default: 1.0 = full denoise)
+            lora_adapters: LoRA adapter name per row, or one name for all rows (optional;
+                None rows use the loaded adapter when LoRA is enabled)
+            lora_scales: LoRA scale per row, or one scale for all rows (optional, default: 1.0)
+            best_of_keep: Return only this many rows, ranked by DiT lyric alignment
+                (optional; see ``_best_of_pruner``)
+            prune_step: Diffusion step at which the ranking happens (default: a quarter
+                of the schedule); the other rows are not denoised further
+            adaptive_tol: Finish a row early once its x0 estimate changes by less than
+                this (relative L2) between steps (optional; default ``ACESTEP_ADAPTIVE_TOL``,
+                0 runs every step; see ``generate_audio_core``)
+            adaptive_min_steps: First step at which a row may finish early (default: half
+                the schedule)
 
         Returns:
             Dictionary containing:
@@ -2476,12 +2738,58 @@ class AceStepHandler:
             
             logger.info(f"[service_generate] Calling generate_audio_core with variant={self.model_variant}")
             logger.info(f"[service_generate] init_latents={init_latents}, t_start={t_start}")
-            outputs = generate_audio_core(
-                self.model, variant=self.model_variant,
-                init_latents=init_latents, t_start=t_start,
-                checkpoint_step=checkpoint_step,
-                **generate_kwargs,
-            )
+            # LoRA hooks and merged weights live on the shared decoder: hold it for the whole run
+            with self._decoder_lock:
+                row_adapters, row_scales = self._resolve_lora_rows(src_latents.shape[0], lora_adapters, lora_scales)
+                # Resolved per-row adapters, for LRC/scoring passes over these latents
+                lora_names = [a.name if a is not None else None for a in row_adapters]
+                lora_row_scales = list(row_scales)
+                row_adapters, row_scales = self._apply_lora_merge(row_adapters, row_scales)
+                use_lora_rows = any(a is not None for a in row_adapters)
+                # The compiled graphs do not include the LoRA hooks
+                decoder_step = None if use_lora_rows else self._get_compiled_step()
+                latent_attention_mask = None
+                if batch["unbucketed_latent_length"] < src_latents.shape[1]:
+                    # Keep bucket padding out of self-attention
+                    latent_attention_mask = batch["latent_masks"].to(device=src_latents.device, dtype=src_latents.dtype)
+                if use_lora_rows:
+                    logger.info(f"[service_generate] LoRA rows: {[a.name if a is not None else None for a in row_adapters]}")
+                pruner = None
+                if best_of_keep is not None and best_of_keep < src_latents.shape[0]:
+                    pruner = self._best_of_pruner(best_of_keep, lyrics, lyric_token_idss, vocal_languages, infer_steps,
+                                                  lora_names, lora_row_scales)
+                    if prune_step is None:
+                        prune_step = max(1, infer_steps // 4)
+                with lora_batch(self.model.decoder, row_adapters, row_scales):
+                    outputs = generate_audio_core(
+                        self.model, variant=self.model_variant,
+                        init_latents=init_latents, t_start=t_start,
+                        checkpoint_step=checkpoint_step,
+                        decoder_step=decoder_step,
+                        attention_mask=latent_attention_mask,
+                        # Per-row LoRA deltas are bound to the original batch rows
+                        prune_step=prune_step, prune_fn=None if use_lora_rows else pruner,
+                        # Rows leaving the batch would shift the per-row LoRA hooks too
+                        adaptive_tol=None if use_lora_rows else (self.adaptive_tol if adaptive_tol is None else adaptive_tol),
+                        adaptive_min_steps=adaptive_min_steps,
+                        **generate_kwargs,
+                    )
+                if decoder_step is not None:
+                    decoder_step.save()
+                kept_rows = outputs.get("kept_rows")
+                if best_of_keep is not None and outputs["target_latents"].shape[0] > best_of_keep:
+                    # Not pruned during diffusion: rank the finished latents, which still
+                    # saves the VAE decode and saving of the dropped rows
+                    rows = list(range(outputs["target_latents"].shape[0]))
+                    if pruner is not None:
+                        rows = pruner(outputs["target_latents"], encoder_hidden_states, encoder_attention_mask,
+                                      context_latents, rows)
+                    else:
+                        rows = rows[:best_of_keep]
+                    outputs["target_latents"] = outputs["target_latents"][rows]
+                    outputs["steps_run"] = [outputs["steps_run"][r] for r in rows]
+                    # Positions in the returned latents -> original batch rows
+                    kept_rows = [kept_rows[r] for r in rows] if kept_rows is not None else rows
             logger.info(f"[service_generate] generate_audio_core returned type={type(outputs)}")
             if outputs is None:
                 logger.error("[service_generate] generate_audio_core returned None!")
@@ -2494,15 +2802,70 @@ class AceStepHandler:
         outputs["chunk_masks"] = chunk_mask
         outputs["spans"] = spans
         outputs["latent_masks"] = batch.get("latent_masks")  # Latent masks for valid length
+        outputs["unbucketed_latent_length"] = batch.get("unbucketed_latent_length")
         
         # Add condition tensors for LRC timestamp generation
         outputs["encoder_hidden_states"] = encoder_hidden_states
         outputs["encoder_attention_mask"] = encoder_attention_mask
         outputs["context_latents"] = context_latents
         outputs["lyric_token_idss"] = lyric_token_idss
+
+        if kept_rows is not None:
+            # Per-row outputs follow the surviving candidates
+            for key in ("src_latents", "target_latents_input", "chunk_masks", "latent_masks",
+                        "encoder_hidden_states", "encoder_attention_mask", "context_latents",
+                        "lyric_token_idss", "checkpoint_latent"):
+                value = outputs.get(key)
+                if isinstance(value, torch.Tensor) and value.shape[0] == batch_size:
+                    outputs[key] = value[torch.tensor(kept_rows, device=value.device)]
+            lora_names = [lora_names[r] for r in kept_rows]
+            lora_row_scales = [lora_row_scales[r] for r in kept_rows]
+        outputs["kept_rows"] = kept_rows
+        outputs["lora_adapters"] = lora_names
+        outputs["lora_scales"] = lora_row_scales
         
         return outputs
 
+    def _best_of_pruner(self, keep: int, lyrics: List[str], lyric_token_idss: torch.Tensor,
+                        vocal_languages: Optional[List[str]], infer_steps: int,
+                        lora_names: List[Optional[str]], lora_scales: List[float]):
+        """
+        Row selector for best-of-N generation, or None without sung lyrics to align.
+
+        Rows are ranked by the DiT lyric-alignment score (``get_lyric_alignments``'s
+        ``dit_score``, without the LM pass) of their x0 estimate; the ``keep`` best
+        are returned in batch order. Called inside the DiT model context.
+        """
+        if not any(l and l.strip() and l.strip().lower() != "[instrumental]" for l in lyrics):
+            return None
+
+        def prune(x0, encoder_hidden_states, encoder_attention_mask, context_latents, rows):
+            try:
+                aligns = self.get_lyric_alignments(
+                    pred_latents=x0,
+                    encoder_hidden_states=encoder_hidden_states,
+                    encoder_attention_mask=encoder_attention_mask,
+                    context_latents=context_latents,
+                    lyric_token_idss=lyric_token_idss[list(rows)],
+                    vocal_language=[vocal_languages[row] if vocal_languages else "en" for row in rows],
+                    inference_steps=infer_steps,
+                    lora_adapters=[lora_names[row] for row in rows],
+                    lora_scales=[lora_scales[row] for row in rows],
+                    include_lm=False,
+                    include_timestamps=False,
+                    load_model=False,
+                )
+            except Exception:
+                logger.exception("[best_of] Alignment scoring failed")
+                aligns = [{"success": False}] * len(rows)
+            scores = [a["dit_score"] if a.get("success") else float("-inf") for a in aligns]
+            ranked = sorted(range(len(rows)), key=lambda r: scores[r], reverse=True)[:keep]
+            logger.info(f"[best_of] Alignment scores {dict(zip(rows, [round(x, 4) for x in scores]))}, "
+                        f"keeping {sorted(rows[r] for r in ranked)}")
+            return sorted(ranked)
+
+        return prune
+
     def tiled_decode(self, latents, chunk_size=512, overlap=64, offload_wav_to_cpu=True):
         """
         Decode latents using tiling to reduce VRAM usage.
@@ -2560,6 +2923,7 @@ class AceStepHandler:
         upsample_factor = None
         
         for i in tqdm(range(num_steps), desc="Decoding audio chunks"):
+            check_cancelled()
             # Core range in latents
             core_start = i * stride
             core_end = min(core_start + stride, T)
@@ -2637,6 +3001,7 @@ class AceStepHandler:
         
         # Process remaining chunks
         for i in tqdm(range(1, num_steps), desc="Decoding audio chunks"):
+            check_cancelled()
             # Core range in latents
             core_start = i * stride
             core_end = min(core_start + stride, T)
@@ -2859,6 +3224,252 @@ class AceStepHandler:
         
         return final_latents
 
+    def _repaint_region(self, total_samples: int, repainting_start: Optional[float],
+                        repainting_end: Optional[float], context_seconds: float) -> Optional[Tuple[int, int]]:
+        """
+        (start, end) samples of the source a repaint needs: the window plus
+        ``context_seconds`` on each side, on latent-frame boundaries. None when
+        the whole track is needed anyway (context disabled, outpainting, or a
+        region covering the track).
+        """
+        if context_seconds is None or context_seconds < 0:
+            return None
+        start = repainting_start or 0.0
+        end = total_samples / self.sample_rate if repainting_end is None else float(repainting_end)
+        if start < 0 or end * self.sample_rate > total_samples or end <= start:
+            return None
+        hop = 1920  # audio samples per latent frame
+        region_start = max(0, int((start - context_seconds) * self.sample_rate)) // hop * hop
+        region_end = min(total_samples, -(-int((end + context_seconds) * self.sample_rate) // hop) * hop)
+        if region_start == 0 and region_end == total_samples:
+            return None
+        return region_start, region_end
+
+    def _splice_repaint_region(self, src_audio: torch.Tensor, region_wavs: torch.Tensor,
+                               region: Tuple[int, int], window: Tuple[int, int]) -> torch.Tensor:
+        """
+        Full-length audio [batch, channels, samples]: the source, with the decoded
+        region mixed in. Within the context on each side of the repaint window the
+        mix ramps linearly from the source to the generated audio.
+        """
+        region_start, region_end = region
+        length = min(region_end - region_start, region_wavs.shape[-1])
+        win_start = max(0, min(window[0], length))
+        win_end = max(win_start, min(window[1], length))
+        src = src_audio.to(device=region_wavs.device, dtype=region_wavs.dtype)
+        src_region = src[:, region_start:region_start + length]
+
+        fade = torch.ones(length, device=region_wavs.device, dtype=region_wavs.dtype)
+        if win_start > 0:
+            fade[:win_start] = torch.linspace(0.0, 1.0, win_start, device=fade.device, dtype=fade.dtype)
+        if win_end < length:
+            fade[win_end:] = torch.linspace(1.0, 0.0, length - win_end, device=fade.device, dtype=fade.dtype)
+
+        out = src.unsqueeze(0).repeat(region_wavs.shape[0], 1, 1)
+        out[..., region_start:region_start + length] = src_region + (region_wavs[..., :length] - src_region) * fade
+        return out
+
+    def _long_form_windows(self, total_samples: int) -> List[Tuple[int, int]]:
+        """
+        (start, end) samples of each long-form window: ``longform_window_seconds``
+        long, consecutive windows sharing at least ``longform_overlap_seconds``, on
+        5Hz code boundaries. The last window is shifted left to at least twice
+        the overlap so it has context to continue from.
+        """
+        hop = 1920 * 5  # audio samples per 5Hz audio code (5 latent frames)
+        window = max(2 * hop, int(self.longform_window_seconds * self.sample_rate) // hop * hop)
+        overlap = max(hop, min(window // 2, int(self.longform_overlap_seconds * self.sample_rate) // hop * hop))
+        if total_samples <= window:
+            return [(0, total_samples)]
+        windows = []
+        start = 0
+        while start + window < total_samples:
+            windows.append((start, start + window))
+            start += window - overlap
+        last_start = min(start, (total_samples - 2 * overlap) // hop * hop)
+        windows.append((last_start, total_samples))
+        return windows
+
+    @staticmethod
+    def _split_lyrics_for_windows(lyrics: str, windows: List[Tuple[int, int]], total_samples: int) -> List[str]:
+        """
+        Lyrics of each long-form window. Lines are spread evenly over the track
+        and each goes to the window whose share (split at the middle of the
+        overlaps) holds its position; section tags stay with the line after them.
+        """
+        groups, pending = [], []
+        for line in (lyrics or "").splitlines():
+            stripped = line.strip()
+            if not stripped:
+                continue
+            pending.append(line)
+            if not (stripped.startswith("[") and stripped.endswith("]")):
+                groups.append(pending)
+                pending = []
+        if not groups:
+            # Instrumental or tags only: every window gets the same lyrics
+            return [lyrics] * len(windows)
+        groups[-1].extend(pending)
+
+        bounds = [(prev_end + start) / 2 for (_, prev_end), (start, _) in zip(windows, windows[1:])]
+        parts: List[List[str]] = [[] for _ in windows]
+        for i, group in enumerate(groups):
+            position = (i + 0.5) / len(groups) * total_samples
+            parts[sum(position >= b for b in bounds)].extend(group)
+        return ["\n".join(part) for part in parts]
+
+    def _generate_long_form(
+        self,
+        windows: List[Tuple[int, int]],
+        captions: str,
+        lyrics: str,
+        bpm: Optional[int],
+        key_scale: str,
+        time_signature: str,
+        vocal_language: str,
+        instruction: str,
+        seeds: List[int],
+        seed_value_for_ui: str,
+        refer_audios,
+        audio_code_string,
+        use_tiled_decode: bool,
+        progress,
+        **service_kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Long-form generation over ``windows`` (see ``_long_form_windows``).
+
+        The first window is generated as usual. Each following one is an
+        outpaint of the audio generated so far: the part it shares with the
+        previous window is kept as source and the rest is repainted, under the
+        same caption and metas, with the lyrics split across windows. Each
+        window offsets the per-row seeds by its index, so windows start from
+        different noise. With audio codes every window is instead a cover of its slice
+        of the codes. Each window is decoded on its own and crossfaded into a
+        CPU buffer over the shared part, so DiT and VAE memory follow the window
+        length, not the track length.
+        """
+        batch_size = len(seeds)
+        total_samples = windows[-1][1]
+        hop = 1920
+        lyrics_per_window = self._split_lyrics_for_windows(lyrics, windows, total_samples)
+        codes = None
+        if has_audio_codes(audio_code_string):
+            rows = audio_code_string if isinstance(audio_code_string, list) else [audio_code_string] * batch_size
+            codes = [parse_audio_codes(row) for row in rows]
+
+        out_wavs = torch.zeros(batch_size, 2, total_samples)
+        latent_parts = []
+        time_costs: Dict[str, float] = {}
+        steps_run = [0] * batch_size
+        written = 0
+        logger.info(f"[generate_music] Long-form: {total_samples / self.sample_rate:.1f}s in {len(windows)} windows "
+                    f"of up to {max(end - start for start, end in windows) / self.sample_rate:.1f}s")
+
+        for w, (start, end) in enumerate(windows):
+            check_cancelled()
+            progress(0.52 + 0.45 * w / len(windows), desc=f"Generating window {w + 1}/{len(windows)}...")
+            length = end - start
+            shared = max(0, written - start)
+            target_wavs = torch.zeros(batch_size, 2, length)
+            repainting_start = repainting_end = None
+            window_instruction = instruction
+            hints = None
+            if codes is not None:
+                hints = [AudioCodes(row.array[start // (hop * 5):end // (hop * 5)]) for row in codes]
+            elif shared:
+                target_wavs[..., :shared] = out_wavs[..., start:start + shared]
+                repainting_start = [shared / self.sample_rate] * batch_size
+                repainting_end = [length / self.sample_rate] * batch_size
+                window_instruction = TASK_INSTRUCTIONS["repaint"]
+
+            captions_batch, instructions_batch, lyrics_batch, vocal_languages_batch, metas_batch = self.prepare_batch_data(
+                batch_size, None, length / self.sample_rate, captions, lyrics_per_window[w],
+                vocal_language, window_instruction, bpm, key_scale, time_signature,
+            )
+            outputs = self.service_generate(
+                captions=captions_batch,
+                lyrics=lyrics_batch,
+                metas=metas_batch,
+                vocal_languages=vocal_languages_batch,
+                refer_audios=refer_audios,
+                target_wavs=target_wavs,
+                seed=[(s + w) % 2 ** 32 for s in seeds],
+                repainting_start=repainting_start,
+                repainting_end=repainting_end,
+                instructions=instructions_batch,
+                audio_code_hints=hints,
+                **service_kwargs,
+            )
+            for key, value in outputs["time_costs"].items():
+                time_costs[key] = time_costs.get(key, 0.0) + value
+            steps_run = [total + steps for total, steps in zip(steps_run, outputs["steps_run"])]
+
+            keep_frames = outputs.get("unbucketed_latent_length") or outputs["target_latents"].shape[1]
+            window_latents = outputs["target_latents"][:, :keep_frames]
+            del outputs
+            start_time = time.time()
+            with torch.no_grad():
+                with self._load_model_context("vae"):
+                    latents_for_decode = window_latents.transpose(1, 2).contiguous().to(self.vae.dtype)
+                    if use_tiled_decode:
+                        wavs = self.tiled_decode(latents_for_decode)
+                    else:
+                        wavs = self.vae.decode(latents_for_decode).sample
+                    wavs = wavs.float().cpu()
+                    del latents_for_decode
+                    torch.cuda.empty_cache()
+            time_costs["vae_decode_time_cost"] = time_costs.get("vae_decode_time_cost", 0.0) + time.time() - start_time
+
+            n = min(length, wavs.shape[-1])
+            shared = min(shared, n)
+            if shared:
+                fade = torch.linspace(0.0, 1.0, shared)
+                prev = out_wavs[..., start:start + shared]
+                out_wavs[..., start:start + shared] = prev + (wavs[..., :shared] - prev) * fade
+            out_wavs[..., start + shared:start + n] = wavs[..., shared:n]
+            latent_parts.append(window_latents[:, shared // hop:].detach().cpu())
+            written = start + n
+            del wavs, window_latents
+
+        time_costs["total_time_cost"] = time_costs.get("total_time_cost", 0.0) + time_costs.get("vae_decode_time_cost", 0.0)
+        time_costs["offload_time_cost"] = self.current_offload_cost
+        out_wavs = out_wavs[..., :written]
+        logger.info(f"[generate_music] Long-form done: {written / self.sample_rate:.1f}s per sample")
+
+        extra_outputs = {
+            "pred_latents": torch.cat(latent_parts, dim=1),
+            "checkpoint_latent": None,
+            "checkpoint_step": None,
+            "schedule": None,
+            "target_latents": None,
+            "src_latents": None,
+            "chunk_masks": None,
+            "latent_masks": None,
+            "spans": [],
+            "time_costs": time_costs,
+            "seed_value": seed_value_for_ui,
+            "kept_rows": None,
+            "steps_run": steps_run,
+            "padding_waste": 0.0,
+            "repaint_region": None,
+            "long_form_windows": [(start / self.sample_rate, end / self.sample_rate) for start, end in windows],
+            # Conditions differ per window, so there are none for LRC/scoring of the whole track
+            "encoder_hidden_states": None,
+            "encoder_attention_mask": None,
+            "context_latents": None,
+            "lyric_token_idss": None,
+            "lora_adapters": None,
+            "lora_scales": None,
+        }
+        return {
+            "audios": [{"tensor": out_wavs[i].clone(), "sample_rate": self.sample_rate} for i in range(batch_size)],
+            "status_message": "✅ Generation completed successfully!",
+            "extra_outputs": extra_outputs,
+            "success": True,
+            "error": None,
+        }
+
     def generate_music(
         self,
         captions: str,
@@ -2875,7 +3486,7 @@ class AceStepHandler:
         audio_duration: Optional[float] = None,
         batch_size: Optional[int] = None,
         src_audio=None,
-        audio_code_string: Union[str, List[str]] = "",
+        audio_code_string: Union[str, AudioCodes, List[Union[str, AudioCodes]]] = "",
         repainting_start: float = 0.0,
         repainting_end: Optional[float] = None,
         instruction: str = DEFAULT_DIT_INSTRUCTION,
@@ -2891,10 +3502,40 @@ class AceStepHandler:
         init_latents: Optional[torch.Tensor] = None,
         t_start: float = 1.0,
         checkpoint_step: Optional[int] = None,
+        lora_adapter: Optional[str] = None,
+        lora_scale: Optional[float] = None,
+        best_of_keep: Optional[int] = None,
+        prune_step: Optional[int] = None,
+        repaint_context: Optional[float] = None,
+        long_form: bool = False,
+        adaptive_tol: Optional[float] = None,
+        adaptive_min_steps: Optional[int] = None,
         progress=None
     ) -> Dict[str, Any]:
         """
         Main interface for music generation
+
+        With ``best_of_keep``, ``batch_size`` candidates are generated and only the
+        ``best_of_keep`` best (DiT lyric alignment at ``prune_step``) are finished,
+        decoded and returned; ``extra_outputs["kept_rows"]`` maps them back to
+        the candidate rows.
+
+        With ``repaint_context`` >= 0 (default ``ACESTEP_REPAINT_CONTEXT_SECONDS``,
+        off), repaints inside the source audio only denoise and decode the window
+        plus that many seconds of source on each side; the result is crossfaded
+        back into the source over that context, and ``extra_outputs["repaint_region"]``
+        gives the span (seconds) that was regenerated. The latents and conditions
+        would cover only that span, so they are not returned (no LRC, scoring or
+        stored latents for such results).
+
+        With ``long_form``, text2music (or cover from audio codes) longer than
+        ``ACESTEP_LONGFORM_WINDOW_SECONDS`` is generated in overlapping windows
+        (see ``_generate_long_form``); ``extra_outputs["long_form_windows"]``
+        lists them in seconds. Peak memory is that of one window.
+
+        With ``adaptive_tol`` (default ``ACESTEP_ADAPTIVE_TOL``), rows whose x0
+        estimate has converged finish before the end of the schedule;
+        ``extra_outputs["steps_run"]`` gives the steps each returned row took.
         
         Returns:
             Dictionary containing:
@@ -2918,16 +3559,11 @@ class AceStepHandler:
                 "error": "Model not fully initialized",
             }
 
-        def _has_audio_codes(v: Union[str, List[str]]) -> bool:
-            if isinstance(v, list):
-                return any((x or "").strip() for x in v)
-            return bool(v and str(v).strip())
-
         # Auto-detect task type based on audio_code_string
         # If audio_code_string is provided and not empty, use cover task
         # Otherwise, use text2music task (or keep current task_type if not text2music)
         if task_type == "text2music":
-            if _has_audio_codes(audio_code_string):
+            if has_audio_codes(audio_code_string):
                 # User has provided audio codes, switch to cover task
                 task_type = "cover"
                 # Update instruction for cover task
@@ -2968,17 +3604,67 @@ class AceStepHandler:
                     refer_audios = [[processed_ref_audio] for _ in range(actual_batch_size)]
             else:
                 refer_audios = [[torch.zeros(2, 30*self.sample_rate)] for _ in range(actual_batch_size)]
+
+            if long_form and src_audio is None and task_type in ("text2music", "cover") \
+                    and init_latents is None and not best_of_keep:
+                long_form_duration = audio_duration
+                if has_audio_codes(audio_code_string):
+                    rows = audio_code_string if isinstance(audio_code_string, list) else [audio_code_string]
+                    code_lengths = {len(parse_audio_codes(row)) for row in rows}
+                    long_form_duration = max(code_lengths) / 5.0
+                windows = self._long_form_windows(int(float(long_form_duration or 0) * self.sample_rate))
+                if len(windows) > 1:
+                    if has_audio_codes(audio_code_string) and len(code_lengths) > 1:
+                        # Windows are cut from the codes; shorter rows would get empty hints
+                        raise ValueError(f"long_form needs audio codes of the same length for every row; "
+                                         f"got lengths {sorted(code_lengths)}")
+                    return self._generate_long_form(
+                        windows, captions, lyrics, bpm, key_scale, time_signature, vocal_language, instruction,
+                        actual_seed_list, seed_value_for_ui, refer_audios, audio_code_string, use_tiled_decode,
+                        progress,
+                        infer_steps=inference_steps,
+                        guidance_scale=guidance_scale,
+                        audio_cover_strength=audio_cover_strength,
+                        use_adg=use_adg,
+                        cfg_interval_start=cfg_interval_start,
+                        cfg_interval_end=cfg_interval_end,
+                        shift=shift,
+                        infer_method=infer_method,
+                        timesteps=timesteps,
+                        lora_adapters=lora_adapter,
+                        lora_scales=lora_scale,
+                        adaptive_tol=adaptive_tol,
+                        adaptive_min_steps=adaptive_min_steps,
+                    )
             
             # 2. Process source audio
             # If audio_code_string is provided, ignore src_audio and use codes instead
             processed_src_audio = None
             if src_audio is not None:
                 # Check if audio codes are provided - if so, ignore src_audio
-                if _has_audio_codes(audio_code_string):
+                if has_audio_codes(audio_code_string):
                     logger.info("[generate_music] Audio codes provided, ignoring src_audio and using codes instead")
                 else:
                     logger.info("[generate_music] Processing source audio...")
                     processed_src_audio = self.process_src_audio(src_audio)
+
+            # Region-limited repaint: generate only the window plus context
+            repaint_region = None
+            if task_type == "repaint" and processed_src_audio is not None:
+                repaint_region = self._repaint_region(
+                    processed_src_audio.shape[-1], repainting_start, repainting_end,
+                    self.repaint_context_seconds if repaint_context is None else repaint_context,
+                )
+            if repaint_region is not None:
+                full_src_audio = processed_src_audio
+                region_start, region_end = repaint_region
+                processed_src_audio = full_src_audio[:, region_start:region_end]
+                region_offset = region_start / self.sample_rate
+                repainting_start = (repainting_start or 0.0) - region_offset
+                if repainting_end is not None:
+                    repainting_end = float(repainting_end) - region_offset
+                logger.info(f"[generate_music] Repainting {region_offset:.2f}-{region_end / self.sample_rate:.2f}s "
+                            f"of {full_src_audio.shape[-1] / self.sample_rate:.2f}s source")
                 
             # 3. Prepare batch data
             captions_batch, instructions_batch, lyrics_batch, vocal_languages_batch, metas_batch = self.prepare_batch_data(
@@ -3013,7 +3699,7 @@ class AceStepHandler:
             # Prepare audio_code_hints - use if audio_code_string is provided
             # This works for both text2music (auto-switched to cover) and cover tasks
             audio_code_hints_batch = None
-            if _has_audio_codes(audio_code_string):
+            if has_audio_codes(audio_code_string):
                 if isinstance(audio_code_string, list):
                     audio_code_hints_batch = audio_code_string
                 else:
@@ -3045,6 +3731,12 @@ class AceStepHandler:
                 init_latents=init_latents,
                 t_start=t_start,
                 checkpoint_step=checkpoint_step,
+                lora_adapters=lora_adapter,  # Named adapter for every row (None = loaded default)
+                lora_scales=lora_scale,
+                best_of_keep=best_of_keep,
+                prune_step=prune_step,
+                adaptive_tol=adaptive_tol,
+                adaptive_min_steps=adaptive_min_steps,
             )
             
             logger.info("[generate_music] Model generation completed. Decoding latents...")
@@ -3096,7 +3788,31 @@ class AceStepHandler:
             end_time = time.time()
             time_costs["vae_decode_time_cost"] = end_time - start_time
             time_costs["total_time_cost"] = time_costs["total_time_cost"] + time_costs["vae_decode_time_cost"]
-            
+
+            # Trim duration-bucket padding off the audio and the returned latents
+            keep_frames = outputs.get("unbucketed_latent_length")
+            padded_frames = pred_latents_cpu.shape[1]
+            if keep_frames is not None and keep_frames < padded_frames:
+                pred_wavs = pred_wavs[..., :keep_frames * 1920]
+                pred_latents_cpu = pred_latents_cpu[:, :keep_frames]
+                for key in ("src_latents", "target_latents_input", "chunk_masks", "latent_masks", "context_latents"):
+                    if outputs.get(key) is not None:
+                        outputs[key] = outputs[key][:, :keep_frames]
+                if outputs.get("checkpoint_latent") is not None:
+                    outputs["checkpoint_latent"] = outputs["checkpoint_latent"][:, :keep_frames]
+                outputs["spans"] = [
+                    (kind, min(start, keep_frames), min(end, keep_frames))
+                    for kind, start, end in outputs.get("spans", [])
+                ]
+                logger.info(f"[generate_music] Trimmed bucket padding: {padded_frames} -> {keep_frames} latent frames")
+            
+            if repaint_region is not None:
+                repaint_window = (
+                    int(round(repainting_start * self.sample_rate)),
+                    int(round(repainting_end * self.sample_rate)) if repainting_end is not None else processed_src_audio.shape[-1],
+                )
+                pred_wavs = self._splice_repaint_region(full_src_audio, pred_wavs, repaint_region, repaint_window)
+
             # Update offload cost one last time to include VAE offloading
             time_costs["offload_time_cost"] = self.current_offload_cost
             
@@ -3109,7 +3825,7 @@ class AceStepHandler:
             # Move to CPU and convert to float32 for return
             audio_tensors = []
             
-            for i in range(actual_batch_size):
+            for i in range(pred_wavs.shape[0]):
                 # Extract audio tensor: [channels, samples] format, CPU, float32
                 audio_tensor = pred_wavs[i].cpu().float()
                 audio_tensors.append(audio_tensor)
@@ -3149,13 +3865,28 @@ class AceStepHandler:
                 "spans": spans,
                 "time_costs": time_costs,
                 "seed_value": seed_value_for_ui,
+                "kept_rows": outputs.get("kept_rows"),
+                "steps_run": outputs.get("steps_run"),
+                "padding_waste": 1.0 - (keep_frames or padded_frames) / padded_frames,
+                "repaint_region": [r / self.sample_rate for r in repaint_region] if repaint_region is not None else None,
                 # Condition tensors for LRC timestamp generation
                 "encoder_hidden_states": encoder_hidden_states.detach().cpu() if encoder_hidden_states is not None else None,
                 "encoder_attention_mask": encoder_attention_mask.detach().cpu() if encoder_attention_mask is not None else None,
                 "context_latents": context_latents.detach().cpu() if context_latents is not None else None,
                 "lyric_token_idss": lyric_token_idss.detach().cpu() if lyric_token_idss is not None else None,
+                # Per-row adapters the latents were generated with (LRC/scoring apply them too)
+                "lora_adapters": outputs.get("lora_adapters"),
+                "lora_scales": outputs.get("lora_scales"),
             }
             
+            if repaint_region is not None:
+                # Latents and conditions cover the regenerated region, not the returned track
+                for key in ("pred_latents", "checkpoint_latent", "target_latents", "src_latents", "chunk_masks",
+                            "latent_masks", "encoder_hidden_states", "encoder_attention_mask",
+                            "context_latents", "lyric_token_idss"):
+                    extra_outputs[key] = None
+                extra_outputs["spans"] = []
+
             # Build audios list with tensor data (no file paths, no UUIDs, handled outside)
             audios = []
             for idx, audio_tensor in enumerate(audio_tensors):
@@ -3185,6 +3916,251 @@ class AceStepHandler:
             }
 
     @torch.no_grad()
+    def get_lyric_alignments(
+        self,
+        pred_latents: torch.Tensor,
+        encoder_hidden_states: torch.Tensor,
+        encoder_attention_mask: torch.Tensor,
+        context_latents: torch.Tensor,
+        lyric_token_idss: torch.Tensor,
+        vocal_language: Union[str, List[str]] = "en",
+        inference_steps: int = 8,
+        seed: Optional[int] = 42,
+        custom_layers_config: Optional[Dict] = None,
+        cache: Optional[Dict] = None,
+        include_lm: bool = True,
+        include_timestamps: bool = True,
+        load_model: bool = True,
+        lora_adapters: Optional[List[Optional[str]]] = None,
+        lora_scales: Optional[List[float]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Lyric alignment of every row of a batch from shared attention-capture passes.
+
+        Each decoder pass covers up to ``alignment_batch`` rows: the regressed latent
+        at t=1/steps (DiT score and LRC timestamps) and, with ``include_lm``, pure
+        noise at t=1.0 (LM score). Every row gets the noise a single-row call with
+        ``seed`` draws, so results match the previous per-sample passes.
+
+        Args:
+            pred_latents: Generated latents [batch, T, D]
+            encoder_hidden_states, encoder_attention_mask, context_latents: Cached conditions
+            lyric_token_idss: Tokenized lyrics [batch, seq_len]
+            vocal_language: Language code, or one per row, for lyrics header parsing
+            inference_steps: Number of inference steps (for noise level calculation)
+            seed: Random seed for noise generation
+            custom_layers_config: Dict mapping layer indices to head indices
+            cache: Per-result dict (e.g. ``extra_outputs["lyric_alignment"]``) holding the
+                processed attention of rows already captured; only missing rows run on
+                the GPU. Used for explicit seeds only.
+            include_lm: Also capture the t=1.0 pass for ``lm_score``
+            include_timestamps: Also keep the LRC alignment matrix
+            load_model: False when the caller already holds the DiT model context
+            lora_adapters, lora_scales: LoRA adapter name and scale per row the latents
+                were generated with (``extra_outputs["lora_adapters"]`` /
+                ``["lora_scales"]``; None rows use the base model). The capture pass
+                applies them as the generation did. None uses the default adapter
+                for every row.
+
+        Returns:
+            One dict per row with success, error, lyric_ids, dit_score and, when
+            requested, lm_score and stamps_matrix (None with stamps_error on failure).
+        """
+        if custom_layers_config is None:
+            custom_layers_config = self.custom_layers_config
+
+        bsz = pred_latents.shape[0]
+        languages = vocal_language if isinstance(vocal_language, (list, tuple)) else [vocal_language] * bsz
+        layers_key = tuple(sorted((int(k), tuple(v)) for k, v in custom_layers_config.items()))
+        needed = {"dit_score"}
+        if include_lm:
+            needed.add("lm_score")
+        if include_timestamps:
+            needed.add("stamps_matrix")
+        if seed is None:
+            cache = None
+        row_adapters, row_scales = self._resolve_lora_rows(
+            bsz, lora_adapters, lora_scales, use_default=lora_adapters is None
+        )
+
+        def cache_key(row):
+            adapter = row_adapters[row]
+            lora = (adapter.name, round(row_scales[row], 6)) if adapter is not None else None
+            return (row, seed, int(inference_steps), languages[row], layers_key, lora)
+
+        results: List[Optional[Dict[str, Any]]] = [None] * bsz
+        todo = []
+        for row in range(bsz):
+            entry = cache.get(cache_key(row)) if cache is not None else None
+            if entry is not None and needed <= entry.keys():
+                results[row] = entry
+            else:
+                todo.append(row)
+
+        device = self.device
+        dtype = self.dtype
+        chunk = max(1, self.alignment_batch)
+        with self._load_model_context("model") if load_model and todo else nullcontext():
+            for start in range(0, len(todo), chunk):
+                rows = todo[start:start + chunk]
+                with self._decoder_lock:
+                    chunk_adapters, chunk_scales = self._apply_lora_merge(
+                        [row_adapters[row] for row in rows], [row_scales[row] for row in rows]
+                    )
+                    with lora_batch(self.model.decoder, chunk_adapters, chunk_scales):
+                        entries = self._align_rows(
+                            rows, pred_latents, encoder_hidden_states, encoder_attention_mask, context_latents,
+                            lyric_token_idss, languages, inference_steps, seed, custom_layers_config,
+                            include_lm, include_timestamps, device, dtype,
+                        )
+                for row, entry in zip(rows, entries):
+                    results[row] = entry
+                    if cache is not None and entry["success"]:
+                        cache[cache_key(row)] = entry
+        return results
+
+    def _align_rows(self, rows, pred_latents, encoder_hidden_states, encoder_attention_mask, context_latents,
+                    lyric_token_idss, languages, inference_steps, seed, custom_layers_config,
+                    include_lm, include_timestamps, device, dtype) -> List[Dict[str, Any]]:
+        """One attention-capture pass over ``rows``; see ``get_lyric_alignments``. Called inside the DiT model context."""
+        n = len(rows)
+        index = torch.tensor(rows, device=pred_latents.device)
+        pred_latent = pred_latents.index_select(0, index).to(device=device, dtype=dtype)
+        encoder_hidden_states = encoder_hidden_states.index_select(0, index.to(encoder_hidden_states.device)).to(device=device, dtype=dtype)
+        encoder_attention_mask = encoder_attention_mask.index_select(0, index.to(encoder_attention_mask.device)).to(device=device, dtype=dtype)
+        context_latents = context_latents.index_select(0, index.to(context_latents.device)).to(device=device, dtype=dtype)
+
+        if seed is None:
+            x0 = torch.randn_like(pred_latent)
+        else:
+            # Same noise for every row, as a single-row call with this seed draws it
+            generator = torch.Generator(device=device).manual_seed(int(seed))
+            x0 = torch.randn((1,) + tuple(pred_latent.shape[1:]), generator=generator, device=device, dtype=dtype)
+            x0 = x0.expand_as(pred_latent)
+
+        # DiT rows: t = 1.0/steps, xt = Regressed Latent (xt = t*x0 + (1-t)*x1)
+        t_last_val = 1.0 / inference_steps
+        xt_parts = [t_last_val * x0 + (1.0 - t_last_val) * pred_latent]
+        t_parts = [torch.full((n,), t_last_val, device=device, dtype=dtype)]
+        if include_lm:
+            # LM rows: t = 1.0, xt = Pure Noise
+            xt_parts.append(x0)
+            t_parts.append(torch.ones(n, device=device, dtype=dtype))
+        copies = len(xt_parts)
+        xt_in = torch.cat(xt_parts, dim=0)
+        t_in = torch.cat(t_parts, dim=0)
+
+        decoder = self.model.decoder
+        if hasattr(decoder, 'eval'):
+            decoder.eval()
+        decoder_outputs = decoder(
+            hidden_states=xt_in,
+            timestep=t_in,
+            timestep_r=t_in,
+            attention_mask=torch.ones(copies * n, xt_in.shape[1], device=device, dtype=dtype),
+            encoder_hidden_states=torch.cat([encoder_hidden_states] * copies, dim=0),
+            use_cache=False,
+            past_key_values=None,
+            encoder_attention_mask=torch.cat([encoder_attention_mask] * copies, dim=0),
+            context_latents=torch.cat([context_latents] * copies, dim=0),
+            output_attentions=True,
+            custom_layers_config=custom_layers_config,
+            enable_early_exit=True
+        )
+
+        def failed(error):
+            return [{"success": False, "error": error} for _ in rows]
+
+        # Extract cross-attention matrices
+        if decoder_outputs[2] is None:
+            return failed("Model did not return attentions")
+        captured_layers_list = [layer_attn for layer_attn in decoder_outputs[2] if layer_attn is not None]
+        if not captured_layers_list:
+            return failed("No valid attention layers returned")
+
+        # Keep only the configured heads ([copies*n, Heads, Frames, Tokens] per layer), moved
+        # to the CPU once; the aligners then see them as layer 0 in config order.
+        num_layers = len(captured_layers_list)
+        num_heads = captured_layers_list[0].shape[1]
+        heads = [(layer_idx, head_idx)
+                 for layer_idx, head_indices in custom_layers_config.items()
+                 for head_idx in head_indices
+                 if layer_idx < num_layers and head_idx < num_heads]
+        if not heads:
+            return failed("No valid attention heads found")
+        selected = torch.stack(
+            [captured_layers_list[layer_idx][:, head_idx] for layer_idx, head_idx in heads], dim=1
+        ).transpose(-1, -2).float().cpu()  # [copies*n, S, Tokens, Frames]
+        del decoder_outputs, captured_layers_list
+        selected_config = {0: list(range(len(heads)))}
+
+        stamps_aligner = MusicStampsAligner(self.text_tokenizer)
+        scorer = MusicLyricScorer(self.text_tokenizer)
+        header_lengths = {}
+        entries = []
+        score_inputs = []  # (entry, score key, matrix, lyric ids)
+        for k, row in enumerate(rows):
+            # Process lyric token IDs to extract pure lyrics
+            raw_lyric_ids = lyric_token_idss[row].tolist()
+
+            # Parse header to find lyrics start position
+            language = languages[row]
+            if language not in header_lengths:
+                header_str = f"# Languages\n{language}\n\n# Lyric\n"
+                header_lengths[language] = len(self.text_tokenizer.encode(header_str, add_special_tokens=False))
+            start_idx = header_lengths[language]
+
+            # Find end of lyrics (before endoftext token)
+            try:
+                end_idx = raw_lyric_ids.index(151643)  # <|endoftext|> token
+            except ValueError:
+                end_idx = len(raw_lyric_ids)
+
+            if start_idx >= selected.shape[-2]:  # Check text dim
+                entries.append({"success": False, "error": "Lyrics indices out of bounds"})
+                continue
+
+            pure_lyric_ids = raw_lyric_ids[start_idx:end_idx]
+            dit_matrix = selected[k:k + 1, :, start_idx:end_idx, :]
+            entry = {"success": True, "error": None, "lyric_ids": pure_lyric_ids}
+            score_inputs.append((entry, "dit_score", dit_matrix, pure_lyric_ids))
+            if include_lm:
+                score_inputs.append((entry, "lm_score", selected[n + k:n + k + 1, :, start_idx:end_idx, :], pure_lyric_ids))
+            if include_timestamps:
+                align_info = stamps_aligner.stamps_align_info(
+                    attention_matrix=dit_matrix,
+                    lyrics_tokens=pure_lyric_ids,
+                    total_duration_seconds=0.0,
+                    custom_config=selected_config,
+                    return_matrices=False,
+                    violence_level=2.0,
+                    medfilt_width=1,
+                )
+                entry["stamps_matrix"] = align_info.get("calc_matrix")
+                entry["stamps_error"] = align_info.get("error")
+            entries.append(entry)
+
+        # All DTW paths of the chunk in one parallel call
+        infos = scorer.lyrics_alignment_info_batch(
+            attention_matrices=[matrix for _, _, matrix, _ in score_inputs],
+            token_ids_list=[ids for _, _, _, ids in score_inputs],
+            custom_config=selected_config,
+            return_matrices=False,
+            medfilt_width=1,
+        ) if score_inputs else []
+        for (entry, score_key, _, _), info in zip(score_inputs, infos):
+            if info.get("energy_matrix") is None:
+                entry[score_key] = 0.0
+                continue
+            res = scorer.calculate_score(
+                energy_matrix=info["energy_matrix"],
+                type_mask=info["type_mask"],
+                path_coords=info["path_coords"],
+            )
+            # Return the final score (check return key)
+            entry[score_key] = res.get("lyrics_score", res.get("final_score", 0.0))
+        return entries
+
     def get_lyric_timestamp(
         self,
         pred_latent: torch.Tensor,
@@ -3197,12 +4173,17 @@ class AceStepHandler:
         inference_steps: int = 8,
         seed: int = 42,
         custom_layers_config: Optional[Dict] = None,
+        sample_index: int = 0,
+        alignment_cache: Optional[Dict] = None,
+        lora_adapters: Optional[List[Optional[str]]] = None,
+        lora_scales: Optional[List[float]] = None,
     ) -> Dict[str, Any]:
         """
         Generate lyrics timestamps from generated audio latents using cross-attention alignment.
         
         This method adds noise to the final pred_latent and re-infers one step to get
         cross-attention matrices, then uses DTW to align lyrics tokens with audio frames.
+        The capture pass is shared with ``get_lyric_score`` (see ``get_lyric_alignments``).
         
         Args:
             pred_latent: Generated latent tensor [batch, T, D]
@@ -3215,6 +4196,10 @@ class AceStepHandler:
             inference_steps: Number of inference steps (for noise level calculation)
             seed: Random seed for noise generation
             custom_layers_config: Dict mapping layer indices to head indices
+            sample_index: Row of the batch to return; pass whole-batch tensors with
+                ``alignment_cache`` so every sample is captured in one pass
+            alignment_cache: Per-result cache dict, see ``get_lyric_alignments``
+            lora_adapters, lora_scales: Per-row LoRA of the generation, see ``get_lyric_alignments``
             
         Returns:
             Dict containing:
@@ -3224,161 +4209,43 @@ class AceStepHandler:
             - success: Whether generation succeeded
             - error: Error message if failed
         """
-        from transformers.cache_utils import EncoderDecoderCache, DynamicCache
-        
-        if self.model is None:
+        def failure(error):
             return {
                 "lrc_text": "",
                 "sentence_timestamps": [],
                 "token_timestamps": [],
                 "success": False,
-                "error": "Model not initialized"
+                "error": error
             }
-        
-        if custom_layers_config is None:
-            custom_layers_config = self.custom_layers_config
+
+        if self.model is None:
+            return failure("Model not initialized")
         
         try:
-            # Move tensors to device
-            device = self.device
-            dtype = self.dtype
-            
-            pred_latent = pred_latent.to(device=device, dtype=dtype)
-            encoder_hidden_states = encoder_hidden_states.to(device=device, dtype=dtype)
-            encoder_attention_mask = encoder_attention_mask.to(device=device, dtype=dtype)
-            context_latents = context_latents.to(device=device, dtype=dtype)
-            
-            bsz = pred_latent.shape[0]
-            
-            # Calculate noise level: t_last = 1.0 / inference_steps
-            t_last_val = 1.0 / inference_steps
-            t_curr_tensor = torch.tensor([t_last_val] * bsz, device=device, dtype=dtype)
-            
-            x1 = pred_latent
-            
-            # Generate noise
-            if seed is None:
-                x0 = torch.randn_like(x1)
-            else:
-                generator = torch.Generator(device=device).manual_seed(int(seed))
-                x0 = torch.randn(x1.shape, generator=generator, device=device, dtype=dtype)
-            
-            # Add noise to pred_latent: xt = t * noise + (1 - t) * x1
-            xt = t_last_val * x0 + (1.0 - t_last_val) * x1
-
-            xt_in = xt
-            t_in = t_curr_tensor
-            
-            # Get null condition embedding
-            encoder_hidden_states_in = encoder_hidden_states
-            encoder_attention_mask_in = encoder_attention_mask
-            context_latents_in = context_latents
-            latent_length = x1.shape[1]
-            attention_mask = torch.ones(bsz, latent_length, device=device, dtype=dtype)
-            attention_mask_in = attention_mask
-            past_key_values = None
-            
-            # Run decoder with output_attentions=True
-            with self._load_model_context("model"):
-                decoder = self.model.decoder
-                decoder_outputs = decoder(
-                    hidden_states=xt_in,
-                    timestep=t_in,
-                    timestep_r=t_in,
-                    attention_mask=attention_mask_in,
-                    encoder_hidden_states=encoder_hidden_states_in,
-                    use_cache=False,
-                    past_key_values=past_key_values,
-                    encoder_attention_mask=encoder_attention_mask_in,
-                    context_latents=context_latents_in,
-                    output_attentions=True,
-                    custom_layers_config=custom_layers_config,
-                    enable_early_exit=True
-                )
-                
-                # Extract cross-attention matrices
-                if decoder_outputs[2] is None:
-                    return {
-                        "lrc_text": "",
-                        "sentence_timestamps": [],
-                        "token_timestamps": [],
-                        "success": False,
-                        "error": "Model did not return attentions"
-                    }
-                
-                cross_attns = decoder_outputs[2]  # Tuple of tensors (some may be None)
-                
-                captured_layers_list = []
-                for layer_attn in cross_attns:
-                    # Skip None values (layers that didn't return attention)
-                    if layer_attn is None:
-                        continue
-                    # Only take conditional part (first half of batch)
-                    cond_attn = layer_attn[:bsz]
-                    layer_matrix = cond_attn.transpose(-1, -2)
-                    captured_layers_list.append(layer_matrix)
-                
-                if not captured_layers_list:
-                    return {
-                        "lrc_text": "",
-                        "sentence_timestamps": [],
-                        "token_timestamps": [],
-                        "success": False,
-                        "error": "No valid attention layers returned"
-                    }
-                
-                stacked = torch.stack(captured_layers_list)
-                if bsz == 1:
-                    all_layers_matrix = stacked.squeeze(1)
-                else:
-                    all_layers_matrix = stacked
-            
-            # Process lyric token IDs to extract pure lyrics
-            if isinstance(lyric_token_ids, torch.Tensor):
-                raw_lyric_ids = lyric_token_ids[0].tolist()
-            else:
-                raw_lyric_ids = lyric_token_ids
-            
-            # Parse header to find lyrics start position
-            header_str = f"# Languages\n{vocal_language}\n\n# Lyric\n"
-            header_ids = self.text_tokenizer.encode(header_str, add_special_tokens=False)
-            start_idx = len(header_ids)
-            
-            # Find end of lyrics (before endoftext token)
-            try:
-                end_idx = raw_lyric_ids.index(151643)  # <|endoftext|> token
-            except ValueError:
-                end_idx = len(raw_lyric_ids)
-            
-            pure_lyric_ids = raw_lyric_ids[start_idx:end_idx]
-            pure_lyric_matrix = all_layers_matrix[:, :, start_idx:end_idx, :]
-            
-            # Create aligner and generate timestamps
-            aligner = MusicStampsAligner(self.text_tokenizer)
-            
-            align_info = aligner.stamps_align_info(
-                attention_matrix=pure_lyric_matrix,
-                lyrics_tokens=pure_lyric_ids,
-                total_duration_seconds=total_duration_seconds,
-                custom_config=custom_layers_config,
-                return_matrices=False,
-                violence_level=2.0,
-                medfilt_width=1,
-            )
-            
-            if align_info.get("calc_matrix") is None:
-                return {
-                    "lrc_text": "",
-                    "sentence_timestamps": [],
-                    "token_timestamps": [],
-                    "success": False,
-                    "error": align_info.get("error", "Failed to process attention matrix")
-                }
+            info = self.get_lyric_alignments(
+                pred_latents=pred_latent,
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_attention_mask=encoder_attention_mask,
+                context_latents=context_latents,
+                lyric_token_idss=lyric_token_ids,
+                vocal_language=vocal_language,
+                inference_steps=inference_steps,
+                seed=seed,
+                custom_layers_config=custom_layers_config,
+                cache=alignment_cache,
+                lora_adapters=lora_adapters,
+                lora_scales=lora_scales,
+            )[sample_index]
+            if not info["success"]:
+                return failure(info["error"])
+            if info["stamps_matrix"] is None:
+                return failure(info.get("stamps_error") or "Failed to process attention matrix")
             
             # Generate timestamps
+            aligner = MusicStampsAligner(self.text_tokenizer)
             result = aligner.get_timestamps_and_lrc(
-                calc_matrix=align_info["calc_matrix"],
-                lyrics_tokens=pure_lyric_ids,
+                calc_matrix=info["stamps_matrix"],
+                lyrics_tokens=info["lyric_ids"],
                 total_duration_seconds=total_duration_seconds
             )
             
@@ -3393,15 +4260,8 @@ class AceStepHandler:
         except Exception as e:
             error_msg = f"Error generating timestamps: {str(e)}"
             logger.exception("[get_lyric_timestamp] Failed")
-            return {
-                "lrc_text": "",
-                "sentence_timestamps": [],
-                "token_timestamps": [],
-                "success": False,
-                "error": error_msg
-            }
+            return failure(error_msg)
 
-    @torch.no_grad()
     def get_lyric_score(
             self,
             pred_latent: torch.Tensor,
@@ -3413,6 +4273,11 @@ class AceStepHandler:
             inference_steps: int = 8,
             seed: int = 42,
             custom_layers_config: Optional[Dict] = None,
+            load_model: bool = True,
+            sample_index: int = 0,
+            alignment_cache: Optional[Dict] = None,
+            lora_adapters: Optional[List[Optional[str]]] = None,
+            lora_scales: Optional[List[float]] = None,
     ) -> Dict[str, Any]:
         """
         Calculate both LM and DiT alignment scores in one pass.
@@ -3430,6 +4295,11 @@ class AceStepHandler:
             inference_steps: Number of inference steps (for noise level calculation)
             seed: Random seed for noise generation
             custom_layers_config: Dict mapping layer indices to head indices
+            load_model: False when the caller already holds the DiT model context
+            sample_index: Row of the batch to return; pass whole-batch tensors with
+                ``alignment_cache`` so every sample is captured in one pass
+            alignment_cache: Per-result cache dict, see ``get_lyric_alignments``
+            lora_adapters, lora_scales: Per-row LoRA of the generation, see ``get_lyric_alignments``
 
         Returns:
             Dict containing:
@@ -3438,181 +4308,39 @@ class AceStepHandler:
             - success: Whether generation succeeded
             - error: Error message if failed
         """
-        from transformers.cache_utils import EncoderDecoderCache, DynamicCache
-
-        if self.model is None:
+        def failure(error):
             return {
                 "lm_score": 0.0,
                 "dit_score": 0.0,
                 "success": False,
-                "error": "Model not initialized"
+                "error": error
             }
 
-        if custom_layers_config is None:
-            custom_layers_config = self.custom_layers_config
+        if self.model is None:
+            return failure("Model not initialized")
 
         try:
-            # Move tensors to device
-            device = self.device
-            dtype = self.dtype
-
-            pred_latent = pred_latent.to(device=device, dtype=dtype)
-            encoder_hidden_states = encoder_hidden_states.to(device=device, dtype=dtype)
-            encoder_attention_mask = encoder_attention_mask.to(device=device, dtype=dtype)
-            context_latents = context_latents.to(device=device, dtype=dtype)
-
-            bsz = pred_latent.shape[0]
-
-            if seed is None:
-                x0 = torch.randn_like(pred_latent)
-            else:
-                generator = torch.Generator(device=device).manual_seed(int(seed))
-                x0 = torch.randn(pred_latent.shape, generator=generator, device=device, dtype=dtype)
-
-            # --- Input A: LM Score ---
-            # t = 1.0, xt = Pure Noise
-            t_lm = torch.tensor([1.0] * bsz, device=device, dtype=dtype)
-            xt_lm = x0
-
-            # --- Input B: DiT Score ---
-            # t = 1.0/steps, xt = Regressed Latent
-            t_last_val = 1.0 / inference_steps
-            t_dit = torch.tensor([t_last_val] * bsz, device=device, dtype=dtype)
-            # Flow Matching Regression: xt = t*x0 + (1-t)*x1
-            xt_dit = t_last_val * x0 + (1.0 - t_last_val) * pred_latent
-
-            # Order: [Think_Batch, DiT_Batch]
-            xt_in = torch.cat([xt_lm, xt_dit], dim=0)
-            t_in = torch.cat([t_lm, t_dit], dim=0)
-
-            # Duplicate conditions
-            encoder_hidden_states_in = torch.cat([encoder_hidden_states, encoder_hidden_states], dim=0)
-            encoder_attention_mask_in = torch.cat([encoder_attention_mask, encoder_attention_mask], dim=0)
-            context_latents_in = torch.cat([context_latents, context_latents], dim=0)
-
-            # Prepare Attention Mask
-            latent_length = xt_in.shape[1]
-            attention_mask_in = torch.ones(2 * bsz, latent_length, device=device, dtype=dtype)
-            past_key_values = None
-
-            # Run decoder with output_attentions=True
-            with self._load_model_context("model"):
-                decoder = self.model.decoder
-                if hasattr(decoder, 'eval'):
-                    decoder.eval()
-
-                decoder_outputs = decoder(
-                    hidden_states=xt_in,
-                    timestep=t_in,
-                    timestep_r=t_in,
-                    attention_mask=attention_mask_in,
-                    encoder_hidden_states=encoder_hidden_states_in,
-                    use_cache=False,
-                    past_key_values=past_key_values,
-                    encoder_attention_mask=encoder_attention_mask_in,
-                    context_latents=context_latents_in,
-                    output_attentions=True,
-                    custom_layers_config=custom_layers_config,
-                    enable_early_exit=True
-                )
-
-                # Extract cross-attention matrices
-                if decoder_outputs[2] is None:
-                    return {
-                        "lm_score": 0.0,
-                        "dit_score": 0.0,
-                        "success": False,
-                        "error": "Model did not return attentions"
-                    }
-
-                cross_attns = decoder_outputs[2]  # Tuple of tensors (some may be None)
-
-                captured_layers_list = []
-                for layer_attn in cross_attns:
-                    if layer_attn is None:
-                        continue
-
-                    # Only take conditional part (first half of batch)
-                    layer_matrix = layer_attn.transpose(-1, -2)
-                    captured_layers_list.append(layer_matrix)
-
-                if not captured_layers_list:
-                    return {
-                        "lm_score": 0.0,
-                        "dit_score": 0.0,
-                        "success": False,
-                        "error": "No valid attention layers returned"
-                    }
-
-                stacked = torch.stack(captured_layers_list)
-
-                all_layers_matrix_lm = stacked[:, :bsz, ...]
-                all_layers_matrix_dit = stacked[:, bsz:, ...]
-
-                if bsz == 1:
-                    all_layers_matrix_lm = all_layers_matrix_lm.squeeze(1)
-                    all_layers_matrix_dit = all_layers_matrix_dit.squeeze(1)
-                else:
-                    pass
-
-            # Process lyric token IDs to extract pure lyrics
-            if isinstance(lyric_token_ids, torch.Tensor):
-                raw_lyric_ids = lyric_token_ids[0].tolist()
-            else:
-                raw_lyric_ids = lyric_token_ids
-
-            # Parse header to find lyrics start position
-            header_str = f"# Languages\n{vocal_language}\n\n# Lyric\n"
-            header_ids = self.text_tokenizer.encode(header_str, add_special_tokens=False)
-            start_idx = len(header_ids)
-
-            # Find end of lyrics (before endoftext token)
-            try:
-                end_idx = raw_lyric_ids.index(151643)  # <|endoftext|> token
-            except ValueError:
-                end_idx = len(raw_lyric_ids)
-
-            pure_lyric_ids = raw_lyric_ids[start_idx:end_idx]
-            if start_idx >= all_layers_matrix_lm.shape[-2]:  # Check text dim
-                return {
-                    "lm_score": 0.0,
-                    "dit_score": 0.0,
-                    "success": False,
-                    "error": "Lyrics indices out of bounds"
-                }
-
-            pure_matrix_lm = all_layers_matrix_lm[..., start_idx:end_idx, :]
-            pure_matrix_dit = all_layers_matrix_dit[..., start_idx:end_idx, :]
-
-            # Create aligner and calculate alignment info
-            aligner = MusicLyricScorer(self.text_tokenizer)
-
-            def calculate_single_score(matrix):
-                """Helper to run aligner on a matrix"""
-                info = aligner.lyrics_alignment_info(
-                    attention_matrix=matrix,
-                    token_ids=pure_lyric_ids,
-                    custom_config=custom_layers_config,
-                    return_matrices=False,
-                    medfilt_width=1,
-                )
-                if info.get("energy_matrix") is None:
-                    return 0.0
-
-                res = aligner.calculate_score(
-                    energy_matrix=info["energy_matrix"],
-                    type_mask=info["type_mask"],
-                    path_coords=info["path_coords"],
-                )
-                # Return the final score (check return key)
-                return res.get("lyrics_score", res.get("final_score", 0.0))
-
-            lm_score = calculate_single_score(pure_matrix_lm)
-            dit_score = calculate_single_score(pure_matrix_dit)
+            info = self.get_lyric_alignments(
+                pred_latents=pred_latent,
+                encoder_hidden_states=encoder_hidden_states,
+                encoder_attention_mask=encoder_attention_mask,
+                context_latents=context_latents,
+                lyric_token_idss=lyric_token_ids,
+                vocal_language=vocal_language,
+                inference_steps=inference_steps,
+                seed=seed,
+                custom_layers_config=custom_layers_config,
+                cache=alignment_cache,
+                load_model=load_model,
+                lora_adapters=lora_adapters,
+                lora_scales=lora_scales,
+            )[sample_index]
+            if not info["success"]:
+                return failure(info["error"])
 
             return {
-                "lm_score": lm_score,
-                "dit_score": dit_score,
+                "lm_score": info["lm_score"],
+                "dit_score": info["dit_score"],
                 "success": True,
                 "error": None
             }
@@ -3620,9 +4348,4 @@ class AceStepHandler:
         except Exception as e:
             error_msg = f"Error generating score: {str(e)}"
             logger.exception("[get_lyric_score] Failed")
-            return {
-                "lm_score": 0.0,
-                "dit_score": 0.0,
-                "success": False,
-                "error": error_msg
-            }
+            return failure(error_msg)
@@ -13,7 +13,8 @@ from typing import Optional, Union, List, Dict, Any, Tuple
 from dataclasses import dataclass, field, asdict
 from loguru import logger
 
-from acestep.audio_utils import AudioSaver, generate_uuid_from_params
+from acestep.audio_utils import AudioSaver, generate_uuid_from_params, get_audio_writer_pool
+from acestep.audio_codes import AudioCodes, export_audio_codes, has_audio_codes
 
 # HuggingFace Space environment detection
 IS_HUGGINGFACE_SPACE = os.environ.get("SPACE_ID") is not None
@@ -60,14 +61,23 @@ class GenerationParams:
         cfg_interval_start: Start ratio (0.0–1.0) to apply CFG.
         cfg_interval_end: End ratio (0.0–1.0) to apply CFG.
         shift: Timestep shift factor (default 1.0). When != 1.0, applies t = shift * t / (1 + (shift - 1) * t) to timesteps.
+        lora_adapter: Name of a registered LoRA adapter (or a sub-directory of ACESTEP_LORA_DIR) for this request. None uses the loaded adapter, if enabled.
+        lora_scale: Scale for the LoRA adapter (default: 1.0 for a named adapter, the handler's scale otherwise).
         
         # Task-Specific Parameters
         task_type: Type of generation task. One of: "text2music", "cover", "repaint", "lego", "extract", "complete".
         reference_audio: Path to a reference audio file for style transfer or cover tasks.
         src_audio: Path to a source audio file for audio-to-audio tasks.
-        audio_codes: Audio semantic codes as a string (advanced use, for code-control generation).
+        audio_codes: Audio semantic codes (advanced use, for code-control generation): AudioCodes, a "<|audio_code_N|>" token string or the compact "ac1:" form.
         repainting_start: For repaint/lego tasks: start time in seconds for region to repaint.
         repainting_end: For repaint/lego tasks: end time in seconds for region to repaint (-1 for until end).
+        repaint_context: For repaint tasks: seconds of source audio kept on each side of the window; only this
+            region is denoised and decoded (None: ACESTEP_REPAINT_CONTEXT_SECONDS, negative: whole track).
+        long_form: For text2music/cover from codes: generate durations above ACESTEP_LONGFORM_WINDOW_SECONDS in
+            overlapping windows, so peak memory is that of one window.
+        adaptive_tol: Finish a sample before the end of the schedule once its predicted clean latent changes by less
+            than this (relative L2) between steps (None: ACESTEP_ADAPTIVE_TOL, 0: run every step).
+        adaptive_min_steps: First step at which a sample may finish early (None: half the schedule).
         audio_cover_strength: Strength of reference audio/codes influence (range 0.0–1.0). set smaller (0.2) for style transfer tasks.
         instruction: Optional task instruction prompt. If empty, auto-generated by system.
         
@@ -91,7 +101,7 @@ class GenerationParams:
     src_audio: Optional[str] = None
 
     # LM Codes Hints
-    audio_codes: str = ""
+    audio_codes: Union[str, AudioCodes] = ""
 
     # Text Inputs
     caption: str = ""
@@ -123,8 +133,16 @@ class GenerationParams:
     t_start: float = 1.0  # 1.0 = full denoise from noise, <1.0 = partial denoise
     checkpoint_step: Optional[int] = None  # Snapshot xt at this diffusion step
 
+    # Per-request LoRA adapter, applied to this request's rows only
+    lora_adapter: Optional[str] = None
+    lora_scale: Optional[float] = None
+
     repainting_start: float = 0.0
     repainting_end: float = -1
+    repaint_context: Optional[float] = None
+    long_form: bool = False
+    adaptive_tol: Optional[float] = None
+    adaptive_min_steps: Optional[int] = None
     audio_cover_strength: float = 1.0
 
     # 5Hz Language Model Parameters
@@ -150,7 +168,9 @@ class GenerationParams:
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert config to dictionary for JSON serialization."""
-        return asdict(self)
+        data = asdict(self)
+        data["audio_codes"] = export_audio_codes(self.audio_codes)
+        return data
 
 
 @dataclass
@@ -168,6 +188,17 @@ class GenerationConfig:
         lm_batch_chunk_size: Batch chunk size for LM processing
         constrained_decoding_debug: Whether to enable constrained decoding debug
         audio_format: Output audio format, one of "mp3", "wav", "flac". Default: "flac"
+        best_of: Generate this many candidates and return the best batch_size of them
+            (0 or <= batch_size disables). Candidates are ranked by LM PMI score after
+            code generation and by DiT lyric alignment part-way through diffusion;
+            only the survivors are finished, decoded and saved
+        best_of_lm_keep: Candidates kept after LM scoring when a DiT stage follows
+            (default: halfway between best_of and batch_size)
+        best_of_prune_step: Diffusion step of the DiT ranking (default: a quarter of the steps)
+        wait_for_files: Return only once every audio file is written. With False,
+            files are still being encoded in the background when ``generate_music``
+            returns (their ``path`` is already set); call ``result.wait_for_files()``
+            before reading them
     """
     batch_size: int = 2
     allow_lm_batch: bool = False
@@ -176,6 +207,10 @@ class GenerationConfig:
     lm_batch_chunk_size: int = 8
     constrained_decoding_debug: bool = False
     audio_format: str = "flac"  # Default to FLAC for fast saving
+    best_of: int = 0
+    best_of_lm_keep: Optional[int] = None
+    best_of_prune_step: Optional[int] = None
+    wait_for_files: bool = True
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert config to dictionary for JSON serialization."""
@@ -204,6 +239,20 @@ class GenerationResult:
     success: bool = True
     error: Optional[str] = None
 
+    def __post_init__(self):
+        # (audio dict, Future) of files still being written by the audio writer pool
+        self._pending_files = []
+
+    def wait_for_files(self, timeout: Optional[float] = None) -> None:
+        """Block until every audio file is written; failed files get an empty ``path``."""
+        pending, self._pending_files = self._pending_files, []
+        for audio, future in pending:
+            try:
+                audio["path"] = future.result(timeout=timeout)
+            except Exception as e:
+                logger.error(f"[generate_music] Failed to save audio file: {e}")
+                audio["path"] = ""  # Fallback to empty path
+
     def to_dict(self) -> Dict[str, Any]:
         """Convert result to dictionary for JSON serialization."""
         return asdict(self)
@@ -294,6 +343,11 @@ def _update_metadata_from_lm(
     return bpm, key_scale, time_signature, audio_duration, vocal_language, caption, lyrics
 
 
+def _has_sung_lyrics(lyrics: Optional[str]) -> bool:
+    """Lyrics the DiT alignment score can be computed on."""
+    return bool(lyrics and lyrics.strip() and lyrics.strip().lower() != "[instrumental]")
+
+
 @_get_spaces_gpu_decorator(duration=180)
 def generate_music(
     dit_handler,
@@ -336,7 +390,7 @@ def generate_music(
         # Determine if we need to generate audio codes
         # If user has provided audio_codes, we don't need to generate them
         # Otherwise, check if we need audio codes (lm_dit mode) or just metas (dit mode)
-        user_provided_audio_codes = bool(params.audio_codes and str(params.audio_codes).strip())
+        user_provided_audio_codes = has_audio_codes(params.audio_codes)
 
         # Determine infer_type: use "llm_dit" if we need audio codes, "dit" if only metas needed
         # For now, we use "llm_dit" if batch mode or if user hasn't provided codes
@@ -347,6 +401,17 @@ def generate_music(
         # Determine if we should use chunk-based LM generation (always use chunks for consistency)
         # Determine actual batch size for chunk processing
         actual_batch_size = config.batch_size if config.batch_size is not None else 1
+        # Best-of-N: generate more candidates than requested, prune them on the way
+        final_batch_size = actual_batch_size
+        best_of = config.best_of if config.best_of and config.best_of > final_batch_size else 0
+        lm_codes_possible = (params.thinking and not user_provided_audio_codes and llm_handler is not None
+                             and llm_handler.llm_initialized and params.task_type not in ("cover", "repaint"))
+        if best_of and not lm_codes_possible and not _has_sung_lyrics(params.lyrics):
+            logger.warning("[generate_music] best_of needs LM codes or lyrics to rank candidates; ignoring it")
+            best_of = 0
+        if best_of:
+            actual_batch_size = best_of
+        best_of_info = None
 
         # Prepare seeds for batch generation
         # Use config.seed if provided, otherwise fallback to params.seed
@@ -511,6 +576,30 @@ def generate_music(
                     time_str = ", ".join([f"{k}: {v:.2f}s" for k, v in lm_chunk_time_costs.items()])
                     lm_status.append(f"✅ LM chunk {chunk_idx+1}: {time_str}")
 
+            if best_of and infer_type == "llm_dit" and len(all_audio_codes_list) > final_batch_size:
+                # Stage 1: rank the candidates' codes by PMI before any diffusion
+                lm_keep = final_batch_size
+                if _has_sung_lyrics(dit_input_lyrics):
+                    # Alignment ranking follows in the DiT; leave it some candidates
+                    lm_keep = config.best_of_lm_keep or math.ceil((actual_batch_size + final_batch_size) / 2)
+                    lm_keep = min(actual_batch_size, max(final_batch_size, lm_keep))
+                if lm_keep < len(all_audio_codes_list):
+                    from acestep.test_time_scaling import calculate_pmi_scores_batch
+                    pmi_results = calculate_pmi_scores_batch(llm_handler, [{
+                        "audio_codes": codes,
+                        "caption": params.caption or "",
+                        "lyrics": dit_input_lyrics or "",
+                        "metadata": dict(all_metadata_list[i]) if i < len(all_metadata_list) and all_metadata_list[i] else None,
+                    } for i, codes in enumerate(all_audio_codes_list)])
+                    lm_scores = [r[1] for r in pmi_results]
+                    kept = sorted(sorted(range(len(lm_scores)), key=lambda i: lm_scores[i], reverse=True)[:lm_keep])
+                    all_audio_codes_list = [all_audio_codes_list[i] for i in kept]
+                    all_metadata_list = [all_metadata_list[i] for i in kept if i < len(all_metadata_list)]
+                    actual_seed_list = [actual_seed_list[i] for i in kept]
+                    best_of_info = {"candidates": actual_batch_size, "lm_scores": lm_scores, "lm_kept": kept}
+                    lm_status.append(f"✅ Best-of-{actual_batch_size}: kept {len(kept)} after LM scoring")
+                    actual_batch_size = len(kept)
+
             lm_generated_metadata = all_metadata_list[0] if all_metadata_list else None
             lm_generated_audio_codes_list = all_audio_codes_list
 
@@ -559,6 +648,11 @@ def generate_music(
 
         # Phase 2: DiT music generation
         # Use seed_for_generation (from config.seed or params.seed) instead of params.seed for actual generation
+        use_random_seed = config.use_random_seed
+        if best_of:
+            # Candidates keep the seeds they were drawn (and LM-ranked) with
+            seed_for_generation = ",".join(str(s) for s in actual_seed_list)
+            use_random_seed = False
         result = dit_handler.generate_music(
             captions=dit_input_caption,
             lyrics=dit_input_lyrics,
@@ -568,11 +662,11 @@ def generate_music(
             vocal_language=dit_input_vocal_language,
             inference_steps=params.inference_steps,
             guidance_scale=params.guidance_scale,
-            use_random_seed=config.use_random_seed,
+            use_random_seed=use_random_seed,
             seed=seed_for_generation,  # Use config.seed (or params.seed fallback) instead of params.seed directly
             reference_audio=params.reference_audio,
             audio_duration=audio_duration,
-            batch_size=config.batch_size if config.batch_size is not None else 1,
+            batch_size=actual_batch_size,
             src_audio=params.src_audio,
             audio_code_string=audio_code_string_to_use,
             repainting_start=params.repainting_start,
@@ -589,6 +683,14 @@ def generate_music(
             init_latents=params.init_latents,
             t_start=params.t_start,
             checkpoint_step=params.checkpoint_step,
+            lora_adapter=params.lora_adapter,
+            lora_scale=params.lora_scale,
+            best_of_keep=final_batch_size if actual_batch_size > final_batch_size else None,
+            prune_step=config.best_of_prune_step,
+            repaint_context=params.repaint_context,
+            long_form=params.long_form,
+            adaptive_tol=params.adaptive_tol,
+            adaptive_min_steps=params.adaptive_min_steps,
             progress=progress,
         )
 
@@ -611,12 +713,26 @@ def generate_music(
         # actual_seed_list was computed earlier using dit_handler.prepare_seeds
         seed_list = actual_seed_list
 
+        kept_rows = dit_extra_outputs.get("kept_rows")
+        if kept_rows is not None:
+            # Best-of-N: per-candidate values follow the rows the DiT kept
+            seed_list = [seed_list[r] for r in kept_rows if r < len(seed_list)]
+            if lm_generated_audio_codes_list:
+                lm_generated_audio_codes_list = [lm_generated_audio_codes_list[r] for r in kept_rows]
+            if isinstance(audio_code_string_to_use, list):
+                audio_code_string_to_use = [audio_code_string_to_use[r] for r in kept_rows]
+            best_of_info = best_of_info or {"candidates": actual_batch_size}
+            best_of_info["dit_kept"] = kept_rows
+
         # Get base params dictionary
         base_params_dict = params.to_dict()
 
         # Save audio files using AudioSaver (format from config)
         audio_format = config.audio_format if config.audio_format else "flac"
         audio_saver = AudioSaver(default_format=audio_format)
+        # Files are encoded and tagged in parallel while the loop builds the results
+        writer_pool = get_audio_writer_pool()
+        pending_files = []
 
         # Use handler's temp_dir for saving files
         if save_dir is not None:
@@ -634,7 +750,7 @@ def generate_music(
 
             # Add audio codes if batch mode
             if lm_generated_audio_codes_list and idx < len(lm_generated_audio_codes_list):
-                audio_params["audio_codes"] = lm_generated_audio_codes_list[idx]
+                audio_params["audio_codes"] = export_audio_codes(lm_generated_audio_codes_list[idx])
 
             # Get audio tensor and metadata
             audio_tensor = dit_audio.get("tensor")
@@ -651,6 +767,7 @@ def generate_music(
 
             # Save audio file (handled outside handler)
             audio_path = None
+            save_future = None
             if audio_tensor is not None and save_dir is not None:
                 try:
                     audio_file = os.path.join(save_dir, f"{audio_key}.{audio_format}")
@@ -675,12 +792,14 @@ def generate_music(
                         "audio_codes": audio_params.get("audio_codes", ""),
                     }
 
-                    audio_path = audio_saver.save_audio(audio_tensor,
-                                                        audio_file,
-                                                        sample_rate=sample_rate,
-                                                        format=audio_format,
-                                                        channels_first=True,
-                                                        metadata=audio_metadata)
+                    save_future = writer_pool.submit(audio_saver,
+                                                     audio_tensor,
+                                                     audio_file,
+                                                     sample_rate=sample_rate,
+                                                     format=audio_format,
+                                                     channels_first=True,
+                                                     metadata=audio_metadata)
+                    audio_path = str(audio_saver.resolve_output(audio_file, audio_format)[0])
                 except Exception as e:
                     logger.error(f"[generate_music] Failed to save audio file: {e}")
                     audio_path = ""  # Fallback to empty path
@@ -694,10 +813,14 @@ def generate_music(
             }
 
             audios.append(audio_dict)
+            if save_future is not None:
+                pending_files.append((audio_dict, save_future))
 
         # Merge extra_outputs: include dit_extra_outputs (latents, masks) and add LM metadata
         extra_outputs = dit_extra_outputs.copy()
         extra_outputs["lm_metadata"] = lm_generated_metadata
+        if best_of_info is not None:
+            extra_outputs["best_of"] = best_of_info
 
         # Merge time_costs from both LM and DiT into a unified dictionary
         unified_time_costs = {}
@@ -727,13 +850,17 @@ def generate_music(
         else:
             status_message = status_message
         # Create and return GenerationResult
-        return GenerationResult(
+        result = GenerationResult(
             audios=audios,
             status_message=status_message,
             extra_outputs=extra_outputs,
             success=True,
             error=None,
         )
+        result._pending_files = pending_files
+        if config.wait_for_files:
+            result.wait_for_files()
+        return result
 
     except Exception as e:
         logger.exception("Music generation failed")
@@ -748,7 +875,7 @@ def generate_music(
 
 def understand_music(
     llm_handler,
-    audio_codes: str,
+    audio_codes: Union[str, AudioCodes],
     temperature: float = 0.85,
     top_k: Optional[int] = None,
     top_p: Optional[float] = None,
@@ -768,8 +895,8 @@ def understand_music(
     
     Args:
         llm_handler: Initialized LLM handler (LLMHandler instance)
-        audio_codes: String of audio code tokens (e.g., "<|audio_code_123|><|audio_code_456|>...")
-                     Use empty string or "NO USER INPUT" to generate a sample example.
+        audio_codes: AudioCodes, a string of audio code tokens (e.g., "<|audio_code_123|><|audio_code_456|>...")
+                     or the compact "ac1:" form. Use empty string or "NO USER INPUT" to generate a sample example.
         temperature: Sampling temperature for generation (0.0-2.0). Higher = more creative.
         top_k: Top-K sampling (None or 0 = disabled)
         top_p: Top-P (nucleus) sampling (None or 1.0 = disabled)
@@ -796,7 +923,7 @@ def understand_music(
         )
     
     # If codes are empty, use "NO USER INPUT" to generate a sample example
-    if not audio_codes or not audio_codes.strip():
+    if not has_audio_codes(audio_codes):
         audio_codes = "NO USER INPUT"
     
     try:
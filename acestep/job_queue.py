@@ -0,0 +1,424 @@
+"""Durable priority job queue and shape-aware job cost model for the API server
+
+Uses diskcache as backend (same dependency as local_cache.py) so queued jobs
+survive a restart. Falls back to an in-memory dict when diskcache is missing
+or no directory is given.
+
+Queue positions and ETAs avoid walking the queue: every priority class keeps
+monotonically increasing head/tail sequence numbers and running cost totals,
+so a job's position is ``(jobs in higher classes) + (its seq - class head)`` and its wait
+is the analogous difference of cumulative estimated costs. Cancelled jobs
+keep their slot until the head reaches it; they are kept per class as a
+sorted (seq, cost) list (rebuilt from the stored records after a restart) and
+subtracted from both.
+"""
+
+import bisect
+import math
+import time
+from contextlib import nullcontext
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from diskcache import Cache
+    HAS_DISKCACHE = True
+except ImportError:
+    HAS_DISKCACHE = False
+
+
+# Priority classes, highest first
+PRIORITY_CLASSES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+
+# Duration bucket width (seconds) used for cost model keys
+DURATION_BUCKET_SECONDS = 30
+
+# Cost model key: (model, steps, duration bucket, batch size, uses LM)
+CostKey = Tuple[str, int, int, int, bool]
+
+
+def make_cost_key(model: str, steps: int, duration: Optional[float], batch_size: int, use_lm: bool) -> CostKey:
+    """
+    Build a cost model key for a job shape.
+
+    Unknown durations (None or <= 0, i.e. chosen by the LM) map to bucket 0.
+    """
+    if duration is None or duration <= 0:
+        bucket = 0
+    else:
+        bucket = int(math.ceil(duration / DURATION_BUCKET_SECONDS)) * DURATION_BUCKET_SECONDS
+    return (model or "", max(1, int(steps or 1)), bucket, max(1, int(batch_size or 1)), bool(use_lm))
+
+
+def _key_str(key: CostKey) -> str:
+    model, steps, bucket, batch, use_lm = key
+    return f"{model}|{steps}|{bucket}|{batch}|{int(use_lm)}"
+
+
+class JobCostModel:
+    """
+    Per-shape job duration estimator fitted from observed ``time_costs``.
+
+    Exact shapes use an exponential moving average of wall-clock seconds.
+    Unseen shapes are extrapolated from per-model unit costs:
+
+        dit_seconds ~= dit_unit * steps * duration * batch
+        lm_seconds  ~= lm_unit * duration * batch        (only if the LM runs)
+        wall        ~= dit_seconds + lm_seconds + overhead
+    """
+
+    def __init__(self, default_seconds: float = 5.0, alpha: float = 0.3, state: Optional[dict] = None):
+        self.default_seconds = default_seconds
+        self.alpha = alpha
+        state = state or {}
+        self._shapes: Dict[str, float] = dict(state.get("shapes", {}))
+        self._units: Dict[str, Dict[str, float]] = {
+            k: dict(v) for k, v in state.get("units", {}).items()
+        }
+
+    def _ema(self, old: Optional[float], new: float) -> float:
+        return new if old is None else (1 - self.alpha) * old + self.alpha * new
+
+    def observe(self, key: CostKey, wall_seconds: float, time_costs: Optional[Dict[str, float]] = None) -> None:
+        """Record a finished job of shape ``key``."""
+        if wall_seconds <= 0:
+            return
+        self._shapes[_key_str(key)] = self._ema(self._shapes.get(_key_str(key)), wall_seconds)
+
+        model, steps, bucket, batch, use_lm = key
+        units = self._units.setdefault(model, {})
+        time_costs = time_costs or {}
+        dit = float(time_costs.get("dit_total_time_cost", 0.0) or 0.0)
+        lm = float(time_costs.get("lm_total_time", 0.0) or 0.0)
+        if bucket > 0 and dit > 0:
+            units["dit"] = self._ema(units.get("dit"), dit / (steps * bucket * batch))
+        if bucket > 0 and use_lm and lm > 0:
+            units["lm"] = self._ema(units.get("lm"), lm / (bucket * batch))
+        if dit > 0 or lm > 0:
+            units["overhead"] = self._ema(units.get("overhead"), max(0.0, wall_seconds - dit - lm))
+        units["wall"] = self._ema(units.get("wall"), wall_seconds)
+
+    def estimate(self, key: CostKey) -> float:
+        """Estimated wall-clock seconds for a job of shape ``key``."""
+        exact = self._shapes.get(_key_str(key))
+        if exact is not None:
+            return exact
+
+        model, steps, bucket, batch, use_lm = key
+        units = self._units.get(model) or {}
+        if "dit" in units:
+            # Duration left to the LM: assume two buckets
+            duration = bucket or 2 * DURATION_BUCKET_SECONDS
+            seconds = units["dit"] * steps * duration * batch + units.get("overhead", 0.0)
+            if use_lm:
+                seconds += units.get("lm", 0.0) * duration * batch
+            return seconds
+        if "wall" in units:
+            return units["wall"]
+        return self.default_seconds
+
+    def state(self) -> dict:
+        """Serializable state for persistence."""
+        return {"shapes": dict(self._shapes), "units": {k: dict(v) for k, v in self._units.items()}}
+
+
+class DurableJobQueue:
+    """
+    Persistent multi-class FIFO queue with cheap position and ETA lookup.
+
+    Not async-aware: callers pair it with an asyncio.Semaphore (released on
+    each ``put``) so workers can await new items.
+    """
+
+    _COST_MODEL_KEY = "meta:cost_model"
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        maxsize: int = 0,
+        default_job_seconds: float = 5.0,
+    ):
+        self.maxsize = maxsize
+        self._lock = Lock()
+        if directory and HAS_DISKCACHE:
+            self._db = Cache(directory)
+            self.persistent = True
+        else:
+            self._db = {}
+            self.persistent = False
+
+        self._head = {c: int(self._db.get(f"meta:head:{c}", 0)) for c in PRIORITY_CLASSES}
+        self._tail = {c: int(self._db.get(f"meta:tail:{c}", 0)) for c in PRIORITY_CLASSES}
+        self._enq_cost = {c: float(self._db.get(f"meta:enq_cost:{c}", 0.0)) for c in PRIORITY_CLASSES}
+        self._deq_cost = {c: float(self._db.get(f"meta:deq_cost:{c}", 0.0)) for c in PRIORITY_CLASSES}
+        self.cost_model = JobCostModel(
+            default_seconds=default_job_seconds, state=self._db.get(self._COST_MODEL_KEY)
+        )
+
+        # In-memory mirror of job records: job_id -> record dict
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        for key in list(self._iter_keys("job:")):
+            rec = self._db.get(key)
+            if rec:
+                self._jobs[rec["job_id"]] = rec
+
+        # Live (not cancelled) queued jobs per class, and cancelled jobs whose
+        # slot the head has not reached yet: sorted (seq, cost)
+        self._live = {c: 0 for c in PRIORITY_CLASSES}
+        self._cancelled: Dict[str, List[Tuple[int, float]]] = {c: [] for c in PRIORITY_CLASSES}
+        for rec in self._jobs.values():
+            if rec["state"] == "queued":
+                self._live[rec["priority"]] += 1
+            elif rec["state"] == "cancelled" and rec["seq"] >= self._head[rec["priority"]]:
+                self._cancelled[rec["priority"]].append((rec["seq"], rec["cost"]))
+        for cancelled in self._cancelled.values():
+            cancelled.sort()
+
+    # ------------------------------------------------------------------ storage
+
+    def _iter_keys(self, prefix: str):
+        keys = self._db.iterkeys() if self.persistent else list(self._db.keys())
+        for k in keys:
+            if isinstance(k, str) and k.startswith(prefix):
+                yield k
+
+    def _transact(self):
+        return self._db.transact() if self.persistent else nullcontext()
+
+    def _save_counters(self, cls: str) -> None:
+        self._db[f"meta:head:{cls}"] = self._head[cls]
+        self._db[f"meta:tail:{cls}"] = self._tail[cls]
+        self._db[f"meta:enq_cost:{cls}"] = self._enq_cost[cls]
+        self._db[f"meta:deq_cost:{cls}"] = self._deq_cost[cls]
+
+    def _save_job(self, rec: Dict[str, Any]) -> None:
+        self._jobs[rec["job_id"]] = rec
+        self._db[f"job:{rec['job_id']}"] = rec
+
+    def _drop_job(self, job_id: str) -> None:
+        self._jobs.pop(job_id, None)
+        try:
+            del self._db[f"job:{job_id}"]
+        except KeyError:
+            pass
+
+    # ------------------------------------------------------------------ queue API
+
+    def qsize(self) -> int:
+        """Number of queued (not running, not cancelled) jobs."""
+        with self._lock:
+            return sum(self._live.values())
+
+    def full(self) -> bool:
+        return self.maxsize > 0 and self.qsize() >= self.maxsize
+
+    def put(
+        self,
+        job_id: str,
+        payload: Dict[str, Any],
+        priority: str = DEFAULT_PRIORITY,
+        cost_key: Optional[CostKey] = None,
+    ) -> int:
+        """
+        Enqueue a job.
+
+        Args:
+            job_id: Job identifier
+            payload: JSON-serializable job data (request, temp files, ...)
+            priority: One of PRIORITY_CLASSES
+            cost_key: Job shape for ETA estimation
+
+        Returns:
+            1-based queue position
+        """
+        if priority not in PRIORITY_CLASSES:
+            priority = DEFAULT_PRIORITY
+        with self._lock:
+            cost = self.cost_model.estimate(cost_key) if cost_key else self.cost_model.default_seconds
+            seq = self._tail[priority]
+            rec = {
+                "job_id": job_id,
+                "priority": priority,
+                "seq": seq,
+                "cost": cost,
+                "cost_before": self._enq_cost[priority],
+                "cost_key": list(cost_key) if cost_key else None,
+                "payload": payload,
+                "state": "queued",
+                "enqueued_at": time.time(),
+            }
+            with self._transact():
+                self._db[f"item:{priority}:{seq}"] = job_id
+                self._tail[priority] = seq + 1
+                self._enq_cost[priority] += cost
+                self._save_counters(priority)
+                self._save_job(rec)
+            self._live[priority] += 1
+            return self._position_locked(rec)
+
+    def pop(self) -> Optional[Dict[str, Any]]:
+        """
+        Dequeue the next job (highest class first) and mark it running.
+
+        Returns:
+            The job record, or None if the queue is empty
+        """
+        with self._lock:
+            for cls in PRIORITY_CLASSES:
+                while self._head[cls] < self._tail[cls]:
+                    seq = self._head[cls]
+                    item_key = f"item:{cls}:{seq}"
+                    job_id = self._db.get(item_key)
+                    rec = self._jobs.get(job_id) if job_id else None
+                    with self._transact():
+                        self._head[cls] = seq + 1
+                        cancelled = self._cancelled[cls]
+                        while cancelled and cancelled[0][0] <= seq:
+                            cancelled.pop(0)
+                        if rec is not None and rec["seq"] == seq:
+                            self._deq_cost[cls] += rec["cost"]
+                        try:
+                            del self._db[item_key]
+                        except KeyError:
+                            pass
+                        self._save_counters(cls)
+                        if rec is None or rec["state"] != "queued" or rec["seq"] != seq:
+                            # Cancelled or stale slot
+                            if rec is not None and rec["state"] == "cancelled" and rec["seq"] == seq:
+                                self._drop_job(job_id)
+                            continue
+                        rec["state"] = "running"
+                        rec["started_at"] = time.time()
+                        self._save_job(rec)
+                    self._live[cls] -= 1
+                    return rec
+            return None
+
+    def complete(self, job_id: str) -> None:
+        """Forget a finished (or failed) job."""
+        with self._lock, self._transact():
+            self._drop_job(job_id)
+
+    def remove(self, job_id: str) -> bool:
+        """
+        Remove a queued job. Its slot is skipped when the head reaches it.
+
+        Returns:
+            True if a queued job was removed
+        """
+        with self._lock:
+            rec = self._jobs.get(job_id)
+            if rec is None or rec["state"] != "queued":
+                return False
+            with self._transact():
+                rec["state"] = "cancelled"
+                self._save_job(rec)
+            self._live[rec["priority"]] -= 1
+            bisect.insort(self._cancelled[rec["priority"]], (rec["seq"], rec["cost"]))
+            return True
+
+    def recover(self) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Restore state after a restart.
+
+        Jobs that were running when the process died are put back at the head
+        of their class so they run first. Cancelled leftovers are dropped.
+
+        Returns:
+            (queued job records, requeued previously-running job records)
+        """
+        requeued = []
+        with self._lock, self._transact():
+            running = []
+            for rec in list(self._jobs.values()):
+                if rec["state"] == "cancelled" and rec["seq"] < self._head[rec["priority"]]:
+                    self._drop_job(rec["job_id"])
+                elif rec["state"] == "running":
+                    running.append(rec)
+            # Each job takes the slot just before the head, so walk them newest
+            # first to have them pop again in their original order.
+            for rec in sorted(running, key=lambda r: r["seq"], reverse=True):
+                cls = rec["priority"]
+                seq = self._head[cls] - 1
+                self._head[cls] = seq
+                self._deq_cost[cls] -= rec["cost"]
+                rec.update(seq=seq, cost_before=self._deq_cost[cls], state="queued")
+                rec.pop("started_at", None)
+                self._db[f"item:{cls}:{seq}"] = rec["job_id"]
+                self._save_counters(cls)
+                self._save_job(rec)
+                self._live[cls] += 1
+                requeued.append(rec)
+            requeued.reverse()
+            queued = [r for r in self._jobs.values() if r["state"] == "queued"]
+        queued.sort(key=lambda r: (PRIORITY_CLASSES.index(r["priority"]), r["seq"]))
+        return queued, requeued
+
+    # ------------------------------------------------------------------ position / ETA
+
+    def _cancelled_ahead(self, cls: str, seq: int) -> Tuple[int, float]:
+        """(count, cost) of cancelled slots of ``cls`` still in the queue before ``seq``."""
+        cancelled = self._cancelled[cls]
+        n = bisect.bisect_left(cancelled, (seq, float("-inf")))
+        return n, sum(cost for _, cost in cancelled[:n])
+
+    def _position_locked(self, rec: Dict[str, Any]) -> int:
+        cls = rec["priority"]
+        ahead = sum(
+            self._tail[c] - self._head[c] - len(self._cancelled[c])
+            for c in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(cls)]
+        )
+        return ahead + (rec["seq"] - self._head[cls] - self._cancelled_ahead(cls, rec["seq"])[0]) + 1
+
+    def position(self, job_id: str) -> int:
+        """1-based queue position, or 0 if the job is not queued."""
+        with self._lock:
+            rec = self._jobs.get(job_id)
+            if rec is None or rec["state"] != "queued":
+                return 0
+            return self._position_locked(rec)
+
+    def eta_seconds(self, job_id: str, running_remaining: float = 0.0) -> Optional[float]:
+        """
+        Estimated seconds until ``job_id`` finishes.
+
+        Args:
+            job_id: Queued job
+            running_remaining: Estimated seconds left on jobs currently running
+
+        Returns:
+            Seconds, or None if the job is not queued
+        """
+        with self._lock:
+            rec = self._jobs.get(job_id)
+            if rec is None or rec["state"] != "queued":
+                return None
+            cls = rec["priority"]
+            ahead = sum(
+                self._enq_cost[c] - self._deq_cost[c] - sum(cost for _, cost in self._cancelled[c])
+                for c in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(cls)]
+            )
+            ahead += rec["cost_before"] - self._deq_cost[cls] - self._cancelled_ahead(cls, rec["seq"])[1]
+            return max(0.0, ahead) + running_remaining + rec["cost"]
+
+    def running_remaining_seconds(self) -> float:
+        """Estimated seconds left on all running jobs."""
+        now = time.time()
+        with self._lock:
+            return sum(
+                max(0.0, r["cost"] - (now - r.get("started_at", now)))
+                for r in self._jobs.values() if r["state"] == "running"
+            )
+
+    def observe(self, cost_key: Optional[CostKey], wall_seconds: float, time_costs: Optional[Dict[str, float]] = None) -> None:
+        """Feed a finished job's timings into the cost model and persist it."""
+        if not cost_key:
+            return
+        with self._lock:
+            self.cost_model.observe(tuple(cost_key), wall_seconds, time_costs)
+            self._db[self._COST_MODEL_KEY] = self.cost_model.state()
+
+    def close(self) -> None:
+        if self.persistent:
+            self._db.close()
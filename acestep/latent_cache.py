@@ -0,0 +1,116 @@
+"""Content-addressed cache of VAE latents for source and reference audio
+
+Cover, repaint and style-reference requests VAE-encode their conditioning
+audio on every call, and ``run_pipeline`` even hands the same waveform to
+every row of a batch. Latents here are keyed by a hash of the waveform's
+samples plus the VAE weights and dtype, so:
+
+* within one batch, identical waveforms are encoded once (``EncodeMemo``),
+* across requests, re-using an upload with a different prompt skips the
+  VAE encode (``LatentCache``, LRU in host memory up to
+  ``ACESTEP_LATENT_CACHE_MB``; ``0`` disables it).
+
+The VAE samples from its posterior, so a cached latent is the sample drawn
+on the first encode of that audio.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+
+LATENT_CACHE_MB = float(os.environ.get("ACESTEP_LATENT_CACHE_MB", "1024"))
+
+
+def waveform_key(wav: torch.Tensor, salt: str = "") -> str:
+    """Hash of a waveform's shape, dtype and samples (plus ``salt``, e.g. the VAE identity)."""
+    t = wav.detach().contiguous()
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{salt}|{tuple(t.shape)}|{t.dtype}|".encode())
+    # Byte view works for every dtype, bfloat16 included
+    h.update(t.reshape(-1).view(torch.uint8).cpu().numpy().tobytes())
+    return h.hexdigest()
+
+
+class EncodeMemo:
+    """
+    Latents already produced for one batch.
+
+    Keys are computed once per tensor object; the tensor is held so its id
+    cannot be reused by another tensor while the memo lives.
+    """
+
+    def __init__(self, salt: str = ""):
+        self.salt = salt
+        self._keys: Dict[int, Tuple[torch.Tensor, str]] = {}
+        self.latents: Dict[str, torch.Tensor] = {}
+
+    def key(self, wav: torch.Tensor) -> str:
+        entry = self._keys.get(id(wav))
+        if entry is None or entry[0] is not wav:
+            entry = (wav, waveform_key(wav, self.salt))
+            self._keys[id(wav)] = entry
+        return entry[1]
+
+
+class LatentCache:
+    """LRU of latents on CPU, bounded by bytes."""
+
+    def __init__(self, budget_mb: float = LATENT_CACHE_MB):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self._entries: "OrderedDict[str, torch.Tensor]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget > 0
+
+    def get(self, key: str) -> Optional[torch.Tensor]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            latent = self._entries.get(key)
+            if latent is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return latent
+
+    def put(self, key: str, latent: torch.Tensor) -> None:
+        if not self.enabled:
+            return
+        latent = latent.detach().to("cpu")
+        nbytes = latent.numel() * latent.element_size()
+        if nbytes > self.budget:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.numel() * old.element_size()
+            self._entries[key] = latent
+            self._bytes += nbytes
+            while self._bytes > self.budget and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.numel() * evicted.element_size()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "mb": round(self._bytes / 1024**2, 2),
+                "budget_mb": round(self.budget / 1024**2, 2),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -16,12 +16,31 @@ from tqdm import tqdm
 from transformers import AutoTokenizer, AutoModelForCausalLM
 from transformers.generation.streamers import BaseStreamer
 from transformers.generation.logits_process import (
+    LogitsProcessor,
     LogitsProcessorList,
     RepetitionPenaltyLogitsProcessor,
 )
+from acestep.cancellation import check_cancelled, current_token
 from acestep.constrained_logits_processor import MetadataConstrainedLogitsProcessor
 from acestep.constants import DEFAULT_LM_INSTRUCTION, DEFAULT_LM_UNDERSTAND_INSTRUCTION, DEFAULT_LM_INSPIRED_INSTRUCTION, DEFAULT_LM_REWRITE_INSTRUCTION
 from acestep.gpu_config import get_lm_gpu_memory_ratio, get_gpu_memory_gb, get_lm_model_size, get_global_gpu_config
+from acestep.model_loading import load_pretrained
+from acestep.audio_codes import COMPACT_PREFIX, AudioCodes, parse_audio_codes
+
+
+def _codes_as_tokens(audio_codes: Union[str, AudioCodes]) -> str:
+    """Token form of audio codes for LM prompts (compact ``ac1:`` strings and AudioCodes are expanded)."""
+    if isinstance(audio_codes, AudioCodes) or (isinstance(audio_codes, str) and audio_codes.startswith(COMPACT_PREFIX)):
+        return parse_audio_codes(audio_codes).to_string()
+    return audio_codes
+
+
+class CancellationCheckLogitsProcessor(LogitsProcessor):
+    """No-op logits processor that aborts HF ``generate()`` once per decode step if the job was cancelled."""
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        check_cancelled()
+        return scores
 
 
 class LLMHandler:
@@ -220,11 +239,8 @@ class LLMHandler:
     def _load_pytorch_model(self, model_path: str, device: str) -> Tuple[bool, str]:
         """Load PyTorch model from path and return (success, status_message)"""
         try:
-            self.llm = AutoModelForCausalLM.from_pretrained(model_path, trust_remote_code=True)
-            if not self.offload_to_cpu:
-                self.llm = self.llm.to(device).to(self.dtype)
-            else:
-                self.llm = self.llm.to("cpu").to(self.dtype)
+            target_device = "cpu" if self.offload_to_cpu else device
+            self.llm = load_pretrained(AutoModelForCausalLM, model_path, target_device, self.dtype, trust_remote_code=True)
             self.llm.eval()
             self.llm_backend = "pt"
             self.llm_initialized = True
@@ -558,9 +574,10 @@ class LLMHandler:
                 formatted_prompt_list,
                 sampling_params,
                 unconditional_prompts=unconditional_prompts,
+                abort_check=check_cancelled,
             )
         else:
-            outputs = self.llm.generate(formatted_prompt_list, sampling_params)
+            outputs = self.llm.generate(formatted_prompt_list, sampling_params, abort_check=check_cancelled)
 
         # Extract text from outputs
         output_texts = []
@@ -639,6 +656,8 @@ class LLMHandler:
 
             # Build logits processor list (only for CFG and repetition penalty)
             logits_processor = self._build_logits_processor(repetition_penalty)
+            if current_token() is not None:
+                logits_processor.append(CancellationCheckLogitsProcessor())
 
             if cfg_scale > 1.0:
                 # Build unconditional prompt based on generation phase
@@ -916,7 +935,7 @@ class LLMHandler:
         Returns:
             Dictionary containing:
                 - metadata: Dict or List[Dict] - Generated metadata
-                - audio_codes: str or List[str] - Generated audio codes
+                - audio_codes: AudioCodes or List[AudioCodes] - Generated audio codes
                 - success: bool - Whether generation succeeded
                 - error: Optional[str] - Error message if failed
                 - extra_outputs: Dict with time_costs and other info
@@ -1139,7 +1158,7 @@ class LLMHandler:
             phase2_time = time.time() - phase2_start
             
             # Log results
-            codes_counts = [len(codes.split('<|audio_code_')) - 1 if codes else 0 for codes in audio_codes_list]
+            codes_counts = [len(codes) for codes in audio_codes_list]
             logger.info(f"Batch Phase 2 completed in {phase2_time:.2f}s. Generated codes: {codes_counts}")
             
             total_time = phase1_time + phase2_time
@@ -1205,7 +1224,7 @@ class LLMHandler:
             # Parse audio codes from output (metadata should be same as Phase 1)
             _, audio_codes = self.parse_lm_output(codes_output_text)
             
-            codes_count = len(audio_codes.split('<|audio_code_')) - 1 if audio_codes else 0
+            codes_count = len(audio_codes)
             logger.info(f"Phase 2 completed in {phase2_time:.2f}s. Generated {codes_count} audio codes")
             
             total_time = phase1_time + phase2_time
@@ -1336,7 +1355,7 @@ class LLMHandler:
     
     def build_formatted_prompt_for_understanding(
         self,
-        audio_codes: str,
+        audio_codes: Union[str, AudioCodes],
         is_negative_prompt: bool = False,
         negative_prompt: str = "NO USER INPUT"
     ) -> str:
@@ -1365,7 +1384,7 @@ class LLMHandler:
         if is_negative_prompt:
             user_content = negative_prompt if negative_prompt and negative_prompt.strip() else ""
         else:
-            user_content = audio_codes
+            user_content = _codes_as_tokens(audio_codes)
         
         return self.llm_tokenizer.apply_chat_template(
             [
@@ -1384,7 +1403,7 @@ class LLMHandler:
     
     def understand_audio_from_codes(
         self,
-        audio_codes: str,
+        audio_codes: Union[str, AudioCodes],
         temperature: float = 0.3,
         top_k: Optional[int] = None,
         top_p: Optional[float] = None,
@@ -1430,6 +1449,7 @@ class LLMHandler:
         if not getattr(self, "llm_initialized", False):
             return {}, "❌ 5Hz LM not initialized. Please initialize it first."
         
+        audio_codes = _codes_as_tokens(audio_codes)
         if not audio_codes or not audio_codes.strip():
             return {}, "❌ No audio codes provided. Please paste audio codes first."
         
@@ -2070,6 +2090,7 @@ class LLMHandler:
         
         with torch.no_grad():
             for step in tqdm(range(max_new_tokens), desc="LLM Constrained Decoding", unit="token"):
+                check_cancelled()
                 # Forward pass
                 outputs = self._forward_pass(model, generated_ids, model_kwargs, past_key_values, use_cache)
                 
@@ -2175,6 +2196,7 @@ class LLMHandler:
         
         with torch.no_grad():
             for step in tqdm(range(max_new_tokens), desc="LLM CFG Generation", unit="token"):
+                check_cancelled()
                 # Forward pass for the entire batch (conditional + unconditional)
                 outputs = self._forward_pass(model, generated_ids, model_kwargs, past_key_values, use_cache)
                 
@@ -2257,20 +2279,16 @@ class LLMHandler:
         <|audio_code_56535|><|audio_code_62918|>...
         
         Returns:
-            Tuple of (metadata_dict, audio_codes_string)
+            Tuple of (metadata_dict, AudioCodes)
         """
         debug_output_text = output_text.split("</think>")[0]
         logger.debug(f"Debug output text: {debug_output_text}")
         metadata = {}
-        audio_codes = ""
         
         import re
         
-        # Extract audio codes - find all <|audio_code_XXX|> patterns
-        code_pattern = r'<\|audio_code_\d+\|>'
-        code_matches = re.findall(code_pattern, output_text)
-        if code_matches:
-            audio_codes = "".join(code_matches)
+        # Extract audio codes - every <|audio_code_XXX|> token, kept as an int array
+        audio_codes = AudioCodes.from_string(output_text)
         
         # Extract metadata from reasoning section
         # Try different reasoning tag patterns
@@ -2427,17 +2445,13 @@ class LLMHandler:
                 # This will load the original unfused weights
                 import time
                 start_time = time.time()
-                self._hf_model_for_scoring = AutoModelForCausalLM.from_pretrained(
-                    model_path,
-                    trust_remote_code=True,
-                    torch_dtype=self.dtype
+                # Same device as the vllm model, loaded there directly
+                device = next(model_runner.model.parameters()).device
+                self._hf_model_for_scoring = load_pretrained(
+                    AutoModelForCausalLM, model_path, device, self.dtype, trust_remote_code=True
                 )
                 load_time = time.time() - start_time
                 logger.info(f"HuggingFace model loaded in {load_time:.2f}s")
-                
-                # Move to same device as vllm model
-                device = next(model_runner.model.parameters()).device
-                self._hf_model_for_scoring = self._hf_model_for_scoring.to(device)
                 self._hf_model_for_scoring.eval()
                 
                 logger.info(f"HuggingFace model for scoring ready on {device}")
@@ -0,0 +1,449 @@
+"""Resident LoRA adapters applied per batch row
+
+Wrapping the decoder in a ``PeftModel`` makes one adapter active for the whole
+process, and switching means restoring a deep copy of the base decoder. Here
+the decoder weights are never touched:
+
+* ``LoraRegistry`` keeps many adapters' A/B matrices resident: on the GPU up
+  to ``ACESTEP_LORA_DEVICE_CACHE_MB``, in pinned host memory up to
+  ``ACESTEP_LORA_HOST_CACHE_MB`` (least recently used first out; adapters
+  dropped from host memory are re-read from disk when requested again).
+  Adapters are registered by path, or resolved by name from the directories
+  in ``ACESTEP_LORA_DIR``.
+* ``lora_batch`` hooks the targeted decoder Linear layers for one
+  ``generate_audio_core`` call and adds each row's own delta,
+  ``scale_row * B[a_row] @ A[a_row] @ x_row``, gathered from adapter stacks,
+  so rows with different adapters and scales share one diffusion batch.
+
+* ``LoraMerger`` is the zero-overhead alternative for batches that all use
+  the same adapter: the delta is fused into the Linear weights in place and
+  restored exactly afterwards, with the merged weights of the most recent
+  adapters (``ACESTEP_LORA_MERGE_CACHE``) kept pinned for fast switching.
+
+Only plain LoRA is supported (no DoRA); the PEFT ``alpha/r`` (or rsLoRA
+``alpha/sqrt(r)``) scaling is folded into B when an adapter is loaded.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+from loguru import logger
+
+DEVICE_CACHE_MB = float(os.environ.get("ACESTEP_LORA_DEVICE_CACHE_MB", "1024"))
+HOST_CACHE_MB = float(os.environ.get("ACESTEP_LORA_HOST_CACHE_MB", "4096"))
+MERGE_CACHE_ENTRIES = max(0, int(os.environ.get("ACESTEP_LORA_MERGE_CACHE", "3")))
+
+_KEY = re.compile(r"^(?:base_model\.model\.)?(?P<fqn>.+)\.lora_(?P<which>[AB])(?:\.[^.]+)?\.weight$")
+
+
+@dataclass
+class LoraAdapter:
+    """One adapter's weights, keyed by decoder-relative module name."""
+
+    name: str
+    path: str
+    # fqn -> (A [r, in], B [out, r] with scaling folded in), pinned host copies
+    host: Dict[str, Tuple[torch.Tensor, torch.Tensor]]
+    nbytes: int
+    device: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = field(default_factory=dict)
+    last_used: float = 0.0
+
+    @property
+    def on_device(self) -> bool:
+        return bool(self.device)
+
+
+def _adapter_weights_file(path: str) -> str:
+    for name in ("adapter_model.safetensors", "adapter_model.bin"):
+        candidate = os.path.join(path, name)
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"No adapter_model.safetensors or adapter_model.bin in {path}")
+
+
+def _module_alpha(fqn: str, default: float, pattern: Dict[str, float]) -> float:
+    for key, value in pattern.items():
+        if fqn == key or fqn.endswith("." + key) or re.fullmatch(key, fqn):
+            return float(value)
+    return default
+
+
+def read_adapter(path: str, dtype: torch.dtype) -> Tuple[Dict[str, Tuple[torch.Tensor, torch.Tensor]], int]:
+    """
+    Read a PEFT LoRA adapter directory into ``{fqn: (A, B * scaling)}`` on pinned CPU memory.
+
+    Returns:
+        (weights, total bytes)
+    """
+    with open(os.path.join(path, "adapter_config.json"), "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if config.get("use_dora"):
+        raise ValueError(f"DoRA adapters are not supported by the batched LoRA path: {path}")
+    alpha = float(config.get("lora_alpha", config.get("r", 8)))
+    alpha_pattern = config.get("alpha_pattern") or {}
+    use_rslora = bool(config.get("use_rslora", False))
+
+    weights_file = _adapter_weights_file(path)
+    if weights_file.endswith(".safetensors"):
+        from safetensors.torch import load_file
+        state = load_file(weights_file, device="cpu")
+    else:
+        state = torch.load(weights_file, map_location="cpu", weights_only=True)
+
+    pairs: Dict[str, Dict[str, torch.Tensor]] = {}
+    for key, tensor in state.items():
+        m = _KEY.match(key)
+        if m:
+            pairs.setdefault(m.group("fqn"), {})[m.group("which")] = tensor
+
+    pin = torch.cuda.is_available()
+    weights: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = {}
+    nbytes = 0
+    for fqn, ab in pairs.items():
+        if "A" not in ab or "B" not in ab:
+            logger.warning(f"[lora_registry] {path}: incomplete LoRA pair for {fqn}, skipped")
+            continue
+        a, b = ab["A"], ab["B"]
+        r = a.shape[0]
+        module_alpha = _module_alpha(fqn, alpha, alpha_pattern)
+        scaling = module_alpha / (r ** 0.5 if use_rslora else r)
+        a = a.to(dtype).contiguous()
+        b = (b.float() * scaling).to(dtype).contiguous()
+        if pin:
+            a, b = a.pin_memory(), b.pin_memory()
+        weights[fqn] = (a, b)
+        nbytes += a.numel() * a.element_size() + b.numel() * b.element_size()
+    if not weights:
+        raise ValueError(f"No LoRA weights found in {weights_file}")
+    return weights, nbytes
+
+
+class LoraRegistry:
+    """
+    Adapters by name, with a device tier and a pinned host tier (both LRU).
+
+    Args:
+        device: Device the decoder runs on.
+        dtype: Serving dtype of the decoder.
+        search_dirs: Directories whose sub-directories are adapters addressable
+            by their directory name (default: ``ACESTEP_LORA_DIR``, os.pathsep separated).
+    """
+
+    def __init__(self, device: str, dtype: torch.dtype, search_dirs: Optional[Sequence[str]] = None,
+                 device_budget_mb: float = DEVICE_CACHE_MB, host_budget_mb: float = HOST_CACHE_MB):
+        self.device = device
+        self.dtype = dtype
+        if search_dirs is None:
+            search_dirs = [d for d in os.environ.get("ACESTEP_LORA_DIR", "").split(os.pathsep) if d]
+        self.search_dirs = list(search_dirs)
+        self.device_budget = int(device_budget_mb * 1024 * 1024)
+        self.host_budget = int(host_budget_mb * 1024 * 1024)
+        self._adapters: "OrderedDict[str, LoraAdapter]" = OrderedDict()
+        self._paths: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Registration
+    # ------------------------------------------------------------------
+
+    def register(self, name: str, path: str) -> LoraAdapter:
+        """Load (or reload) the adapter at ``path`` under ``name``."""
+        weights, nbytes = read_adapter(path, self.dtype)
+        adapter = LoraAdapter(name=name, path=path, host=weights, nbytes=nbytes, last_used=time.monotonic())
+        with self._lock:
+            self._adapters.pop(name, None)
+            self._adapters[name] = adapter
+            self._paths[name] = path
+            self._trim_host(keep=(name,))
+        logger.info(f"[lora_registry] Registered {name} ({len(weights)} layers, {nbytes / 1024**2:.1f} MB) from {path}")
+        return adapter
+
+    def remove(self, name: str) -> None:
+        with self._lock:
+            self._adapters.pop(name, None)
+            self._paths.pop(name, None)
+
+    def _find(self, name: str) -> Optional[str]:
+        if name in self._paths:
+            return self._paths[name]
+        # Names from requests address a direct sub-directory, nothing else
+        if not name or os.path.basename(name) != name or name in (".", ".."):
+            return None
+        for root in self.search_dirs:
+            candidate = os.path.join(root, name)
+            if os.path.isfile(os.path.join(candidate, "adapter_config.json")):
+                return candidate
+        return None
+
+    def resolve(self, name: str) -> LoraAdapter:
+        """Adapter by name, reading it from disk if it is registered but not resident."""
+        with self._lock:
+            adapter = self._adapters.get(name)
+            if adapter is not None:
+                self._adapters.move_to_end(name)
+                return adapter
+            path = self._find(name)
+        if path is None:
+            raise KeyError(f"Unknown LoRA adapter: {name}")
+        return self.register(name, path)
+
+    # ------------------------------------------------------------------
+    # Residency
+    # ------------------------------------------------------------------
+
+    def acquire(self, names: Sequence[str]) -> List[LoraAdapter]:
+        """
+        Adapters for ``names`` with their weights on the device (evicting others as needed).
+
+        The returned objects are snapshots: a later eviction does not take the
+        device weights away from a batch that is already using them.
+        """
+        adapters = [self.resolve(n) for n in names]
+        with self._lock:
+            now = time.monotonic()
+            for adapter in adapters:
+                adapter.last_used = now
+                if not adapter.on_device:
+                    adapter.device = {
+                        fqn: (a.to(self.device, non_blocking=True), b.to(self.device, non_blocking=True))
+                        for fqn, (a, b) in adapter.host.items()
+                    }
+            self._trim_device(keep={a.name for a in adapters})
+            return [replace(a) for a in adapters]
+
+    def _trim_device(self, keep) -> None:
+        used = sum(a.nbytes for a in self._adapters.values() if a.on_device)
+        for adapter in sorted(self._adapters.values(), key=lambda a: a.last_used):
+            if used <= self.device_budget:
+                break
+            if adapter.on_device and adapter.name not in keep:
+                adapter.device = {}
+                used -= adapter.nbytes
+
+    def _trim_host(self, keep) -> None:
+        used = sum(a.nbytes for a in self._adapters.values())
+        for name in list(self._adapters.keys()):
+            if used <= self.host_budget:
+                break
+            if name not in keep:
+                used -= self._adapters.pop(name).nbytes
+                logger.info(f"[lora_registry] Dropped {name} from host memory (re-read from disk on next use)")
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "adapters": [
+                    {"name": a.name, "path": a.path, "mb": round(a.nbytes / 1024**2, 2), "on_device": a.on_device}
+                    for a in self._adapters.values()
+                ],
+                "known": sorted(self._paths.keys()),
+                "device_mb": round(sum(a.nbytes for a in self._adapters.values() if a.on_device) / 1024**2, 2),
+                "host_mb": round(sum(a.nbytes for a in self._adapters.values()) / 1024**2, 2),
+            }
+
+
+# ----------------------------------------------------------------------
+# Per-row application
+# ----------------------------------------------------------------------
+
+def _expand_rows(t: torch.Tensor, n: int) -> torch.Tensor:
+    """Row values for an ``n``-row activation; CFG stacks [cond; uncond] copies of the batch."""
+    rows = t.shape[0]
+    if n == rows:
+        return t
+    reps, rem = divmod(n, rows)
+    parts = [t.repeat(reps)] if reps else []
+    if rem:
+        parts.append(t[-1:].expand(rem))
+    return torch.cat(parts)
+
+
+def _stack(adapters: Sequence[LoraAdapter], fqn: str, in_features: int,
+           out_features: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    """[U, r_max, in] and [U, out, r_max] stacks; adapters without ``fqn`` contribute zeros."""
+    present = [a.device[fqn] for a in adapters if fqn in a.device]
+    r_max = max(a.shape[0] for a, _ in present)
+    dtype, device = present[0][0].dtype, present[0][0].device
+    a_stack = torch.zeros(len(adapters), r_max, in_features, dtype=dtype, device=device)
+    b_stack = torch.zeros(len(adapters), out_features, r_max, dtype=dtype, device=device)
+    for i, adapter in enumerate(adapters):
+        if fqn in adapter.device:
+            a, b = adapter.device[fqn]
+            a_stack[i, : a.shape[0]] = a
+            b_stack[i, :, : b.shape[1]] = b
+    return a_stack, b_stack
+
+
+@contextmanager
+def lora_batch(decoder: torch.nn.Module, row_adapters: Sequence[Optional[LoraAdapter]],
+               row_scales: Sequence[float]) -> Iterator[None]:
+    """
+    Add per-row LoRA deltas to the decoder's Linear outputs inside the block.
+
+    The hooks fire on every forward of ``decoder``, so the caller must keep
+    other batches off it while the block runs (``AceStepHandler._decoder_lock``).
+
+    Args:
+        decoder: The (unwrapped) DiT decoder.
+        row_adapters: One entry per batch row; None = base model for that row.
+        row_scales: User scale per row (multiplies the adapter's own scaling).
+    """
+    unique: List[LoraAdapter] = []
+    for adapter in row_adapters:
+        if adapter is not None and all(adapter is not u for u in unique):
+            unique.append(adapter)
+    if not unique:
+        yield
+        return
+
+    # Adapter weights live on the serving device (the decoder may be streamed from CPU)
+    device = next(iter(unique[0].device.values()))[0].device
+    slot = {id(a): i for i, a in enumerate(unique)}
+    row_idx = torch.tensor([slot[id(a)] if a is not None else 0 for a in row_adapters], device=device)
+    row_scale = torch.tensor(
+        [float(s) if a is not None else 0.0 for a, s in zip(row_adapters, row_scales)],
+        device=device, dtype=torch.float32,
+    )
+    single = len(unique) == 1
+
+    handles = []
+    targets = sorted({fqn for a in unique for fqn in a.device})
+    for fqn in targets:
+        try:
+            module = decoder.get_submodule(fqn)
+        except AttributeError:
+            logger.warning(f"[lora_batch] Decoder has no module {fqn}; adapter layer skipped")
+            continue
+        if not isinstance(module, torch.nn.Linear):
+            logger.warning(f"[lora_batch] {fqn} is {type(module).__name__}, not Linear; adapter layer skipped")
+            continue
+
+        if single:
+            weights = unique[0].device[fqn]
+        else:
+            weights = _stack(unique, fqn, module.in_features, module.out_features)
+
+        def hook(mod, inputs, output, _w=weights):
+            x = inputs[0]
+            n = x.shape[0]
+            h = x.reshape(n, -1, x.shape[-1]).to(_w[0].dtype)
+            scale = _expand_rows(row_scale, n).to(h.dtype)[:, None, None]
+            if single:
+                delta = (h @ _w[0].t()) @ _w[1].t()
+            else:
+                idx = _expand_rows(row_idx, n)
+                delta = torch.bmm(torch.bmm(h, _w[0][idx].transpose(1, 2)), _w[1][idx].transpose(1, 2))
+            return output + (delta * scale).reshape(output.shape).to(output.dtype)
+
+        handles.append(module.register_forward_hook(hook))
+    try:
+        yield
+    finally:
+        for handle in handles:
+            handle.remove()
+
+
+# ----------------------------------------------------------------------
+# Merged weights
+# ----------------------------------------------------------------------
+
+def _host_copy(t: torch.Tensor) -> torch.Tensor:
+    out = torch.empty(t.shape, dtype=t.dtype, pin_memory=torch.cuda.is_available())
+    out.copy_(t)
+    return out
+
+
+class LoraMerger:
+    """
+    One adapter fused into the decoder's Linear weights, switchable in place.
+
+    The original weight of every layer an adapter touches is copied once to
+    pinned host memory; ``unmerge`` copies it back, which is exact (subtracting
+    the delta again would not be, in bf16). Merged weights of the last
+    ``cache_entries`` (adapter, scale) pairs are kept pinned as well, so
+    switching between hot adapters is a copy of the touched layers instead of
+    a recompute. Weights are updated in place, so compiled steps and CUDA
+    graphs that captured their addresses stay valid.
+
+    Args:
+        decoder: The (unwrapped) DiT decoder; must stay resident while merged.
+        cache_entries: Merged snapshots to keep (``ACESTEP_LORA_MERGE_CACHE``).
+    """
+
+    def __init__(self, decoder: torch.nn.Module, cache_entries: int = MERGE_CACHE_ENTRIES):
+        self.decoder = decoder
+        self.cache_entries = cache_entries
+        self._base: Dict[str, torch.Tensor] = {}
+        # (name, scale) -> (adapter host weights it was built from, fqn -> merged weight)
+        self._snapshots: "OrderedDict[Tuple[str, float], Tuple[dict, Dict[str, torch.Tensor]]]" = OrderedDict()
+        self._touched: List[str] = []
+        self._merged_host: Optional[dict] = None
+        self.merged: Optional[Tuple[str, float]] = None
+
+    def _targets(self, adapter: LoraAdapter) -> List[Tuple[str, torch.nn.Linear]]:
+        targets = []
+        for fqn in adapter.device:
+            try:
+                module = self.decoder.get_submodule(fqn)
+            except AttributeError:
+                logger.warning(f"[LoraMerger] Decoder has no module {fqn}; adapter layer skipped")
+                continue
+            if not isinstance(module, torch.nn.Linear):
+                logger.warning(f"[LoraMerger] {fqn} is {type(module).__name__}, not Linear; adapter layer skipped")
+                continue
+            if type(module.weight.data) is not torch.Tensor:
+                # torchao tensor subclasses cannot take an additive delta
+                raise ValueError(f"cannot merge LoRA into quantized layer {fqn}")
+            targets.append((fqn, module))
+        return targets
+
+    def merge(self, adapter: LoraAdapter, scale: float) -> None:
+        """Fuse ``scale * B @ A`` of ``adapter`` (weights on the device) into the decoder."""
+        key = (adapter.name, round(float(scale), 6))
+        if self.merged == key and self._merged_host is adapter.host:
+            return
+        targets = self._targets(adapter)
+        self.unmerge()
+
+        cached = self._snapshots.get(key)
+        snapshot = cached[1] if cached is not None and cached[0] is adapter.host else None
+        with torch.no_grad():
+            for fqn, module in targets:
+                weight = module.weight.data
+                if fqn not in self._base:
+                    self._base[fqn] = _host_copy(weight)
+                if snapshot is not None:
+                    weight.copy_(snapshot[fqn], non_blocking=True)
+                else:
+                    a, b = adapter.device[fqn]
+                    delta = (b.float() @ a.float()).mul_(float(scale)).to(weight.device)
+                    weight.copy_(weight.float().add_(delta))
+        self._touched = [fqn for fqn, _ in targets]
+        self._merged_host = adapter.host
+        self.merged = key
+
+        if snapshot is not None:
+            self._snapshots.move_to_end(key)
+        elif self.cache_entries > 0:
+            self._snapshots[key] = (adapter.host, {fqn: _host_copy(module.weight.data) for fqn, module in targets})
+            while len(self._snapshots) > self.cache_entries:
+                self._snapshots.popitem(last=False)
+
+    def unmerge(self) -> None:
+        """Restore the original weights of the layers the merged adapter touched."""
+        if self.merged is None:
+            return
+        with torch.no_grad():
+            for fqn in self._touched:
+                self.decoder.get_submodule(fqn).weight.data.copy_(self._base[fqn], non_blocking=True)
+        self._touched = []
+        self._merged_host = None
+        self.merged = None
@@ -0,0 +1,75 @@
+"""Checkpoint loading straight into the target device and dtype
+
+A plain ``from_pretrained`` materializes every weight in host RAM and
+``.to(device)`` then copies it again, so a cold start pays for the full model
+twice in host memory and once more in a host->device copy. ``load_pretrained``
+asks transformers/diffusers to build the module on the meta device and fill it
+from the memory-mapped safetensors shards directly on ``device`` in ``dtype``
+(``low_cpu_mem_usage`` + a single-device ``device_map``). Loaders that do not
+support that path fall back to the plain load.
+
+``from_pretrained`` swaps process-wide state while it builds a module (the
+default dtype, ``nn.Module.register_parameter`` under ``init_empty_weights``,
+``torch.nn.init`` under ``no_init_weights``) and restores it afterwards, so
+two overlapping calls can restore each other's patched versions. Every call
+therefore holds ``_FROM_PRETRAINED_LOCK``. ``LOAD_WORKERS`` bounds the thread
+pool that loads independent components (DiT, VAE, text encoder): each worker
+reads its shards into the page cache before taking the lock, so the disk
+reads overlap and the locked part is the build and device copy.
+"""
+
+import glob
+import os
+import threading
+from typing import Any, Union
+
+import torch
+from loguru import logger
+
+LOAD_WORKERS = max(1, int(os.environ.get("ACESTEP_LOAD_WORKERS", "3")))
+
+_FROM_PRETRAINED_LOCK = threading.Lock()
+_READ_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def _warm_shards(path: str) -> None:
+    """Read the weight files under ``path`` once so the locked load hits the page cache."""
+    buf = bytearray(_READ_CHUNK_BYTES)
+    for shard in sorted(glob.glob(os.path.join(path, "*.safetensors")) + glob.glob(os.path.join(path, "*.bin"))):
+        try:
+            with open(shard, "rb", buffering=0) as f:
+                while f.readinto(buf):
+                    pass
+        except OSError as e:
+            logger.debug(f"[load_pretrained] Could not pre-read {shard}: {e}")
+            return
+
+
+def load_pretrained(cls: Any, path: str, device: Union[str, torch.device], dtype: torch.dtype, **kwargs) -> torch.nn.Module:
+    """
+    ``cls.from_pretrained(path, **kwargs)`` placed on ``device`` in ``dtype``.
+
+    Args:
+        cls: A transformers Auto class or model class, or a diffusers model class.
+        path: Local checkpoint directory.
+        device: Target device for every parameter and buffer.
+        dtype: Target floating point dtype.
+        **kwargs: Passed through (``trust_remote_code``, ``attn_implementation``, ...).
+    """
+    device = str(device)
+    _warm_shards(path)
+    with _FROM_PRETRAINED_LOCK:
+        try:
+            model = cls.from_pretrained(
+                path,
+                torch_dtype=dtype,
+                low_cpu_mem_usage=True,
+                device_map={"": device},
+                **kwargs,
+            )
+        except (ValueError, TypeError, NotImplementedError, ImportError) as e:
+            # Loader without device_map support (or accelerate missing)
+            logger.debug(f"[load_pretrained] Direct-to-device load of {path} unavailable ({e}); loading on CPU first")
+            model = cls.from_pretrained(path, torch_dtype=dtype, **kwargs)
+    # No-op when already placed; also catches modules whose remote code ignores torch_dtype
+    return model.to(device).to(dtype)
@@ -0,0 +1,338 @@
+"""CPU offload engine
+
+Replaces the whole-model ``.to()`` round trips of ``offload_to_cpu`` with:
+
+* ``FlatWeightMirror`` - a module's weights packed into one page-locked host
+  buffer per dtype. Loading is one async host-to-device copy per dtype on a
+  side stream; offloading just re-points the parameters at their host views
+  (inference weights never change on the device, so nothing is copied back).
+* ``LayerStreamer`` - keeps the DiT decoder's transformer layers in host
+  memory and streams them to the GPU one at a time from forward pre-hooks,
+  prefetching the next ``depth`` layers on the side stream while the current
+  one computes. Only ``depth + 1`` layers are on the device at any moment.
+
+Mirrors are cached per component and rebuilt when the module's parameters
+change (model swap, LoRA load). Code that edits weights in place must call
+``OffloadEngine.invalidate`` so the host copy is refreshed.
+"""
+
+import os
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional, Set
+
+import torch
+from loguru import logger
+
+
+def _collect_tensors(module: torch.nn.Module, skip_modules: Set[int]) -> List[torch.Tensor]:
+    """
+    Parameters and buffers reachable from ``module``.
+
+    Includes nn.Module attributes that were never registered as submodules
+    (some remote-code models keep those); the ``dir()`` scan that needs is
+    only paid when a mirror is built.
+    """
+    tensors: List[torch.Tensor] = []
+    seen_tensors: Set[int] = set()
+    visited: Set[int] = set(skip_modules)
+
+    def visit(m: torch.nn.Module) -> None:
+        if id(m) in visited:
+            return
+        visited.add(id(m))
+        for t in list(m._parameters.values()) + list(m._buffers.values()):
+            if t is not None and id(t) not in seen_tensors:
+                seen_tensors.add(id(t))
+                tensors.append(t)
+        for child in m._modules.values():
+            if child is not None:
+                visit(child)
+        for attr_name in dir(m):
+            if attr_name.startswith("_"):
+                continue
+            try:
+                attr = getattr(m, attr_name, None)
+            except Exception:
+                continue
+            if isinstance(attr, torch.nn.Module):
+                visit(attr)
+
+    visit(module)
+    return tensors
+
+
+def _param_signature(module: torch.nn.Module) -> tuple:
+    return tuple(id(p) for p in module.parameters())
+
+
+class FlatWeightMirror:
+    """
+    Page-locked host copy of a module's weights, one flat buffer per dtype.
+
+    After construction every parameter/buffer of the module is a view into
+    the host buffers; ``to_device`` re-points them at views of a freshly
+    copied device buffer and ``to_host`` points them back.
+
+    Args:
+        module: Module to mirror.
+        dtype: Dtype for floating-point tensors (others keep theirs).
+        skip_modules: Submodules left out of this mirror (e.g. streamed layers).
+    """
+
+    def __init__(self, module: torch.nn.Module, dtype: Optional[torch.dtype] = None,
+                 skip_modules: Optional[List[torch.nn.Module]] = None):
+        self.signature = _param_signature(module)
+        self.dtype = dtype
+        self._tensors = _collect_tensors(module, {id(m) for m in (skip_modules or [])})
+        for t in self._tensors:
+            if type(t) not in (torch.Tensor, torch.nn.Parameter):
+                # Tensor subclasses (e.g. torchao quantized weights) cannot be re-pointed
+                raise TypeError(f"cannot mirror tensor subclass {type(t).__name__}")
+        self._layout = []  # (tensor, dtype, offset, numel, shape)
+        sizes: Dict[torch.dtype, int] = {}
+        for t in self._tensors:
+            target = dtype if (dtype is not None and t.is_floating_point()) else t.dtype
+            offset = sizes.get(target, 0)
+            self._layout.append((t, target, offset, t.numel(), t.shape))
+            sizes[target] = offset + t.numel()
+
+        pin = torch.cuda.is_available()
+        self.host: Dict[torch.dtype, torch.Tensor] = {}
+        with torch.inference_mode(False), torch.no_grad():
+            for target, numel in sizes.items():
+                self.host[target] = torch.empty(numel, dtype=target, pin_memory=pin)
+            for t, target, offset, numel, _ in self._layout:
+                self.host[target][offset:offset + numel].copy_(t.detach().reshape(-1))
+        self.device_buffers: Optional[Dict[torch.dtype, torch.Tensor]] = None
+        self._ready = None
+        self._repoint(self.host)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(b.numel() * b.element_size() for b in self.host.values())
+
+    @property
+    def on_device(self) -> bool:
+        return self.device_buffers is not None
+
+    def _repoint(self, buffers: Dict[torch.dtype, torch.Tensor]) -> None:
+        with torch.inference_mode(False), torch.no_grad():
+            for t, target, offset, numel, shape in self._layout:
+                t.data = buffers[target][offset:offset + numel].view(shape)
+
+    def matches(self, module: torch.nn.Module) -> bool:
+        """True while the module still owns the mirrored tensors at the mirrored addresses."""
+        if _param_signature(module) != self.signature:
+            return False
+        buffers = self.device_buffers if self.device_buffers is not None else self.host
+        for t, target, offset, _, _ in self._layout:
+            expected = buffers[target].data_ptr() + offset * buffers[target].element_size()
+            if t.data_ptr() != expected:
+                return False
+        return True
+
+    def to_device(self, device: str, stream=None) -> None:
+        """Issue the host-to-device copy (async on ``stream`` when given)."""
+        if self.device_buffers is not None:
+            return
+        ctx = torch.cuda.stream(stream) if stream is not None else nullcontext()
+        with torch.inference_mode(False), torch.no_grad(), ctx:
+            buffers = {}
+            for target, host in self.host.items():
+                dev = torch.empty(host.shape, dtype=target, device=device)
+                dev.copy_(host, non_blocking=stream is not None)
+                buffers[target] = dev
+            if stream is not None:
+                self._ready = torch.cuda.Event()
+                self._ready.record(stream)
+        self.device_buffers = buffers
+        self._repoint(buffers)
+
+    def wait(self) -> None:
+        """Make the current stream wait for the copy; no host synchronisation."""
+        if self._ready is None:
+            return
+        current = torch.cuda.current_stream()
+        current.wait_event(self._ready)
+        # Buffers were allocated on the side stream; tell the allocator the
+        # compute stream uses them so they are not recycled too early.
+        for buf in self.device_buffers.values():
+            buf.record_stream(current)
+        self._ready = None
+
+    def to_host(self) -> None:
+        """Point the module back at host memory and release the device copy."""
+        if self.device_buffers is None:
+            return
+        self._repoint(self.host)
+        self.device_buffers = None
+        self._ready = None
+
+
+class LayerStreamer:
+    """
+    Streams a stack of layers through the device during forward.
+
+    A forward pre-hook on layer ``i`` waits for its copy and issues copies of
+    layers ``i+1 .. i+depth`` (wrapping, so the next denoising step's first
+    layers arrive during this step's last ones); a forward hook releases it.
+    """
+
+    def __init__(self, layers: torch.nn.ModuleList, device: str, dtype: Optional[torch.dtype],
+                 stream, depth: int):
+        self.layers = list(layers)
+        self.device = device
+        self.stream = stream
+        self.depth = max(1, depth)
+        self.mirrors = [FlatWeightMirror(layer, dtype) for layer in self.layers]
+        self._handles = []
+        self.bytes_streamed = 0
+
+    def matches(self, layers: torch.nn.ModuleList) -> bool:
+        layers = list(layers)
+        if len(layers) != len(self.layers):
+            return False
+        return all(a is b and m.matches(a) for a, b, m in zip(layers, self.layers, self.mirrors))
+
+    def _issue(self, i: int) -> None:
+        mirror = self.mirrors[i]
+        if not mirror.on_device:
+            mirror.to_device(self.device, self.stream)
+            self.bytes_streamed += mirror.nbytes
+
+    def _pre_hook(self, i: int):
+        def hook(module, args):
+            self._issue(i)
+            self.mirrors[i].wait()
+            for d in range(1, self.depth + 1):
+                self._issue((i + d) % len(self.mirrors))
+        return hook
+
+    def _post_hook(self, i: int):
+        def hook(module, args, output):
+            self.mirrors[i].to_host()
+        return hook
+
+    def attach(self) -> None:
+        self.bytes_streamed = 0
+        for i, layer in enumerate(self.layers):
+            self._handles.append(layer.register_forward_pre_hook(self._pre_hook(i)))
+            self._handles.append(layer.register_forward_hook(self._post_hook(i)))
+        self._issue(0)
+
+    def detach(self) -> None:
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+        for mirror in self.mirrors:
+            mirror.to_host()
+
+
+def find_layer_stack(module: torch.nn.Module) -> Optional[torch.nn.ModuleList]:
+    """The ModuleList holding the most parameters (the transformer blocks)."""
+    best, best_numel = None, 0
+    for sub in module.modules():
+        if isinstance(sub, torch.nn.ModuleList) and len(sub) > 1:
+            numel = sum(p.numel() for p in sub.parameters())
+            if numel > best_numel:
+                best, best_numel = sub, numel
+    return best
+
+
+class OffloadEngine:
+    """
+    Moves offloaded components between pinned host memory and the device.
+
+    Args:
+        device: Accelerator device string.
+        stream_depth: Layers prefetched ahead when streaming the DiT decoder
+            (``ACESTEP_OFFLOAD_STREAM_DEPTH``, default 2). ``0`` loads the
+            whole DiT per phase instead of streaming it.
+    """
+
+    def __init__(self, device: str, stream_depth: Optional[int] = None):
+        self.device = device
+        if stream_depth is None:
+            stream_depth = int(os.environ.get("ACESTEP_OFFLOAD_STREAM_DEPTH", "2"))
+        self.stream_depth = stream_depth
+        self._stream = None
+        if str(device).startswith("cuda") and torch.cuda.is_available():
+            self._stream = torch.cuda.Stream(device=device)
+        self._mirrors: Dict[str, FlatWeightMirror] = {}
+        self._streamers: Dict[str, LayerStreamer] = {}
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Forget cached mirrors (all, or one component's) after in-place weight edits."""
+        for cache in (self._mirrors, self._streamers):
+            for key in list(cache):
+                if name is None or key == name:
+                    del cache[key]
+
+    def _mirror(self, name: str, module: torch.nn.Module, dtype: Optional[torch.dtype],
+                skip_modules: Optional[List[torch.nn.Module]] = None) -> FlatWeightMirror:
+        mirror = self._mirrors.get(name)
+        if mirror is None or mirror.dtype != dtype or not mirror.matches(module):
+            mirror = FlatWeightMirror(module, dtype, skip_modules)
+            self._mirrors[name] = mirror
+            logger.info(f"[offload_engine] Built pinned mirror for {name} ({mirror.nbytes / 1024**2:.0f} MB)")
+        return mirror
+
+    @contextmanager
+    def resident(self, name: str, module: torch.nn.Module, dtype: Optional[torch.dtype]) -> Iterator[None]:
+        """Keep the whole module on the device for the duration of the block."""
+        try:
+            mirror = self._mirror(name, module, dtype)
+        except TypeError as e:
+            logger.warning(f"[offload_engine] {name}: {e}; falling back to module.to()")
+            module.to(self.device)
+            if dtype is not None:
+                module.to(dtype)
+            try:
+                yield
+            finally:
+                module.to("cpu")
+            return
+        mirror.to_device(self.device, self._stream)
+        mirror.wait()
+        try:
+            yield
+        finally:
+            mirror.to_host()
+
+    @contextmanager
+    def streamed(self, name: str, module: torch.nn.Module, dtype: Optional[torch.dtype]) -> Iterator[None]:
+        """
+        Run ``module`` with its largest layer stack streamed through the device.
+
+        Falls back to ``resident`` when streaming is disabled, there is no CUDA
+        side stream, or no layer stack is found.
+        """
+        root = getattr(module, "decoder", module)
+        layers = find_layer_stack(root) if self.stream_depth > 0 and self._stream is not None else None
+        if layers is None:
+            with self.resident(name, module, dtype):
+                yield
+            return
+
+        try:
+            streamer = self._streamers.get(name)
+            if streamer is None or not streamer.matches(layers):
+                streamer = LayerStreamer(layers, self.device, dtype, self._stream, self.stream_depth)
+                self._streamers[name] = streamer
+                self._mirrors.pop(name, None)
+            base = self._mirror(name, module, dtype, skip_modules=[layers])
+        except TypeError as e:
+            logger.warning(f"[offload_engine] {name}: {e}; loading it whole instead of streaming")
+            self._streamers.pop(name, None)
+            with self.resident(name, module, dtype):
+                yield
+            return
+        base.to_device(self.device, self._stream)
+        base.wait()
+        streamer.attach()
+        try:
+            yield
+        finally:
+            streamer.detach()
+            base.to_host()
+            logger.debug(f"[offload_engine] Streamed {streamer.bytes_streamed / 1024**3:.2f} GB of {name} layers")
@@ -0,0 +1,164 @@
+"""DiT weight quantization (torchao) with an on-disk cache per variant
+
+``quantize_`` computes scales from the bf16 weights, which used to happen at
+every start and was skipped entirely by ``swap_dit_model``. This module:
+
+* builds the torchao config for a mode,
+* serializes the quantized state dict once per (variant, mode, weights
+  fingerprint, torchao version) and loads it directly afterwards, with
+  ``weights_only`` unpickling that admits only torchao classes,
+* quantizes only the Linear layers that are still plain tensors, so it can
+  be applied again to a partly quantized module (``lora_`` adapter layers
+  are left in full precision).
+"""
+
+import glob
+import hashlib
+import importlib
+import os
+import pickle
+from typing import Optional
+
+import torch
+from loguru import logger
+
+QUANTIZATION_MODES = ("int8_weight_only", "fp8_weight_only", "w8a8_dynamic")
+
+
+def build_quant_config(mode: str):
+    """torchao config object for ``mode``."""
+    if mode == "int8_weight_only":
+        from torchao.quantization import Int8WeightOnlyConfig
+        return Int8WeightOnlyConfig()
+    if mode == "fp8_weight_only":
+        from torchao.quantization import Float8WeightOnlyConfig
+        return Float8WeightOnlyConfig()
+    if mode == "w8a8_dynamic":
+        from torchao.quantization import Int8DynamicActivationInt8WeightConfig, MappingType
+        return Int8DynamicActivationInt8WeightConfig(act_mapping_type=MappingType.ASYMMETRIC)
+    raise ValueError(f"Unsupported quantization type: {mode}")
+
+
+def _is_plain(t: torch.Tensor) -> bool:
+    return type(t) in (torch.Tensor, torch.nn.Parameter)
+
+
+def _needs_quantization(module: torch.nn.Module, fqn: str) -> bool:
+    """Plain-precision Linear layers outside LoRA adapters."""
+    if not isinstance(module, torch.nn.Linear):
+        return False
+    if "lora_" in fqn:
+        return False
+    return _is_plain(module.weight)
+
+
+def quantize_module(module: torch.nn.Module, mode: str) -> int:
+    """Quantize every not-yet-quantized Linear in ``module``. Returns the number quantized."""
+    from torchao.quantization import quantize_
+
+    count = sum(1 for fqn, m in module.named_modules() if _needs_quantization(m, fqn))
+    if count:
+        quantize_(module, build_quant_config(mode), filter_fn=_needs_quantization)
+    return count
+
+
+def is_quantized(module: torch.nn.Module) -> bool:
+    return any(not _is_plain(p) for p in module.parameters())
+
+
+def cast_unquantized(module: torch.nn.Module, dtype: torch.dtype) -> torch.nn.Module:
+    """``module.to(dtype)`` that leaves quantized weights alone."""
+    with torch.no_grad():
+        for p in module.parameters():
+            if _is_plain(p) and p.is_floating_point() and p.dtype != dtype:
+                p.data = p.data.to(dtype)
+    return module
+
+
+def default_cache_dir() -> str:
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.environ.get("ACESTEP_QUANT_CACHE_DIR", os.path.join(project_root, ".cache", "acestep", "quantized"))
+
+
+def weights_fingerprint(checkpoint_path: str) -> str:
+    """Cheap identity of a checkpoint directory: names, sizes and mtimes of its weight files."""
+    h = hashlib.sha1()
+    for path in sorted(glob.glob(os.path.join(checkpoint_path, "*.safetensors")) +
+                       glob.glob(os.path.join(checkpoint_path, "*.bin"))):
+        st = os.stat(path)
+        h.update(f"{os.path.basename(path)}:{st.st_size}:{int(st.st_mtime)}".encode())
+    return h.hexdigest()[:16]
+
+
+def cache_path(variant: str, mode: str, checkpoint_path: str, cache_dir: Optional[str] = None) -> str:
+    try:
+        import torchao
+        torchao_version = torchao.__version__
+    except Exception:
+        torchao_version = "unknown"
+    name = f"{mode}-{weights_fingerprint(checkpoint_path)}-torchao{torchao_version}.pt"
+    return os.path.join(cache_dir or default_cache_dir(), variant, name)
+
+
+def _resolve_global(name: str):
+    """Class named by a pickle global (``module.Qualname``), imported without running the pickle."""
+    parts = name.split(".")
+    for i in range(len(parts) - 1, 0, -1):
+        try:
+            obj = importlib.import_module(".".join(parts[:i]))
+        except ImportError:
+            continue
+        for attr in parts[i:]:
+            obj = getattr(obj, attr)
+        return obj
+    raise ImportError(name)
+
+
+def load_cached_state(path: str) -> dict:
+    """
+    ``torch.load`` a cached quantized state dict with ``weights_only=True``.
+
+    The tensor subclasses, layouts and enums the file references are
+    allow-listed only when they are torchao classes; any other global makes
+    the load fail instead of letting pickle call it.
+    """
+    allowed = []
+    for name in torch.serialization.get_unsafe_globals_in_checkpoint(path):
+        obj = _resolve_global(name) if name.startswith("torchao.") else None
+        if not isinstance(obj, type):
+            raise pickle.UnpicklingError(f"global {name} is not an allowed torchao class")
+        allowed.append(obj)
+    with torch.serialization.safe_globals(allowed):
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+
+
+def quantize_dit(model: torch.nn.Module, mode: str, variant: str, checkpoint_path: str,
+                 device: str, cache_dir: Optional[str] = None) -> torch.nn.Module:
+    """
+    Quantize a freshly loaded bf16 DiT, from the on-disk cache when possible.
+
+    The model must already be on ``device``; it is returned quantized on it.
+    On a cache miss the model is quantized in place and the result saved.
+    """
+    path = cache_path(variant, mode, checkpoint_path, cache_dir)
+    if os.path.exists(path):
+        try:
+            state = load_cached_state(path)
+            model.load_state_dict(state, assign=True)
+            model.to(device)
+            logger.info(f"[quantization] Loaded {mode} weights for {variant} from {path}")
+            return model
+        except Exception as e:
+            logger.warning(f"[quantization] Cached weights {path} unusable ({e}); re-quantizing")
+
+    count = quantize_module(model, mode)
+    logger.info(f"[quantization] Quantized {count} Linear layers of {variant} with {mode}")
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        torch.save(model.state_dict(), tmp)
+        os.replace(tmp, path)
+        logger.info(f"[quantization] Saved {mode} weights for {variant} to {path}")
+    except Exception as e:
+        logger.warning(f"[quantization] Could not cache quantized weights: {e}")
+    return model
@@ -1,7 +1,21 @@
 """
 Test-Time Scaling Module
 Implements perplexity-based scoring for generated audio codes
+
+All scores are teacher-forced continuations of an understanding prompt (the
+audio codes, or "NO USER INPUT" for the unconditional side). ``_score_continuations``
+runs them together: one prefix pass per distinct prompt, whose KV cache is
+shared by every target of that prompt, and the targets of all prompts packed
+into padded forwards of up to ``ACESTEP_SCORING_BATCH_TOKENS`` tokens (the
+prefix passes too). Logits are only computed at the target positions.
+``ACESTEP_SCORING_BATCH_TOKENS=0`` scores every request with its own full
+forward (``_calculate_topk_recall`` / ``_calculate_log_prob``), the reference
+``scripts/check_scoring_equivalence.py`` compares the batched path against.
 """
+import os
+import weakref
+from collections import OrderedDict
+
 import torch
 import torch.nn.functional as F
 from typing import Tuple, Optional, Dict, Any, List
@@ -10,6 +24,18 @@ import yaml
 import math
 import re
 
+from acestep.audio_codes import has_audio_codes
+
+SCORING_BATCH_TOKENS = int(os.environ.get("ACESTEP_SCORING_BATCH_TOKENS", "8192"))
+METADATA_RECALL_KEYS = ['bpm', 'duration', 'genres', 'keyscale', 'language', 'timesignature']
+METADATA_PMI_KEYS = ['caption']
+UNCONDITIONAL_CODES = "NO USER INPUT"
+
+# Unconditional log-probs depend only on the target text, so samples scored in
+# separate calls share them: {(prompt, target): (weakref(model), log_prob)}
+_UNCOND_LOG_PROBS: "OrderedDict[Tuple[str, str], Tuple[Any, float]]" = OrderedDict()
+_UNCOND_LOG_PROBS_MAX = 64
+
 
 def pmi_score(log_prob_conditional: float, log_prob_unconditional: float) -> float:
     """
@@ -127,7 +153,12 @@ def _calculate_topk_recall(llm_handler,
     """
     # Use the fixed helper to get aligned logits/labels
     pred_logits, target_ids = _get_logits_and_target_for_scoring(llm_handler, formatted_prompt, target_text)
+    return _topk_recall_from_logits(pred_logits, target_ids, topk)
+
 
+def _topk_recall_from_logits(pred_logits: torch.Tensor, target_ids: torch.Tensor,
+                             topk: int = 10) -> Tuple[float, Dict[int, float]]:
+    """Position-weighted top-k recall of ``target_ids`` under ``pred_logits`` [target_len, vocab]."""
     if target_ids.shape[0] == 0:
         return 0.0, {}
 
@@ -209,7 +240,11 @@ def _calculate_log_prob(
     Calculate average log probability of target text given prompt.
     """
     pred_logits, target_ids = _get_logits_and_target_for_scoring(llm_handler, formatted_prompt, target_text)
+    return _log_prob_from_logits(pred_logits, target_ids)
 
+
+def _log_prob_from_logits(pred_logits: torch.Tensor, target_ids: torch.Tensor) -> float:
+    """Average log probability of ``target_ids`` under ``pred_logits`` [target_len, vocab]."""
     if target_ids.shape[0] == 0:
         return float('-inf')
 
@@ -228,6 +263,185 @@ def _calculate_log_prob(
     return mean_log_prob
 
 
+def _score_continuations(llm_handler,
+                         requests: List[Tuple[str, str, str]],
+                         topk: int = 10) -> List[Any]:
+    """
+    Score teacher-forced continuations, sharing work between them.
+
+    Args:
+        requests: (formatted_prompt, target_text, kind) with kind "recall"
+                  (``_topk_recall_from_logits``) or "log_prob" (``_log_prob_from_logits``).
+
+    Returns:
+        One result per request, equal to what ``_calculate_topk_recall`` /
+        ``_calculate_log_prob`` return for it.
+
+    Each target is still tokenized together with its prompt and scored from
+    ``prompt_len - 1`` on, exactly like ``_get_logits_and_target_for_scoring``.
+    The tokens all continuations of a prompt agree on are encoded once; the
+    continuations attend to that KV cache (rows of a padded batch, padding
+    masked out), and only target positions go through the LM head.
+    """
+    if SCORING_BATCH_TOKENS <= 0:
+        # Reference path: one full forward per request
+        return [
+            _calculate_topk_recall(llm_handler, prompt, target_text, topk=topk) if kind == "recall"
+            else _calculate_log_prob(llm_handler, prompt, target_text)
+            for prompt, target_text, kind in requests
+        ]
+
+    model = llm_handler.get_hf_model_for_scoring()
+    tokenizer = llm_handler.llm_tokenizer
+    device = llm_handler.device if llm_handler.llm_backend == "pt" else next(model.parameters()).device
+    reducers = {
+        "recall": lambda logits, ids: _topk_recall_from_logits(logits, ids, topk),
+        "log_prob": _log_prob_from_logits,
+    }
+
+    results: List[Any] = [None] * len(requests)
+    # Identical requests (e.g. the same target under the same prompt for two samples) run once
+    unique: Dict[Tuple[str, str, str], List[int]] = {}
+    for i, request in enumerate(requests):
+        unique.setdefault(request, []).append(i)
+
+    prompts: Dict[str, Dict[str, Any]] = {}
+    rows = []  # (request, prompt entry, token ids)
+    for request in unique:
+        prompt, target_text, kind = request
+        entry = prompts.get(prompt)
+        if entry is None:
+            prompt_len = tokenizer(prompt, return_tensors="pt", add_special_tokens=True)['input_ids'].shape[1]
+            entry = prompts[prompt] = {"prompt_len": prompt_len, "prefix": None, "prefix_len": prompt_len - 1}
+        ids = tokenizer(prompt + target_text, padding=False, truncation=True, add_special_tokens=True)['input_ids']
+        if len(ids) <= entry["prompt_len"]:
+            # Target empty or truncated away
+            value = reducers[kind](torch.empty(0, device=device), torch.empty(0, device=device))
+            for i in unique[request]:
+                results[i] = value
+            continue
+        # Shared prefix: tokens every continuation agrees on, stopping before the first scored position
+        if entry["prefix"] is None:
+            entry["prefix"] = ids
+        else:
+            n = 0
+            limit = entry["prefix_len"]
+            while n < limit and ids[n] == entry["prefix"][n]:
+                n += 1
+            entry["prefix_len"] = n
+        rows.append((request, entry, ids))
+    if not rows:
+        return results
+
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else (tokenizer.eos_token_id or 0)
+    decoder = model.get_decoder()
+    lm_head = model.get_output_embeddings()
+
+    with torch.no_grad():
+        with llm_handler._load_model_context():
+            # 1. Prefixes of the distinct prompts, packed up to SCORING_BATCH_TOKENS padded tokens per forward
+            entries = sorted((e for e in prompts.values() if e["prefix"] is not None and e["prefix_len"] > 0),
+                             key=lambda e: e["prefix_len"])
+            groups, current = [], []
+            for entry in entries:
+                if current and (len(current) + 1) * entry["prefix_len"] > SCORING_BATCH_TOKENS:
+                    groups.append(current)
+                    current = []
+                current.append(entry)
+            if current:
+                groups.append(current)
+            for group in groups:
+                width = group[-1]["prefix_len"]
+                prefix_ids = torch.full((len(group), width), pad_id, dtype=torch.long)
+                prefix_mask = torch.zeros(len(group), width, dtype=torch.long)
+                for g, entry in enumerate(group):
+                    n = entry["prefix_len"]
+                    prefix_ids[g, :n] = torch.tensor(entry["prefix"][:n])
+                    prefix_mask[g, :n] = 1
+                cache = decoder(
+                    input_ids=prefix_ids.to(device),
+                    attention_mask=prefix_mask.to(device),
+                    position_ids=torch.arange(width, device=device).unsqueeze(0).expand(len(group), -1),
+                    use_cache=True,
+                ).past_key_values
+                for g, entry in enumerate(group):
+                    n = entry["prefix_len"]
+                    entry["kv"] = [(cache[layer][0][g:g + 1, :, :n], cache[layer][1][g:g + 1, :, :n])
+                                   for layer in range(len(cache))]
+                del cache
+
+            # 2. Continuations, shortest first, packed up to SCORING_BATCH_TOKENS padded tokens
+            rows.sort(key=lambda r: len(r[2]) - r[1]["prefix_len"])
+            chunks, current, current_prefix = [], [], 0
+            for row in rows:
+                width = len(row[2]) - row[1]["prefix_len"]
+                prefix_width = max(current_prefix, row[1]["prefix_len"])
+                if current and (len(current) + 1) * (prefix_width + width) > SCORING_BATCH_TOKENS:
+                    chunks.append(current)
+                    current, prefix_width = [], row[1]["prefix_len"]
+                current.append(row)
+                current_prefix = prefix_width
+            chunks.append(current)
+
+            for chunk in chunks:
+                batch = len(chunk)
+                width = max(len(ids) - entry["prefix_len"] for _, entry, ids in chunk)
+                prefix_width = max(entry["prefix_len"] for _, entry, _ in chunk)
+                input_ids = torch.full((batch, width), pad_id, dtype=torch.long)
+                suffix_mask = torch.zeros(batch, width, dtype=torch.long)
+                position_ids = torch.zeros(batch, width, dtype=torch.long)
+                prefix_mask = torch.zeros(batch, prefix_width, dtype=torch.long)
+                for r, (_, entry, ids) in enumerate(chunk):
+                    suffix = ids[entry["prefix_len"]:]
+                    input_ids[r, :len(suffix)] = torch.tensor(suffix)
+                    suffix_mask[r, :len(suffix)] = 1
+                    position_ids[r] = torch.arange(entry["prefix_len"], entry["prefix_len"] + width)
+                    prefix_mask[r, :entry["prefix_len"]] = 1
+
+                past = None
+                attention_mask = suffix_mask.to(device)
+                if prefix_width > 0:
+                    from transformers.cache_utils import DynamicCache
+                    past = DynamicCache()
+                    template = next(entry["kv"] for _, entry, _ in chunk if entry["prefix_len"] > 0)
+                    for layer, (k0, v0) in enumerate(template):
+                        ks, vs = [], []
+                        for _, entry, _ in chunk:
+                            n = entry["prefix_len"]
+                            k = entry["kv"][layer][0] if n else k0[:, :, :0]
+                            v = entry["kv"][layer][1] if n else v0[:, :, :0]
+                            # Right-pad to the chunk's prefix width; the padding is masked out
+                            ks.append(F.pad(k, (0, 0, 0, prefix_width - n)))
+                            vs.append(F.pad(v, (0, 0, 0, prefix_width - n)))
+                        past.update(torch.cat(ks), torch.cat(vs), layer)
+                    attention_mask = torch.cat([prefix_mask.to(device), attention_mask], dim=1)
+                hidden = decoder(
+                    input_ids=input_ids.to(device),
+                    attention_mask=attention_mask,
+                    position_ids=position_ids.to(device),
+                    past_key_values=past,
+                    use_cache=past is not None,
+                ).last_hidden_state
+                del past
+
+                for r, (request, entry, ids) in enumerate(chunk):
+                    # Logit at position p predicts token p + 1; the target starts at prompt_len
+                    start = entry["prompt_len"] - 1 - entry["prefix_len"]
+                    stop = len(ids) - 1 - entry["prefix_len"]
+                    target_logits = lm_head(hidden[r, start:stop])
+                    target_ids = torch.tensor(ids[entry["prompt_len"]:], device=device)
+                    value = reducers[request[2]](target_logits, target_ids)
+                    for i in unique[request]:
+                        results[i] = value
+    return results
+
+
+def _field_target_text(field_name: str, value: Any) -> str:
+    """CoT target for one metadata field, e.g. ``<think>\nbpm: 120\n</think>\n``."""
+    field_yaml = yaml.dump({field_name: value}, allow_unicode=True, sort_keys=True).strip()
+    return f"<think>\n{field_yaml}\n</think>\n"
+
+
 def calculate_reward_score(
     scores: Dict[str, float],
     weights_config: Optional[Dict[str, float]] = None
@@ -339,72 +553,129 @@ def calculate_pmi_score_per_condition(
     - Metadata: Uses Top-k Recall.
     - Caption/Lyrics: Uses PMI (Normalized).
     """
-    if not llm_handler.llm_initialized:
-        return {}, 0.0, "❌ LLM not initialized"
-
-    if not audio_codes or not audio_codes.strip():
-        return {}, 0.0, "❌ No audio codes provided"
-
-    if "caption" not in metadata:
-        metadata['caption'] = caption
-
-    formatted_prompt = llm_handler.build_formatted_prompt_for_understanding(audio_codes=audio_codes, is_negative_prompt=False)
-    prompt_uncond = llm_handler.build_formatted_prompt_for_understanding(audio_codes="NO USER INPUT", is_negative_prompt=False)
-    try:
-        # 1. Calculate Recall for Metadata Fields
-        if metadata and isinstance(metadata, dict):
-            scores = {}
-            # Define which fields use which metric
-            metadata_recall_keys = ['bpm', 'duration', 'genres', 'keyscale', 'language', 'timesignature']
-            metadata_pmi_keys = ['caption']
-            for key in metadata_recall_keys:
-                if key in metadata and metadata[key] is not None:
-                    recall_metadata = {key: metadata[key]}
-                    field_scores = _calculate_metadata_recall(llm_handler, formatted_prompt, recall_metadata, topk=topk)
-                    scores.update(field_scores)
-
-            # 2. Calculate PMI for Caption
-            for key in metadata_pmi_keys:
-                if key in metadata and metadata[key] is not None:
-                    cot_yaml = yaml.dump({key: metadata[key]}, allow_unicode=True, sort_keys=True).strip()
-                    target_text = f"<think>\n{cot_yaml}\n</think>\n"
-
-                    log_prob_cond = _calculate_log_prob(llm_handler, formatted_prompt, target_text)
-                    log_prob_uncond = _calculate_log_prob(llm_handler, prompt_uncond, target_text)
-
-                    pmi_normalized = pmi_to_normalized_score(log_prob_cond - log_prob_uncond, scale=score_scale)
-                    scores[key] = pmi_normalized
+    return calculate_pmi_scores_batch(
+        llm_handler,
+        [{"audio_codes": audio_codes, "caption": caption, "lyrics": lyrics, "metadata": metadata}],
+        topk=topk,
+        score_scale=score_scale,
+    )[0]
 
-        # 3. Calculate PMI for Lyrics
-        if lyrics:
-            target_text = f"<think>\n</think>\n# Lyric\n{lyrics}\n"
 
-            log_prob_cond = _calculate_log_prob(llm_handler, formatted_prompt, target_text)
+def calculate_pmi_scores_batch(
+    llm_handler,
+    samples: List[Dict[str, Any]],
+    topk: int = 10,
+    score_scale: float = 0.1,
+) -> List[Tuple[Dict[str, float], float, str]]:
+    """
+    ``calculate_pmi_score_per_condition`` for several samples at once.
 
-            prompt_uncond = llm_handler.build_formatted_prompt_for_understanding(audio_codes="NO USER INPUT", is_negative_prompt=False)
-            log_prob_uncond = _calculate_log_prob(llm_handler, prompt_uncond, target_text)
+    Args:
+        samples: Dicts with ``audio_codes``, ``caption``, ``lyrics`` and ``metadata``
+                 (same meaning as the single-sample arguments).
 
-            scores['lyrics'] = pmi_to_normalized_score(log_prob_cond - log_prob_uncond, scale=score_scale)
+    Returns:
+        One (scores, global_score, status) tuple per sample.
 
-        if not scores:
-            return {}, 0.0, "❌ No conditions to evaluate"
+    Every recall and PMI term of every sample is scored in one
+    ``_score_continuations`` call; unconditional log-probs are shared between
+    samples and remembered across calls for the same model.
+    """
+    if not llm_handler.llm_initialized:
+        return [({}, 0.0, "❌ LLM not initialized")] * len(samples)
 
-        # 4. Global Score
-        global_score = sum(scores.values()) / len(scores)
-        global_score, breakdown_lines = calculate_reward_score(scores)
+    results: List[Any] = [None] * len(samples)
+    plans = []
+    requests: List[Tuple[str, str, str]] = []
+    model = llm_handler.get_hf_model_for_scoring()
+    prompt_uncond = None
+    uncond_pending: Dict[Tuple[str, str], int] = {}
+    uncond_values: Dict[Tuple[str, str], float] = {}
 
-        # Status Message
-        status_lines = [breakdown_lines, "\n✅ Per-condition scores (0-1):"]
-        for key, score in sorted(scores.items()):
-            metric = "Top-k Recall" if key in metadata_recall_keys else "PMI (Norm)"
-            status_lines.append(f"  {key}: {score:.4f} ({metric})")
-        status = "\n".join(status_lines)
-        logger.info(f"Calculated scores: {global_score:.4f}\n{status}")
-        return scores, global_score, status
+    try:
+        for s, sample in enumerate(samples):
+            audio_codes = sample.get("audio_codes")
+            if not has_audio_codes(audio_codes):
+                results[s] = ({}, 0.0, "❌ No audio codes provided")
+                continue
+            metadata = sample.get("metadata")
+            metadata = metadata if isinstance(metadata, dict) else {}
+            if "caption" not in metadata:
+                metadata['caption'] = sample.get("caption", "")
+
+            formatted_prompt = llm_handler.build_formatted_prompt_for_understanding(audio_codes=audio_codes, is_negative_prompt=False)
+            if prompt_uncond is None:
+                prompt_uncond = llm_handler.build_formatted_prompt_for_understanding(audio_codes=UNCONDITIONAL_CODES, is_negative_prompt=False)
+
+            # (score key, metric, request index of the conditional term, unconditional key)
+            plan = []
+            # 1. Recall for metadata fields
+            for key in METADATA_RECALL_KEYS:
+                if key in metadata and metadata[key] is not None:
+                    plan.append((key, "recall", len(requests), None))
+                    requests.append((formatted_prompt, _field_target_text(key, metadata[key]), "recall"))
+
+            # 2. PMI for caption, 3. PMI for lyrics
+            pmi_targets = [(key, _field_target_text(key, metadata[key]))
+                           for key in METADATA_PMI_KEYS if key in metadata and metadata[key] is not None]
+            lyrics = sample.get("lyrics")
+            if lyrics:
+                pmi_targets.append(('lyrics', f"<think>\n</think>\n# Lyric\n{lyrics}\n"))
+            for key, target_text in pmi_targets:
+                uncond_key = (prompt_uncond, target_text)
+                plan.append((key, "pmi", len(requests), uncond_key))
+                requests.append((formatted_prompt, target_text, "log_prob"))
+                if uncond_key in uncond_values or uncond_key in uncond_pending:
+                    continue
+                cached = _UNCOND_LOG_PROBS.get(uncond_key)
+                if cached is not None and cached[0]() is model:
+                    uncond_values[uncond_key] = cached[1]
+                    _UNCOND_LOG_PROBS.move_to_end(uncond_key)
+                else:
+                    uncond_pending[uncond_key] = len(requests)
+                    requests.append((prompt_uncond, target_text, "log_prob"))
+            plans.append((s, plan))
+
+        values = _score_continuations(llm_handler, requests, topk=topk) if requests else []
+
+        for uncond_key, index in uncond_pending.items():
+            uncond_values[uncond_key] = values[index]
+            _UNCOND_LOG_PROBS[uncond_key] = (weakref.ref(model), values[index])
+            _UNCOND_LOG_PROBS.move_to_end(uncond_key)
+        while len(_UNCOND_LOG_PROBS) > _UNCOND_LOG_PROBS_MAX:
+            _UNCOND_LOG_PROBS.popitem(last=False)
+
+        for s, plan in plans:
+            scores = {}
+            for key, metric, index, uncond_key in plan:
+                if metric == "recall":
+                    scores[key] = values[index][0]
+                    logger.debug(f"Recall for {key}: {scores[key]:.4f}")
+                else:
+                    log_prob_cond = values[index]
+                    log_prob_uncond = uncond_values[uncond_key]
+                    scores[key] = pmi_to_normalized_score(log_prob_cond - log_prob_uncond, scale=score_scale)
+
+            if not scores:
+                results[s] = ({}, 0.0, "❌ No conditions to evaluate")
+                continue
+
+            # 4. Global Score
+            global_score, breakdown_lines = calculate_reward_score(scores)
+
+            # Status Message
+            status_lines = [breakdown_lines, "\n✅ Per-condition scores (0-1):"]
+            for key, score in sorted(scores.items()):
+                metric = "Top-k Recall" if key in METADATA_RECALL_KEYS else "PMI (Norm)"
+                status_lines.append(f"  {key}: {score:.4f} ({metric})")
+            status = "\n".join(status_lines)
+            logger.info(f"Calculated scores: {global_score:.4f}\n{status}")
+            results[s] = (scores, global_score, status)
+        return results
 
     except Exception as e:
         import traceback
         error_msg = f"❌ Error: {str(e)}"
         logger.error(error_msg)
         logger.error(traceback.format_exc())
-        return {}, float('-inf'), error_msg
+        return [r if r is not None else ({}, float('-inf'), error_msg) for r in results]
@@ -108,7 +108,10 @@ class LLMEngine:
         sampling_params: SamplingParams | list[SamplingParams],
         use_tqdm: bool = True,
         unconditional_prompts: list[str] | list[list[int]] | None = None,
+        abort_check=None,
     ) -> list[str]:
+        # abort_check: optional callable run before every engine step; it aborts
+        # generation by raising (scheduler state is reset on the way out)
         # Clean up any residual state from previous interrupted generations
         # This prevents 'deque index out of range' errors from accumulated block leaks
         if not self.is_finished():
@@ -126,6 +129,8 @@ class LLMEngine:
         prefill_throughput = decode_throughput = 0.
         try:
             while not self.is_finished():
+                if abort_check is not None:
+                    abort_check()
                 t = perf_counter()
                 output, num_tokens = self.step()
                 if use_tqdm:
@@ -141,8 +146,8 @@ class LLMEngine:
                     outputs[seq_id] = token_ids
                     if use_tqdm:
                         pbar.update(1)
-        except Exception:
-            # Clean up on exception to prevent block leaks
+        except BaseException:
+            # Clean up on exception (or abort) to prevent block leaks
             self.reset()
             raise
         finally:
@@ -5,7 +5,7 @@ import os
 import sys
 import toml
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, List, Optional, Tuple
 
 # Load environment variables from .env or .env.example (if available)
 try:
@@ -62,12 +62,16 @@ def _configure_logging(
 
 _configure_logging()
 
-from acestep.handler import AceStepHandler
-from acestep.llm_inference import LLMHandler
-from acestep.inference import GenerationParams, GenerationConfig, generate_music, create_sample, format_sample
 from acestep.constants import DEFAULT_DIT_INSTRUCTION, TASK_INSTRUCTIONS
 from acestep.gpu_config import get_gpu_config, set_global_gpu_config, GPUConfig, GPU_TIER_CONFIGS
-import torch
+
+# torch and the model stack (acestep.inference, the handler modules with
+# transformers, diffusers, peft, numba) are imported once the arguments are
+# parsed, so --help and argument errors return quickly.
+if TYPE_CHECKING:
+    from acestep.handler import AceStepHandler
+    from acestep.inference import GenerationConfig, GenerationParams
+    from acestep.llm_inference import LLMHandler
 
 
 TRACK_CHOICES = [
@@ -318,7 +322,7 @@ def _parse_timesteps_input(value) -> Optional[List[float]]:
 
 
 def _install_prompt_edit_hook(
-    llm_handler: LLMHandler,
+    llm_handler: "LLMHandler",
     instruction_path: str,
     preloaded_prompt: Optional[str] = None,
 ) -> None:
@@ -457,6 +461,8 @@ def _parse_bool(value: str) -> bool:
 
 
 def _resolve_device(device: str) -> str:
+    import torch
+
     if device == "auto":
         if hasattr(torch, 'xpu') and torch.xpu.is_available():
             return "xpu"
@@ -496,7 +502,7 @@ def _default_instruction_for_task(task_type: str, tracks: Optional[List[str]] =
     return DEFAULT_DIT_INSTRUCTION
 
 
-def _apply_optional_defaults(args, params_defaults: GenerationParams, config_defaults: GenerationConfig) -> None:
+def _apply_optional_defaults(args, params_defaults: "GenerationParams", config_defaults: "GenerationConfig") -> None:
     optional_defaults = {
         "duration": params_defaults.duration,
         "bpm": params_defaults.bpm,
@@ -560,10 +566,10 @@ def _summarize_lyrics(lyrics: Optional[str]) -> str:
 
 def _print_final_parameters(
     args,
-    params: GenerationParams,
-    config: GenerationConfig,
-    params_defaults: GenerationParams,
-    config_defaults: GenerationConfig,
+    params: "GenerationParams",
+    config: "GenerationConfig",
+    params_defaults: "GenerationParams",
+    config_defaults: "GenerationConfig",
     compact: bool,
     resolved_device: Optional[str] = None,
 ) -> None:
@@ -613,7 +619,7 @@ def _print_final_parameters(
     print("-------------------------------\n")
 
 
-def _build_meta_dict(params: GenerationParams) -> Optional[dict]:
+def _build_meta_dict(params: "GenerationParams") -> Optional[dict]:
     meta = {}
     if params.bpm is not None:
         meta["bpm"] = params.bpm
@@ -626,7 +632,7 @@ def _build_meta_dict(params: GenerationParams) -> Optional[dict]:
     return meta or None
 
 
-def _print_dit_prompt(dit_handler: "AceStepHandler", params: GenerationParams) -> None:
+def _print_dit_prompt(dit_handler: "AceStepHandler", params: "GenerationParams") -> None:
     meta = _build_meta_dict(params)
     caption_input, lyrics_input = dit_handler.build_dit_inputs(
         task=params.task_type,
@@ -644,8 +650,8 @@ def _print_dit_prompt(dit_handler: "AceStepHandler", params: GenerationParams) -
 
 
 def run_wizard(args, configure_only: bool = False, default_config_path: Optional[str] = None,
-               params_defaults: Optional[GenerationParams] = None,
-               config_defaults: Optional[GenerationConfig] = None):
+               params_defaults: Optional["GenerationParams"] = None,
+               config_defaults: Optional["GenerationConfig"] = None):
     """
     Runs an interactive wizard to set generation parameters.
     """
@@ -682,6 +688,7 @@ def run_wizard(args, configure_only: bool = False, default_config_path: Optional
             print("Note: This task requires a base DiT model (acestep-v15-base). It will be auto-downloaded if missing.")
 
         # Model selection (DiT)
+        from acestep.handler import AceStepHandler
         dit_handler = AceStepHandler()
         available_dit_models = dit_handler.get_available_acestep_v15_models()
         base_only = args.task_type in {"lego", "extract", "complete"}
@@ -714,6 +721,7 @@ def run_wizard(args, configure_only: bool = False, default_config_path: Optional
             print("\nNote: No local DiT models found. The main model will be auto-downloaded during initialization.")
 
         # Model selection (LM)
+        from acestep.llm_inference import LLMHandler
         llm_handler = LLMHandler()
         available_lm_models = llm_handler.get_available_5hz_lm_models()
         if available_lm_models:
@@ -990,6 +998,25 @@ def main():
     """
     Main function to run ACE-Step music generation from the command line.
     """
+    parser = argparse.ArgumentParser(
+        description="ACE-Step 1.5: Music generation (wizard/config only).",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("-c", "--config", type=str, help="Path to a TOML configuration file to load.")
+    parser.add_argument("--configure", action="store_true", help="Run wizard to save configuration without generating.")
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        default="INFO",
+        help="Logging level for internal modules (TRACE/DEBUG/INFO/WARNING/ERROR/CRITICAL).",
+    )
+    cli_args = parser.parse_args()
+
+    _configure_logging(level=cli_args.log_level)
+
+    import torch
+    from acestep.inference import GenerationParams, GenerationConfig, generate_music, create_sample, format_sample
+
     gpu_config = get_gpu_config()
     # Override tier thresholds in CLI without modifying gpu_config.py.
     # For MPS, use iogpu.wired_limit_mb as a proxy for memory when available.
@@ -1074,22 +1101,6 @@ def main():
     params_defaults = GenerationParams()
     config_defaults = GenerationConfig()
 
-    parser = argparse.ArgumentParser(
-        description="ACE-Step 1.5: Music generation (wizard/config only).",
-        formatter_class=argparse.ArgumentDefaultsHelpFormatter
-    )
-    parser.add_argument("-c", "--config", type=str, help="Path to a TOML configuration file to load.")
-    parser.add_argument("--configure", action="store_true", help="Run wizard to save configuration without generating.")
-    parser.add_argument(
-        "--log-level",
-        type=str,
-        default="INFO",
-        help="Logging level for internal modules (TRACE/DEBUG/INFO/WARNING/ERROR/CRITICAL).",
-    )
-    cli_args = parser.parse_args()
-
-    _configure_logging(level=cli_args.log_level)
-
     default_batch_size = 1 if not cli_args.config else config_defaults.batch_size
     defaults = {
         "project_root": _get_project_root(),
@@ -1332,6 +1343,8 @@ def main():
         args.backend = "pt"
 
     print("Initializing ACE-Step handlers...")
+    from acestep.handler import AceStepHandler
+    from acestep.llm_inference import LLMHandler
     dit_handler = AceStepHandler()
     llm_handler = LLMHandler()
 
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Parse/serialize cost of audio codes: ``<|audio_code_N|>`` strings vs AudioCodes
+
+Times the operations a code sequence goes through between the LM and storage,
+for the previous string path and for ``acestep.audio_codes.AudioCodes``:
+
+* build: codes -> text (``convert_src_audio_to_codes`` / LM output)
+* parse: text -> int list (the handler's regex + clamp loop) vs ``from_string``
+  on token text and ``deserialize`` on the compact ``ac1:`` form
+* json: ``json.dumps`` of a metadata dict carrying the codes, and its size
+
+Usage:
+    python scripts/benchmark_audio_codes.py
+    python scripts/benchmark_audio_codes.py --seconds 240 600 --repeat 50
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import timeit
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from acestep.audio_codes import MAX_AUDIO_CODE, AudioCodes
+
+CODES_PER_SECOND = 5
+
+
+def legacy_build(codes):
+    return "".join([f"<|audio_code_{idx}|>" for idx in codes])
+
+
+def legacy_parse(code_str):
+    codes = []
+    for x in re.findall(r"<\|audio_code_(\d+)\|>", code_str):
+        code_value = int(x)
+        codes.append(max(0, min(code_value, MAX_AUDIO_CODE)))
+    return codes
+
+
+def bench(fn, repeat):
+    """Median-of-5 time per call in microseconds."""
+    runs = timeit.repeat(fn, number=repeat, repeat=5)
+    return sorted(runs)[2] / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark audio code string vs compact representations")
+    parser.add_argument("--seconds", type=float, nargs="+", default=[30, 240, 600],
+                        help="Song durations to benchmark (5 codes per second)")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    results = []
+    for seconds in args.seconds:
+        n = int(seconds * CODES_PER_SECOND)
+        ints = [rng.randrange(MAX_AUDIO_CODE + 1) for _ in range(n)]
+        token_text = legacy_build(ints)
+        codes = AudioCodes(ints)
+        compact = codes.serialize()
+        assert legacy_parse(token_text) == ints
+        assert AudioCodes.from_string(token_text) == codes
+        assert AudioCodes.deserialize(compact) == codes
+        assert codes.to_string() == token_text
+
+        row = {
+            "seconds": seconds,
+            "codes": n,
+            "build_string_us": bench(lambda: legacy_build(ints), args.repeat),
+            "build_tokens_us": bench(lambda: codes.to_string(), args.repeat),
+            "build_compact_us": bench(lambda: codes.serialize(), args.repeat),
+            "parse_regex_us": bench(lambda: legacy_parse(token_text), args.repeat),
+            "parse_tokens_us": bench(lambda: AudioCodes.from_string(token_text), args.repeat),
+            "parse_compact_us": bench(lambda: AudioCodes.deserialize(compact), args.repeat),
+            "json_string_us": bench(lambda: json.dumps({"audio_codes": token_text}), args.repeat),
+            "json_compact_us": bench(lambda: json.dumps({"audio_codes": compact}), args.repeat),
+            "string_bytes": len(token_text),
+            "compact_bytes": len(compact),
+        }
+        results.append(row)
+
+    print(f"{'codes':>7} {'':<10}{'string (us)':>14}{'tokens (us)':>14}{'compact (us)':>14}")
+    for r in results:
+        print(f"{r['codes']:>7} {'build':<10}{r['build_string_us']:>14.1f}{r['build_tokens_us']:>14.1f}{r['build_compact_us']:>14.1f}")
+        print(f"{'':>7} {'parse':<10}{r['parse_regex_us']:>14.1f}{r['parse_tokens_us']:>14.1f}{r['parse_compact_us']:>14.1f}")
+        print(f"{'':>7} {'json':<10}{r['json_string_us']:>14.1f}{'-':>14}{r['json_compact_us']:>14.1f}")
+        print(f"{'':>7} {'bytes':<10}{r['string_bytes']:>14}{r['string_bytes']:>14}{r['compact_bytes']:>14}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
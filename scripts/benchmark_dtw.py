@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+DTW cost for lyric alignment: previous kernel vs the current one
+
+Times ``acestep.dit_alignment_score`` against a copy of the previous
+``dtw_cpu`` (column-order fill over a full float32 cost matrix and float32
+trace, compiled without ``cache=True``) on random cost matrices shaped like
+lyric attention maps (tokens x 25Hz frames), and checks the paths are
+identical:
+
+* single: ``dtw_cpu`` per matrix
+* batch: ``dtw_batch`` over all samples of a generation (parallel fill)
+
+Usage:
+    python scripts/benchmark_dtw.py
+    python scripts/benchmark_dtw.py --tokens 400 --seconds 240 --batch 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import numba
+import numpy as np
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+from acestep.dit_alignment_score import _backtrace, dtw_batch, dtw_cpu
+
+FRAMES_PER_SECOND = 25
+
+
+@numba.jit(nopython=True)
+def legacy_dtw_cpu(x):
+    N, M = x.shape
+    cost = np.ones((N + 1, M + 1), dtype=np.float32) * np.inf
+    trace = -np.ones((N + 1, M + 1), dtype=np.float32)
+    cost[0, 0] = 0
+
+    for j in range(1, M + 1):
+        for i in range(1, N + 1):
+            c0 = cost[i - 1, j - 1]
+            c1 = cost[i - 1, j]
+            c2 = cost[i, j - 1]
+
+            if c0 < c1 and c0 < c2:
+                c, t = c0, 0
+            elif c1 < c0 and c1 < c2:
+                c, t = c1, 1
+            else:
+                c, t = c2, 2
+
+            cost[i, j] = x[i - 1, j - 1] + c
+            trace[i, j] = t
+
+    return _backtrace(trace, N, M)
+
+
+def bench(fn, repeat):
+    """Median-of-5 time per call in milliseconds."""
+    runs = timeit.repeat(fn, number=repeat, repeat=5)
+    return sorted(runs)[2] / repeat * 1e3
+
+
+def make_matrices(rng, batch, tokens, frames, dtype):
+    """Negated, softmax-like attention maps with a rough diagonal, as the aligners pass them."""
+    mats = []
+    for _ in range(batch):
+        n = max(1, tokens + int(rng.integers(-tokens // 10, tokens // 10 + 1)))
+        attn = rng.random((n, frames))
+        diag = np.exp(-((np.arange(frames)[None, :] / frames - np.arange(n)[:, None] / n) ** 2) * 200)
+        attn = attn * 0.2 + diag
+        mats.append((-(attn / attn.sum(axis=0, keepdims=True))).astype(dtype))
+    return mats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DTW used by lyric alignment")
+    parser.add_argument("--tokens", type=int, nargs="+", default=[100, 400])
+    parser.add_argument("--seconds", type=float, nargs="+", default=[60, 240])
+    parser.add_argument("--batch", type=int, default=4, help="Samples per generation")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    for tokens in args.tokens:
+        for seconds in args.seconds:
+            frames = int(seconds * FRAMES_PER_SECOND)
+            # float64: MusicStampsAligner, float32: MusicLyricScorer
+            for dtype in (np.float64, np.float32):
+                mats = make_matrices(rng, args.batch, tokens, frames, dtype)
+                legacy = [legacy_dtw_cpu(m) for m in mats]  # also compiles
+                for ref, m, batched in zip(legacy, mats, dtw_batch(mats)):
+                    assert np.array_equal(ref, dtw_cpu(m)), "dtw_cpu path differs from legacy"
+                    assert np.array_equal(ref, batched), "dtw_batch path differs from legacy"
+
+                results.append({
+                    "tokens": tokens,
+                    "frames": frames,
+                    "dtype": np.dtype(dtype).name,
+                    "batch": args.batch,
+                    "legacy_ms": bench(lambda: [legacy_dtw_cpu(m) for m in mats], args.repeat),
+                    "single_ms": bench(lambda: [dtw_cpu(m) for m in mats], args.repeat),
+                    "batch_ms": bench(lambda: dtw_batch(mats), args.repeat),
+                })
+
+    print(f"Paths identical to the legacy kernel for every case ({numba.get_num_threads()} threads)\n")
+    print(f"{'tokens':>7}{'frames':>8}{'dtype':>9}{'legacy (ms)':>13}{'single (ms)':>13}{'batch (ms)':>12}")
+    for r in results:
+        print(f"{r['tokens']:>7}{r['frames']:>8}{r['dtype']:>9}"
+              f"{r['legacy_ms']:>13.1f}{r['single_ms']:>13.1f}{r['batch_ms']:>12.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
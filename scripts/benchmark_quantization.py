@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Precision/latency matrix for DiT quantization modes
+
+For each mode the DiT is initialized (compile_model=True, which quantization
+requires), then the same prompts are generated with fixed seeds. Reported per
+mode:
+
+* per-step diffusion latency (median over runs, after a warmup run)
+* peak CUDA memory during generation
+* similarity of the generated latents to the bf16 run on the same seeds:
+  cosine similarity and SNR in dB
+
+Usage:
+    python scripts/benchmark_quantization.py
+    python scripts/benchmark_quantization.py --modes none,int8_weight_only --duration 60 --runs 5
+    python scripts/benchmark_quantization.py --config-path acestep-v15-base --steps 32 --json results.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import torch
+
+from acestep.handler import AceStepHandler
+from acestep.quantization import QUANTIZATION_MODES
+
+CAPTION = "upbeat electronic pop with punchy drums, bright synth leads and a catchy hook"
+LYRICS = "[verse]\nCity lights are calling me tonight\n[chorus]\nWe keep on dancing till the morning light"
+
+
+def run_mode(args, mode, seeds):
+    handler = AceStepHandler()
+    quantization = None if mode == "none" else mode
+    status, ok = handler.initialize_service(
+        project_root=project_root,
+        config_path=args.config_path,
+        device=args.device,
+        use_flash_attention=args.flash_attention,
+        compile_model=args.compile or quantization is not None,
+        quantization=quantization,
+    )
+    if not ok:
+        print(f"[{mode}] initialization failed:\n{status}")
+        return None
+
+    target_wavs = handler.create_target_wavs(args.duration).unsqueeze(0)
+
+    def generate(seed):
+        return handler.service_generate(
+            captions=CAPTION,
+            lyrics=LYRICS,
+            target_wavs=target_wavs,
+            metas={"duration": args.duration},
+            vocal_languages="en",
+            infer_steps=args.steps,
+            guidance_scale=args.guidance_scale,
+            seed=[seed],
+            shift=args.shift,
+        )
+
+    # Warmup (compilation, cache loads)
+    generate(seeds[0])
+
+    step_times, latents = [], []
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    for _ in range(args.runs):
+        for seed in seeds:
+            outputs = generate(seed)
+            step_times.append(outputs["time_costs"]["diffusion_per_step_time_cost"])
+            latents.append(outputs["target_latents"].detach().float().cpu())
+    peak_gb = torch.cuda.max_memory_allocated() / 1024**3 if torch.cuda.is_available() else 0.0
+
+    del handler
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+    return {
+        "mode": mode,
+        "step_ms": statistics.median(step_times) * 1000,
+        "peak_gb": peak_gb,
+        # One latent per seed (the last run), compared against bf16 later
+        "latents": latents[-len(seeds):],
+    }
+
+
+def similarity(a, b):
+    a, b = a.flatten(), b.flatten()
+    cosine = torch.nn.functional.cosine_similarity(a, b, dim=0).item()
+    noise = (a - b).pow(2).mean().item()
+    snr = 10 * torch.log10(torch.tensor(b.pow(2).mean().item() / max(noise, 1e-12))).item()
+    return cosine, snr
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DiT quantization modes against bf16")
+    parser.add_argument("--config-path", type=str, default=os.environ.get("ACESTEP_CONFIG_PATH", "acestep-v15-turbo"))
+    parser.add_argument("--device", type=str, default="auto")
+    parser.add_argument("--modes", type=str, default="none," + ",".join(QUANTIZATION_MODES),
+                        help="Comma-separated modes; 'none' is the bf16 reference")
+    parser.add_argument("--seeds", type=str, default="42,1234,2024")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--steps", type=int, default=8)
+    parser.add_argument("--guidance-scale", type=float, default=7.0)
+    parser.add_argument("--shift", type=float, default=3.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--compile", action="store_true", help="Also compile the bf16 reference")
+    parser.add_argument("--flash-attention", action="store_true")
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    if "none" in modes:
+        modes.remove("none")
+    modes.insert(0, "none")
+    seeds = [int(s) for s in args.seeds.split(",")]
+
+    results = []
+    for mode in modes:
+        print(f"\n=== {mode} ===")
+        result = run_mode(args, mode, seeds)
+        if result is not None:
+            results.append(result)
+
+    reference = next((r for r in results if r["mode"] == "none"), None)
+    rows = []
+    for r in results:
+        row = {"mode": r["mode"], "step_ms": r["step_ms"], "peak_gb": r["peak_gb"], "cosine": None, "snr_db": None}
+        if reference is not None:
+            pairs = [similarity(a, b) for a, b in zip(r["latents"], reference["latents"])]
+            row["cosine"] = statistics.mean(p[0] for p in pairs)
+            row["snr_db"] = statistics.mean(p[1] for p in pairs)
+        rows.append(row)
+
+    print("\n" + "=" * 72)
+    print(f"{args.config_path}  duration={args.duration}s  steps={args.steps}  seeds={seeds}")
+    print("=" * 72)
+    print(f"{'mode':<20}{'step (ms)':>12}{'peak (GB)':>12}{'cosine':>12}{'SNR (dB)':>12}")
+    for row in rows:
+        cosine = f"{row['cosine']:.5f}" if row["cosine"] is not None else "-"
+        snr = f"{row['snr_db']:.1f}" if row["snr_db"] is not None and row["mode"] != "none" else "-"
+        print(f"{row['mode']:<20}{row['step_ms']:>12.1f}{row['peak_gb']:>12.2f}{cosine:>12}{snr:>12}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config_path": args.config_path, "duration": args.duration, "steps": args.steps,
+                       "seeds": seeds, "results": rows}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
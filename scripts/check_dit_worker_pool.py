@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+CPU self-check for the DiT worker pool
+
+Runs without a GPU or model checkpoints: the pool is started with a fake
+``handler_factory`` whose ``generate_music`` echoes its tensors back, so only
+the pool machinery is exercised:
+
+* ``pack_tensors`` / ``unpack_tensors`` round trips (dtypes, empty and
+  non-contiguous tensors, nested containers) and segment cleanup
+* ``parse_worker_specs``
+* routing across workers, progress forwarding, worker errors
+* cancellation (explicit, by deadline, and through ``RemoteDiTHandler``)
+* failing outstanding requests on ``close``
+
+Exits with status 1 if any check fails.
+
+Usage:
+    python scripts/check_dit_worker_pool.py
+    python scripts/check_dit_worker_pool.py --workers 4 --requests 32
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import wait
+from multiprocessing import shared_memory
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import torch
+
+from acestep.cancellation import CancellationToken, GenerationCancelled, cancellation_scope, check_cancelled
+from acestep.dit_worker_pool import DiTWorkerPool, pack_tensors, parse_worker_specs, unpack_tensors
+
+FAILURES = []
+
+
+def check(name, ok, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}{f'  ({detail})' if detail and not ok else ''}")
+    if not ok:
+        FAILURES.append(name)
+
+
+class FakeHandler:
+    """Stands in for ``AceStepHandler``: doubles ``x`` after ``steps`` cancellable steps."""
+
+    dtype = torch.float32
+
+    def __init__(self, spec):
+        self.label = spec.label
+
+    def generate_music(self, progress=None, x=None, steps=1, step_seconds=0.0, fail=False, **kwargs):
+        for i in range(steps):
+            check_cancelled()
+            progress(i / steps, desc=f"step {i + 1}/{steps}")
+            time.sleep(step_seconds)
+        if fail:
+            raise ValueError("requested failure")
+        return {
+            "audios": [{"tensor": x * 2, "sample_rate": 48000}],
+            "status_message": "ok",
+            "extra_outputs": {"pid": os.getpid(), "label": self.label, "echo": kwargs},
+            "success": True,
+            "error": None,
+        }
+
+
+def fake_handler_factory(spec):
+    return FakeHandler(spec)
+
+
+def segment_exists(name):
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    shm.close()
+    return True
+
+
+def check_channel():
+    payload = {
+        "f32": torch.randn(3, 5),
+        "bf16": torch.randn(4, 7).to(torch.bfloat16),
+        "i64": torch.arange(11),
+        "bool": torch.rand(6) > 0.5,
+        "empty": torch.empty(0, 3),
+        "strided": torch.randn(8, 6).t(),
+        "nested": [{"a": torch.ones(2, 2, dtype=torch.float16)}, (torch.zeros(1), "text", 3)],
+        "plain": {"caption": "x", "steps": 8, "none": None},
+    }
+    envelope, name = pack_tensors(payload)
+    check("pack: segment created", name is not None and segment_exists(name))
+    out = unpack_tensors(envelope, name)
+    check("unpack: segment unlinked", not segment_exists(name))
+    for key in ("f32", "bf16", "i64", "bool", "empty", "strided"):
+        a, b = payload[key], out[key]
+        check(f"round trip: {key}", a.dtype == b.dtype and a.shape == b.shape and torch.equal(a, b),
+              f"{b.dtype} {tuple(b.shape)}")
+    check("round trip: nested containers",
+          torch.equal(out["nested"][0]["a"], payload["nested"][0]["a"])
+          and isinstance(out["nested"][1], tuple) and out["nested"][1][1:] == ("text", 3))
+    check("round trip: plain values", out["plain"] == payload["plain"])
+    envelope, name = pack_tensors({"steps": 8})
+    check("pack: no segment without tensors", name is None and unpack_tensors(envelope, name) == {"steps": 8})
+
+
+def check_specs():
+    specs = parse_worker_specs("turbo@cpu*2, base@cuda:1", "default")
+    check("specs: models and devices", [(s.model, s.device) for s in specs]
+          == [("turbo", "cpu"), ("turbo", "cpu"), ("base", "cuda:1")])
+    check("specs: cpu threads split", specs[0].num_threads == max(1, (os.cpu_count() or 1) // 2)
+          and specs[2].num_threads is None)
+    check("specs: default model", [s.model for s in parse_worker_specs("cpu", "default")] == ["default"])
+
+
+def check_pool(num_workers, num_requests):
+    specs = parse_worker_specs(f"fake@cpu*{num_workers},other@cpu", "fake")
+    pool = DiTWorkerPool(specs, handler_factory=fake_handler_factory)
+    t0 = time.time()
+    failed = pool.start(timeout=120)
+    check("pool: all workers started", not failed and pool.models == ["fake", "other"], str(failed))
+    print(f"      ({len(pool)} workers up in {time.time() - t0:.1f}s)")
+    slow = []
+    try:
+        progress_calls = []
+        inputs = [torch.randn(2, 1000 + i) for i in range(num_requests)]
+        futures = [
+            pool.submit("fake", {"x": x, "steps": 3, "step_seconds": 0.02, "tag": i},
+                        progress=lambda value, desc=None: progress_calls.append(desc))
+            for i, x in enumerate(inputs)
+        ]
+        results = [f.result(timeout=60) for f in futures]
+        check("pool: results match inputs", all(
+            torch.equal(r["audios"][0]["tensor"], x * 2) and r["extra_outputs"]["echo"] == {"tag": i}
+            for i, (r, x) in enumerate(zip(results, inputs))
+        ))
+        pids = {r["extra_outputs"]["pid"] for r in results}
+        labels = {r["extra_outputs"]["label"] for r in results}
+        check("pool: requests spread over the model's workers", len(pids) == num_workers and labels == {"fake@cpu"},
+              f"pids={len(pids)} labels={labels}")
+        check("pool: progress forwarded", len(progress_calls) == 3 * num_requests, str(len(progress_calls)))
+        check("pool: queue depths drained", all(v == 0 for v in pool.queue_depths().values()))
+
+        r = pool.submit("other", {"x": torch.ones(1)}).result(timeout=60)
+        check("pool: routed by model", r["extra_outputs"]["label"] == "other@cpu")
+        r = pool.submit("missing", {"x": torch.ones(1)}).result(timeout=60)
+        check("pool: unknown model falls back to default", r["extra_outputs"]["label"] == "fake@cpu")
+
+        fut = pool.submit("fake", {"x": torch.ones(1), "fail": True})
+        try:
+            fut.result(timeout=60)
+            check("pool: worker errors surface", False, "no exception")
+        except RuntimeError as e:
+            check("pool: worker errors surface", "requested failure" in str(e), str(e))
+
+        fut = pool.submit("fake", {"x": torch.ones(1), "steps": 1000, "step_seconds": 0.01})
+        time.sleep(0.2)
+        pool.cancel(fut, "stop")
+        try:
+            fut.result(timeout=30)
+            check("pool: explicit cancel", False, "completed")
+        except GenerationCancelled as e:
+            check("pool: explicit cancel", e.reason == "stop", e.reason)
+
+        fut = pool.submit("fake", {"x": torch.ones(1), "steps": 1000, "step_seconds": 0.01},
+                          deadline=time.time() + 0.3)
+        try:
+            fut.result(timeout=30)
+            check("pool: deadline cancel", False, "completed")
+        except GenerationCancelled:
+            check("pool: deadline cancel", True)
+
+        remote = pool.handler_for("fake")
+        out = remote.generate_music(x=torch.full((3,), 2.0))
+        check("remote handler: result", out["success"] and torch.equal(out["audios"][0]["tensor"], torch.full((3,), 4.0)))
+        out = remote.generate_music(x=torch.ones(1), fail=True)
+        check("remote handler: errors become a failed result", not out["success"] and "requested failure" in out["error"])
+        try:
+            with cancellation_scope(CancellationToken.with_timeout(0.3)):
+                remote.generate_music(x=torch.ones(1), steps=1000, step_seconds=0.01)
+            check("remote handler: caller token mirrored", False, "completed")
+        except GenerationCancelled:
+            check("remote handler: caller token mirrored", True)
+
+        slow = [pool.submit("fake", {"x": torch.ones(1), "steps": 1000, "step_seconds": 0.01}) for _ in range(num_workers)]
+    finally:
+        pool.close(timeout=5)
+    wait(slow, timeout=10)
+    check("close: outstanding requests failed", all(f.done() and f.exception() is not None for f in slow))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU self-check for the DiT worker pool")
+    parser.add_argument("--workers", type=int, default=2, help="Fake workers serving the default model")
+    parser.add_argument("--requests", type=int, default=12)
+    args = parser.parse_args()
+
+    check_channel()
+    check_specs()
+    check_pool(max(1, args.workers), max(args.workers, args.requests))
+
+    print(f"\n{len(FAILURES)} check(s) failed" if FAILURES else "\nAll checks passed")
+    sys.exit(1 if FAILURES else 0)
+
+
+if __name__ == "__main__":
+    main()
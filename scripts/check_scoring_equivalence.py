@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Batched LM scoring vs the per-request reference
+
+``acestep.test_time_scaling._score_continuations`` packs the recall and PMI
+terms of several samples into prefix-shared, padded forwards. This script
+scores the same requests with each full forward on its own
+(``ACESTEP_SCORING_BATCH_TOKENS=0``: ``_calculate_topk_recall`` /
+``_calculate_log_prob``) and with the batched path at several token budgets
+(small ones force several prefix and continuation chunks), and reports:
+
+* max absolute difference of the average log-probs (PMI terms)
+* max absolute difference of the top-k recall scores
+* the final per-sample scores of ``calculate_pmi_scores_batch``
+
+It exits with status 1 when a difference exceeds ``--atol``. Run it in float32
+for a tight check; bfloat16 shows the kernel-level drift to expect in service.
+
+Usage:
+    python scripts/check_scoring_equivalence.py
+    python scripts/check_scoring_equivalence.py --dtype bfloat16 --budgets 512,8192 --atol 1e-2
+"""
+
+import argparse
+import os
+import random
+import sys
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import torch
+
+from acestep import test_time_scaling as tts
+from acestep.audio_codes import AudioCodes
+from acestep.llm_inference import LLMHandler
+
+CAPTIONS = [
+    "upbeat electronic pop with punchy drums, bright synth leads and a catchy hook",
+    "slow acoustic ballad with fingerpicked guitar and soft female vocals",
+    "aggressive metal with distorted guitars and double kick drums",
+]
+LYRICS = "[verse]\nCity lights are calling me tonight\n[chorus]\nWe keep on dancing till the morning light"
+
+
+def make_samples(n, seconds, rng):
+    samples = []
+    for i in range(n):
+        codes = AudioCodes([rng.randrange(0, 64000) for _ in range(int(seconds * 5))])
+        samples.append({
+            "audio_codes": codes.to_string(),
+            "caption": CAPTIONS[i % len(CAPTIONS)],
+            "lyrics": LYRICS if i % 2 == 0 else "",
+            "metadata": {"bpm": 90 + 10 * i, "duration": seconds, "keyscale": "C major",
+                         "language": "en", "timesignature": "4"},
+        })
+    return samples
+
+
+def make_requests(llm_handler, samples):
+    """The (prompt, target, kind) requests ``calculate_pmi_scores_batch`` builds for ``samples``."""
+    uncond = llm_handler.build_formatted_prompt_for_understanding(audio_codes=tts.UNCONDITIONAL_CODES,
+                                                                   is_negative_prompt=False)
+    requests = []
+    for sample in samples:
+        prompt = llm_handler.build_formatted_prompt_for_understanding(audio_codes=sample["audio_codes"],
+                                                                       is_negative_prompt=False)
+        metadata = dict(sample["metadata"], caption=sample["caption"])
+        for key in tts.METADATA_RECALL_KEYS:
+            if key in metadata:
+                requests.append((prompt, tts._field_target_text(key, metadata[key]), "recall"))
+        targets = [tts._field_target_text("caption", metadata["caption"])]
+        if sample["lyrics"]:
+            targets.append(f"<think>\n</think>\n# Lyric\n{sample['lyrics']}\n")
+        for target in targets:
+            requests.append((prompt, target, "log_prob"))
+            requests.append((uncond, target, "log_prob"))
+    return requests
+
+
+def run(llm_handler, budget, requests, samples):
+    tts.SCORING_BATCH_TOKENS = budget
+    tts._UNCOND_LOG_PROBS.clear()
+    values = tts._score_continuations(llm_handler, requests)
+    tts._UNCOND_LOG_PROBS.clear()
+    scores = [r[0] for r in tts.calculate_pmi_scores_batch(llm_handler, samples)]
+    return values, scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check batched LM scoring against the per-request path")
+    parser.add_argument("--lm-model-path", type=str, default=os.environ.get("ACESTEP_LM_MODEL_PATH", "acestep-5Hz-lm-0.6B"))
+    parser.add_argument("--device", type=str, default="auto")
+    parser.add_argument("--dtype", type=str, default="float32", choices=["float32", "bfloat16", "float16"])
+    parser.add_argument("--samples", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--budgets", type=str, default="256,2048,8192",
+                        help="Comma-separated ACESTEP_SCORING_BATCH_TOKENS values for the batched path")
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    llm_handler = LLMHandler()
+    status, ok = llm_handler.initialize(
+        checkpoint_dir=os.path.join(project_root, "checkpoints"),
+        lm_model_path=args.lm_model_path,
+        backend="pt",
+        device=args.device,
+        dtype=getattr(torch, args.dtype),
+    )
+    if not ok:
+        print(f"LLM initialization failed:\n{status}")
+        sys.exit(2)
+
+    samples = make_samples(args.samples, args.seconds, random.Random(0))
+    requests = make_requests(llm_handler, samples)
+    kinds = [kind for _, _, kind in requests]
+    ref_values, ref_scores = run(llm_handler, 0, requests, samples)
+
+    failed = False
+    print(f"{len(requests)} requests, {args.samples} samples, {args.dtype}\n")
+    print(f"{'budget':>8}{'max |d log_prob|':>19}{'max |d recall|':>17}{'max |d score|':>16}")
+    for budget in [int(b) for b in args.budgets.split(",") if b.strip()]:
+        values, scores = run(llm_handler, budget, requests, samples)
+        d_log_prob = max((abs(a - b) for a, b, k in zip(values, ref_values, kinds) if k == "log_prob"), default=0.0)
+        d_recall = max((abs(a[0] - b[0]) for a, b, k in zip(values, ref_values, kinds) if k == "recall"), default=0.0)
+        d_score = max((abs(a[key] - b[key]) for a, b in zip(scores, ref_scores) for key in b), default=0.0)
+        worst = max(d_log_prob, d_recall, d_score)
+        failed |= worst > args.atol
+        print(f"{budget:>8}{d_log_prob:>19.2e}{d_recall:>17.2e}{d_score:>16.2e}{'  FAIL' if worst > args.atol else ''}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
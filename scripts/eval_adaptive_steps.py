@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Latency/quality trade-off of adaptive step counts
+
+Generates the same prompts with fixed seeds (one batch, so converged rows
+leave it as they would in production) over the full schedule and with each
+``adaptive_tol``, after a warmup run. Reported per tolerance:
+
+* diffusion latency (median over runs) and speedup over the full schedule
+* mean steps run per sample and the share of row-steps saved
+* similarity of the latents to the full-schedule run on the same seeds:
+  cosine similarity and SNR in dB
+* DiT lyric-alignment score (reference-free; the full schedule's is the baseline)
+
+Run it once per model (turbo/base/sft have different schedules) to pick a
+tolerance for each.
+
+Usage:
+    python scripts/eval_adaptive_steps.py --config-path acestep-v15-base --steps 50
+    python scripts/eval_adaptive_steps.py --tols 0.002,0.005,0.01,0.02 --min-steps 16 --json results.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import torch
+
+from acestep.handler import AceStepHandler
+
+CAPTION = "upbeat electronic pop with punchy drums, bright synth leads and a catchy hook"
+LYRICS = "[verse]\nCity lights are calling me tonight\n[chorus]\nWe keep on dancing till the morning light"
+
+
+def similarity(a, b):
+    a, b = a.flatten(), b.flatten()
+    cosine = torch.nn.functional.cosine_similarity(a, b, dim=0).item()
+    noise = (a - b).pow(2).mean().item()
+    snr = 10 * torch.log10(torch.tensor(b.pow(2).mean().item() / max(noise, 1e-12))).item()
+    return cosine, snr
+
+
+def run_tol(handler, args, seeds, tol, runs):
+    n = len(seeds)
+    target_wavs = handler.create_target_wavs(args.duration).unsqueeze(0).repeat(n, 1, 1)
+
+    def generate():
+        return handler.service_generate(
+            captions=[CAPTION] * n,
+            lyrics=[LYRICS] * n,
+            target_wavs=target_wavs,
+            metas=[{"duration": args.duration}] * n,
+            vocal_languages=["en"] * n,
+            infer_steps=args.steps,
+            guidance_scale=args.guidance_scale,
+            seed=list(seeds),
+            shift=args.shift,
+            adaptive_tol=tol,
+            adaptive_min_steps=args.min_steps,
+        )
+
+    times = []
+    for _ in range(runs):
+        outputs = generate()
+        times.append(outputs["time_costs"]["diffusion_time_cost"])
+
+    latents = outputs["target_latents"]
+    aligns = handler.get_lyric_alignments(
+        pred_latents=latents,
+        encoder_hidden_states=outputs["encoder_hidden_states"],
+        encoder_attention_mask=outputs["encoder_attention_mask"],
+        context_latents=outputs["context_latents"],
+        lyric_token_idss=outputs["lyric_token_idss"],
+        vocal_language="en",
+        inference_steps=args.steps,
+        include_lm=False,
+        include_timestamps=False,
+    )
+    scores = [a["dit_score"] for a in aligns if a["success"] and a["dit_score"] is not None]
+    return {
+        "tol": tol,
+        "diffusion_s": statistics.median(times),
+        "steps_run": outputs["steps_run"],
+        "dit_score": statistics.mean(scores) if scores else None,
+        "latents": [row.detach().float().cpu() for row in latents],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate adaptive step counts against the full schedule")
+    parser.add_argument("--config-path", type=str, default=os.environ.get("ACESTEP_CONFIG_PATH", "acestep-v15-base"))
+    parser.add_argument("--device", type=str, default="auto")
+    parser.add_argument("--tols", type=str, default="0.001,0.002,0.005,0.01,0.02",
+                        help="Comma-separated adaptive_tol values; the full schedule is always the reference")
+    parser.add_argument("--min-steps", type=int, default=None, help="adaptive_min_steps (default: half the schedule)")
+    parser.add_argument("--seeds", type=str, default="42,1234,2024,7")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--guidance-scale", type=float, default=7.0)
+    parser.add_argument("--shift", type=float, default=3.0)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--flash-attention", action="store_true")
+    parser.add_argument("--json", type=str, default=None, help="Write results to this file")
+    args = parser.parse_args()
+
+    seeds = [int(s) for s in args.seeds.split(",")]
+    tols = [0.0] + [float(t) for t in args.tols.split(",") if t.strip()]
+
+    handler = AceStepHandler()
+    status, ok = handler.initialize_service(
+        project_root=project_root,
+        config_path=args.config_path,
+        device=args.device,
+        use_flash_attention=args.flash_attention,
+    )
+    if not ok:
+        print(f"Initialization failed:\n{status}")
+        return
+
+    # Warmup (cache loads, kernel selection)
+    run_tol(handler, args, seeds, 0.0, runs=1)
+
+    results = []
+    for tol in tols:
+        print(f"\n=== adaptive_tol={tol} ===")
+        results.append(run_tol(handler, args, seeds, tol, args.runs))
+
+    reference = results[0]
+    rows = []
+    for r in results:
+        pairs = [similarity(a, b) for a, b in zip(r["latents"], reference["latents"])]
+        mean_steps = statistics.mean(r["steps_run"])
+        rows.append({
+            "tol": r["tol"],
+            "diffusion_s": r["diffusion_s"],
+            "speedup": reference["diffusion_s"] / max(r["diffusion_s"], 1e-9),
+            "mean_steps": mean_steps,
+            "steps_saved": 1.0 - mean_steps / args.steps,
+            "cosine": statistics.mean(p[0] for p in pairs),
+            "snr_db": statistics.mean(p[1] for p in pairs),
+            "dit_score": r["dit_score"],
+            "steps_run": r["steps_run"],
+        })
+
+    print("\n" + "=" * 90)
+    print(f"{args.config_path}  duration={args.duration}s  steps={args.steps}  seeds={seeds}  min_steps={args.min_steps}")
+    print("=" * 90)
+    print(f"{'tol':>8}{'diffusion (s)':>15}{'speedup':>9}{'steps':>8}{'saved':>8}{'cosine':>10}{'SNR (dB)':>10}{'dit_score':>11}")
+    for row in rows:
+        snr = f"{row['snr_db']:.1f}" if row["tol"] else "-"
+        score = f"{row['dit_score']:.4f}" if row["dit_score"] is not None else "-"
+        print(f"{row['tol']:>8g}{row['diffusion_s']:>15.2f}{row['speedup']:>8.2f}x{row['mean_steps']:>8.1f}"
+              f"{row['steps_saved']:>7.0%} {row['cosine']:>10.5f}{snr:>10}{score:>11}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config_path": args.config_path, "duration": args.duration, "steps": args.steps,
+                       "min_steps": args.min_steps, "seeds": seeds, "results": rows}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Cold-import profile of the ACE-Step entry points
+
+Each target is imported in a fresh interpreter with ``-X importtime``; the
+per-module report on stderr is parsed into a table of the slowest imports.
+With ``--check`` the script exits non-zero when a target goes over its
+time budget or imports one of the heavy packages that should only load on
+first use (transformers, diffusers, peft, numba, gradio, ...; torch as well
+for the web backend). Run it in CI
+to keep worker startup and readiness checks fast.
+
+Usage:
+    python scripts/profile_importtime.py
+    python scripts/profile_importtime.py --targets acestep.api_server --top 40
+    python scripts/profile_importtime.py --check --budget 3.0
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+DEFAULT_TARGETS = ("acestep.api_server", "web.backend.app", "acestep.acestep_v15_pipeline")
+
+# Packages that only the model code needs; importing a server entry point
+# must not pull them in.
+DEFAULT_FORBIDDEN = ("transformers", "diffusers", "peft", "numba", "gradio", "vector_quantize_pytorch", "lightning")
+
+# Extra packages per target: the web backend answers /health before any
+# model is loaded, so it must not import torch either.
+TARGET_FORBIDDEN = {"web.backend.app": ("torch",)}
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """``(module, self_us, cumulative_us, depth)`` for every line of an -X importtime report."""
+    rows = []
+    for line in stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            depth = (len(m.group(3)) - 1) // 2
+            rows.append((m.group(4), int(m.group(1)), int(m.group(2)), depth))
+    return rows
+
+
+def profile_target(target: str) -> Dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = project_root + os.pathsep + env.get("PYTHONPATH", "")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=project_root,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    rows = parse_importtime(proc.stderr)
+    error = None
+    if proc.returncode != 0:
+        tail = [l for l in proc.stderr.splitlines() if not l.startswith("import time:")]
+        error = tail[-1] if tail else f"exit code {proc.returncode}"
+    total_us = next((cum for mod, _, cum, depth in rows if mod == target and depth == 0), None)
+    if total_us is None:
+        total_us = sum(cum for _, _, cum, depth in rows if depth == 0)
+    return {"target": target, "wall": wall, "total_us": total_us, "rows": rows, "error": error}
+
+
+def top_level_packages(rows) -> set:
+    return {mod.split(".")[0] for mod, _, _, _ in rows}
+
+
+def print_report(result: Dict, top: int) -> None:
+    print("\n" + "=" * 80)
+    print(f"{result['target']}: {result['total_us'] / 1e6:.2f}s import "
+          f"({result['wall']:.2f}s wall incl. interpreter start)")
+    print("=" * 80)
+    if result["error"]:
+        print(f"  import failed: {result['error']}")
+
+    # Self time summed per top-level package
+    packages: Dict[str, int] = {}
+    for mod, self_us, _, _ in result["rows"]:
+        root = mod.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+    print(f"\n{'package':<40}{'self total (ms)':>18}")
+    for name, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"{name:<40}{us / 1000:>18.1f}")
+
+    print(f"\n{'module':<56}{'self (ms)':>11}{'cumul (ms)':>12}")
+    for mod, self_us, cum_us, _ in sorted(result["rows"], key=lambda r: -r[2])[:top]:
+        print(f"{mod[:55]:<56}{self_us / 1000:>11.1f}{cum_us / 1000:>12.1f}")
+
+
+def check(result: Dict, budget: Optional[float], forbidden) -> List[str]:
+    problems = []
+    if result["error"]:
+        problems.append(f"{result['target']}: import failed ({result['error']})")
+    if budget is not None and result["total_us"] / 1e6 > budget:
+        problems.append(f"{result['target']}: {result['total_us'] / 1e6:.2f}s exceeds the {budget:.2f}s budget")
+    pulled = sorted(top_level_packages(result["rows"]) & set(forbidden))
+    if pulled:
+        problems.append(f"{result['target']}: imports {', '.join(pulled)} at startup")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile cold import time of ACE-Step entry points")
+    parser.add_argument("--targets", type=str, default=",".join(DEFAULT_TARGETS),
+                        help="Comma-separated modules to import")
+    parser.add_argument("--top", type=int, default=25, help="Rows per table")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit with status 1 if a target is over budget or imports a forbidden package")
+    parser.add_argument("--budget", type=float,
+                        default=float(os.environ.get("ACESTEP_IMPORT_BUDGET_SECONDS", "5.0")),
+                        help="Import time budget per target in seconds (with --check)")
+    parser.add_argument("--forbidden", type=str, default=",".join(DEFAULT_FORBIDDEN),
+                        help="Comma-separated top-level packages that must not load at import")
+    args = parser.parse_args()
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    forbidden = [f.strip() for f in args.forbidden.split(",") if f.strip()]
+
+    problems = []
+    for target in targets:
+        result = profile_target(target)
+        print_report(result, args.top)
+        target_forbidden = forbidden + [f for f in TARGET_FORBIDDEN.get(target, ()) if f not in forbidden]
+        problems.extend(check(result, args.budget if args.check else None, target_forbidden))
+
+    if problems:
+        print("\nStartup regressions:")
+        for p in problems:
+            print(f"  - {p}")
+        if args.check:
+            sys.exit(1)
+    elif args.check:
+        print(f"\nAll targets within {args.budget:.2f}s and free of {', '.join(forbidden)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,3 +14,7 @@ LATENT_DIR = os.getenv("ACE_LATENT_DIR", os.path.join(TEMP_DIR, "latents"))
 LATENT_TTL_HOURS = int(os.getenv("ACE_LATENT_TTL_HOURS", "24"))
 VERBOSE_ERRORS = os.getenv("ACE_VERBOSE_ERRORS", "true").lower() in ("1", "true", "yes")
 CORS_ORIGINS = os.getenv("ACE_CORS_ORIGINS", "http://localhost:3000").split(",")
+TRANSCODE_DIR = os.getenv("ACE_TRANSCODE_DIR", os.path.join(TEMP_DIR, "transcode"))
+TRANSCODE_CACHE_MB = int(os.getenv("ACE_TRANSCODE_CACHE_MB", "512"))
+PEAK_BUCKETS = int(os.getenv("ACE_PEAK_BUCKETS", "1000"))
+TASK_TIMEOUT_SECONDS = float(os.getenv("ACE_TASK_TIMEOUT_SECONDS", "0"))  # 0 = no deadline
@@ -4,14 +4,18 @@ from __future__ import annotations
 
 import sys
 import os
+from typing import TYPE_CHECKING
 
 # Ensure project root is on path so acestep is importable
 _project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
 if _project_root not in sys.path:
     sys.path.insert(0, _project_root)
 
-from acestep.handler import AceStepHandler
-from acestep.llm_inference import LLMHandler
+# The handler modules pull in torch, transformers, diffusers, peft and numba;
+# import them on first use so the app starts (and /health answers) quickly.
+if TYPE_CHECKING:
+    from acestep.handler import AceStepHandler
+    from acestep.llm_inference import LLMHandler
 
 _dit_handler: AceStepHandler | None = None
 _llm_handler: LLMHandler | None = None
@@ -20,6 +24,7 @@ _llm_handler: LLMHandler | None = None
 def get_dit_handler() -> AceStepHandler:
     global _dit_handler
     if _dit_handler is None:
+        from acestep.handler import AceStepHandler
         _dit_handler = AceStepHandler()
     return _dit_handler
 
@@ -27,5 +32,6 @@ def get_dit_handler() -> AceStepHandler:
 def get_llm_handler() -> LLMHandler:
     global _llm_handler
     if _llm_handler is None:
+        from acestep.llm_inference import LLMHandler
         _llm_handler = LLMHandler()
     return _llm_handler
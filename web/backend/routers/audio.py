@@ -1,11 +1,20 @@
-"""Audio router: upload, serve, convert-to-codes, score, LRC, download-all."""
+"""Audio router: upload, serve, preview, peaks, convert-to-codes, score, LRC, download-all."""
 
 import os
 import zipfile
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File
 from fastapi.responses import FileResponse
+from loguru import logger
 
+from acestep.audio_serving import (
+    PREVIEW_FORMATS,
+    TranscodeCache,
+    load_or_compute_peaks,
+    ranged_file_response,
+)
+from web.backend import config
 from web.backend.dependencies import get_dit_handler, get_llm_handler
 from web.backend.schemas.common import ApiResponse
 from web.backend.schemas.audio import (
@@ -23,6 +32,8 @@ from web.backend.services.audio_metadata import extract_metadata
 
 router = APIRouter()
 
+transcode_cache = TranscodeCache(config.TRANSCODE_DIR, config.TRANSCODE_CACHE_MB * 1024 * 1024)
+
 
 @router.post("/upload")
 async def upload_audio(file: UploadFile = File(...)):
@@ -32,11 +43,45 @@ async def upload_audio(file: UploadFile = File(...)):
 
 
 @router.get("/files/{file_id}")
-def serve_audio(file_id: str):
+def serve_audio(file_id: str, request: Request, preview: Optional[str] = None):
+    """Serve an audio file with HTTP Range support.
+
+    ``preview=opus|mp3`` returns a cached low-bitrate transcode instead of
+    the original; if ffmpeg is unavailable the original is served.
+    """
     entry = audio_store.get_file(file_id)
     if not entry or not os.path.exists(entry.path):
         raise HTTPException(404, "Audio file not found")
-    return FileResponse(entry.path, filename=entry.filename)
+    range_header = request.headers.get("range")
+
+    if preview:
+        if preview not in PREVIEW_FORMATS:
+            raise HTTPException(400, f"Unsupported preview format: {preview}")
+        try:
+            preview_path = transcode_cache.get_or_create(entry.path, preview)
+        except RuntimeError as e:
+            logger.warning(f"Preview transcode failed for {file_id}, serving original: {e}")
+        else:
+            stem = os.path.splitext(entry.filename)[0]
+            ext = PREVIEW_FORMATS[preview][0]
+            return ranged_file_response(
+                preview_path, range_header, PREVIEW_FORMATS[preview][2], f"{stem}{ext}"
+            )
+
+    return ranged_file_response(entry.path, range_header, filename=entry.filename)
+
+
+@router.get("/peaks/{file_id}")
+def get_audio_peaks(file_id: str, buckets: int = config.PEAK_BUCKETS):
+    """Return min/max waveform peaks so the player can render before download."""
+    entry = audio_store.get_file(file_id)
+    if not entry or not os.path.exists(entry.path):
+        raise HTTPException(404, "Audio file not found")
+    try:
+        peaks = load_or_compute_peaks(entry.path, buckets)
+    except Exception as e:
+        raise HTTPException(500, f"Peak extraction failed: {e}")
+    return ApiResponse(data=peaks)
 
 
 @router.get("/metadata/{file_id}")
@@ -108,18 +153,26 @@ def calculate_score(
     if pred_latents is None or encoder_hidden_states is None:
         raise HTTPException(400, "Missing required tensors for scoring")
 
+    idx = req.sample_index
+    if not 0 <= idx < pred_latents.shape[0]:
+        raise HTTPException(400, f"sample_index {idx} out of range")
+
     try:
-        # Index into batch for the requested sample
-        idx = req.sample_index
+        # All samples are captured in one pass and cached with the task,
+        # so later score/LRC requests for it skip the DiT
         score_result = dit.get_lyric_score(
-            pred_latent=pred_latents[idx:idx+1],
-            encoder_hidden_states=encoder_hidden_states[idx:idx+1],
-            encoder_attention_mask=encoder_attention_mask[idx:idx+1],
-            context_latents=context_latents[idx:idx+1],
-            lyric_token_ids=lyric_token_idss[idx:idx+1] if lyric_token_idss is not None else None,
+            pred_latent=pred_latents,
+            encoder_hidden_states=encoder_hidden_states,
+            encoder_attention_mask=encoder_attention_mask,
+            context_latents=context_latents,
+            lyric_token_ids=lyric_token_idss,
             vocal_language=req.vocal_language,
             inference_steps=req.inference_steps,
             seed=req.seed,
+            sample_index=idx,
+            alignment_cache=extra.setdefault("lyric_alignment", {}),
+            lora_adapters=extra.get("lora_adapters"),
+            lora_scales=extra.get("lora_scales"),
         )
         return ApiResponse(data=ScoreResponse(
             lm_score=score_result.get("lm_score", 0.0),
@@ -150,19 +203,25 @@ def generate_lrc(
     if pred_latents is None:
         raise HTTPException(400, "Missing required tensors for LRC generation")
 
+    idx = req.sample_index
+    if not 0 <= idx < pred_latents.shape[0]:
+        raise HTTPException(400, f"sample_index {idx} out of range")
+
     try:
-        # Index into batch for the requested sample
-        idx = req.sample_index
         lrc_result = dit.get_lyric_timestamp(
-            pred_latent=pred_latents[idx:idx+1],
-            encoder_hidden_states=encoder_hidden_states[idx:idx+1],
-            encoder_attention_mask=encoder_attention_mask[idx:idx+1],
-            context_latents=context_latents[idx:idx+1],
-            lyric_token_ids=lyric_token_idss[idx:idx+1] if lyric_token_idss is not None else None,
+            pred_latent=pred_latents,
+            encoder_hidden_states=encoder_hidden_states,
+            encoder_attention_mask=encoder_attention_mask,
+            context_latents=context_latents,
+            lyric_token_ids=lyric_token_idss,
             total_duration_seconds=req.total_duration_seconds,
             vocal_language=req.vocal_language,
             inference_steps=req.inference_steps,
             seed=req.seed,
+            sample_index=idx,
+            alignment_cache=extra.setdefault("lyric_alignment", {}),
+            lora_adapters=extra.get("lora_adapters"),
+            lora_scales=extra.get("lora_scales"),
         )
         return ApiResponse(data=LRCResponse(
             lrc_text=lrc_result.get("lrc_text", ""),
@@ -5,10 +5,10 @@ import tempfile
 from typing import Optional
 
 import soundfile as sf
-import torch
 from fastapi import APIRouter, Depends, HTTPException, Query
 from loguru import logger
 
+from web.backend import config
 from web.backend.dependencies import get_dit_handler, get_llm_handler
 from web.backend.schemas.common import ApiResponse
 from web.backend.schemas.generation import (
@@ -27,16 +27,9 @@ from web.backend.schemas.pipeline import PipelineRequest
 from web.backend.services.task_manager import task_manager, TaskStatus
 from web.backend.services.audio_store import audio_store
 from web.backend.services.latent_store import latent_store
-from web.backend.services.pipeline_executor import run_pipeline
-
-from acestep.inference import (
-    GenerationParams,
-    GenerationConfig,
-    generate_music,
-    create_sample,
-    format_sample,
-    understand_music,
-)
+
+# torch, acestep.inference and the pipeline executor (torchaudio, audio utils)
+# are imported inside the endpoints that need them, keeping app startup light.
 
 router = APIRouter()
 
@@ -107,6 +100,8 @@ def start_generation(
 
         # Renoise for partial denoising (same pattern as pipeline_executor.py)
         if effective_t_start < 1.0 - 1e-6:
+            import torch
+
             with torch.inference_mode():
                 init_latents_tensor = dit.model.renoise(
                     tensor.to(dit.device).to(dit.dtype), effective_t_start,
@@ -124,6 +119,8 @@ def start_generation(
     if req.task_type == "text2music" and req.thinking and req.lm_codes_strength < 1.0:
         effective_cover_strength = req.lm_codes_strength
 
+    from acestep.inference import GenerationParams, GenerationConfig, generate_music
+
     params = GenerationParams(
         caption=req.caption,
         lyrics=req.lyrics,
@@ -280,7 +277,7 @@ def start_generation(
             "extra_outputs": result.extra_outputs,  # Keep tensors in memory for score/LRC
         }
 
-    task_id = task_manager.submit(_run)
+    task_id = task_manager.submit(_run, timeout=req.timeout_seconds or config.TASK_TIMEOUT_SECONDS)
     return ApiResponse(data={"task_id": task_id})
 
 
@@ -305,6 +302,16 @@ def get_task_status(task_id: str):
     ))
 
 
+@router.post("/task/{task_id}/cancel")
+def cancel_task(task_id: str):
+    """Cancel a pending or running task (running ones stop at the next step boundary)."""
+    task = task_manager.get_task(task_id)
+    if not task:
+        raise HTTPException(404, "Task not found")
+    cancelled = task_manager.cancel(task_id)
+    return ApiResponse(data={"task_id": task_id, "cancelled": cancelled, "status": task.status.value})
+
+
 @router.post("/create-sample")
 def create_sample_endpoint(
     req: CreateSampleRequest,
@@ -313,6 +320,8 @@ def create_sample_endpoint(
     top_k = None if req.lm_top_k == 0 else req.lm_top_k
     top_p = None if req.lm_top_p >= 1.0 else req.lm_top_p
 
+    from acestep.inference import create_sample
+
     result = create_sample(
         llm_handler=llm,
         query=req.query,
@@ -360,6 +369,8 @@ def format_endpoint(
     if req.timesignature:
         user_metadata["timesignature"] = req.timesignature
 
+    from acestep.inference import format_sample
+
     result = format_sample(
         llm_handler=llm,
         caption=req.caption,
@@ -392,6 +403,8 @@ def understand_endpoint(
     req: UnderstandRequest,
     llm=Depends(get_llm_handler),
 ):
+    from acestep.inference import understand_music
+
     result = understand_music(
         llm_handler=llm,
         audio_codes=req.audio_codes,
@@ -563,9 +576,11 @@ def start_pipeline(
             )
 
     def _run(task_id):
+        from web.backend.services.pipeline_executor import run_pipeline
+
         return run_pipeline(task_id=task_id, dit_handler=dit, req=req)
 
-    task_id = task_manager.submit(_run)
+    task_id = task_manager.submit(_run, timeout=req.timeout_seconds or config.TASK_TIMEOUT_SECONDS)
     return ApiResponse(data={"task_id": task_id})
 
 
@@ -689,6 +704,8 @@ def decode_latent(
 
     Returns audio ID that can be played via /audio/files/{id}.
     """
+    import torch
+
     if dit.model is None:
         raise HTTPException(400, "DiT service not initialized (VAE required)")
 
@@ -1,4 +1,4 @@
-"""LoRA router: load, unload, enable, scale."""
+"""LoRA router: load, unload, enable, scale, merge."""
 
 from fastapi import APIRouter, Depends
 
@@ -8,6 +8,7 @@ from web.backend.schemas.lora import (
     LoadLoRARequest,
     EnableLoRARequest,
     ScaleLoRARequest,
+    MergeLoRARequest,
     LoRAStatusResponse,
 )
 
@@ -42,3 +43,9 @@ def enable_lora(req: EnableLoRARequest, dit=Depends(get_dit_handler)):
 def set_scale(req: ScaleLoRARequest, dit=Depends(get_dit_handler)):
     msg = dit.set_lora_scale(req.scale)
     return ApiResponse(data={"message": msg})
+
+
+@router.post("/merge")
+def set_merge(req: MergeLoRARequest, dit=Depends(get_dit_handler)):
+    msg = dit.set_lora_merge(req.enabled)
+    return ApiResponse(data={"message": msg})
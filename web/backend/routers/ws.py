@@ -22,7 +22,9 @@ async def websocket_endpoint(ws: WebSocket):
                 if msg.get("type") == "subscribe":
                     tid = msg.get("task_id")
                     if tid:
-                        task_manager.register_ws(ws, tid)
+                        task_manager.register_ws(
+                            ws, tid, cancel_on_disconnect=bool(msg.get("cancel_on_disconnect")),
+                        )
                         # Send current status immediately
                         task = task_manager.get_task(tid)
                         if task:
@@ -33,7 +35,12 @@ async def websocket_endpoint(ws: WebSocket):
                                 "progress": task.progress,
                                 "message": task.message,
                             })
+                # Cancel a task from the socket
+                elif msg.get("type") == "cancel":
+                    tid = msg.get("task_id")
+                    if tid:
+                        task_manager.cancel(tid)
             except json.JSONDecodeError:
                 pass
     except WebSocketDisconnect:
-        task_manager.unregister_ws(ws)
+        task_manager.handle_disconnect(ws)
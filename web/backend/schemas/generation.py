@@ -76,10 +76,13 @@ class GenerateRequest(BaseModel):
     checkpoint_step: Optional[int] = None
     resume_sample_index: Optional[int] = None
 
+    # Abort the task this many seconds after submission (None = server default)
+    timeout_seconds: Optional[float] = None
+
 
 class TaskStatusResponse(BaseModel):
     task_id: str
-    status: str  # "pending", "running", "completed", "error"
+    status: str  # "pending", "running", "completed", "error", "cancelled"
     progress: float = 0.0
     message: str = ""
     result: Optional[Dict[str, Any]] = None
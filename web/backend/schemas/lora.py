@@ -16,9 +16,15 @@ class ScaleLoRARequest(BaseModel):
     scale: float
 
 
+class MergeLoRARequest(BaseModel):
+    enabled: bool
+
+
 class LoRAStatusResponse(BaseModel):
     loaded: bool = False
     enabled: bool = False
     path: Optional[str] = None
     scale: float = 1.0
+    merge: bool = False
+    merged: Optional[str] = None
     info: Optional[Dict[str, Any]] = None
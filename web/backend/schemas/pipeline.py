@@ -86,5 +86,8 @@ class PipelineRequest(BaseModel):
     # VRAM management
     keep_in_vram: bool = False  # If True, keep all models loaded (requires more VRAM)
 
+    # Abort the task this many seconds after submission (None = server default)
+    timeout_seconds: Optional[float] = None
+
     # Pipeline stages (at least 1)
     stages: List[PipelineStageConfig] = Field(..., min_length=1)
@@ -11,6 +11,7 @@ from dataclasses import dataclass, field
 from typing import Dict, Optional
 
 from loguru import logger
+from acestep.audio_serving import precompute_peaks_async, remove_peaks_sidecars
 from web.backend import config
 
 
@@ -46,6 +47,8 @@ class AudioStore:
         entry = AudioFile(id=file_id, path=dest, filename=filename)
         with self._lock:
             self._files[file_id] = entry
+        # Generated outputs get waveform peaks ready before the player asks
+        precompute_peaks_async(dest, config.PEAK_BUCKETS)
         return entry
 
     def store_upload(self, data: bytes, filename: str) -> AudioFile:
@@ -95,6 +98,7 @@ class AudioStore:
                         os.remove(entry.path)
                     except OSError:
                         pass
+                    remove_peaks_sidecars(entry.path)
             for fid in expired:
                 del self._files[fid]
         if expired:
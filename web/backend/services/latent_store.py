@@ -12,15 +12,19 @@ import threading
 import time
 import uuid
 from dataclasses import dataclass, field, asdict
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
 import lmdb
-import torch
 from loguru import logger
-from safetensors.torch import save_file, load_file
 
 from web.backend import config
 
+if TYPE_CHECKING:
+    import torch
+
+# safetensors.torch (and with it torch) is imported inside store()/get(),
+# keeping app startup light.
+
 # LMDB map size — 256MB is plenty for metadata-only (no tensors).
 # LMDB won't allocate this upfront; it's a ceiling.
 _LMDB_MAP_SIZE = 256 * 1024 * 1024
@@ -162,6 +166,8 @@ class LatentStore:
 
     def store(self, tensor: torch.Tensor, metadata: Dict[str, Any]) -> str:
         """Serialize tensor to safetensors, store metadata in LMDB, return UUID."""
+        from safetensors.torch import save_file
+
         latent_id = uuid.uuid4().hex[:12]
         tensor_path = os.path.join(config.LATENT_DIR, f"{latent_id}.safetensors")
 
@@ -201,6 +207,8 @@ class LatentStore:
 
     def get(self, latent_id: str) -> Optional[torch.Tensor]:
         """Load tensor from disk by UUID. Returns None if missing."""
+        from safetensors.torch import load_file
+
         record = self.get_record(latent_id)
         if record is None:
             return None
@@ -158,6 +158,15 @@ def run_pipeline(
             loaded_models.add(stage_model)
             logger.info(f"[pipeline] {swap_msg}")
 
+        # Stage the next stage's model while this one diffuses
+        next_model = next(
+            (s.model for s in req.stages[idx + 1:] if s.model and s.model != current_model),
+            None,
+        )
+        if next_model and hasattr(dit_handler, "prefetch_dit_model"):
+            if dit_handler.prefetch_dit_model(next_model):
+                logger.info(f"[pipeline] Prefetching {next_model} for a later stage")
+
         task_manager.update_progress(
             task_id, idx / total_stages, f"{stage_label}..."
         )
@@ -339,8 +348,9 @@ def run_pipeline(
             logger.exception(f"[pipeline] service_generate raised exception: {e}")
             raise
 
-        # Store clean latents (CPU) for later stages
-        stage_latents[idx] = outputs["target_latents"].detach().cpu()
+        # Store clean latents (CPU) for later stages, without duration-bucket padding
+        keep_frames = outputs.get("unbucketed_latent_length")
+        stage_latents[idx] = outputs["target_latents"][:, :keep_frames].detach().cpu()
 
         # Build params snapshot from shared conditioning + per-stage config
         stage_params = {
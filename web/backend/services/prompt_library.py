@@ -1,10 +1,17 @@
-"""Prompt Library storage service using JSON file."""
+"""Prompt Library storage service backed by SQLite.
+
+Each prompt is one row, so saves/updates/deletes touch only that row instead
+of rewriting the whole library. Name/caption/lyrics are indexed with FTS5 and
+genres/tags/mood live in indexed facet columns/tables for filtered queries.
+A legacy ``prompts.json`` file is migrated into the database on first start.
+"""
 
 import os
 import json
+import sqlite3
 import uuid
 from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pathlib import Path
 from threading import Lock
 
@@ -19,55 +26,186 @@ from web.backend.schemas.prompt_library import (
     TAGS,
 )
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    caption TEXT NOT NULL,
+    lyrics TEXT NOT NULL DEFAULT '',
+    mood_lc TEXT NOT NULL DEFAULT '',
+    updated_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_prompts_updated_at ON prompts(updated_at);
+CREATE INDEX IF NOT EXISTS idx_prompts_mood ON prompts(mood_lc);
+
+CREATE TABLE IF NOT EXISTS prompt_facets (
+    prompt_id TEXT NOT NULL REFERENCES prompts(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    value_lc TEXT NOT NULL,
+    PRIMARY KEY (kind, value_lc, prompt_id)
+);
+CREATE INDEX IF NOT EXISTS idx_prompt_facets_prompt ON prompt_facets(prompt_id);
+
+CREATE TRIGGER IF NOT EXISTS prompts_ai AFTER INSERT ON prompts BEGIN
+    INSERT INTO prompts_fts(rowid, name, caption, lyrics)
+    VALUES (new.rowid, new.name, new.caption, new.lyrics);
+END;
+CREATE TRIGGER IF NOT EXISTS prompts_ad AFTER DELETE ON prompts BEGIN
+    INSERT INTO prompts_fts(prompts_fts, rowid, name, caption, lyrics)
+    VALUES ('delete', old.rowid, old.name, old.caption, old.lyrics);
+END;
+CREATE TRIGGER IF NOT EXISTS prompts_au AFTER UPDATE ON prompts BEGIN
+    INSERT INTO prompts_fts(prompts_fts, rowid, name, caption, lyrics)
+    VALUES ('delete', old.rowid, old.name, old.caption, old.lyrics);
+    INSERT INTO prompts_fts(rowid, name, caption, lyrics)
+    VALUES (new.rowid, new.name, new.caption, new.lyrics);
+END;
+"""
+
+_FTS_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5("
+    "name, caption, lyrics, content='prompts', content_rowid='rowid', tokenize='{tokenizer}')"
+)
+
+# Trigram queries need at least this many characters to use the index
+_TRIGRAM_MIN_LEN = 3
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def _fts_phrase(text: str) -> str:
+    """Quote text as a single FTS5 phrase."""
+    return '"' + text.replace('"', '""') + '"'
+
 
 class PromptLibrary:
-    """JSON-based prompt library storage."""
+    """SQLite/FTS5-backed prompt library storage."""
 
-    def __init__(self, storage_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, legacy_json_path: Optional[str] = None):
         """Initialize prompt library.
 
         Args:
-            storage_path: Path to JSON storage file. Defaults to ~/.acestep/prompts.json
+            db_path: Path to the SQLite database. Defaults to ~/.acestep/prompts.db
+            legacy_json_path: JSON file to migrate from on first start.
+                Defaults to prompts.json next to the database.
         """
-        if storage_path is None:
+        if db_path is None:
             home = Path.home()
             storage_dir = home / ".acestep"
             storage_dir.mkdir(exist_ok=True)
-            storage_path = str(storage_dir / "prompts.json")
+            db_path = str(storage_dir / "prompts.db")
+        if legacy_json_path is None:
+            legacy_json_path = os.path.join(os.path.dirname(db_path), "prompts.json")
 
-        self.storage_path = storage_path
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
         self._lock = Lock()
-        self._prompts: Dict[str, PromptEntry] = {}
-        self._load()
-
-    def _load(self):
-        """Load prompts from disk."""
-        if os.path.exists(self.storage_path):
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._trigram = self._init_schema()
+
+        self._migrate_legacy_json()
+
+    def _init_schema(self) -> bool:
+        """Create tables; returns True if the FTS index uses the trigram tokenizer."""
+        with self._conn:
+            row = self._conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'prompts_fts'"
+            ).fetchone()
+            if row is not None:
+                trigram = "trigram" in row["sql"]
+            else:
+                # trigram gives substring matching (SQLite >= 3.34); fall back to
+                # word tokens with prefix queries on older builds.
+                try:
+                    self._conn.execute(_FTS_TABLE.format(tokenizer="trigram"))
+                    trigram = True
+                except sqlite3.OperationalError:
+                    self._conn.execute(_FTS_TABLE.format(tokenizer="unicode61"))
+                    trigram = False
+            self._conn.executescript(_SCHEMA)
+        return trigram
+
+    def _migrate_legacy_json(self):
+        """One-time migration: import prompts.json into SQLite, then rename it."""
+        if not os.path.exists(self.legacy_json_path):
+            return
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+            if count:
+                return
             try:
-                with open(self.storage_path, "r", encoding="utf-8") as f:
+                with open(self.legacy_json_path, "r", encoding="utf-8") as f:
                     data = json.load(f)
-                    for p in data.get("prompts", []):
-                        entry = PromptEntry(**p)
-                        self._prompts[entry.id] = entry
-                logger.info(f"[PromptLibrary] Loaded {len(self._prompts)} prompts from {self.storage_path}")
+                entries = [PromptEntry(**p) for p in data.get("prompts", [])]
             except Exception as e:
-                logger.warning(f"[PromptLibrary] Failed to load prompts: {e}")
-                self._prompts = {}
-        else:
-            logger.info(f"[PromptLibrary] No existing prompts file at {self.storage_path}")
+                logger.warning(f"[PromptLibrary] Failed to read legacy prompts file: {e}")
+                return
+            with self._conn:
+                for entry in entries:
+                    self._write_entry(entry)
 
-    def _save(self):
-        """Save prompts to disk."""
         try:
-            data = {
-                "version": 1,
-                "prompts": [p.model_dump() for p in self._prompts.values()],
-            }
-            with open(self.storage_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            logger.debug(f"[PromptLibrary] Saved {len(self._prompts)} prompts")
-        except Exception as e:
-            logger.error(f"[PromptLibrary] Failed to save prompts: {e}")
+            os.replace(self.legacy_json_path, self.legacy_json_path + ".migrated")
+        except OSError as e:
+            logger.warning(f"[PromptLibrary] Could not rename legacy prompts file: {e}")
+        logger.info(
+            f"[PromptLibrary] Migrated {len(entries)} prompts from {self.legacy_json_path} to {self.db_path}"
+        )
+
+    def _write_entry(self, entry: PromptEntry):
+        """Upsert one prompt row and its facets. Caller holds the lock and a transaction."""
+        self._conn.execute(
+            "INSERT INTO prompts (id, name, caption, lyrics, mood_lc, updated_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET name=excluded.name, caption=excluded.caption, "
+            "lyrics=excluded.lyrics, mood_lc=excluded.mood_lc, "
+            "updated_at=excluded.updated_at, data=excluded.data",
+            (
+                entry.id,
+                entry.name,
+                entry.caption,
+                entry.lyrics,
+                entry.mood.lower(),
+                entry.updated_at,
+                entry.model_dump_json(),
+            ),
+        )
+        self._conn.execute("DELETE FROM prompt_facets WHERE prompt_id = ?", (entry.id,))
+        facets = [("genre", g) for g in entry.genres] + [("tag", t) for t in entry.tags]
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO prompt_facets (prompt_id, kind, value, value_lc) VALUES (?, ?, ?, ?)",
+            [(entry.id, kind, value, value.lower()) for kind, value in facets],
+        )
+
+    def _search_clause(self, search: str) -> Tuple[str, list]:
+        if self._trigram and len(search) >= _TRIGRAM_MIN_LEN:
+            return (
+                "rowid IN (SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?)",
+                [_fts_phrase(search)],
+            )
+        if not self._trigram:
+            terms = search.split()
+            if terms:
+                query = " AND ".join(_fts_phrase(t) + "*" for t in terms)
+                return (
+                    "rowid IN (SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH ?)",
+                    [query],
+                )
+        # Too short for the trigram index: plain substring scan
+        pattern = "%" + search.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return (
+            "(lower(name) LIKE ? ESCAPE '\\' OR lower(caption) LIKE ? ESCAPE '\\' "
+            "OR lower(lyrics) LIKE ? ESCAPE '\\')",
+            [pattern, pattern, pattern],
+        )
 
     def list_prompts(
         self,
@@ -91,52 +229,47 @@ class PromptLibrary:
         Returns:
             Tuple of (prompts, total_count)
         """
-        with self._lock:
-            results = list(self._prompts.values())
-
-        # Filter by genres
-        if genres:
-            genres_lower = [g.lower() for g in genres]
-            results = [
-                p for p in results
-                if any(g.lower() in genres_lower for g in p.genres)
-            ]
-
-        # Filter by tags
-        if tags:
-            tags_lower = [t.lower() for t in tags]
-            results = [
-                p for p in results
-                if any(t.lower() in tags_lower for t in p.tags)
-            ]
-
-        # Filter by mood
+        where: List[str] = []
+        params: List[Any] = []
+
+        for kind, values in (("genre", genres), ("tag", tags)):
+            if values:
+                values_lc = [v.lower() for v in values]
+                placeholders = ",".join("?" * len(values_lc))
+                where.append(
+                    "id IN (SELECT prompt_id FROM prompt_facets "
+                    f"WHERE kind = ? AND value_lc IN ({placeholders}))"
+                )
+                params.extend([kind, *values_lc])
+
         if mood:
-            mood_lower = mood.lower()
-            results = [p for p in results if p.mood.lower() == mood_lower]
+            where.append("mood_lc = ?")
+            params.append(mood.lower())
 
-        # Search
         if search:
-            search_lower = search.lower()
-            results = [
-                p for p in results
-                if search_lower in p.name.lower()
-                or search_lower in p.caption.lower()
-                or search_lower in p.lyrics.lower()
-            ]
+            clause, clause_params = self._search_clause(search)
+            where.append(clause)
+            params.extend(clause_params)
 
-        # Sort by updated_at descending
-        results.sort(key=lambda p: p.updated_at, reverse=True)
-
-        total = len(results)
-        results = results[offset:offset + limit]
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            total = self._conn.execute(
+                f"SELECT COUNT(*) FROM prompts{where_sql}", params
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT data FROM prompts{where_sql} ORDER BY updated_at DESC LIMIT ? OFFSET ?",
+                [*params, limit, offset],
+            ).fetchall()
 
-        return results, total
+        return [PromptEntry.model_validate_json(r["data"]) for r in rows], total
 
     def get_prompt(self, prompt_id: str) -> Optional[PromptEntry]:
         """Get a single prompt by ID."""
         with self._lock:
-            return self._prompts.get(prompt_id)
+            row = self._conn.execute(
+                "SELECT data FROM prompts WHERE id = ?", (prompt_id,)
+            ).fetchone()
+        return PromptEntry.model_validate_json(row["data"]) if row else None
 
     def save_prompt(self, req: SavePromptRequest) -> PromptEntry:
         """Save a new prompt.
@@ -147,7 +280,7 @@ class PromptLibrary:
         Returns:
             Created prompt entry
         """
-        now = datetime.utcnow().isoformat() + "Z"
+        now = _now()
         prompt_id = uuid.uuid4().hex[:12]
 
         entry = PromptEntry(
@@ -173,9 +306,8 @@ class PromptLibrary:
             notes=req.notes,
         )
 
-        with self._lock:
-            self._prompts[prompt_id] = entry
-            self._save()
+        with self._lock, self._conn:
+            self._write_entry(entry)
 
         logger.info(f"[PromptLibrary] Saved prompt '{req.name}' with ID {prompt_id}")
         return entry
@@ -190,11 +322,14 @@ class PromptLibrary:
         Returns:
             Updated prompt entry, or None if not found
         """
-        with self._lock:
-            if prompt_id not in self._prompts:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT data FROM prompts WHERE id = ?", (prompt_id,)
+            ).fetchone()
+            if row is None:
                 return None
 
-            entry = self._prompts[prompt_id]
+            entry = PromptEntry.model_validate_json(row["data"])
             update_data = req.model_dump(exclude_unset=True)
 
             # Apply updates
@@ -202,8 +337,8 @@ class PromptLibrary:
                 if value is not None:
                     setattr(entry, key, value)
 
-            entry.updated_at = datetime.utcnow().isoformat() + "Z"
-            self._save()
+            entry.updated_at = _now()
+            self._write_entry(entry)
 
         logger.info(f"[PromptLibrary] Updated prompt {prompt_id}")
         return entry
@@ -217,13 +352,11 @@ class PromptLibrary:
         Returns:
             True if deleted, False if not found
         """
-        with self._lock:
-            if prompt_id not in self._prompts:
+        with self._lock, self._conn:
+            cur = self._conn.execute("DELETE FROM prompts WHERE id = ?", (prompt_id,))
+            if cur.rowcount == 0:
                 return False
 
-            del self._prompts[prompt_id]
-            self._save()
-
         logger.info(f"[PromptLibrary] Deleted prompt {prompt_id}")
         return True
 
@@ -238,18 +371,18 @@ class PromptLibrary:
         - user_tags: Tags used in saved prompts
         """
         with self._lock:
-            user_genres = set()
-            user_tags = set()
-            for p in self._prompts.values():
-                user_genres.update(p.genres)
-                user_tags.update(p.tags)
+            rows = self._conn.execute(
+                "SELECT DISTINCT kind, value FROM prompt_facets"
+            ).fetchall()
+        user_genres = sorted(r["value"] for r in rows if r["kind"] == "genre")
+        user_tags = sorted(r["value"] for r in rows if r["kind"] == "tag")
 
         return {
             "genres": GENRES,
             "tags": TAGS,
             "moods": MOODS,
-            "user_genres": sorted(user_genres),
-            "user_tags": sorted(user_tags),
+            "user_genres": user_genres,
+            "user_tags": user_tags,
         }
 
     def import_from_metadata(self, metadata: Dict[str, Any], name: str) -> PromptEntry:
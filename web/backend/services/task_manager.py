@@ -13,6 +13,7 @@ from typing import Any, Callable, Dict, List, Optional
 
 from loguru import logger
 
+from acestep.cancellation import CancellationToken, GenerationCancelled, cancellation_scope
 from web.backend import config
 
 
@@ -21,6 +22,7 @@ class TaskStatus(str, Enum):
     RUNNING = "running"
     COMPLETED = "completed"
     ERROR = "error"
+    CANCELLED = "cancelled"
 
 
 @dataclass
@@ -34,6 +36,7 @@ class Task:
     error_detail: Optional[str] = None  # Full traceback when verbose errors enabled
     created_at: float = field(default_factory=time.time)
     extra_outputs: Optional[Dict[str, Any]] = None
+    cancel_token: CancellationToken = field(default_factory=CancellationToken)
 
 
 class TaskManager:
@@ -44,22 +47,33 @@ class TaskManager:
         self._tasks: Dict[str, Task] = {}
         self._ws_connections: Dict[str, List[Any]] = {}  # task_id -> [websockets]
         self._global_connections: List[Any] = []
+        self._cancel_on_disconnect: Dict[str, List[Any]] = {}  # task_id -> [websockets]
         self._loop: Optional[asyncio.AbstractEventLoop] = None
 
     def set_event_loop(self, loop: asyncio.AbstractEventLoop):
         """Store a reference to the main event loop for thread-safe broadcasts."""
         self._loop = loop
 
-    def submit(self, fn: Callable, *args, **kwargs) -> str:
+    def submit(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> str:
+        """Queue ``fn(task_id, *args, **kwargs)``.
+
+        ``timeout`` (seconds, counted from submission) sets a deadline after
+        which the task is aborted at the next cancellation check.
+        """
         task_id = uuid.uuid4().hex[:12]
-        task = Task(id=task_id)
+        task = Task(id=task_id, cancel_token=CancellationToken.with_timeout(timeout))
         self._tasks[task_id] = task
 
         def _run():
+            if task.cancel_token.cancelled:
+                if task.status != TaskStatus.CANCELLED:
+                    self._mark_cancelled(task, task.cancel_token.reason)
+                return
             task.status = TaskStatus.RUNNING
             self._broadcast_sync(task_id, {"type": "status", "status": "running", "task_id": task_id})
             try:
-                result = fn(task_id, *args, **kwargs)
+                with cancellation_scope(task.cancel_token):
+                    result = fn(task_id, *args, **kwargs)
                 task.status = TaskStatus.COMPLETED
                 task.progress = 1.0
                 task.result = result.get("result") if isinstance(result, dict) else result
@@ -69,6 +83,9 @@ class TaskManager:
                     "task_id": task_id,
                     "result": task.result,
                 })
+            except GenerationCancelled as e:
+                logger.info(f"Task {task_id} cancelled: {e.reason}")
+                self._mark_cancelled(task, e.reason)
             except Exception as e:
                 logger.exception(f"Task {task_id} failed")
                 task.status = TaskStatus.ERROR
@@ -89,6 +106,25 @@ class TaskManager:
     def get_task(self, task_id: str) -> Optional[Task]:
         return self._tasks.get(task_id)
 
+    def cancel(self, task_id: str, reason: str = "cancelled by client") -> bool:
+        """Request cancellation; pending tasks never start, running ones stop at the next check."""
+        task = self._tasks.get(task_id)
+        if task is None or task.status not in (TaskStatus.PENDING, TaskStatus.RUNNING):
+            return False
+        task.cancel_token.cancel(reason)
+        if task.status == TaskStatus.PENDING:
+            self._mark_cancelled(task, reason)
+        return True
+
+    def _mark_cancelled(self, task: Task, reason: Optional[str]):
+        task.status = TaskStatus.CANCELLED
+        task.error = f"Cancelled: {reason or 'cancelled'}"
+        self._broadcast_sync(task.id, {
+            "type": "cancelled",
+            "task_id": task.id,
+            "error": task.error,
+        })
+
     def update_progress(self, task_id: str, progress: float, message: str = ""):
         task = self._tasks.get(task_id)
         if task:
@@ -101,16 +137,19 @@ class TaskManager:
                 "message": message,
             })
 
-    def register_ws(self, ws, task_id: Optional[str] = None):
+    def register_ws(self, ws, task_id: Optional[str] = None, cancel_on_disconnect: bool = False):
         if task_id:
             self._ws_connections.setdefault(task_id, []).append(ws)
+            if cancel_on_disconnect:
+                self._cancel_on_disconnect.setdefault(task_id, []).append(ws)
         else:
             self._global_connections.append(ws)
 
     def unregister_ws(self, ws, task_id: Optional[str] = None):
-        if task_id and task_id in self._ws_connections:
+        task_ids = [task_id] if task_id else list(self._ws_connections)
+        for tid in task_ids:
             try:
-                self._ws_connections[task_id].remove(ws)
+                self._ws_connections.get(tid, []).remove(ws)
             except ValueError:
                 pass
         try:
@@ -118,6 +157,18 @@ class TaskManager:
         except ValueError:
             pass
 
+    def handle_disconnect(self, ws):
+        """Drop ``ws`` and cancel tasks whose last cancel-on-disconnect subscriber it was."""
+        self.unregister_ws(ws)
+        for tid, owners in list(self._cancel_on_disconnect.items()):
+            if ws not in owners:
+                continue
+            owners.remove(ws)
+            if not owners and not self._ws_connections.get(tid):
+                del self._cancel_on_disconnect[tid]
+                if self.cancel(tid, "client disconnected"):
+                    logger.info(f"Task {tid} cancelled: client disconnected")
+
     def _broadcast_sync(self, task_id: str, data: dict):
         """Broadcast data to WebSocket clients, safe to call from any thread."""
         targets = list(self._global_connections)
@@ -141,10 +192,11 @@ class TaskManager:
         now = time.time()
         expired = [tid for tid, t in self._tasks.items()
                    if now - t.created_at > max_age_seconds
-                   and t.status in (TaskStatus.COMPLETED, TaskStatus.ERROR)]
+                   and t.status in (TaskStatus.COMPLETED, TaskStatus.ERROR, TaskStatus.CANCELLED)]
         for tid in expired:
             del self._tasks[tid]
             self._ws_connections.pop(tid, None)
+            self._cancel_on_disconnect.pop(tid, None)
 
 
 task_manager = TaskManager()
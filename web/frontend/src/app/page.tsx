@@ -103,6 +103,11 @@ export default function HomePage() {
         }
         break;
 
+      case 'cancelled':
+        results.setGenerating(false);
+        results.setStatusMessage(msg.error || 'Cancelled');
+        break;
+
       case 'status':
         if (msg.status === 'running') {
           results.setGenerating(true);
@@ -146,6 +151,10 @@ export default function HomePage() {
           if (task.error_detail) {
             console.error('[Generation Traceback]\n', task.error_detail);
           }
+        } else if (task.status === 'cancelled') {
+          stopPolling();
+          results.setGenerating(false);
+          results.setStatusMessage(task.error || 'Cancelled');
         }
       } catch {
         // ignore polling errors
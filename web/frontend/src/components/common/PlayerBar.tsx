@@ -2,6 +2,25 @@
 
 import { useEffect, useRef, useState, useCallback } from 'react';
 import { usePlayerStore, Track } from '@/stores/playerStore';
+import * as api from '@/lib/api';
+
+// Stored results have precomputed peaks and a low-bitrate preview, so the
+// waveform renders immediately and playback streams via Range requests
+// instead of downloading the full-resolution file first.
+async function loadTrack(ws: any, track: Track) {
+  if (track.url === api.getAudioUrl(track.id)) {
+    try {
+      const resp = await api.getAudioPeaks(track.id);
+      if (resp.success && resp.data?.data?.length) {
+        ws.load(api.getAudioUrl(track.id, 'opus'), [resp.data.data], resp.data.duration);
+        return;
+      }
+    } catch {
+      // Fall through to plain load
+    }
+  }
+  ws.load(track.url);
+}
 
 export function PlayerBar() {
   const {
@@ -24,8 +43,8 @@ export function PlayerBar() {
   const [loading, setLoading] = useState(false);
   const [showPlaylist, setShowPlaylist] = useState(false);
   const currentUrlRef = useRef<string | null>(null);
-  // Queue: if user clicks play before WaveSurfer is ready, store the URL to load
-  const pendingUrlRef = useRef<string | null>(null);
+  // Queue: if user clicks play before WaveSurfer is ready, store the track to load
+  const pendingTrackRef = useRef<Track | null>(null);
 
   const hasContent = playlist.length > 0 || !!currentTrack;
 
@@ -94,12 +113,12 @@ export function PlayerBar() {
         setWsReady(true);
 
         // If a track was requested before WaveSurfer was ready, load it now
-        const pending = pendingUrlRef.current;
+        const pending = pendingTrackRef.current;
         if (pending) {
-          pendingUrlRef.current = null;
-          currentUrlRef.current = pending;
+          pendingTrackRef.current = null;
+          currentUrlRef.current = pending.url;
           setLoading(true);
-          ws.load(pending);
+          loadTrack(ws, pending);
         }
       } catch (e) {
         console.error('Failed to init WaveSurfer:', e);
@@ -121,20 +140,20 @@ export function PlayerBar() {
   // Load new track when currentTrack changes
   useEffect(() => {
     const url = currentTrack?.url;
-    if (!url) return;
+    if (!url || !currentTrack) return;
 
     // Skip if same URL already loaded
     if (currentUrlRef.current === url) return;
 
     if (!wsRef.current || !wsReady) {
-      // WaveSurfer not ready yet - queue the URL
-      pendingUrlRef.current = url;
+      // WaveSurfer not ready yet - queue the track
+      pendingTrackRef.current = currentTrack;
       return;
     }
 
     currentUrlRef.current = url;
     setLoading(true);
-    wsRef.current.load(url);
+    loadTrack(wsRef.current, currentTrack);
   }, [currentTrack?.url, currentTrack?.id, wsReady]);
 
   // Sync play/pause state with WaveSurfer
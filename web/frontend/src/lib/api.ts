@@ -66,6 +66,11 @@ export const startGeneration = (req: GenerateRequest) =>
   });
 export const getTaskStatus = (taskId: string) =>
   request<any>(`/generation/task/${taskId}`);
+export const cancelTask = (taskId: string) =>
+  request<{ task_id: string; cancelled: boolean; status: string }>(
+    `/generation/task/${taskId}/cancel`,
+    { method: 'POST' },
+  );
 export const createSample = (req: CreateSampleRequest) =>
   request<any>('/generation/create-sample', {
     method: 'POST',
@@ -100,8 +105,12 @@ export const uploadAudio = async (file: File) => {
     ApiResponse<{ id: string; filename: string }>
   >;
 };
-export const getAudioUrl = (fileId: string) =>
-  `${API_BASE}/audio/files/${fileId}`;
+export const getAudioUrl = (fileId: string, preview?: 'opus' | 'mp3') =>
+  `${API_BASE}/audio/files/${fileId}${preview ? `?preview=${preview}` : ''}`;
+export const getAudioPeaks = (fileId: string) =>
+  request<{ duration: number; length: number; data: number[] }>(
+    `/audio/peaks/${fileId}`
+  );
 
 // Latent
 export const getLatentMetadata = (latentId: string) =>
@@ -263,7 +263,7 @@ export interface ApiResponse<T = any> {
 
 // WebSocket messages
 export interface WSMessage {
-  type: "status" | "progress" | "completed" | "error";
+  type: "status" | "progress" | "completed" | "error" | "cancelled";
   task_id: string;
   status?: string;
   progress?: number;